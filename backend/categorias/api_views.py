@@ -3,7 +3,7 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from django.db import models
 from .models import Category
-from .serializers import CategoryTreeSerializer
+from .tree import get_tree_data
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -11,11 +11,10 @@ def category_tree_public(request):
     """
     Endpoint público para obtener el árbol de categorías
     """
-    categories = Category.objects.filter(parent=None, is_active=True).order_by('sort_order', 'name')
-    serializer = CategoryTreeSerializer(categories, many=True, context={'request': request})
+    data = get_tree_data(request, root_only=True)
     return Response({
-        'count': len(serializer.data),
-        'results': serializer.data
+        'count': len(data),
+        'results': data
     })
 
 @api_view(['GET'])
@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from decimal import Decimal
+from categorias import search_index
+from tratamientos.models import Tratamiento, CategoriaTratamiento
+import random
+import statistics
+import time
+
+
+PALABRAS = [
+    'limpieza', 'profunda', 'resina', 'corona', 'porcelana', 'endodoncia', 'conducto',
+    'extracción', 'muela', 'juicio', 'implante', 'titanio', 'blanqueamiento', 'láser',
+    'ortodoncia', 'brackets', 'estéticos', 'retenedor', 'encía', 'periodontal', 'raspado',
+    'alisado', 'radiografía', 'panorámica', 'sellador', 'fosetas', 'fisuras', 'fluoruro',
+    'prótesis', 'removible', 'puente', 'fijo', 'carilla', 'amalgama', 'curetaje', 'injerto',
+]
+
+SILABAS = ['ca', 'de', 'mo', 'lar', 'ti', 'den', 'pro', 'ra', 'sel', 'no', 'pe', 'ri', 'on', 'ta', 'ge', 'lu']
+
+
+def generar_vocabulario(rng, total):
+    """Vocabulario sintético para que las consultas sean selectivas como en datos reales"""
+    vocabulario = set(PALABRAS)
+    while len(vocabulario) < total:
+        vocabulario.add(''.join(rng.choices(SILABAS, k=rng.randint(3, 5))))
+    return sorted(vocabulario)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la latencia de la búsqueda con icontains contra el índice de texto completo. '
+        'Los datos sintéticos se crean dentro de una transacción que se revierte al terminar.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Tratamientos sintéticos a crear')
+        parser.add_argument('--queries', type=int, default=50, help='Consultas a medir por método')
+        parser.add_argument('--limit', type=int, default=20, help='Resultados por consulta')
+        parser.add_argument('--vocabulary', type=int, default=20000, help='Palabras distintas en los datos')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla aleatoria')
+    
+    def handle(self, *args, **options):
+        if search_index.get_search_backend() is None:
+            raise CommandError("La base de datos actual no soporta búsqueda de texto completo")
+        
+        rows = options['rows']
+        limit = options['limit']
+        rng = random.Random(options['seed'])
+        vocabulario = generar_vocabulario(rng, options['vocabulary'])
+        
+        # Consultas de uno y dos términos, incluyendo prefijos como al escribir
+        consultas = []
+        for _ in range(options['queries']):
+            palabras = rng.sample(vocabulario, rng.choice([1, 2]))
+            palabras[-1] = palabras[-1][:max(4, len(palabras[-1]) - 2)]
+            consultas.append(' '.join(palabras))
+        
+        # El esquema se crea fuera de la transacción que se revierte
+        search_index.create_schema()
+        
+        with transaction.atomic():
+            self.stdout.write(f"Creando {rows} tratamientos sintéticos...")
+            categoria = CategoriaTratamiento.objects.create(nombre='Benchmark de búsqueda')
+            Tratamiento.objects.bulk_create(
+                (
+                    Tratamiento(
+                        nombre=' '.join(rng.sample(vocabulario, 3)).capitalize(),
+                        codigo=f"BEN-{i:07d}",
+                        categoria=categoria,
+                        descripcion=' '.join(rng.choices(vocabulario, k=25)),
+                        precio_base=Decimal('100.00'),
+                        duracion_estimada=30,
+                    )
+                    for i in range(rows)
+                ),
+                batch_size=2000
+            )
+            
+            self.stdout.write("Indexando...")
+            start_time = time.time()
+            search_index.rebuild(doc_types=['tratamiento'])
+            self.stdout.write(f"- Indexación: {time.time() - start_time:.2f} segundos")
+            
+            def icontains(query):
+                filters = Q(nombre__icontains=query) | Q(descripcion__icontains=query) | Q(codigo__icontains=query)
+                return list(Tratamiento.objects.filter(filters, activo=True).order_by('nombre')[:limit])
+            
+            def texto_completo(query):
+                return search_index.search('tratamiento', query, limit)
+            
+            for nombre, metodo in [('icontains', icontains), ('texto completo', texto_completo)]:
+                tiempos = []
+                for query in consultas:
+                    inicio = time.perf_counter()
+                    metodo(query)
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                tiempos.sort()
+                p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+                self.stdout.write(
+                    f"- {nombre}: mediana {statistics.median(tiempos):.2f} ms, "
+                    f"p95 {p95:.2f} ms, máx {tiempos[-1]:.2f} ms"
+                )
+            
+            # No dejar datos sintéticos en la base de datos
+            transaction.set_rollback(True)
+        
+        self.stdout.write(self.style.SUCCESS("Benchmark completado (datos revertidos)"))
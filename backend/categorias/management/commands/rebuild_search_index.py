@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from categorias import search_index
+import time
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de texto completo de categorías, tratamientos y pacientes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type',
+            dest='doc_types',
+            action='append',
+            choices=list(search_index.DOCUMENT_TYPES),
+            help='Tipo de documento a reindexar (se puede repetir). Por defecto todos'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Registros leídos por lote'
+        )
+    
+    def handle(self, *args, **options):
+        if search_index.get_search_backend() is None:
+            raise CommandError("La base de datos actual no soporta búsqueda de texto completo")
+        
+        start_time = time.time()
+        totals = search_index.rebuild(
+            doc_types=options.get('doc_types'),
+            batch_size=options['batch_size']
+        )
+        elapsed_time = time.time() - start_time
+        
+        for doc_type, total in totals.items():
+            self.stdout.write(f"- {doc_type}: {total} documentos")
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice reconstruido en {elapsed_time:.2f} segundos"
+        ))
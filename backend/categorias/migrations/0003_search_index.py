@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def create_search_schema(apps, schema_editor):
+    from categorias import search_index
+    search_index.create_schema(schema_editor.connection.alias)
+
+
+def drop_search_schema(apps, schema_editor):
+    from categorias import search_index
+    search_index.drop_schema(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categorias', '0002_category_category_name_idx_and_more'),
+    ]
+
+    operations = [
+        # El índice se puebla con: python manage.py rebuild_search_index
+        migrations.RunPython(create_search_schema, drop_search_schema),
+    ]
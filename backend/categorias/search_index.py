@@ -0,0 +1,406 @@
+"""
+Índice de búsqueda de texto completo para el sistema dental ERP.
+
+Sustituye las búsquedas con ``icontains`` (un escaneo secuencial por cada
+tecla) por un índice invertido con resultados ordenados por relevancia:
+
+- PostgreSQL: tabla ``search_document`` con una columna ``tsvector`` e
+  índice GIN, usando la configuración ``spanish_unaccent`` (stemming en
+  español e insensible a acentos)
+- SQLite: tabla virtual FTS5 ``search_document_fts`` con el tokenizador
+  ``unicode61 remove_diacritics 2``
+
+El índice cubre categorías, tratamientos y pacientes, y se mantiene
+sincronizado con señales (ver ``categorias.signals``). Para poblarlo por
+primera vez se usa ``python manage.py rebuild_search_index``.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connections, transaction
+
+# Tipos de documento indexados: nombre -> etiqueta del modelo
+DOCUMENT_TYPES = {
+    'categoria': 'categorias.Category',
+    'tratamiento': 'tratamientos.Tratamiento',
+    'paciente': 'pacientes.Paciente',
+}
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Estado del esquema por alias de base de datos (True/False)
+_schema_state = {}
+
+
+def build_document(doc_type, instance):
+    """
+    Construir el documento indexable de una instancia.
+
+    El título pesa más que el cuerpo al calcular la relevancia.
+
+    Returns:
+        tuple: (activo, título, cuerpo)
+    """
+    if doc_type == 'categoria':
+        title = ' '.join(filter(None, [instance.name, instance.meta_title]))
+        return instance.is_active, title, instance.description or ''
+    if doc_type == 'tratamiento':
+        title = ' '.join(filter(None, [instance.nombre, instance.codigo]))
+        return instance.activo, title, instance.descripcion or ''
+    if doc_type == 'paciente':
+        title = ' '.join(filter(None, [
+            instance.nombre, instance.apellido_paterno, instance.apellido_materno,
+            instance.numero_expediente,
+        ]))
+        return instance.activo, title, instance.email or ''
+    raise ValueError(f"Tipo de documento desconocido: {doc_type}")
+
+
+def get_doc_type(model):
+    """Obtener el tipo de documento de un modelo, o None si no se indexa"""
+    label = model._meta.label
+    for doc_type, model_label in DOCUMENT_TYPES.items():
+        if model_label == label:
+            return doc_type
+    return None
+
+
+def parse_terms(query):
+    """Extraer los términos de búsqueda; se descartan operadores y símbolos"""
+    return [term.lower() for term in TERM_PATTERN.findall(query or '')][:10]
+
+
+class BaseSearchBackend:
+    """Interfaz común de los backends de texto completo"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_schema(self):
+        raise NotImplementedError
+
+    def drop_schema(self):
+        raise NotImplementedError
+
+    def schema_exists(self):
+        return 'search_document' in self.connection.introspection.table_names()
+
+    def index(self, doc_type, object_id, activo, title, body):
+        raise NotImplementedError
+
+    def remove(self, doc_type, object_id):
+        raise NotImplementedError
+
+    def clear(self, doc_type):
+        raise NotImplementedError
+
+    def search(self, doc_type, terms, limit, active_only=True):
+        """Devuelve los ids de los documentos ordenados por relevancia"""
+        raise NotImplementedError
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector + GIN con stemming en español insensible a acentos"""
+
+    config = 'spanish_unaccent'
+
+    def create_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+            cursor.execute("""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'spanish_unaccent') THEN
+                        CREATE TEXT SEARCH CONFIGURATION spanish_unaccent (COPY = spanish);
+                        ALTER TEXT SEARCH CONFIGURATION spanish_unaccent
+                            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+                    END IF;
+                END
+                $$
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS search_document (
+                    doc_type varchar(32) NOT NULL,
+                    object_id varchar(64) NOT NULL,
+                    activo boolean NOT NULL DEFAULT true,
+                    search_vector tsvector NOT NULL,
+                    PRIMARY KEY (doc_type, object_id)
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS search_document_vector_gin "
+                "ON search_document USING gin (search_vector)"
+            )
+
+    def drop_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS search_document")
+            cursor.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS spanish_unaccent")
+
+    def index(self, doc_type, object_id, activo, title, body):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO search_document (doc_type, object_id, activo, search_vector)
+                VALUES (
+                    %s, %s, %s,
+                    setweight(to_tsvector('{self.config}', %s), 'A') ||
+                    setweight(to_tsvector('{self.config}', %s), 'B')
+                )
+                ON CONFLICT (doc_type, object_id) DO UPDATE
+                SET activo = EXCLUDED.activo, search_vector = EXCLUDED.search_vector
+            """, [doc_type, str(object_id), activo, title, body])
+
+    def remove(self, doc_type, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM search_document WHERE doc_type = %s AND object_id = %s",
+                [doc_type, str(object_id)]
+            )
+
+    def clear(self, doc_type):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM search_document WHERE doc_type = %s", [doc_type])
+
+    def search(self, doc_type, terms, limit, active_only=True):
+        # Búsqueda por prefijo para que funcione mientras se escribe
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        active_clause = 'AND activo' if active_only else ''
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT object_id
+                FROM search_document, to_tsquery('{self.config}', %s) query
+                WHERE doc_type = %s AND search_vector @@ query {active_clause}
+                ORDER BY ts_rank_cd(search_vector, query) DESC, object_id
+                LIMIT %s
+            """, [tsquery, doc_type, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    FTS5 con una tabla de mapeo para obtener un rowid estable por documento.
+
+    Borrar en FTS5 por una columna no indexada recorre toda la tabla, por lo
+    que ``search_document`` asigna a cada (tipo, id) el rowid que se usa en
+    la tabla virtual.
+    """
+
+    def create_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS search_document (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doc_type varchar(32) NOT NULL,
+                    object_id varchar(64) NOT NULL,
+                    activo bool NOT NULL DEFAULT 1,
+                    UNIQUE (doc_type, object_id)
+                )
+            """)
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS search_document_fts
+                USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 2')
+            """)
+
+    def drop_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS search_document_fts")
+            cursor.execute("DROP TABLE IF EXISTS search_document")
+
+    def index(self, doc_type, object_id, activo, title, body):
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO search_document (doc_type, object_id, activo) VALUES (%s, %s, %s)
+                ON CONFLICT (doc_type, object_id) DO UPDATE SET activo = excluded.activo
+            """, [doc_type, str(object_id), activo])
+            cursor.execute(
+                "SELECT id FROM search_document WHERE doc_type = %s AND object_id = %s",
+                [doc_type, str(object_id)]
+            )
+            rowid = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM search_document_fts WHERE rowid = %s", [rowid])
+            cursor.execute(
+                "INSERT INTO search_document_fts (rowid, title, body) VALUES (%s, %s, %s)",
+                [rowid, title, body]
+            )
+
+    def remove(self, doc_type, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM search_document WHERE doc_type = %s AND object_id = %s",
+                [doc_type, str(object_id)]
+            )
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("DELETE FROM search_document_fts WHERE rowid = %s", [row[0]])
+                cursor.execute("DELETE FROM search_document WHERE id = %s", [row[0]])
+
+    def clear(self, doc_type):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM search_document_fts WHERE rowid IN "
+                "(SELECT id FROM search_document WHERE doc_type = %s)",
+                [doc_type]
+            )
+            cursor.execute("DELETE FROM search_document WHERE doc_type = %s", [doc_type])
+
+    def search(self, doc_type, terms, limit, active_only=True):
+        # Cada término entre comillas y con * para búsqueda por prefijo
+        match = ' '.join(f'"{term}"*' for term in terms)
+        active_clause = 'AND d.activo = 1' if active_only else ''
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT d.object_id
+                FROM search_document_fts f
+                JOIN search_document d ON d.id = f.rowid
+                WHERE search_document_fts MATCH %s AND d.doc_type = %s {active_clause}
+                ORDER BY bm25(search_document_fts, 10.0, 1.0), d.object_id
+                LIMIT %s
+            """, [match, doc_type, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    """Obtener el backend de texto completo para la base de datos, o None"""
+    connection = connections[using]
+    backend_class = BACKENDS.get(connection.vendor)
+    return backend_class(connection) if backend_class else None
+
+
+def is_available(using='default'):
+    """Indica si el índice está habilitado y su esquema existe"""
+    if not getattr(settings, 'SEARCH_FULLTEXT_ENABLED', True):
+        return False
+
+    if using not in _schema_state:
+        backend = get_search_backend(using)
+        _schema_state[using] = bool(backend and backend.schema_exists())
+    return _schema_state[using]
+
+
+def create_schema(using='default'):
+    """Crear las tablas del índice (lo usa la migración y rebuild_search_index)"""
+    backend = get_search_backend(using)
+    if backend is None:
+        return False
+    backend.create_schema()
+    _schema_state[using] = True
+    return True
+
+
+def drop_schema(using='default'):
+    backend = get_search_backend(using)
+    if backend is not None:
+        backend.drop_schema()
+    _schema_state.pop(using, None)
+
+
+def reset_schema_state():
+    """Olvidar el estado del esquema; se vuelve a detectar en la siguiente consulta"""
+    _schema_state.clear()
+
+
+def index_instance(instance, using='default'):
+    """Agregar o actualizar una instancia en el índice"""
+    doc_type = get_doc_type(type(instance))
+    if doc_type is None or not is_available(using):
+        return
+    activo, title, body = build_document(doc_type, instance)
+    get_search_backend(using).index(doc_type, instance.pk, activo, title, body)
+
+
+def index_instances(instances, using='default'):
+    """
+    Agregar o actualizar varias instancias de un modelo en una transacción.
+
+    Para las altas masivas que no envían ``post_save`` (por ejemplo la
+    importación de pacientes).
+    """
+    instances = list(instances)
+    if not instances:
+        return
+    doc_type = get_doc_type(type(instances[0]))
+    if doc_type is None or not is_available(using):
+        return
+    backend = get_search_backend(using)
+    with transaction.atomic(using=using):
+        for instance in instances:
+            activo, title, body = build_document(doc_type, instance)
+            backend.index(doc_type, instance.pk, activo, title, body)
+
+
+def remove_instance(instance, using='default'):
+    """Eliminar una instancia del índice"""
+    doc_type = get_doc_type(type(instance))
+    if doc_type is None or not is_available(using):
+        return
+    get_search_backend(using).remove(doc_type, instance.pk)
+
+
+def rebuild(doc_types=None, batch_size=1000, using='default'):
+    """
+    Reconstruir el índice desde cero.
+
+    Returns:
+        dict: Documentos indexados por tipo
+    """
+    from django.apps import apps
+
+    create_schema(using)
+    backend = get_search_backend(using)
+    totals = {}
+
+    for doc_type in doc_types or DOCUMENT_TYPES:
+        model = apps.get_model(DOCUMENT_TYPES[doc_type])
+        backend.clear(doc_type)
+        total = 0
+        for instance in model.objects.using(using).order_by().iterator(chunk_size=batch_size):
+            activo, title, body = build_document(doc_type, instance)
+            backend.index(doc_type, instance.pk, activo, title, body)
+            total += 1
+        totals[doc_type] = total
+
+    return totals
+
+
+def search(doc_type, query, limit=20, active_only=True, queryset=None, using='default'):
+    """
+    Buscar en el índice y devolver las instancias ordenadas por relevancia.
+
+    Args:
+        doc_type: 'categoria', 'tratamiento' o 'paciente'
+        query: Texto escrito por el usuario
+        limit: Número máximo de resultados
+        active_only: Excluir registros inactivos
+        queryset: Queryset base para cargar las instancias
+            (permite usar select_related)
+
+    Returns:
+        list: Instancias ordenadas por relevancia, o None si el índice no está
+        disponible y se debe usar la búsqueda tradicional
+    """
+    if not is_available(using):
+        return None
+
+    terms = parse_terms(query)
+    if not terms:
+        return []
+
+    ids = get_search_backend(using).search(doc_type, terms, limit, active_only)
+    if not ids:
+        return []
+
+    if queryset is None:
+        from django.apps import apps
+        queryset = apps.get_model(DOCUMENT_TYPES[doc_type]).objects.all()
+
+    instances = queryset.in_bulk(ids)
+    # in_bulk indexa por la clave primaria real (UUID), el índice la guarda como texto
+    by_id = {str(pk): instance for pk, instance in instances.items()}
+    return [by_id[object_id] for object_id in ids if object_id in by_id]
@@ -7,6 +7,8 @@ Este módulo proporciona vistas API para:
 - Búsqueda global
 
 Cada API de búsqueda permite filtrado flexible y ordenación de resultados.
+Cuando el índice de texto completo está disponible (ver search_index) los
+resultados se ordenan por relevancia; si no, se usa la búsqueda con icontains.
 """
 
 from rest_framework.decorators import api_view, permission_classes
@@ -14,6 +16,7 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from django.db.models import Q
 
+from . import search_index
 from .models import Category
 from .serializers import CategoryTreeSerializer
 from tratamientos.models import Tratamiento, CategoriaTratamiento
@@ -78,6 +81,49 @@ class SearchResult:
         }
 
 
+def buscar_categorias(query, active_only=True, limit=20):
+    """Categorías que coinciden con la búsqueda, por relevancia si hay índice"""
+    results = search_index.search('categoria', query, limit, active_only)
+    if results is not None:
+        return results
+    
+    filters = Q(name__icontains=query) | Q(description__icontains=query) | Q(meta_title__icontains=query)
+    if active_only:
+        filters &= Q(is_active=True)
+    return Category.objects.filter(filters).distinct().order_by('name')[:limit]
+
+
+def buscar_tratamientos(query, active_only=True, limit=20):
+    """Tratamientos que coinciden con la búsqueda, por relevancia si hay índice"""
+    queryset = Tratamiento.objects.select_related('categoria')
+    results = search_index.search('tratamiento', query, limit, active_only, queryset=queryset)
+    if results is not None:
+        return results
+    
+    filters = Q(nombre__icontains=query) | Q(descripcion__icontains=query) | Q(codigo__icontains=query)
+    if active_only:
+        filters &= Q(activo=True)
+    return queryset.filter(filters).distinct().order_by('nombre')[:limit]
+
+
+def buscar_pacientes(query, active_only=True, limit=20):
+    """Pacientes que coinciden con la búsqueda, por relevancia si hay índice"""
+    results = search_index.search('paciente', query, limit, active_only)
+    if results is not None:
+        return results
+    
+    filters = (
+        Q(nombre__icontains=query) | 
+        Q(apellido_paterno__icontains=query) | 
+        Q(apellido_materno__icontains=query) | 
+        Q(email__icontains=query) |
+        Q(numero_expediente__icontains=query)
+    )
+    if active_only:
+        filters &= Q(activo=True)
+    return Paciente.objects.filter(filters).distinct().order_by('apellido_paterno', 'nombre')[:limit]
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def search_categories(request):
@@ -97,15 +143,8 @@ def search_categories(request):
     if not query:
         return Response({'error': 'Se requiere un término de búsqueda'}, status=400)
     
-    # Construir consulta
-    filters = Q(name__icontains=query) | Q(description__icontains=query) | Q(meta_title__icontains=query)
-    
-    # Aplicar filtros adicionales
-    if active_only:
-        filters &= Q(is_active=True)
-    
     # Ejecutar consulta
-    categories = Category.objects.filter(filters).distinct().order_by('name')[:limit]
+    categories = buscar_categorias(query, active_only, limit)
     
     # Formatear y devolver resultados
     return Response(SearchResult.format_category_results(categories, request))
@@ -130,15 +169,8 @@ def search_tratamientos(request):
     if not query:
         return Response({'error': 'Se requiere un término de búsqueda'}, status=400)
     
-    # Construir consulta
-    filters = Q(nombre__icontains=query) | Q(descripcion__icontains=query) | Q(codigo__icontains=query)
-    
-    # Aplicar filtros adicionales
-    if active_only:
-        filters &= Q(activo=True)
-    
     # Ejecutar consulta
-    tratamientos = Tratamiento.objects.filter(filters).distinct().order_by('nombre')[:limit]
+    tratamientos = buscar_tratamientos(query, active_only, limit)
     
     # Formatear y devolver resultados
     return Response(SearchResult.format_tratamiento_results(tratamientos, request))
@@ -174,32 +206,17 @@ def search_global(request):
     
     # Buscar categorías
     if 'categories' in include_types:
-        filters = Q(name__icontains=query) | Q(description__icontains=query)
-        if active_only:
-            filters &= Q(is_active=True)
-        categories = Category.objects.filter(filters).distinct().order_by('name')[:limit]
+        categories = buscar_categorias(query, active_only, limit)
         results['categories'] = SearchResult.format_category_results(categories, request)
     
     # Buscar tratamientos
     if 'tratamientos' in include_types:
-        filters = Q(nombre__icontains=query) | Q(descripcion__icontains=query) | Q(codigo__icontains=query)
-        if active_only:
-            filters &= Q(activo=True)
-        tratamientos = Tratamiento.objects.filter(filters).distinct().order_by('nombre')[:limit]
+        tratamientos = buscar_tratamientos(query, active_only, limit)
         results['tratamientos'] = SearchResult.format_tratamiento_results(tratamientos, request)
     
     # Buscar pacientes (solo si el usuario tiene permisos)
     if 'pacientes' in include_types and request.user and request.user.has_perm('pacientes.view_paciente'):
-        filters = (
-            Q(nombre__icontains=query) | 
-            Q(apellido_paterno__icontains=query) | 
-            Q(apellido_materno__icontains=query) | 
-            Q(email__icontains=query) |
-            Q(numero_expediente__icontains=query)
-        )
-        if active_only:
-            filters &= Q(activo=True)
-        pacientes = Paciente.objects.filter(filters).distinct().order_by('apellido_paterno', 'nombre')[:limit]
+        pacientes = buscar_pacientes(query, active_only, limit)
         results['pacientes'] = SearchResult.format_paciente_results(pacientes, request)
     
     # Formatear respuesta global
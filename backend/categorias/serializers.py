@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from dental_erp.eager_loading import get_precomputed
+from dental_erp.fast_serializers import FastSerializer, Placeholder
 from .models import Category, CategoryAttribute
 from mptt.templatetags.mptt_tags import cache_tree_children
 
@@ -20,7 +22,7 @@ class CategoryTreeSerializer(serializers.ModelSerializer):
     """
     children = serializers.SerializerMethodField()
     attributes = CategoryAttributeSerializer(many=True, read_only=True)
-    full_path = serializers.ReadOnlyField()
+    full_path = serializers.SerializerMethodField()
     children_count = serializers.SerializerMethodField()
     descendants_count = serializers.SerializerMethodField()
     is_leaf = serializers.SerializerMethodField()
@@ -48,25 +50,70 @@ class CategoryTreeSerializer(serializers.ModelSerializer):
             return CategoryTreeSerializer(children, many=True, context=self.context).data
         return []
     
+    # Los valores precalculados por categorias.tree.build_category_tree
+    # evitan una consulta por nodo
+    def get_full_path(self, obj):
+        if hasattr(obj, '_tree_breadcrumbs'):
+            return " > ".join(crumb['name'] for crumb in obj._tree_breadcrumbs)
+        return obj.get_full_path()
+    
     def get_children_count(self, obj):
+        if hasattr(obj, '_tree_children_count'):
+            return obj._tree_children_count
         return obj.get_children_count()
     
     def get_descendants_count(self, obj):
+        if hasattr(obj, '_tree_descendants_count'):
+            return obj._tree_descendants_count
         return obj.get_descendants_count()
     
     def get_is_leaf(self, obj):
+        if hasattr(obj, '_tree_children_count'):
+            return obj._tree_children_count == 0
         return obj.is_leaf()
     
     def get_breadcrumbs(self, obj):
+        if hasattr(obj, '_tree_breadcrumbs'):
+            return obj._tree_breadcrumbs
         return obj.get_breadcrumbs()
 
 
+# Ruta rápida de solo lectura para el árbol (ver dental_erp.fast_serializers
+# y categorias.tree.build_tree_data); la salida coincide con la de
+# CategoryTreeSerializer
+
+class CategoryAttributeReadSerializer(FastSerializer):
+    class Meta:
+        model = CategoryAttribute
+        fields = CategoryAttributeSerializer.Meta.fields
+        extra = ('category',)
+
+
+class CategoryTreeReadSerializer(FastSerializer):
+    # Datos del árbol que completa build_tree_data
+    full_path = Placeholder()
+    children = Placeholder()
+    children_count = Placeholder()
+    descendants_count = Placeholder()
+    is_leaf = Placeholder()
+    breadcrumbs = Placeholder()
+    attributes = Placeholder()
+    
+    class Meta:
+        model = Category
+        fields = CategoryTreeSerializer.Meta.fields
+        extra = ('tree_id', 'lft', 'rght')
+
+
 class CategoryListSerializer(serializers.ModelSerializer):
     """
-    Serializer para listar categorías sin estructura jerárquica
+    Serializer para listar categorías sin estructura jerárquica.
+    
+    Lee ``children_total`` y ``_tree_breadcrumbs`` cuando la vista los
+    precalculó (ver ``CategoryViewSet.list_annotations``).
     """
     parent_name = serializers.SerializerMethodField()
-    full_path = serializers.ReadOnlyField()
+    full_path = serializers.SerializerMethodField()
     children_count = serializers.SerializerMethodField()
     
     class Meta:
@@ -81,8 +128,13 @@ class CategoryListSerializer(serializers.ModelSerializer):
     def get_parent_name(self, obj):
         return obj.parent.name if obj.parent else None
     
+    def get_full_path(self, obj):
+        if hasattr(obj, '_tree_breadcrumbs'):
+            return " > ".join(crumb['name'] for crumb in obj._tree_breadcrumbs)
+        return obj.get_full_path()
+    
     def get_children_count(self, obj):
-        return obj.get_children_count()
+        return get_precomputed(obj, 'children_total', obj.get_children_count)
 
 
 class CategoryDetailSerializer(serializers.ModelSerializer):
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from . import search_index
+from .models import Category, CategoryAttribute
+from .tree import invalidate_tree_cache
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def invalidar_arbol_categoria(sender, instance, **kwargs):
+    """
+    Invalidar el árbol en caché cuando una categoría se guarda, se elimina o se mueve
+    """
+    invalidate_tree_cache()
+
+
+@receiver(post_save, sender=CategoryAttribute)
+@receiver(post_delete, sender=CategoryAttribute)
+def invalidar_arbol_atributo(sender, instance, **kwargs):
+    """
+    Los atributos forman parte del árbol serializado
+    """
+    invalidate_tree_cache()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender='tratamientos.Tratamiento')
+@receiver(post_save, sender='pacientes.Paciente')
+def indexar_documento(sender, instance, **kwargs):
+    """
+    Mantener actualizado el índice de texto completo
+    """
+    search_index.index_instance(instance, using=kwargs.get('using') or 'default')
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender='tratamientos.Tratamiento')
+@receiver(post_delete, sender='pacientes.Paciente')
+def desindexar_documento(sender, instance, **kwargs):
+    """
+    Quitar del índice de texto completo los registros eliminados
+    """
+    search_index.remove_instance(instance, using=kwargs.get('using') or 'default')
@@ -2,6 +2,7 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from rest_framework import status
+from dental_erp.testing import QueryBudgetMixin
 from .models import Category, CategoryAttribute
 
 
@@ -163,3 +164,198 @@ class CategoryAPITest(APITestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CategoryTreeEngineTest(APITestCase):
+    """Tests para el motor del árbol de categorías"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        
+        self.root = Category.objects.create(name="Servicios")
+        self.child1 = Category.objects.create(name="Preventivos", parent=self.root)
+        self.child2 = Category.objects.create(name="Correctivos", parent=self.root)
+        self.grandchild = Category.objects.create(name="Limpiezas", parent=self.child1)
+        self.inactive = Category.objects.create(name="Obsoletos", parent=self.root, is_active=False)
+        CategoryAttribute.objects.create(category=self.child1, name="color", value="azul")
+    
+    def _find(self, nodes, name):
+        for node in nodes:
+            if node['name'] == name:
+                return node
+            found = self._find(node['children'], name)
+            if found:
+                return found
+        return None
+    
+    def test_tree_matches_model_methods(self):
+        """Los valores precalculados coinciden con los métodos del modelo"""
+        response = self.client.get('/api/categories/tree/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        
+        for category in Category.objects.filter(is_active=True):
+            node = self._find(data, category.name)
+            self.assertIsNotNone(node)
+            self.assertEqual(node['children_count'], category.get_children_count())
+            self.assertEqual(node['descendants_count'], category.get_descendants_count())
+            self.assertEqual(node['is_leaf'], category.is_leaf())
+            self.assertEqual(node['breadcrumbs'], category.get_breadcrumbs())
+            self.assertEqual(node['full_path'], category.get_full_path())
+        
+        self.assertIsNone(self._find(data, "Obsoletos"))
+        self.assertEqual(len(self._find(data, "Preventivos")['attributes']), 1)
+    
+    def test_tree_query_count_is_constant(self):
+        """El árbol se arma con una consulta más la de atributos, y luego sale del caché"""
+        for i in range(10):
+            Category.objects.create(name=f"Extra {i}", parent=self.child2)
+        
+        with self.assertNumQueries(2):
+            self.client.get('/api/categories/tree/')
+        
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/tree/')
+    
+    def test_max_depth(self):
+        """max_depth limita los niveles incluidos"""
+        data = self.client.get('/api/categories/tree/?max_depth=1').json()
+        preventivos = self._find(data, "Preventivos")
+        self.assertEqual(preventivos['children'], [])
+        self.assertEqual(preventivos['children_count'], 1)
+    
+    def test_fast_tree_matches_serializer(self):
+        """El árbol leído con values_list coincide con CategoryTreeSerializer"""
+        from rest_framework.test import APIRequestFactory
+        from rest_framework.request import Request
+        from .serializers import CategoryTreeSerializer
+        from .tree import build_category_tree, build_tree_data
+
+        request = Request(APIRequestFactory().get('/api/categories/tree/'))
+        for options in ({}, {'root_only': True}, {'max_depth': 1}):
+            expected = CategoryTreeSerializer(
+                build_category_tree(**options), many=True, context={'request': request}
+            ).data
+            with self.assertNumQueries(2):
+                data = build_tree_data(request, **options)
+            self.assertEqual(data, expected)
+
+    def test_cache_invalidation(self):
+        """Guardar, mover o eliminar una categoría invalida el caché"""
+        self.client.get('/api/categories/tree/')
+        
+        Category.objects.create(name="Estética", parent=self.root)
+        data = self.client.get('/api/categories/tree/').json()
+        self.assertIsNotNone(self._find(data, "Estética"))
+        
+        grandchild = Category.objects.get(pk=self.grandchild.pk)
+        grandchild.move_to(Category.objects.get(pk=self.child2.pk), 'last-child')
+        data = self.client.get('/api/categories/tree/').json()
+        self.assertEqual(self._find(data, "Preventivos")['children'], [])
+        self.assertEqual(len(self._find(data, "Correctivos")['children']), 1)
+        
+        Category.objects.get(pk=self.child2.pk).delete()
+        data = self.client.get('/api/categories/tree/').json()
+        self.assertIsNone(self._find(data, "Correctivos"))
+        self.assertIsNone(self._find(data, "Limpiezas"))
+
+
+class SearchIndexTest(APITestCase):
+    """Tests para el índice de texto completo"""
+    
+    @classmethod
+    def setUpClass(cls):
+        from . import search_index
+        # El esquema se crea fuera de la transacción de cada test
+        search_index.create_schema()
+        super().setUpClass()
+    
+    @classmethod
+    def tearDownClass(cls):
+        from . import search_index
+        super().tearDownClass()
+        search_index.drop_schema()
+    
+    def setUp(self):
+        from decimal import Decimal
+        from tratamientos.models import CategoriaTratamiento, Tratamiento
+        
+        self.categoria = CategoriaTratamiento.objects.create(nombre="Cirugía")
+        self.extraccion = Tratamiento.objects.create(
+            nombre="Extracción de muela del juicio",
+            categoria=self.categoria,
+            descripcion="Procedimiento quirúrgico",
+            precio_base=Decimal('1500.00'),
+            duracion_estimada=60
+        )
+        self.limpieza = Tratamiento.objects.create(
+            nombre="Limpieza dental",
+            categoria=self.categoria,
+            descripcion="Incluye revisión de la muela",
+            precio_base=Decimal('500.00'),
+            duracion_estimada=30
+        )
+        self.category = Category.objects.create(name="Ortodoncia", description="Brackets y alineadores")
+    
+    def test_accent_insensitive_prefix_search(self):
+        """La búsqueda ignora acentos y funciona con prefijos"""
+        response = self.client.get('/api/search/tratamientos/', {'q': 'extraccion jui'})
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['id'], str(self.extraccion.id))
+    
+    def test_ranking_prefers_title(self):
+        """Las coincidencias en el nombre pesan más que en la descripción"""
+        response = self.client.get('/api/search/tratamientos/', {'q': 'muela'})
+        ids = [r['id'] for r in response.json()['results']]
+        self.assertEqual(ids, [str(self.extraccion.id), str(self.limpieza.id)])
+    
+    def test_index_follows_changes(self):
+        """Las señales mantienen el índice sincronizado"""
+        self.limpieza.activo = False
+        self.limpieza.save()
+        response = self.client.get('/api/search/tratamientos/', {'q': 'muela'})
+        self.assertEqual(response.json()['count'], 1)
+        
+        self.extraccion.delete()
+        response = self.client.get('/api/search/tratamientos/', {'q': 'muela'})
+        self.assertEqual(response.json()['count'], 0)
+        
+        self.category.name = "Ortopedia"
+        self.category.save()
+        response = self.client.get('/api/search/global/', {'q': 'ortopedia', 'include': 'categories'})
+        self.assertEqual(response.json()['results']['categories']['count'], 1)
+    
+    def test_rebuild_and_fallback(self):
+        """rebuild repuebla el índice y sin esquema se usa icontains"""
+        from . import search_index
+        
+        totals = search_index.rebuild(doc_types=['tratamiento', 'categoria'])
+        self.assertEqual(totals, {'tratamiento': 2, 'categoria': 1})
+        self.assertEqual(len(search_index.search('tratamiento', 'limpieza')), 1)
+        
+        with self.settings(SEARCH_FULLTEXT_ENABLED=False):
+            self.assertIsNone(search_index.search('tratamiento', 'limpieza'))
+            response = self.client.get('/api/search/tratamientos/', {'q': 'impiez'})
+            self.assertEqual(response.json()['count'], 1)
+
+
+class CategoryListQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """El listado de categorías no consulta por fila"""
+    
+    def test_list_query_budget(self):
+        root = Category.objects.create(name="Servicios")
+        parent = Category.objects.create(name="Preventivos", parent=root)
+        Category.objects.create(name="Limpiezas", parent=parent)
+        creadas = []
+        
+        def crear(n):
+            for _ in range(n):
+                creadas.append(Category.objects.create(name=f"Extra {len(creadas)}", parent=parent))
+        
+        self.assertListQueryBudget('/api/categories/', crear)
+        data = {c['name']: c for c in self.client.get('/api/categories/').json()['results']}
+        self.assertEqual(data['Preventivos']['children_count'], 1 + len(creadas))
+        self.assertEqual(data['Extra 0']['full_path'], "Servicios > Preventivos > Extra 0")
+        self.assertEqual(data['Servicios']['full_path'], "Servicios")
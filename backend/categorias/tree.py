@@ -0,0 +1,262 @@
+"""
+Motor de construcción del árbol de categorías.
+
+Este módulo arma el árbol completo de categorías a partir de una sola
+consulta y calcula en memoria los datos que antes se obtenían con una
+consulta por nodo:
+
+- Número de descendientes, a partir de las columnas MPTT ``lft``/``rght``
+- Número de hijos directos e indicador de hoja
+- Breadcrumbs, con un único recorrido de ancestros en preorden
+
+``build_tree_data`` hace lo mismo sobre tuplas de ``values_list`` y arma
+directamente los diccionarios de la respuesta, sin pasar por los campos
+de DRF. ``build_category_tree`` devuelve las instancias del modelo.
+
+El resultado serializado se guarda en caché bajo una versión que se
+incrementa cada vez que una categoría se guarda, se elimina o se mueve
+(ver ``categorias.signals``).
+"""
+
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, prefetch_related_objects
+
+from .models import Category
+
+TREE_CACHE_VERSION_KEY = 'categorias:tree:version'
+TREE_CACHE_TIMEOUT = getattr(settings, 'CATEGORY_TREE_CACHE_TIMEOUT', 60 * 15)
+
+
+def get_tree_version():
+    """Obtener la versión vigente del caché del árbol"""
+    version = cache.get(TREE_CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(TREE_CACHE_VERSION_KEY, 1, timeout=None)
+        version = cache.get(TREE_CACHE_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_tree_cache():
+    """
+    Invalidar el árbol en caché incrementando su versión.
+
+    Las entradas anteriores dejan de ser alcanzables y expiran solas.
+    """
+    try:
+        cache.incr(TREE_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(TREE_CACHE_VERSION_KEY, 2, timeout=None)
+
+
+def build_category_tree(root_only=False, max_depth=None):
+    """
+    Construir el árbol de categorías activas con una sola consulta.
+
+    Cada nodo devuelto lleva precalculados ``_cached_children``,
+    ``_tree_children_count``, ``_tree_descendants_count`` y
+    ``_tree_breadcrumbs``, que ``CategoryTreeSerializer`` usa en lugar de
+    consultar la base de datos.
+
+    Args:
+        root_only: Ordenar las raíces por ``sort_order`` y ``name`` en lugar
+            del orden del árbol
+        max_depth: Nivel máximo a incluir (inclusive)
+
+    Returns:
+        list: Categorías raíz activas con sus hijos en caché
+    """
+    # Se leen todas las categorías (activas e inactivas) para que los
+    # conteos coincidan con los de los métodos del modelo
+    nodes = list(Category.objects.order_by('tree_id', 'lft'))
+
+    roots = []
+    included = []
+    stack = []
+
+    for node in nodes:
+        # Descartar del stack los nodos que ya no son ancestros
+        while stack and (stack[-1].tree_id != node.tree_id or stack[-1].rght < node.lft):
+            stack.pop()
+
+        parent = stack[-1] if stack else None
+        crumb = {
+            'id': str(node.id),
+            'name': node.name,
+            'slug': node.slug,
+            'level': node.level,
+        }
+
+        node._cached_children = []
+        node._tree_children_count = 0
+        node._tree_descendants_count = (node.rght - node.lft - 1) // 2
+        node._tree_breadcrumbs = (parent._tree_breadcrumbs if parent else []) + [crumb]
+        node._tree_included = (
+            node.is_active
+            and (parent is None or parent._tree_included)
+            and (max_depth is None or node.level <= max_depth)
+        )
+
+        if parent is not None:
+            parent._tree_children_count += 1
+            if node._tree_included:
+                parent._cached_children.append(node)
+        elif node._tree_included:
+            roots.append(node)
+
+        if node._tree_included:
+            included.append(node)
+
+        stack.append(node)
+
+    prefetch_related_objects(included, 'attributes')
+
+    if root_only:
+        roots.sort(key=lambda c: (c.sort_order, c.name))
+
+    return roots
+
+
+def build_tree_data(request=None, root_only=False, max_depth=None):
+    """
+    Árbol serializado por la ruta rápida de solo lectura.
+
+    Produce lo mismo que ``CategoryTreeSerializer`` sobre
+    ``build_category_tree``, pero arma los diccionarios directamente desde
+    las tuplas de ``values_list`` (ver ``dental_erp.fast_serializers``):
+    una consulta para las categorías y otra para los atributos.
+
+    Returns:
+        list: Datos serializados de las categorías raíz
+    """
+    from .models import CategoryAttribute
+    from .serializers import CategoryAttributeReadSerializer, CategoryTreeReadSerializer
+
+    context = {'request': request}
+    serializer = CategoryTreeReadSerializer(context=context)
+    rows = list(serializer.values_queryset(Category.objects.order_by('tree_id', 'lft')))
+    column = {name: index for index, name in enumerate(serializer.columns)}
+    tree_id, lft, rght = column['tree_id'], column['lft'], column['rght']
+
+    roots = []
+    included = {}
+    stack = []
+
+    for row, node in zip(rows, serializer.serialize(rows)):
+        # Descartar del stack los nodos que ya no son ancestros
+        while stack and (stack[-1][0][tree_id] != row[tree_id] or stack[-1][0][rght] < row[lft]):
+            stack.pop()
+
+        parent = stack[-1][1] if stack else None
+        crumb = {
+            'id': node['id'],
+            'name': node['name'],
+            'slug': node['slug'],
+            'level': node['level'],
+        }
+
+        node['breadcrumbs'] = (parent['breadcrumbs'] if parent else []) + [crumb]
+        node['full_path'] = " > ".join(c['name'] for c in node['breadcrumbs'])
+        node['children'] = []
+        node['children_count'] = 0
+        node['descendants_count'] = (row[rght] - row[lft] - 1) // 2
+        node['attributes'] = []
+        node_included = (
+            node['is_active']
+            and (parent is None or stack[-1][2])
+            and (max_depth is None or node['level'] <= max_depth)
+        )
+
+        if parent is not None:
+            parent['children_count'] += 1
+            if node_included:
+                parent['children'].append(node)
+        elif node_included:
+            roots.append(node)
+
+        if node_included:
+            included[row[0]] = node
+
+        stack.append((row, node, node_included))
+
+    for node in included.values():
+        node['is_leaf'] = node['children_count'] == 0
+
+    if included:
+        attributes = CategoryAttributeReadSerializer(context=context)
+        attribute_rows = list(attributes.values_queryset(
+            CategoryAttribute.objects.filter(category__in=list(included))
+        ))
+        category = attributes.columns.index('category')
+        for row, attribute in zip(attribute_rows, attributes.serialize(attribute_rows)):
+            included[row[category]]['attributes'].append(attribute)
+
+    if root_only:
+        roots.sort(key=lambda c: (c['sort_order'], c['name']))
+
+    return roots
+
+
+def annotate_breadcrumbs(categories):
+    """
+    Precalcular ``_tree_breadcrumbs`` de una página de categorías.
+
+    Los ancestros de todas se leen con una sola consulta por rangos
+    ``lft``/``rght``, en lugar de una por categoría.
+    """
+    conditions = [
+        Q(tree_id=category.tree_id, lft__lt=category.lft, rght__gt=category.rght)
+        for category in categories
+        if category.level > 0
+    ]
+    ancestors = []
+    if conditions:
+        ancestors = list(
+            Category.objects.filter(reduce(operator.or_, conditions))
+            .only('id', 'name', 'slug', 'level', 'tree_id', 'lft', 'rght')
+            .order_by('tree_id', 'lft')
+        )
+
+    for category in categories:
+        category._tree_breadcrumbs = [
+            {
+                'id': str(node.id),
+                'name': node.name,
+                'slug': node.slug,
+                'level': node.level,
+            }
+            for node in ancestors
+            if node.tree_id == category.tree_id and node.lft < category.lft and node.rght > category.rght
+        ] + [{
+            'id': str(category.id),
+            'name': category.name,
+            'slug': category.slug,
+            'level': category.level,
+        }]
+
+
+def get_tree_cache_key(request, root_only=False, max_depth=None):
+    """Clave de caché para una variante del árbol"""
+    # Las URLs de imagen son absolutas, por lo que dependen del host
+    host = request.build_absolute_uri('/') if request is not None else ''
+    return 'categorias:tree:v{}:{}:{}:{}'.format(
+        get_tree_version(), int(bool(root_only)), max_depth, host
+    )
+
+
+def get_tree_data(request, root_only=False, max_depth=None):
+    """
+    Obtener el árbol serializado, usando el caché versionado.
+
+    Returns:
+        list: Datos serializados de las categorías raíz
+    """
+    cache_key = get_tree_cache_key(request, root_only, max_depth)
+    data = cache.get(cache_key)
+    if data is None:
+        data = build_tree_data(request, root_only=root_only, max_depth=max_depth)
+        cache.set(cache_key, data, TREE_CACHE_TIMEOUT)
+    return data
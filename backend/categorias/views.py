@@ -2,10 +2,9 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db import models
-from django.db.models import Q, Count
+from django.db.models import Q, Count, OuterRef
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from mptt.templatetags.mptt_tags import cache_tree_children
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 
@@ -18,6 +17,8 @@ from .serializers import (
     CategoryBreadcrumbSerializer,
     CategoryStatsSerializer
 )
+from .tree import annotate_breadcrumbs, get_tree_data
+from dental_erp.eager_loading import EagerLoadingMixin, SubqueryCount
 
 # Nueva vista para la interfaz de búsqueda
 def search_interface(request):
@@ -30,7 +31,7 @@ def search_interface(request):
     return render(request, 'categorias/search.html')
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     """
     ViewSet completo para el manejo de categorías jerárquicas.
     
@@ -45,6 +46,14 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'sort_order', 'created_at', 'level']
     ordering = ['tree_id', 'lft']
     
+    # Lo que necesita CategoryListSerializer sin consultar por fila
+    eager_loading_actions = ('list', 'children', 'search')
+    list_select_related = ('parent',)
+    list_annotations = {
+        'children_total': SubqueryCount(Category.objects.filter(parent=OuterRef('pk'))),
+    }
+    list_page_prefetchers = (annotate_breadcrumbs,)
+    
     def get_serializer_class(self):
         """Seleccionar el serializer apropiado según la acción"""
         if self.action == 'list':
@@ -67,7 +76,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
             # Para el árbol, traer solo categorías activas
             queryset = queryset.filter(is_active=True)
         
-        return queryset
+        return self.eager_load(queryset)
     
     @action(detail=False, methods=['get'])
     def tree(self, request):
@@ -83,28 +92,17 @@ class CategoryViewSet(viewsets.ModelViewSet):
         root_only = request.query_params.get('root_only', 'false').lower() == 'true'
         max_depth = request.query_params.get('max_depth')
         
-        if root_only:
-            # Solo categorías raíz
-            categories = Category.objects.filter(
-                parent=None, 
-                is_active=True
-            ).order_by('sort_order', 'name')
+        if max_depth and not root_only:
+            try:
+                max_depth = int(max_depth)
+            except ValueError:
+                max_depth = None
         else:
-            # Árbol completo optimizado
-            categories = Category.objects.filter(is_active=True)
-            if max_depth:
-                try:
-                    max_depth = int(max_depth)
-                    categories = categories.filter(level__lte=max_depth)
-                except ValueError:
-                    pass
-            
-            # Optimizar consultas con cache_tree_children
-            categories = cache_tree_children(categories)
-            categories = [c for c in categories if c.is_root_node()]
-        
-        serializer = self.get_serializer(categories, many=True)
-        return Response(serializer.data)
+            max_depth = None
+        
+        # Árbol construido con una sola consulta y guardado en caché
+        data = get_tree_data(request, root_only=root_only, max_depth=max_depth)
+        return Response(data)
     
     @action(detail=True, methods=['get'])
     def children(self, request, pk=None):
@@ -114,7 +112,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         GET /api/categories/{id}/children/
         """
         category = self.get_object()
-        children = category.get_children().filter(is_active=True)
+        children = self.prefetch_page(self.eager_load(category.get_children().filter(is_active=True)))
         serializer = CategoryListSerializer(children, many=True, context={'request': request})
         return Response(serializer.data)
     
@@ -289,7 +287,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         level = request.query_params.get('level')
         parent_id = request.query_params.get('parent')
         
-        queryset = Category.objects.filter(is_active=True)
+        queryset = self.eager_load(Category.objects.filter(is_active=True))
         
         if query:
             queryset = queryset.filter(
@@ -316,7 +314,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
             serializer = CategoryListSerializer(page, many=True, context={'request': request})
             return self.get_paginated_response(serializer.data)
         
-        serializer = CategoryListSerializer(queryset, many=True, context={'request': request})
+        serializer = CategoryListSerializer(self.prefetch_page(queryset), many=True, context={'request': request})
         return Response(serializer.data)
 
 @login_required
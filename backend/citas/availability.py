@@ -0,0 +1,231 @@
+"""
+Búsqueda de horarios libres de los dentistas.
+
+Para cada dentista se arma su jornada (``horario_inicio``/``horario_fin``
+en sus ``dias_laborales``) y se recorre en orden la lista de citas activas
+restando los intervalos ocupados. Las citas de todos los dentistas que no
+están en caché se leen con una sola consulta por rango sobre el índice
+``(dentista, fecha_hora)``.
+
+Los huecos de cada dentista se guardan en caché para el rango de fechas
+pedido, bajo una versión por dentista que se incrementa cuando una de sus
+citas o su horario cambian (ver ``citas.signals``). La duración mínima y el
+recorte de horas pasadas se aplican al leer, así que no forman parte de la
+clave.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from . import scheduling
+
+CACHE_TIMEOUT = getattr(settings, 'CITA_DISPONIBILIDAD_CACHE_TIMEOUT', 60 * 10)
+
+# Días máximos por consulta
+MAX_RANGE_DAYS = 62
+
+# Paso mínimo en minutos entre horas de inicio (``slot_starts``)
+MIN_SLOT_STEP = 5
+
+
+def _version_key(dentista_id):
+    return f'citas:disponibilidad:version:{dentista_id}'
+
+
+def invalidate(*dentista_ids):
+    """Invalidar los huecos en caché de los dentistas dados"""
+    for dentista_id in set(filter(None, dentista_ids)):
+        try:
+            cache.incr(_version_key(dentista_id))
+        except ValueError:
+            cache.set(_version_key(dentista_id), 2, timeout=None)
+
+
+def _cache_keys(dentistas, desde, hasta):
+    versions = cache.get_many([_version_key(d.pk) for d in dentistas])
+    return {
+        dentista.pk: 'citas:disponibilidad:{}:v{}:{}:{}'.format(
+            dentista.pk, versions.get(_version_key(dentista.pk), 1), desde, hasta
+        )
+        for dentista in dentistas
+    }
+
+
+def working_intervals(dentista, desde, hasta, tz=None):
+    """
+    Jornadas laborales del dentista entre dos fechas (inclusive).
+
+    Returns:
+        list: Tuplas ``(inicio, fin)`` en UTC, como las fechas que devuelve
+        la base de datos (comparar fechas de la misma zona es mucho más rápido)
+    """
+    tz = tz or timezone.get_current_timezone()
+    dias = set(dentista.dias_laborales or '')
+    intervals = []
+    dia = desde
+    while dia <= hasta:
+        if str(dia.isoweekday()) in dias:
+            inicio = datetime.combine(dia, dentista.horario_inicio, tzinfo=tz).astimezone(dt_timezone.utc)
+            fin = datetime.combine(dia, dentista.horario_fin, tzinfo=tz).astimezone(dt_timezone.utc)
+            if fin > inicio:
+                intervals.append((inicio, fin))
+        dia += timedelta(days=1)
+    return intervals
+
+
+def subtract_busy(intervals, busy):
+    """
+    Restar intervalos ocupados a las jornadas con un solo recorrido.
+
+    Args:
+        intervals: Jornadas ``(inicio, fin)`` ordenadas y sin traslapes
+        busy: Intervalos ocupados ``(inicio, fin)`` ordenados por inicio
+
+    Returns:
+        list: Huecos libres ``(inicio, fin)`` en orden
+    """
+    free = []
+    i = 0
+    for inicio, fin in intervals:
+        cursor = inicio
+        # Saltar las citas que terminan antes de esta jornada
+        while i < len(busy) and busy[i][1] <= cursor:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < fin:
+            ocupado_inicio, ocupado_fin = busy[j]
+            if ocupado_inicio > cursor:
+                free.append((cursor, ocupado_inicio))
+            cursor = max(cursor, ocupado_fin)
+            j += 1
+        if cursor < fin:
+            free.append((cursor, fin))
+    return free
+
+
+def _to_utc(value):
+    """Fecha de la base de datos en UTC (SQLite devuelve texto sin zona)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=dt_timezone.utc)
+    return value.astimezone(dt_timezone.utc)
+
+
+def _load_busy(dentistas, desde_dt, hasta_dt):
+    """Intervalos ocupados por dentista, con una sola consulta"""
+    from .models import Cita
+
+    queryset = Cita.objects.filter(
+        dentista_id__in=[d.pk for d in dentistas],
+        estado__in=scheduling.ACTIVE_STATES,
+        fecha_hora__gt=desde_dt - timedelta(minutes=scheduling.get_max_duration()),
+        fecha_hora__lt=hasta_dt,
+    ).order_by('fecha_hora').values_list('dentista_id', 'fecha_hora', 'duracion_estimada')
+
+    # Se ejecuta el SQL del ORM sin sus convertidores por fila, que en
+    # rangos de varias semanas eran la mayor parte del tiempo
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    # El id llega como UUID o como texto hexadecimal, según la base de datos
+    por_hex = {d.pk.hex: d.pk for d in dentistas}
+    busy = defaultdict(list)
+    for dentista_id, fecha_hora, duracion in rows:
+        inicio = _to_utc(fecha_hora)
+        busy[por_hex[str(dentista_id).replace('-', '')]].append(
+            (inicio, inicio + timedelta(minutes=duracion))
+        )
+    return busy
+
+
+def free_intervals(dentistas, desde, hasta):
+    """
+    Huecos libres de varios dentistas entre dos fechas (inclusive).
+
+    Solo consulta la base de datos por los dentistas que no están en caché.
+
+    Returns:
+        dict: Lista de huecos ``(inicio, fin)`` por id de dentista
+    """
+    dentistas = list(dentistas)
+    if not dentistas:
+        return {}
+
+    keys = _cache_keys(dentistas, desde, hasta)
+    cached = cache.get_many(list(keys.values()))
+    result = {
+        dentista.pk: cached[keys[dentista.pk]]
+        for dentista in dentistas if keys[dentista.pk] in cached
+    }
+
+    missing = [d for d in dentistas if d.pk not in result]
+    if missing:
+        tz = timezone.get_current_timezone()
+        jornadas = {d.pk: working_intervals(d, desde, hasta, tz) for d in missing}
+        con_jornada = [d for d in missing if jornadas[d.pk]]
+        busy = {}
+        if con_jornada:
+            busy = _load_busy(
+                con_jornada,
+                min(jornadas[d.pk][0][0] for d in con_jornada),
+                max(jornadas[d.pk][-1][1] for d in con_jornada),
+            )
+
+        computed = {
+            d.pk: subtract_busy(jornadas[d.pk], busy.get(d.pk, [])) for d in missing
+        }
+        cache.set_many({keys[pk]: value for pk, value in computed.items()}, CACHE_TIMEOUT)
+        result.update(computed)
+
+    return result
+
+
+def find_free_slots(dentistas, desde, hasta, duracion, now=None):
+    """
+    Huecos donde cabe una cita de ``duracion`` minutos.
+
+    Args:
+        dentistas: Dentistas a consultar
+        desde, hasta: Rango de fechas (``date``), inclusive
+        duracion: Duración de la cita en minutos
+        now: Momento a partir del cual se buscan huecos (default: ahora)
+
+    Returns:
+        dict: Lista de huecos ``(inicio, fin)`` por id de dentista
+    """
+    now = (now or timezone.now()).astimezone(dt_timezone.utc)
+    # Empezar en un múltiplo de 5 minutos, no a la hora exacta de la petición
+    now = (now + timedelta(minutes=4, seconds=59)).replace(second=0, microsecond=0)
+    now -= timedelta(minutes=now.minute % 5)
+    minimo = timedelta(minutes=duracion)
+
+    result = {}
+    for dentista_id, intervals in free_intervals(dentistas, desde, hasta).items():
+        huecos = []
+        for inicio, fin in intervals:
+            inicio = max(inicio, now)
+            if fin - inicio >= minimo:
+                huecos.append((inicio, fin))
+        result[dentista_id] = huecos
+    return result
+
+
+def slot_starts(huecos, duracion, paso):
+    """Horas de inicio posibles cada ``paso`` minutos dentro de los huecos"""
+    duracion = timedelta(minutes=duracion)
+    paso = timedelta(minutes=paso)
+    starts = []
+    for inicio, fin in huecos:
+        hora = inicio
+        while hora + duracion <= fin:
+            starts.append(hora)
+            hora += paso
+    return starts
@@ -4,19 +4,16 @@ Handles all email notifications related to appointments functionality.
 """
 
 import logging
-import resend
 from typing import Optional, Dict, Any
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils import timezone
+from emails import outbox
 from .models import Cita
 
 logger = logging.getLogger(__name__)
 
-# Configure Resend API
-resend.api_key = "re_FPCt2fuB_6Fct8cxW19Bct73QqFjZGbEV"
-
 
 class AppointmentEmailServiceError(Exception):
     """Custom exception for appointment email service errors."""
@@ -30,59 +27,64 @@ class AppointmentEmailService:
     Features:
     - Appointment confirmation emails
     - Template-based emails with HTML/text versions
-    - Integration with Resend API
+    - Delivery through the email outbox (Resend provider)
     - Error handling and logging
     """
     
     def __init__(self):
         self.from_email = "DentalERP <onboarding@resend.dev>"
         self.subject_prefix = getattr(settings, 'EMAIL_SUBJECT_PREFIX', '[Dental ERP] ')
+        self.ultimo_email = None
         
     def _send_email_with_resend(
         self, 
         to_email: str,
         subject: str, 
         html_content: str,
-        text_content: Optional[str] = None
+        text_content: Optional[str] = None,
+        categoria: str = '',
+        clave_idempotencia: Optional[str] = None
     ) -> bool:
         """
-        Internal method to send email using Resend API.
+        Queue an email for delivery through Resend.
+        
+        The email is stored in the outbox (see ``emails.outbox``) and sent by
+        the ``process_email_outbox`` worker, so the request never waits on
+        the provider. The queued message is kept in ``self.ultimo_email``.
         
         Args:
             to_email: Recipient email address
             subject: Email subject
             html_content: HTML version of the message
             text_content: Optional plain text version
+            categoria: Notification type stored with the queued email
+            clave_idempotencia: Optional key; queuing the same key twice
+                returns the email already queued
             
         Returns:
-            bool: True if email was sent successfully, False otherwise
+            bool: True if the email was queued, False otherwise
         """
+        self.ultimo_email = None
         try:
             if not to_email:
                 logger.warning("No recipient email provided")
                 return False
-                
-            # Add subject prefix
-            full_subject = f"{self.subject_prefix}{subject}"
-            
-            email_data = {
-                "from": self.from_email,
-                "to": to_email,
-                "subject": full_subject,
-                "html": html_content
-            }
             
-            if text_content:
-                email_data["text"] = text_content
-            
-            # Send email using Resend
-            response = resend.Emails.send(email_data)
-            
-            logger.info(f"Email sent successfully to {to_email}: {subject} - ID: {response}")
+            self.ultimo_email = outbox.enqueue(
+                destinatarios=[to_email],
+                asunto=f"{self.subject_prefix}{subject}",
+                html=html_content,
+                texto=text_content or '',
+                remitente=self.from_email,
+                proveedor='resend',
+                categoria=categoria,
+                clave_idempotencia=clave_idempotencia,
+            )
+            logger.info(f"Email queued for {to_email}: {subject} - ID: {self.ultimo_email.pk}")
             return True
             
         except Exception as e:
-            logger.error(f"Failed to send email to {to_email} with subject '{subject}': {str(e)}")
+            logger.error(f"Failed to queue email to {to_email} with subject '{subject}': {str(e)}")
             return False
     
     def _render_email_template(
@@ -122,15 +124,16 @@ class AppointmentEmailService:
             logger.error(f"Failed to render email template '{template_name}': {str(e)}")
             raise AppointmentEmailServiceError(f"Template rendering failed: {str(e)}")
     
-    def send_appointment_confirmation_email(self, cita: Cita) -> bool:
+    def send_appointment_confirmation_email(self, cita: Cita, clave_idempotencia: Optional[str] = None) -> bool:
         """
         Send confirmation email when an appointment is created or confirmed.
         
         Args:
             cita: The appointment object
+            clave_idempotencia: Optional key to avoid queuing the email twice
             
         Returns:
-            bool: True if email was sent successfully
+            bool: True if the email was queued
         """
         try:
             # Check if patient has email
@@ -155,22 +158,25 @@ class AppointmentEmailService:
                 to_email=cita.paciente.email,
                 subject=subject,
                 html_content=html_content,
-                text_content=text_content
+                text_content=text_content,
+                categoria='cita_confirmacion',
+                clave_idempotencia=clave_idempotencia
             )
             
         except Exception as e:
             logger.error(f"Failed to send appointment confirmation for {cita.numero_cita}: {str(e)}")
             return False
     
-    def send_appointment_reminder_email(self, cita: Cita) -> bool:
+    def send_appointment_reminder_email(self, cita: Cita, clave_idempotencia: Optional[str] = None) -> bool:
         """
         Send reminder email for upcoming appointment.
         
         Args:
             cita: The appointment object
+            clave_idempotencia: Optional key to avoid queuing the email twice
             
         Returns:
-            bool: True if email was sent successfully
+            bool: True if the email was queued
         """
         try:
             if not cita.paciente or not cita.paciente.email:
@@ -191,23 +197,26 @@ class AppointmentEmailService:
                 to_email=cita.paciente.email,
                 subject=subject,
                 html_content=html_content,
-                text_content=text_content
+                text_content=text_content,
+                categoria='cita_recordatorio',
+                clave_idempotencia=clave_idempotencia
             )
             
         except Exception as e:
             logger.error(f"Failed to send appointment reminder for {cita.numero_cita}: {str(e)}")
             return False
     
-    def send_appointment_cancellation_email(self, cita: Cita, motivo: str = '') -> bool:
+    def send_appointment_cancellation_email(self, cita: Cita, motivo: str = '', clave_idempotencia: Optional[str] = None) -> bool:
         """
         Send cancellation email when an appointment is cancelled.
         
         Args:
             cita: The cancelled appointment object
             motivo: Reason for cancellation
+            clave_idempotencia: Optional key to avoid queuing the email twice
             
         Returns:
-            bool: True if email was sent successfully
+            bool: True if the email was queued
         """
         try:
             if not cita.paciente or not cita.paciente.email:
@@ -229,7 +238,9 @@ class AppointmentEmailService:
                 to_email=cita.paciente.email,
                 subject=subject,
                 html_content=html_content,
-                text_content=text_content
+                text_content=text_content,
+                categoria='cita_cancelacion',
+                clave_idempotencia=clave_idempotencia
             )
             
         except Exception as e:
@@ -15,7 +15,7 @@ from .models import Cita
 logger = logging.getLogger(__name__)
 
 # Configure Resend API
-resend.api_key = "re_FPCt2fuB_6Fct8cxW19Bct73QqFjZGbEV"
+resend.api_key = settings.RESEND_API_KEY
 
 
 class AppointmentEmailServiceError(Exception):
@@ -0,0 +1,99 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from datetime import date, timedelta
+from rest_framework.renderers import JSONRenderer
+from citas.models import Cita
+from citas.serializers import CitaReadSerializer, CitaSerializer
+from dental_erp.renderers import FastJSONRenderer
+from dentistas.models import Dentista
+from pacientes.management.commands.benchmark_autocomplete import APELLIDOS, NOMBRES
+from pacientes.models import Paciente
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la serialización de un listado de citas: CitaSerializer + JSONRenderer de DRF '
+        'contra CitaReadSerializer (dental_erp.fast_serializers) + FastJSONRenderer. Los datos '
+        'sintéticos se crean dentro de una transacción que se revierte al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Citas a serializar')
+        parser.add_argument('--pacientes', type=int, default=200, help='Pacientes entre los que se reparten')
+        parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por ruta (se reporta la mejor)')
+        parser.add_argument('--seed', type=int, default=7, help='Semilla aleatoria')
+
+    def medir(self, nombre, filas, repeticiones, funcion):
+        mejor = None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            tamano = len(funcion())
+            segundos = time.perf_counter() - inicio
+            mejor = segundos if mejor is None else min(mejor, segundos)
+        self.stdout.write(
+            f"- {nombre}: {filas} filas en {mejor:.3f} segundos "
+            f"({filas / mejor:.0f} filas/s, {tamano / 1024 / 1024:.1f} MB)"
+        )
+        return filas / mejor
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        filas = options['rows']
+
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username='benchmark-serializacion', first_name='Ana', last_name='López'
+            )
+            dentista = Dentista.objects.create(
+                user=user, cedula_profesional='BENCH-SER-0001', universidad='UNAM',
+                anio_graduacion=2010, telefono='5555555555', fecha_nacimiento=date(1980, 1, 1),
+                direccion='-', fecha_ingreso=date(2020, 1, 1),
+                horario_inicio='08:00', horario_fin='17:00',
+            )
+            pacientes = Paciente.objects.bulk_create([
+                Paciente(
+                    creado_por=dentista, nombre=rng.choice(NOMBRES),
+                    apellido_paterno=rng.choice(APELLIDOS), apellido_materno=rng.choice(APELLIDOS),
+                    fecha_nacimiento=date(1990, 5, 10), sexo=rng.choice('MF'), telefono='5512345678',
+                    email=f'benchmark-serializacion{i}@ejemplo.com', direccion='Av. Reforma 100, CDMX',
+                    numero_expediente=f'BENCH-SER-{i:06d}', contacto_emergencia_nombre='Contacto',
+                    contacto_emergencia_telefono='5500000000', contacto_emergencia_relacion='Familiar',
+                )
+                for i in range(options['pacientes'])
+            ])
+
+            # bulk_create no pasa por Cita.save(): las citas no se traslapan
+            # porque cada una ocupa su propia media hora
+            inicio = timezone.now().replace(minute=0, second=0, microsecond=0)
+            Cita.objects.bulk_create([
+                Cita(
+                    paciente=rng.choice(pacientes), dentista=dentista,
+                    fecha_hora=inicio + timedelta(minutes=30 * i), duracion_estimada=30,
+                    estado=rng.choice(['programada', 'confirmada', 'completada']),
+                    motivo_consulta='Revisión', numero_cita=f'BENCH-SER-{i:07d}',
+                )
+                for i in range(filas)
+            ], batch_size=1000)
+            queryset = Cita.objects.select_related('paciente', 'dentista__user', 'tratamiento')
+
+            self.stdout.write(f"Serializando {filas} citas...")
+            drf = self.medir(
+                'ModelSerializer + JSONRenderer', filas, options['repeat'],
+                lambda: JSONRenderer().render(CitaSerializer(queryset, many=True).data)
+            )
+            serializer = CitaReadSerializer()
+            rapido = self.medir(
+                'FastSerializer + FastJSONRenderer', filas, options['repeat'],
+                lambda: FastJSONRenderer().render(serializer.serialize_queryset(queryset))
+            )
+
+            # No dejar datos sintéticos en la base de datos
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Benchmark completado (datos revertidos): {rapido / drf:.1f}x más filas/s con la ruta rápida"
+        ))
@@ -0,0 +1,85 @@
+from django.db import migrations
+
+# Restricción de exclusión: un dentista no puede tener dos citas activas cuyos
+# intervalos se traslapen. timestamptz + interval no es IMMUTABLE en general
+# (depende de la zona horaria con días o meses), pero sí lo es con minutos,
+# por eso el rango se calcula en una función propia.
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    """
+    CREATE OR REPLACE FUNCTION cita_rango(inicio timestamptz, duracion integer)
+    RETURNS tstzrange AS $$
+        SELECT tstzrange(inicio, inicio + duracion * interval '1 minute', '[)')
+    $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    """,
+    """
+    ALTER TABLE citas_cita ADD CONSTRAINT citas_cita_sin_traslape
+    EXCLUDE USING gist (dentista_id WITH =, cita_rango(fecha_hora, duracion_estimada) WITH &&)
+    WHERE (estado IN ('programada', 'confirmada', 'en_curso'))
+    """,
+]
+
+DROP_SQL = [
+    "ALTER TABLE citas_cita DROP CONSTRAINT IF EXISTS citas_cita_sin_traslape",
+    "DROP FUNCTION IF EXISTS cita_rango(timestamptz, integer)",
+]
+
+# Citas activas que ya se traslapan y que impedirían crear la restricción
+OVERLAPS_SQL = """
+    SELECT a.dentista_id, a.numero_cita, a.fecha_hora, b.numero_cita, b.fecha_hora
+    FROM citas_cita a
+    JOIN citas_cita b ON a.dentista_id = b.dentista_id AND a.id < b.id
+    WHERE a.estado IN ('programada', 'confirmada', 'en_curso')
+      AND b.estado IN ('programada', 'confirmada', 'en_curso')
+      AND a.fecha_hora < b.fecha_hora + b.duracion_estimada * interval '1 minute'
+      AND b.fecha_hora < a.fecha_hora + a.duracion_estimada * interval '1 minute'
+    ORDER BY a.dentista_id, a.fecha_hora
+"""
+
+# Pares de citas que se muestran en el error
+MAX_OVERLAPS_SHOWN = 50
+
+
+def create_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(OVERLAPS_SQL)
+        overlaps = cursor.fetchall()
+    if overlaps:
+        # Los traslapes se corrigen a mano (reprogramar o cancelar una de
+        # las citas) y después se vuelve a ejecutar ``migrate``
+        lines = [
+            f"  dentista {dentista_id}: {numero_a} ({inicio_a:%Y-%m-%d %H:%M}) "
+            f"se traslapa con {numero_b} ({inicio_b:%Y-%m-%d %H:%M})"
+            for dentista_id, numero_a, inicio_a, numero_b, inicio_b in overlaps[:MAX_OVERLAPS_SHOWN]
+        ]
+        if len(overlaps) > MAX_OVERLAPS_SHOWN:
+            lines.append(f"  ... y {len(overlaps) - MAX_OVERLAPS_SHOWN} pares más")
+        raise RuntimeError(
+            f"No se puede crear la restricción citas_cita_sin_traslape: hay {len(overlaps)} "
+            "pares de citas activas traslapadas. Reprograme o cancele una cita de cada par "
+            "y vuelva a ejecutar migrate.\n" + "\n".join(lines)
+        )
+
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_constraint, drop_constraint),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 import uuid
 
+from dental_erp import sequences
+from . import scheduling
+
 class Cita(models.Model):
     ESTADOS_CITA = [
         ('programada', 'Programada'),
@@ -86,30 +89,64 @@ class Cita(models.Model):
                 raise ValidationError("No se puede programar una cita en el pasado")
         
         # Validar conflictos de horario del dentista
-        if self.dentista and self.fecha_hora:
-            conflictos = Cita.objects.filter(
-                dentista=self.dentista,
-                fecha_hora__date=self.fecha_hora.date(),
-                estado__in=['programada', 'confirmada', 'en_curso']
-            ).exclude(pk=self.pk)
-            
-            for cita in conflictos:
-                inicio_existente = cita.fecha_hora
-                fin_existente = cita.fecha_hora + timezone.timedelta(minutes=cita.duracion_estimada)
-                inicio_nueva = self.fecha_hora
-                fin_nueva = self.fecha_hora + timezone.timedelta(minutes=self.duracion_estimada)
-                
-                if (inicio_nueva < fin_existente and fin_nueva > inicio_existente):
-                    raise ValidationError(f"Conflicto de horario con la cita {cita.numero_cita}")
+        if self.horario_cambio() and not scheduling.uses_exclusion_constraint():
+            self.validar_conflictos()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._horario_guardado = instance._horario()
+        return instance
+    
+    def _horario(self):
+        """Campos que determinan si la cita ocupa la agenda y en qué intervalo"""
+        # Se lee __dict__ para no cargar campos diferidos
+        return tuple(self.__dict__.get(campo) for campo in
+                     ('dentista_id', 'fecha_hora', 'duracion_estimada', 'estado'))
+    
+    def horario_cambio(self):
+        """
+        Indica si hay que buscar traslapes al guardar.
+        
+        No hace falta si la cita no está activa, ni si solo cambiaron campos
+        que no afectan el horario (confirmar, agregar notas, etc.).
+        """
+        if not (self.dentista_id and self.fecha_hora and self.estado in scheduling.ACTIVE_STATES):
+            return False
+        
+        guardado = getattr(self, '_horario_guardado', None)
+        if guardado is None:
+            return True
+        
+        dentista_id, fecha_hora, duracion, estado = guardado
+        return (
+            (dentista_id, fecha_hora, duracion) != (self.dentista_id, self.fecha_hora, self.duracion_estimada)
+            or estado not in scheduling.ACTIVE_STATES
+        )
+    
+    def validar_conflictos(self):
+        """Buscar traslapes con una consulta por rango sobre el índice (dentista, fecha_hora)"""
+        if self.duracion_estimada > scheduling.get_max_duration():
+            raise ValidationError(
+                f"La duración no puede exceder {scheduling.get_max_duration()} minutos"
+            )
+        
+        conflictos = scheduling.find_conflicts(
+            self.dentista_id, self.fecha_hora, self.duracion_estimada, exclude_pk=self.pk
+        )
+        if conflictos:
+            raise ValidationError(f"Conflicto de horario con la cita {conflictos[0].numero_cita}")
     
     def save(self, *args, **kwargs):
         if not self.numero_cita:
-            # Generar número de cita automático
+            # Generar número de cita automático (consecutivo por día de la cita)
             fecha_str = self.fecha_hora.strftime('%Y%m%d')
-            ultimo_numero = Cita.objects.filter(
-                fecha_hora__date=self.fecha_hora.date()
-            ).count() + 1
-            self.numero_cita = f"CITA-{fecha_str}-{ultimo_numero:03d}"
+            prefijo = f"CITA-{fecha_str}-"
+            numero = sequences.next_value(
+                f'cita:{fecha_str}',
+                seed=lambda: sequences.max_suffix(Cita.objects, 'numero_cita', prefijo)
+            )
+            self.numero_cita = f"{prefijo}{numero:03d}"
         
         # Si se asigna un tratamiento, copiar la duración estimada
         if self.tratamiento and not self.duracion_estimada != 60:
@@ -120,7 +157,20 @@ class Cita(models.Model):
             self.costo_estimado = self.tratamiento.precio_base
         
         self.clean()
-        super().save(*args, **kwargs)
+        
+        if scheduling.uses_exclusion_constraint(kwargs.get('using') or 'default'):
+            try:
+                with transaction.atomic(using=kwargs.get('using')):
+                    super().save(*args, **kwargs)
+            except IntegrityError as e:
+                if not scheduling.is_overlap_error(e):
+                    raise
+                self.validar_conflictos()
+                raise ValidationError("Conflicto de horario con otra cita")
+        else:
+            super().save(*args, **kwargs)
+        
+        self._horario_guardado = self._horario()
     
     @property
     def fecha_fin_estimada(self):
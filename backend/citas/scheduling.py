@@ -0,0 +1,136 @@
+"""
+Detección de traslapes en la agenda de los dentistas.
+
+Una cita ocupa el intervalo ``[fecha_hora, fecha_hora + duracion_estimada)``
+y solo bloquea la agenda mientras está en un estado activo. Para saber si
+un intervalo choca con otros basta una consulta por rango sobre el índice
+``(dentista, fecha_hora)``: las citas que pueden traslaparse empiezan antes
+del fin del intervalo y como mucho ``CITA_DURACION_MAXIMA`` minutos antes de
+su inicio. El traslape exacto se comprueba después sobre esas pocas filas.
+
+En PostgreSQL la migración ``0002_cita_sin_traslape`` añade además una
+restricción de exclusión sobre un ``tstzrange``; cuando existe, la base de
+datos rechaza el traslape y no hace falta consultar antes de guardar.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+
+# Estados en los que una cita ocupa la agenda del dentista
+ACTIVE_STATES = ('programada', 'confirmada', 'en_curso')
+
+EXCLUSION_CONSTRAINT_NAME = 'citas_cita_sin_traslape'
+
+# Resultado de buscar la restricción de exclusión, por alias de conexión
+_constraint_state = {}
+
+
+def get_max_duration():
+    """Duración máxima de una cita, en minutos"""
+    return getattr(settings, 'CITA_DURACION_MAXIMA', 8 * 60)
+
+
+def overlaps(inicio_a, fin_a, inicio_b, fin_b):
+    return inicio_a < fin_b and fin_a > inicio_b
+
+
+def _candidates(dentista_id, inicio, fin, exclude_pk=None):
+    """Citas activas del dentista que pueden traslaparse con [inicio, fin)"""
+    from .models import Cita
+
+    queryset = Cita.objects.filter(
+        dentista_id=dentista_id,
+        estado__in=ACTIVE_STATES,
+        fecha_hora__gt=inicio - timedelta(minutes=get_max_duration()),
+        fecha_hora__lt=fin,
+    ).only('id', 'numero_cita', 'fecha_hora', 'duracion_estimada').order_by('fecha_hora')
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return list(queryset)
+
+
+def find_conflicts(dentista_id, fecha_hora, duracion_estimada, exclude_pk=None):
+    """
+    Citas activas que se traslapan con el intervalo dado.
+
+    Returns:
+        list: Citas en conflicto, ordenadas por hora de inicio
+    """
+    fin = fecha_hora + timedelta(minutes=duracion_estimada)
+    return [
+        cita for cita in _candidates(dentista_id, fecha_hora, fin, exclude_pk)
+        if overlaps(fecha_hora, fin, cita.fecha_hora, cita.fecha_fin_estimada)
+    ]
+
+
+def check_slots(dentista_id, slots, exclude_pk=None):
+    """
+    Validar varios horarios propuestos con una sola consulta.
+
+    Además de las citas existentes, cada horario se compara con los demás
+    horarios de la lista, que se reservarían juntos.
+
+    Args:
+        dentista_id: Dentista al que se asignarían las citas
+        slots: Lista de tuplas ``(fecha_hora, duracion_estimada)``
+        exclude_pk: Cita a ignorar (por ejemplo, la que se está reagendando)
+
+    Returns:
+        list: Para cada horario, en el mismo orden, un diccionario con
+        ``conflictos`` (citas existentes) y ``traslapa_con`` (índices de
+        otros horarios de la lista)
+    """
+    if not slots:
+        return []
+
+    intervals = [(inicio, inicio + timedelta(minutes=duracion)) for inicio, duracion in slots]
+    existing = _candidates(
+        dentista_id,
+        min(inicio for inicio, _ in intervals),
+        max(fin for _, fin in intervals),
+        exclude_pk,
+    )
+
+    results = []
+    for i, (inicio, fin) in enumerate(intervals):
+        results.append({
+            'conflictos': [
+                cita for cita in existing
+                if overlaps(inicio, fin, cita.fecha_hora, cita.fecha_fin_estimada)
+            ],
+            'traslapa_con': [
+                j for j, (otro_inicio, otro_fin) in enumerate(intervals)
+                if j != i and overlaps(inicio, fin, otro_inicio, otro_fin)
+            ],
+        })
+    return results
+
+
+def uses_exclusion_constraint(using='default'):
+    """Indica si la base de datos valida los traslapes con la restricción de exclusión"""
+    if not getattr(settings, 'CITA_EXCLUSION_CONSTRAINT', True):
+        return False
+
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+
+    if using not in _constraint_state:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_constraint WHERE conname = %s",
+                [EXCLUSION_CONSTRAINT_NAME]
+            )
+            _constraint_state[using] = cursor.fetchone() is not None
+    return _constraint_state[using]
+
+
+def reset_constraint_state():
+    _constraint_state.clear()
+
+
+def is_overlap_error(error):
+    """Indica si un IntegrityError proviene de la restricción de exclusión"""
+    return EXCLUSION_CONSTRAINT_NAME in str(error)
@@ -1,10 +1,35 @@
 from rest_framework import serializers
 from django.utils import timezone
-from datetime import timedelta
 from .models import Cita
+from . import scheduling
 from pacientes.models import Paciente
 from dentistas.models import Dentista
 from tratamientos.models import Tratamiento
+from dental_erp.fast_serializers import FastSerializer, Column, Computed
+
+
+def nombre_paciente(nombre, apellido_paterno, apellido_materno):
+    """Nombre completo del paciente"""
+    return f"{nombre} {apellido_paterno} {apellido_materno or ''}".strip()
+
+
+def formatear_duracion(duracion):
+    """Duración en minutos en formato legible"""
+    if duracion:
+        horas = duracion // 60
+        minutos = duracion % 60
+        if horas > 0:
+            return f"{horas}h {minutos}m" if minutos > 0 else f"{horas}h"
+        return f"{minutos}m"
+    return None
+
+
+def formatear_fecha(fecha_hora):
+    """Fecha en formato legible"""
+    if fecha_hora:
+        return fecha_hora.strftime('%d/%m/%Y %H:%M')
+    return None
+
 
 class CitaSerializer(serializers.ModelSerializer):
     """
@@ -38,7 +63,7 @@ class CitaSerializer(serializers.ModelSerializer):
     def get_paciente_nombre(self, obj):
         """Retorna el nombre completo del paciente"""
         if obj.paciente:
-            return f"{obj.paciente.nombre} {obj.paciente.apellido_paterno} {obj.paciente.apellido_materno or ''}".strip()
+            return nombre_paciente(obj.paciente.nombre, obj.paciente.apellido_paterno, obj.paciente.apellido_materno)
         return None
     
     def get_paciente_email(self, obj):
@@ -61,19 +86,11 @@ class CitaSerializer(serializers.ModelSerializer):
     
     def get_duracion_formateada(self, obj):
         """Retorna la duración en formato legible"""
-        if obj.duracion_estimada:
-            horas = obj.duracion_estimada // 60
-            minutos = obj.duracion_estimada % 60
-            if horas > 0:
-                return f"{horas}h {minutos}m" if minutos > 0 else f"{horas}h"
-            return f"{minutos}m"
-        return None
+        return formatear_duracion(obj.duracion_estimada)
     
     def get_fecha_formateada(self, obj):
         """Retorna la fecha en formato legible"""
-        if obj.fecha_hora:
-            return obj.fecha_hora.strftime('%d/%m/%Y %H:%M')
-        return None
+        return formatear_fecha(obj.fecha_hora)
     
     def validate_fecha_hora(self, value):
         """Validar que la cita no sea en el pasado para citas programadas"""
@@ -92,58 +109,25 @@ class CitaSerializer(serializers.ModelSerializer):
             # Excluir la cita actual si estamos editando
             exclude_id = self.instance.pk if self.instance else None
             
-            conflictos = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['programada', 'confirmada', 'en_curso']
+            conflictos = scheduling.find_conflicts(
+                dentista.pk, fecha_hora, duracion, exclude_pk=exclude_id
             )
             
-            if exclude_id:
-                conflictos = conflictos.exclude(pk=exclude_id)
-            
-            for cita in conflictos:
-                inicio_existente = cita.fecha_hora
-                fin_existente = inicio_existente + timedelta(minutes=cita.duracion_estimada)
-                inicio_nueva = fecha_hora
-                fin_nueva = fecha_hora + timedelta(minutes=duracion)
-                
-                if (inicio_nueva < fin_existente and fin_nueva > inicio_existente):
-                    raise serializers.ValidationError(
-                        f"Conflicto de horario con la cita {cita.numero_cita} "
-                        f"del {inicio_existente.strftime('%d/%m/%Y %H:%M')}"
-                    )
+            if conflictos:
+                cita = conflictos[0]
+                raise serializers.ValidationError(
+                    f"Conflicto de horario con la cita {cita.numero_cita} "
+                    f"del {cita.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
+                )
         
         return data
-    
-    def create(self, validated_data):
-        """Generar número de cita automático"""
-        if not validated_data.get('numero_cita'):
-            # Generar número de cita: CITA-YYYYMMDD-XXXX
-            from datetime import date
-            today = date.today()
-            prefix = f"CITA-{today.strftime('%Y%m%d')}"
-            
-            # Obtener el último número del día
-            ultima_cita = Cita.objects.filter(
-                numero_cita__startswith=prefix
-            ).order_by('-numero_cita').first()
-            
-            if ultima_cita:
-                try:
-                    ultimo_num = int(ultima_cita.numero_cita[-4:])
-                    nuevo_num = ultimo_num + 1
-                except ValueError:
-                    nuevo_num = 1
-            else:
-                nuevo_num = 1
-            
-            validated_data['numero_cita'] = f"{prefix}-{nuevo_num:04d}"
-        
-        return super().create(validated_data)
 
 class CitaListSerializer(serializers.ModelSerializer):
     """
-    Serializer simplificado para listado de citas
+    Serializer simplificado para listado de citas.
+    
+    Los nombres salen de ``paciente``, ``dentista__user`` y ``tratamiento``,
+    que ``CitaViewSet`` carga con ``select_related``.
     """
     paciente_nombre = serializers.SerializerMethodField()
     paciente_email = serializers.SerializerMethodField()
@@ -162,7 +146,7 @@ class CitaListSerializer(serializers.ModelSerializer):
     def get_paciente_nombre(self, obj):
         """Retorna el nombre completo del paciente"""
         if obj.paciente:
-            return f"{obj.paciente.nombre} {obj.paciente.apellido_paterno} {obj.paciente.apellido_materno or ''}".strip()
+            return nombre_paciente(obj.paciente.nombre, obj.paciente.apellido_paterno, obj.paciente.apellido_materno)
         return None
     
     def get_paciente_email(self, obj):
@@ -185,9 +169,31 @@ class CitaListSerializer(serializers.ModelSerializer):
     
     def get_fecha_formateada(self, obj):
         """Retorna la fecha en formato legible"""
-        if obj.fecha_hora:
-            return obj.fecha_hora.strftime('%d/%m/%Y %H:%M')
-        return None
+        return formatear_fecha(obj.fecha_hora)
+
+
+class CitaReadSerializer(FastSerializer):
+    """
+    Misma salida que ``CitaSerializer`` por la ruta rápida de solo lectura
+    (ver ``dental_erp.fast_serializers``), para ``today`` y ``upcoming``
+    """
+    paciente_nombre = Computed(
+        ('paciente__nombre', 'paciente__apellido_paterno', 'paciente__apellido_materno'),
+        nombre_paciente
+    )
+    paciente_email = Column('paciente__email')
+    dentista_nombre = Computed(
+        ('dentista__user__first_name', 'dentista__user__last_name'),
+        lambda first_name, last_name: f"Dr. {first_name} {last_name}"
+    )
+    tratamiento_nombre = Column('tratamiento__nombre')
+    duracion_formateada = Computed(('duracion_estimada',), formatear_duracion)
+    fecha_formateada = Computed(('fecha_hora',), formatear_fecha)
+    
+    class Meta:
+        model = Cita
+        fields = CitaSerializer.Meta.fields
+
 
 class CitaCreateSerializer(serializers.ModelSerializer):
     """
@@ -237,4 +243,35 @@ class CitaCreateSerializer(serializers.ModelSerializer):
                     f"La cita debe estar entre {dentista.horario_inicio} y {dentista.horario_fin}."
                 )
         
-        return super().validate(data)
\ No newline at end of file
+        return super().validate(data)
+
+
+class HorarioPropuestoSerializer(serializers.Serializer):
+    """
+    Horario propuesto para validar en lote
+    """
+    fecha_hora = serializers.DateTimeField()
+    duracion_estimada = serializers.IntegerField(min_value=1, default=60)
+
+
+class ValidarHorariosSerializer(serializers.Serializer):
+    """
+    Serializer para validar varios horarios de un dentista en una sola consulta
+    """
+    dentista = serializers.PrimaryKeyRelatedField(queryset=Dentista.objects.all())
+    horarios = HorarioPropuestoSerializer(many=True, allow_empty=False)
+    excluir_cita = serializers.UUIDField(required=False, allow_null=True)
+    
+    max_horarios = 200
+    
+    def validate_horarios(self, value):
+        if len(value) > self.max_horarios:
+            raise serializers.ValidationError(
+                f"Se pueden validar como máximo {self.max_horarios} horarios."
+            )
+        duracion_maxima = scheduling.get_max_duration()
+        if any(h['duracion_estimada'] > duracion_maxima for h in value):
+            raise serializers.ValidationError(
+                f"La duración no puede exceder {duracion_maxima} minutos."
+            )
+        return value
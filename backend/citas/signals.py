@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from dentistas.models import Dentista
+from . import availability
+from .models import Cita
+
+
+@receiver(post_save, sender=Cita)
+def invalidar_disponibilidad_cita(sender, instance, **kwargs):
+    """Invalidar los huecos libres del dentista (y del anterior, si cambió)"""
+    guardado = getattr(instance, '_horario_guardado', None)
+    availability.invalidate(instance.dentista_id, guardado[0] if guardado else None)
+
+
+@receiver(post_delete, sender=Cita)
+def invalidar_disponibilidad_cita_eliminada(sender, instance, **kwargs):
+    availability.invalidate(instance.dentista_id)
+
+
+@receiver(post_save, sender=Dentista)
+def invalidar_disponibilidad_dentista(sender, instance, **kwargs):
+    """Un cambio de horario o días laborales cambia sus huecos"""
+    availability.invalidate(instance.pk)
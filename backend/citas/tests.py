@@ -1,3 +1,221 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.utils import timezone
+from decimal import Decimal
+
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from dental_erp.renderers import FastJSONRenderer
+from dental_erp.testing import QueryBudgetMixin
+from pacientes.tests import crear_dentista, crear_paciente
+from . import availability
+from .models import Cita
+from .serializers import CitaSerializer
+
+
+class CitaFixtureMixin:
+    
+    def setUp(self):
+        self.dentista = crear_dentista()
+        self.paciente = crear_paciente(self.dentista, 'María', 'García')
+        self.manana = (timezone.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+    
+    def crear_cita(self, inicio, duracion=60, **kwargs):
+        return Cita.objects.create(
+            paciente=self.paciente,
+            dentista=self.dentista,
+            fecha_hora=inicio,
+            duracion_estimada=duracion,
+            motivo_consulta='Revisión',
+            **kwargs
+        )
+
+
+class CitaConflictTest(CitaFixtureMixin, TestCase):
+    """Tests para la detección de traslapes de horario"""
+    
+    def test_overlap_is_rejected(self):
+        self.crear_cita(self.manana)
+        with self.assertRaises(ValidationError):
+            self.crear_cita(self.manana + timedelta(minutes=30))
+        # Citas contiguas no se traslapan
+        self.crear_cita(self.manana + timedelta(minutes=60))
+    
+    def test_long_appointment_from_previous_day(self):
+        """Una cita que empieza antes del día también cuenta"""
+        self.crear_cita(self.manana - timedelta(hours=3), duracion=240)
+        with self.assertRaises(ValidationError):
+            self.crear_cita(self.manana + timedelta(minutes=30))
+    
+    def test_inactive_appointments_do_not_block(self):
+        self.crear_cita(self.manana, estado='cancelada')
+        self.crear_cita(self.manana)
+    
+    def test_status_change_skips_conflict_query(self):
+        """Confirmar o cancelar no vuelve a buscar traslapes"""
+        cita = Cita.objects.get(pk=self.crear_cita(self.manana).pk)
+        with self.assertNumQueries(1):
+            cita.estado = 'confirmada'
+            cita.save()
+        with self.assertNumQueries(1):
+            cita.notas_dentista = 'Paciente puntual'
+            cita.save()
+    
+    def test_reactivation_is_checked(self):
+        cancelada = self.crear_cita(self.manana, estado='cancelada')
+        self.crear_cita(self.manana)
+        cancelada.estado = 'programada'
+        with self.assertRaises(ValidationError):
+            cancelada.save()
+
+
+class ValidateSlotsAPITest(CitaFixtureMixin, APITestCase):
+    """Tests para la validación de horarios en lote"""
+    
+    def test_validate_slots(self):
+        self.crear_cita(self.manana)
+        horarios = [
+            {'fecha_hora': self.manana + timedelta(minutes=30), 'duracion_estimada': 30},
+            {'fecha_hora': self.manana + timedelta(hours=2), 'duracion_estimada': 60},
+            {'fecha_hora': self.manana + timedelta(hours=2, minutes=30), 'duracion_estimada': 30},
+            {'fecha_hora': self.manana + timedelta(hours=5), 'duracion_estimada': 45},
+        ]
+        
+        with self.assertNumQueries(2):  # dentista + citas en el rango
+            response = self.client.post('/api/citas/validate_slots/', {
+                'dentista': str(self.dentista.pk),
+                'horarios': [{**h, 'fecha_hora': h['fecha_hora'].isoformat()} for h in horarios],
+            }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['disponibles'])
+        resultados = response.data['horarios']
+        self.assertEqual([r['disponible'] for r in resultados], [False, False, False, True])
+        self.assertEqual(len(resultados[0]['conflictos']), 1)
+        self.assertEqual(resultados[1]['traslapa_con'], [2])
+
+
+class AvailableSlotsAPITest(CitaFixtureMixin, APITestCase):
+    """Tests para la validación de parámetros de horarios libres"""
+    
+    url = '/api/citas/available_slots/'
+    
+    def test_invalid_ids(self):
+        for params in ({'dentista': 'no-es-uuid'}, {'especialidad': '1 OR 1=1'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_minimum_step(self):
+        params = {'dentista': str(self.dentista.pk), 'duracion': 30}
+        response = self.client.get(self.url, {**params, 'paso': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get(self.url, {**params, 'paso': availability.MIN_SLOT_STEP})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['dentistas'][0]['id'], str(self.dentista.pk))
+
+
+class CitaListQueryBudgetTest(QueryBudgetMixin, CitaFixtureMixin, APITestCase):
+    """El listado de citas no consulta por fila"""
+    
+    def test_list_query_budget(self):
+        creadas = []
+        
+        def crear(n):
+            for _ in range(n):
+                dentista = crear_dentista(f'lista{len(creadas)}')
+                paciente = crear_paciente(dentista, 'Paciente', f'Lista{len(creadas)}')
+                creadas.append(Cita.objects.create(
+                    paciente=paciente,
+                    dentista=dentista,
+                    fecha_hora=self.manana + timedelta(hours=len(creadas)),
+                    motivo_consulta='Revisión'
+                ))
+        
+        self.assertListQueryBudget('/api/citas/', crear)
+        data = self.client.get('/api/citas/').json()['results']
+        self.assertTrue(all(cita['dentista_nombre'].startswith('Dr.') for cita in data))
+
+
+class CitaReadSerializerTest(CitaFixtureMixin, APITestCase):
+    """La ruta rápida produce exactamente la salida de CitaSerializer"""
+    
+    def test_upcoming_matches_model_serializer(self):
+        from tratamientos.models import CategoriaTratamiento, Tratamiento
+        
+        categoria = CategoriaTratamiento.objects.create(nombre="General")
+        tratamiento = Tratamiento.objects.create(
+            nombre="Limpieza", categoria=categoria, descripcion="Limpieza",
+            precio_base=Decimal('500.00'), duracion_estimada=30
+        )
+        self.crear_cita(self.manana, duracion=90, tratamiento=tratamiento, costo_estimado=Decimal('750.5'))
+        self.crear_cita(self.manana + timedelta(hours=3), duracion=45, notas_dentista='Dolor \u2028 agudo')
+        cancelada = self.crear_cita(self.manana + timedelta(hours=5))
+        cancelada.fecha_cancelacion = timezone.now()
+        cancelada.save()
+        
+        response = self.client.get('/api/citas/upcoming/')
+        
+        citas = Cita.objects.filter(estado__in=['programada', 'confirmada'])
+        esperado = JSONRenderer().render(CitaSerializer(citas, many=True).data)
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(response.content, esperado)
+        self.assertEqual(len(response.json()), 3)
+
 
-# Create your tests here.
+class AvailabilityTest(CitaFixtureMixin, TestCase):
+    """Tests para la búsqueda de horarios libres"""
+    
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.manana_local = timezone.localtime(self.manana)
+        self.dia = self.manana_local.date()
+        self.inicio_jornada = self.manana_local.replace(hour=8, minute=0)
+    
+    def huecos(self, duracion=60):
+        return availability.find_free_slots(
+            [self.dentista], self.dia, self.dia, duracion, now=self.inicio_jornada - timedelta(days=1)
+        )[self.dentista.pk]
+    
+    def test_free_intervals_around_appointments(self):
+        local = self.inicio_jornada
+        self.crear_cita(local.replace(hour=10))
+        self.crear_cita(local.replace(hour=10, minute=30), estado='cancelada')
+        self.crear_cita(local.replace(hour=12), duracion=30)
+        
+        self.assertEqual(self.huecos(), [
+            (local, local.replace(hour=10)),
+            (local.replace(hour=11), local.replace(hour=12)),
+            (local.replace(hour=12, minute=30), local.replace(hour=17)),
+        ])
+        # Con 90 minutos el hueco de las 11 ya no sirve
+        self.assertEqual(len(self.huecos(duracion=90)), 2)
+    
+    def test_results_are_cached_and_invalidated(self):
+        self.huecos()
+        with self.assertNumQueries(0):
+            self.huecos()
+        
+        self.crear_cita(self.inicio_jornada.replace(hour=9))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.huecos()), 2)
+    
+    def test_slot_starts(self):
+        local = self.inicio_jornada
+        starts = availability.slot_starts([(local, local.replace(hour=9))], 30, 15)
+        self.assertEqual(
+            starts, [local, local.replace(minute=15), local.replace(minute=30)]
+        )
+    
+    def test_non_working_day(self):
+        self.dentista.dias_laborales = ''.join(
+            d for d in '1234567' if d != str(self.dia.isoweekday())
+        )
+        self.dentista.save()
+        self.assertEqual(self.huecos(), [])
@@ -5,17 +5,25 @@ from rest_framework.response import Response
 from django.db.models import Q
 from django.utils import timezone
 from datetime import datetime, timedelta
+import uuid
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 
 from .models import Cita
-from .serializers import CitaSerializer, CitaListSerializer, CitaCreateSerializer
+from dental_erp.eager_loading import EagerLoadingMixin
+from dental_erp.exports import Columna, ExportMixin
+from dentistas.models import Dentista
+from .serializers import (
+    CitaSerializer, CitaListSerializer, CitaCreateSerializer, CitaReadSerializer, ValidarHorariosSerializer
+)
+from . import availability, scheduling
 from .email_service import AppointmentEmailService
+from emails import outbox
 import logging
 
 logger = logging.getLogger(__name__)
 
-class CitaViewSet(viewsets.ModelViewSet):
+class CitaViewSet(EagerLoadingMixin, ExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing appointments (Citas)
     Provides CRUD operations and additional functionality
@@ -27,6 +35,25 @@ class CitaViewSet(viewsets.ModelViewSet):
     search_fields = ['numero_cita', 'paciente__nombre', 'paciente__apellido_paterno', 'motivo_consulta']
     ordering_fields = ['fecha_hora', 'fecha_creacion', 'estado']
     ordering = ['fecha_hora']
+    cursor_ordering = ('fecha_hora',)
+    # CitaListSerializer lee el nombre del dentista de su usuario
+    list_select_related = ('dentista__user',)
+    export_name = 'citas'
+    export_columns = (
+        Columna('numero_cita', 'Número de cita'),
+        Columna('fecha_hora', 'Fecha y hora'),
+        Columna('duracion_estimada', 'Duración (min)'),
+        Columna('tipo_cita', 'Tipo'),
+        Columna('estado', 'Estado'),
+        Columna('paciente', 'Expediente del paciente', 'paciente__numero_expediente'),
+        Columna('paciente_nombre', 'Nombre del paciente', 'paciente__nombre'),
+        Columna('paciente_apellido', 'Apellido del paciente', 'paciente__apellido_paterno'),
+        Columna('dentista', 'Cédula del dentista', 'dentista__cedula_profesional'),
+        Columna('tratamiento', 'Tratamiento', 'tratamiento__nombre'),
+        Columna('motivo_consulta', 'Motivo de consulta'),
+        Columna('costo_estimado', 'Costo estimado'),
+        Columna('fecha_creacion', 'Fecha de creación'),
+    )
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -65,7 +92,7 @@ class CitaViewSet(viewsets.ModelViewSet):
             except ValueError:
                 pass
         
-        return queryset.select_related('paciente', 'dentista', 'tratamiento')
+        return self.eager_load(queryset.select_related('paciente', 'dentista', 'tratamiento'))
 
     def create(self, request, *args, **kwargs):
         """
@@ -107,14 +134,20 @@ class CitaViewSet(viewsets.ModelViewSet):
             cita.estado = 'confirmada'
             cita.save()
             
-            # Enviar email de confirmación
+            # Encolar el email de confirmación; lo envía process_email_outbox.
+            # La clave evita un segundo email si la cita se confirma dos veces
+            # con el mismo horario.
             email_service = AppointmentEmailService()
-            email_enviado = email_service.send_appointment_confirmation_email(cita)
+            email_enviado = email_service.send_appointment_confirmation_email(
+                cita,
+                clave_idempotencia=f'cita-confirmacion:{cita.pk}:{cita.fecha_hora.isoformat()}'
+            )
             
             return Response({
                 'message': 'Cita confirmada exitosamente',
                 'estado': cita.estado,
                 'email_enviado': email_enviado,
+                **outbox.response_fields(email_service.ultimo_email),
                 'paciente_email': cita.paciente.email if cita.paciente else None
             })
             
@@ -134,14 +167,18 @@ class CitaViewSet(viewsets.ModelViewSet):
         
         try:
             email_service = AppointmentEmailService()
-            email_enviado = email_service.send_appointment_confirmation_email(cita)
+            email_enviado = email_service.send_appointment_confirmation_email(
+                cita,
+                clave_idempotencia=outbox.request_key(request, f'cita-reenvio:{cita.pk}')
+            )
             
             if email_enviado:
                 return Response({
-                    'message': 'Email de confirmación enviado exitosamente',
+                    'message': 'Email de confirmación encolado para envío',
                     'email_enviado': True,
+                    **outbox.response_fields(email_service.ultimo_email),
                     'destinatario': cita.paciente.email
-                })
+                }, status=status.HTTP_202_ACCEPTED)
             else:
                 return Response({
                     'message': 'No se pudo enviar el email',
@@ -200,13 +237,137 @@ class CitaViewSet(viewsets.ModelViewSet):
             'estado': cita.estado
         })
     
+    @action(detail=False, methods=['post'])
+    def validate_slots(self, request):
+        """
+        Validar varios horarios propuestos para un dentista en una sola consulta
+        
+        POST /api/citas/validate_slots/
+        {"dentista": "<id>", "horarios": [{"fecha_hora": "...", "duracion_estimada": 60}, ...]}
+        """
+        serializer = ValidarHorariosSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        horarios = data['horarios']
+        resultados = scheduling.check_slots(
+            data['dentista'].pk,
+            [(h['fecha_hora'], h['duracion_estimada']) for h in horarios],
+            exclude_pk=data.get('excluir_cita'),
+        )
+        
+        return Response({
+            'disponibles': all(
+                not r['conflictos'] and not r['traslapa_con'] for r in resultados
+            ),
+            'horarios': [
+                {
+                    'fecha_hora': horario['fecha_hora'],
+                    'duracion_estimada': horario['duracion_estimada'],
+                    'disponible': not resultado['conflictos'] and not resultado['traslapa_con'],
+                    'conflictos': [
+                        {
+                            'id': str(cita.id),
+                            'numero_cita': cita.numero_cita,
+                            'fecha_hora': cita.fecha_hora,
+                            'fecha_fin_estimada': cita.fecha_fin_estimada,
+                        }
+                        for cita in resultado['conflictos']
+                    ],
+                    'traslapa_con': resultado['traslapa_con'],
+                }
+                for horario, resultado in zip(horarios, resultados)
+            ]
+        })
+    
+    @action(detail=False, methods=['get'])
+    def available_slots(self, request):
+        """
+        Horarios libres de un dentista o de los dentistas de una especialidad
+        
+        GET /api/citas/available_slots/?dentista=<id>&desde=2025-06-02&hasta=2025-06-20&duracion=45
+        GET /api/citas/available_slots/?especialidad=<id>&duracion=60&paso=15
+        
+        Con ``paso`` se incluyen también las horas de inicio posibles.
+        """
+        params = request.query_params
+        dentista_id = params.get('dentista')
+        especialidad_id = params.get('especialidad')
+        if not dentista_id and not especialidad_id:
+            return Response(
+                {'error': 'Se requiere el parámetro dentista o especialidad'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            dentista_id = uuid.UUID(dentista_id) if dentista_id else None
+            especialidad_id = uuid.UUID(especialidad_id) if especialidad_id else None
+        except ValueError:
+            return Response(
+                {'error': 'Los parámetros dentista y especialidad deben ser UUID'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            hoy = timezone.localdate()
+            desde = datetime.fromisoformat(params['desde']).date() if params.get('desde') else hoy
+            hasta = datetime.fromisoformat(params['hasta']).date() if params.get('hasta') else desde + timedelta(days=6)
+            duracion = int(params.get('duracion', 60))
+            paso = int(params['paso']) if params.get('paso') else None
+        except ValueError:
+            return Response(
+                {'error': 'Parámetros inválidos: use fechas YYYY-MM-DD y minutos enteros'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        max_dias = availability.MAX_RANGE_DAYS
+        if hasta < desde or (hasta - desde).days >= max_dias:
+            return Response(
+                {'error': f'El rango debe ser de 1 a {max_dias} días'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < duracion <= scheduling.get_max_duration() or (
+            paso is not None and paso < availability.MIN_SLOT_STEP
+        ):
+            return Response(
+                {'error': f'Duración inválida o paso menor a {availability.MIN_SLOT_STEP} minutos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        dentistas = Dentista.objects.filter(activo=True).select_related('user')
+        if dentista_id:
+            dentistas = dentistas.filter(pk=dentista_id)
+        if especialidad_id:
+            dentistas = dentistas.filter(especialidades=especialidad_id)
+        dentistas = list(dentistas)
+        
+        huecos = availability.find_free_slots(dentistas, max(desde, hoy), hasta, duracion)
+        
+        resultado = []
+        for dentista in dentistas:
+            item = {
+                'id': str(dentista.id),
+                'nombre': dentista.nombre_completo,
+                'huecos': [{'inicio': inicio, 'fin': fin} for inicio, fin in huecos[dentista.pk]],
+            }
+            if paso:
+                item['horarios'] = availability.slot_starts(huecos[dentista.pk], duracion, paso)
+            resultado.append(item)
+        
+        return Response({
+            'desde': desde,
+            'hasta': hasta,
+            'duracion': duracion,
+            'dentistas': resultado,
+        })
+    
     @action(detail=False, methods=['get'])
     def today(self, request):
         """Get today's appointments"""
         today = timezone.now().date()
         citas = self.get_queryset().filter(fecha_hora__date=today)
-        serializer = self.get_serializer(citas, many=True)
-        return Response(serializer.data)
+        serializer = CitaReadSerializer(context=self.get_serializer_context())
+        return Response(serializer.serialize_queryset(citas))
     
     @action(detail=False, methods=['get'])
     def upcoming(self, request):
@@ -215,6 +376,6 @@ class CitaViewSet(viewsets.ModelViewSet):
         citas = self.get_queryset().filter(
             fecha_hora__gte=now,
             estado__in=['programada', 'confirmada']
-        )[:10]
-        serializer = self.get_serializer(citas, many=True)
-        return Response(serializer.data)
+        )
+        serializer = CitaReadSerializer(context=self.get_serializer_context())
+        return Response(serializer.serialize(serializer.values_queryset(citas)[:10]))
@@ -0,0 +1,150 @@
+"""
+Caché de lectura (read-through) para datos de referencia.
+
+Los datos que casi nunca cambian (por ahora las especialidades, ver
+``dental_erp.reference_data``) se leen en cada petición. Este módulo
+los guarda en el backend de caché configurado con ``CACHE_URL``
+(memoria local, archivos o Redis) y los invalida automáticamente con las
+señales ``post_save``/``post_delete`` de los modelos de origen.
+
+Cada caché usa un número de versión propio: invalidar consiste en
+incrementar esa versión, de modo que todas las claves anteriores dejan de
+ser alcanzables sin tener que borrarlas una por una.
+"""
+
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+
+# Valor centinela para distinguir "no está en caché" de un valor None guardado
+_MISSING = object()
+
+# Registro de todas las cachés de lectura, indexadas por nombre
+_registry = {}
+
+
+class ReadThroughCache:
+    """
+    Caché de lectura con invalidación por señales y contadores de aciertos.
+
+    Args:
+        name: Nombre único de la caché, usado como prefijo de las claves
+        loader: Función que obtiene el valor desde la base de datos. Recibe
+            los mismos argumentos posicionales que ``get``.
+        models: Modelos (o etiquetas ``'app.Modelo'``) cuyos cambios
+            invalidan la caché
+        timeout: Segundos de vida de cada entrada
+            (default: ``REFERENCE_CACHE_TIMEOUT``)
+    """
+
+    def __init__(self, name, loader, models=(), timeout=None):
+        if name in _registry:
+            raise ValueError(f"Ya existe una caché de lectura llamada '{name}'")
+
+        self.name = name
+        self.loader = loader
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+        for model in models:
+            post_save.connect(
+                self._on_change, sender=model, weak=False,
+                dispatch_uid=f'read_through_cache:{name}:save:{model}'
+            )
+            post_delete.connect(
+                self._on_change, sender=model, weak=False,
+                dispatch_uid=f'read_through_cache:{name}:delete:{model}'
+            )
+
+        _registry[name] = self
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'REFERENCE_CACHE_ALIAS', 'default')]
+
+    def _get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return getattr(settings, 'REFERENCE_CACHE_TIMEOUT', 60 * 60)
+
+    def _version_key(self):
+        return f'read_through:{self.name}:version'
+
+    def _get_version(self):
+        version = self.cache.get(self._version_key())
+        if version is None:
+            self.cache.add(self._version_key(), 1, timeout=None)
+            version = self.cache.get(self._version_key(), 1)
+        return version
+
+    def make_key(self, *args):
+        parts = ':'.join(str(arg) for arg in args)
+        return f'read_through:{self.name}:v{self._get_version()}:{parts}'
+
+    def get(self, *args):
+        """Obtener el valor desde la caché o, si no está, desde el loader"""
+        key = self.make_key(*args)
+        value = self.cache.get(key, _MISSING)
+
+        if value is not _MISSING:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+
+        value = self.loader(*args)
+        self.cache.set(key, value, self._get_timeout())
+        return value
+
+    def invalidate(self):
+        """Invalidar todas las entradas de esta caché"""
+        try:
+            self.cache.incr(self._version_key())
+        except ValueError:
+            self.cache.set(self._version_key(), 2, timeout=None)
+
+        with self._lock:
+            self.invalidations += 1
+
+    def _on_change(self, sender, **kwargs):
+        self.invalidate()
+
+    def get_stats(self):
+        """Contadores de aciertos y fallos de este proceso"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+
+def get_cache_stats():
+    """
+    Obtener los contadores de todas las cachés de lectura registradas.
+
+    Returns:
+        dict: Estadísticas por nombre de caché
+    """
+    return {name: read_cache.get_stats() for name, read_cache in sorted(_registry.items())}
+
+
+def reset_cache_stats():
+    """Reiniciar los contadores de todas las cachés de lectura"""
+    for read_cache in _registry.values():
+        read_cache.reset_stats()
@@ -0,0 +1,115 @@
+"""
+Carga anticipada declarativa para los listados de la API.
+
+Cada vista declara lo que su serializador de listado necesita y el
+serializador sólo lee atributos ya calculados, de modo que el número de
+consultas de una página no depende de cuántas filas tiene:
+
+    class ReviewViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
+        list_select_related = ('user',)
+        list_prefetch_related = ('content_object',)
+        list_annotations = {
+            'media_total': SubqueryCount(ReviewMedia.objects.filter(review=OuterRef('pk'))),
+        }
+
+``select_related``, ``prefetch_related`` y las anotaciones se aplican al
+queryset con ``eager_load`` (las vistas que redefinen ``get_queryset`` lo
+llaman al final). Los ``list_page_prefetchers`` reciben las filas de la
+página ya evaluadas, para datos que no se pueden anotar en SQL (por
+ejemplo los ancestros de un árbol MPTT), y deben resolverlos con una
+consulta para toda la página.
+
+Los serializadores leen los valores con ``get_precomputed``, que vuelve al
+cálculo por fila si la vista no los anotó (por ejemplo en ``retrieve``).
+``dental_erp.testing.QueryBudgetMixin`` comprueba en los tests que un
+listado hace las mismas consultas con una fila que con una página llena.
+"""
+
+from django.db.models import IntegerField, Subquery
+from rest_framework.response import Response
+
+_MISSING = object()
+
+
+class SubqueryCount(Subquery):
+    """
+    ``COUNT(*)`` de un queryset correlacionado (con ``OuterRef``).
+
+    A diferencia de ``Count`` no agrega un JOIN ni un GROUP BY, por lo que
+    varios conteos sobre relaciones distintas no se multiplican entre sí.
+    """
+    template = '(SELECT COUNT(*) FROM (%(subquery)s) _count)'
+    output_field = IntegerField()
+
+    def __init__(self, queryset, **kwargs):
+        super().__init__(queryset.order_by().values('pk'), **kwargs)
+
+
+def get_precomputed(obj, name, compute):
+    """
+    Valor precalculado por la vista o, si no existe, calculado por fila.
+
+    Args:
+        obj: Instancia que se serializa
+        name: Atributo anotado por la vista
+        compute: Callable sin argumentos para cuando no se anotó
+    """
+    value = getattr(obj, name, _MISSING)
+    if value is _MISSING:
+        return compute()
+    return value
+
+
+class EagerLoadingMixin:
+    """
+    Aplica las relaciones y anotaciones declaradas por la vista en las
+    acciones de ``eager_loading_actions``.
+    """
+    eager_loading_actions = ('list',)
+    list_select_related = ()
+    list_prefetch_related = ()
+    list_annotations = {}
+    list_page_prefetchers = ()
+
+    def uses_eager_loading(self):
+        return getattr(self, 'action', None) in self.eager_loading_actions
+
+    def eager_load(self, queryset):
+        """Agregar al queryset lo que necesita el serializador de listado"""
+        if not self.uses_eager_loading():
+            return queryset
+        if self.list_select_related:
+            queryset = queryset.select_related(*self.list_select_related)
+        if self.list_prefetch_related:
+            queryset = queryset.prefetch_related(*self.list_prefetch_related)
+        if self.list_annotations:
+            queryset = queryset.annotate(**self.list_annotations)
+        return queryset
+
+    def prefetch_page(self, objects):
+        """Resolver los datos por página sobre las filas ya evaluadas"""
+        if self.uses_eager_loading() and self.list_page_prefetchers:
+            objects = list(objects)
+            for prefetcher in self.list_page_prefetchers:
+                prefetcher(objects)
+        return objects
+
+    def get_queryset(self):
+        return self.eager_load(super().get_queryset())
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is None:
+            return None
+        return self.prefetch_page(page)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(self.prefetch_page(queryset), many=True)
+        return Response(serializer.data)
@@ -0,0 +1,405 @@
+"""
+Exportaciones masivas en streaming (CSV, NDJSON y XLSX).
+
+Para sacar todo el padrón de pacientes (o todas las citas, facturas o
+movimientos de inventario) no sirve paginar la API de 20 en 20 con un
+serializer por fila. Aquí cada exportación es un ``StreamingHttpResponse``:
+
+- Las filas se leen con ``values_list(...).iterator()``: tuplas en lugar
+  de instancias y, en PostgreSQL, un cursor de servidor, así que la
+  memoria no crece con el número de filas.
+- Cada formato escribe las filas a un búfer que se envía al cliente cada
+  ``FLUSH_BYTES`` bytes.
+- El XLSX se escribe a mano (un zip con la hoja en XML y cadenas en línea)
+  en lugar de con una biblioteca de hojas de cálculo, que construiría el
+  libro completo antes de poder enviarlo.
+
+Las vistas lo usan con ``ExportMixin`` (acción ``exportar``) declarando
+sus columnas en ``export_columns``::
+
+    export_columns = (
+        Columna('numero_expediente', 'Número de expediente'),
+        Columna('edad', 'Edad', 'fecha_nacimiento', edad),
+    )
+
+``GET .../exportar/?formato=csv|ndjson|xlsx`` aplica los mismos filtros
+que el listado.
+"""
+
+import csv
+import datetime
+import decimal
+import io
+import json
+import logging
+import re
+import zipfile
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# Filas leídas de la base de datos por viaje
+CHUNK_SIZE = 2000
+
+# Bytes acumulados antes de enviar un trozo de la respuesta
+FLUSH_BYTES = 64 * 1024
+
+# Filas de una hoja de Excel (incluida la cabecera)
+XLSX_MAX_ROWS = 1048576
+
+
+class Columna(namedtuple('Columna', 'clave titulo campo formato', defaults=(None, None))):
+    """
+    Columna de una exportación.
+
+    Args:
+        clave: Nombre de la columna en NDJSON
+        titulo: Cabecera en CSV y XLSX
+        campo: Campo o lookup a leer (por defecto ``clave``)
+        formato: Función que convierte el valor leído (p. ej. fecha de
+            nacimiento -> edad)
+    """
+
+    @property
+    def lookup(self):
+        return self.campo or self.clave
+
+
+def edad(fecha_nacimiento, hoy=None):
+    """Edad en años cumplidos"""
+    if not fecha_nacimiento:
+        return None
+    hoy = hoy or datetime.date.today()
+    return hoy.year - fecha_nacimiento.year - (
+        (hoy.month, hoy.day) < (fecha_nacimiento.month, fecha_nacimiento.day)
+    )
+
+
+def filas(queryset, columnas, chunk_size=CHUNK_SIZE):
+    """
+    Valores de cada fila, en el orden de ``columnas``.
+
+    Lee solo los campos necesarios, como tuplas y por lotes.
+    """
+    lookups = list(dict.fromkeys(columna.lookup for columna in columnas))
+    posiciones = [lookups.index(columna.lookup) for columna in columnas]
+    formatos = [columna.formato for columna in columnas]
+    rows = queryset.prefetch_related(None).values_list(*lookups).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield [
+            formato(row[i]) if formato else row[i]
+            for i, formato in zip(posiciones, formatos)
+        ]
+
+
+def _texto(valor):
+    """Representación de un valor en CSV y NDJSON"""
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime.datetime):
+        return timezone.localtime(valor).isoformat() if timezone.is_aware(valor) else valor.isoformat()
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    return str(valor)
+
+
+# Primeros caracteres con los que Excel y LibreOffice interpretan una celda
+# como fórmula
+_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _celda_csv(valor):
+    """
+    Texto de una celda CSV sin riesgo de inyección de fórmulas.
+
+    Los textos que empiezan como una fórmula se prefijan con ``'``; los
+    números (también los negativos) se escriben tal cual.
+    """
+    texto = _texto(valor)
+    if isinstance(valor, str) and texto.startswith(_FORMULA):
+        return "'" + texto
+    return texto
+
+
+class CSVWriter:
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def __init__(self, columnas, nombre=''):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.columnas = columnas
+
+    def _drain(self):
+        data = self.buffer.getvalue().encode('utf-8')
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def start(self):
+        # BOM para que Excel lea los acentos como UTF-8
+        self.buffer.write('\ufeff')
+        self.writer.writerow([columna.titulo for columna in self.columnas])
+        return self._drain()
+
+    def write(self, row):
+        self.writer.writerow([_celda_csv(valor) for valor in row])
+        if self.buffer.tell() >= FLUSH_BYTES:
+            return self._drain()
+        return b''
+
+    def finish(self):
+        return self._drain()
+
+
+class NDJSONWriter:
+    content_type = 'application/x-ndjson; charset=utf-8'
+    extension = 'ndjson'
+
+    def __init__(self, columnas, nombre=''):
+        self.claves = [columna.clave for columna in columnas]
+        self.partes = []
+        self.size = 0
+
+    def _drain(self):
+        data = ''.join(self.partes).encode('utf-8')
+        self.partes = []
+        self.size = 0
+        return data
+
+    def start(self):
+        return b''
+
+    def write(self, row):
+        linea = json.dumps(
+            dict(zip(self.claves, row)), ensure_ascii=False, default=_texto, separators=(',', ':')
+        ) + '\n'
+        self.partes.append(linea)
+        self.size += len(linea)
+        if self.size >= FLUSH_BYTES:
+            return self._drain()
+        return b''
+
+    def finish(self):
+        return self._drain()
+
+
+class _Salida:
+    """Destino del zip sin ``seek``: acumula lo escrito hasta recogerlo"""
+
+    def __init__(self):
+        self.partes = []
+        self.size = 0
+
+    def write(self, data):
+        self.partes.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.partes)
+        self.partes = []
+        self.size = 0
+        return data
+
+
+# Caracteres que XML 1.0 no admite
+_XML_INVALIDO = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+XLSX_ESTATICOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="2"><xf/><xf fontId="1" applyFont="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+
+class XLSXWriter:
+    content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    extension = 'xlsx'
+
+    def __init__(self, columnas, nombre=''):
+        self.columnas = columnas
+        # Excel limita el nombre de la hoja a 31 caracteres, sin []:*?/\
+        self.hoja = re.sub(r'[\[\]:*?/\\]', '', nombre)[:31] or 'Datos'
+        self.salida = _Salida()
+        self.zip = None
+        self.sheet = None
+        self.rows = 0
+
+    def start(self):
+        self.zip = zipfile.ZipFile(self.salida, 'w', compression=zipfile.ZIP_DEFLATED)
+        for nombre, contenido in XLSX_ESTATICOS.items():
+            self.zip.writestr(nombre, contenido)
+        self.zip.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(self.hoja)}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        # force_zip64: el tamaño de la hoja no se conoce de antemano
+        self.sheet = self.zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self.sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            b'<sheetData>'
+        )
+        self._row([columna.titulo for columna in self.columnas], estilo=' s="1"')
+        return self.salida.drain()
+
+    @staticmethod
+    def _cell(valor, estilo=''):
+        if valor is None or valor == '':
+            return ''
+        if isinstance(valor, bool):
+            return f'<c t="b"{estilo}><v>{int(valor)}</v></c>'
+        if isinstance(valor, (int, float, decimal.Decimal)):
+            return f'<c{estilo}><v>{valor}</v></c>'
+        texto = escape(_XML_INVALIDO.sub('', _texto(valor)))
+        return f'<c t="inlineStr"{estilo}><is><t xml:space="preserve">{texto}</t></is></c>'
+
+    def _row(self, row, estilo=''):
+        self.rows += 1
+        cells = ''.join(self._cell(valor, estilo) for valor in row)
+        self.sheet.write(f'<row>{cells}</row>'.encode('utf-8'))
+
+    def write(self, row):
+        if self.rows >= XLSX_MAX_ROWS:
+            if self.rows == XLSX_MAX_ROWS:
+                logger.warning("Exportación XLSX recortada a %s filas", XLSX_MAX_ROWS - 1)
+                self.rows += 1
+            return b''
+        self._row(row)
+        if self.salida.size >= FLUSH_BYTES:
+            return self.salida.drain()
+        return b''
+
+    def finish(self):
+        self.sheet.write(b'</sheetData></worksheet>')
+        self.sheet.close()
+        self.zip.close()
+        return self.salida.drain()
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'ndjson': NDJSONWriter,
+    'xlsx': XLSXWriter,
+}
+
+
+def stream(queryset, columnas, formato='csv', nombre=''):
+    """
+    Generador con los bytes de la exportación.
+
+    Args:
+        queryset: Filas a exportar (con sus filtros y su orden)
+        columnas: Secuencia de ``Columna``
+        formato: 'csv', 'ndjson' o 'xlsx'
+        nombre: Nombre de la hoja en XLSX
+    """
+    writer = WRITERS[formato](columnas, nombre)
+    data = writer.start()
+    if data:
+        yield data
+    for row in filas(queryset, columnas):
+        data = writer.write(row)
+        if data:
+            yield data
+    data = writer.finish()
+    if data:
+        yield data
+
+
+def response(queryset, columnas, formato='csv', nombre='exportacion'):
+    """``StreamingHttpResponse`` con la exportación como archivo adjunto"""
+    writer = WRITERS[formato]
+    response = StreamingHttpResponse(
+        stream(queryset, columnas, formato, nombre), content_type=writer.content_type
+    )
+    archivo = f"{nombre}-{timezone.localdate():%Y%m%d}.{writer.extension}"
+    response['Content-Disposition'] = f'attachment; filename="{archivo}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class ExportMixin:
+    """
+    Acción ``exportar`` para un ViewSet: exporta en streaming todas las
+    filas del listado (``get_queryset`` y los filtros de la vista) con las
+    columnas de ``export_columns``.
+
+    La acción exige un usuario autenticado aunque el ViewSet permita
+    acceso anónimo: devuelve el listado completo de una sola vez.
+    """
+    export_columns = ()
+    export_name = None
+
+    @action(
+        detail=False, methods=['get'], url_path='exportar',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def exportar(self, request):
+        """
+        Exporta el listado completo, sin paginar.
+        ``?formato=csv`` (por defecto), ``ndjson`` o ``xlsx``.
+        """
+        formato = request.query_params.get('formato', 'csv').lower()
+        if formato not in WRITERS:
+            return Response(
+                {'error': f"Formato no válido. Opciones: {', '.join(WRITERS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        nombre = self.export_name or str(queryset.model._meta.verbose_name_plural).lower().replace(' ', '-')
+        return response(queryset, self.export_columns, formato, nombre)
@@ -0,0 +1,279 @@
+"""
+Serialización de solo lectura sin la maquinaria de campos de DRF.
+
+En los listados de mucho volumen, una vez resueltas las consultas N+1, el
+costo dominante es ``to_representation`` campo por campo. ``FastSerializer``
+declara los campos una sola vez, lee las columnas con ``values_list`` y
+genera (una vez por clase) una función que arma los diccionarios
+directamente desde las tuplas:
+
+    class CitaReadSerializer(FastSerializer):
+        paciente_nombre = Computed(
+            ('paciente__nombre', 'paciente__apellido_paterno'),
+            lambda nombre, apellido: f"{nombre} {apellido}"
+        )
+
+        class Meta:
+            model = Cita
+            fields = ['id', 'fecha_hora', 'estado', 'paciente_nombre']
+
+Los campos del modelo se convierten igual que en ``ModelSerializer``: UUID
+y decimales como texto, fechas en ISO 8601 en la zona horaria activa,
+archivos como URL absoluta y llaves foráneas como su pk. ``Column`` lee otra
+columna (``'categoria__nombre'``) o una anotación de ``Meta.annotations``;
+``Computed`` recibe los valores crudos de sus columnas; ``Related``
+serializa el objeto de una llave foránea con otro ``FastSerializer``, con
+una consulta por página; y ``Placeholder`` reserva la posición de un dato
+que completa quien llama. La salida debe coincidir con la del serializador
+de DRF equivalente, y los tests lo comprueban.
+
+No valida ni escribe: las vistas lo usan sólo en acciones de lectura.
+"""
+
+import datetime
+import decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import timezone
+from rest_framework.settings import ISO_8601, api_settings
+
+
+class Column:
+    """Columna del queryset (campo, ruta ``a__b`` o anotación)"""
+
+    def __init__(self, source=None):
+        self.source = source
+
+
+class Computed:
+    """Campo calculado a partir de los valores crudos de otras columnas"""
+
+    def __init__(self, sources, function):
+        self.sources = tuple(sources)
+        self.function = function
+
+
+class Related:
+    """Objeto de una llave foránea serializado con otro ``FastSerializer``"""
+
+    def __init__(self, serializer_class, source=None):
+        self.serializer_class = serializer_class
+        self.source = source
+
+
+class Placeholder:
+    """Campo que se emite como None para que lo complete quien llama"""
+
+
+def resolve_field(model, path):
+    """Campo del modelo al final de una ruta ``a__b``, o None si es una anotación"""
+    field = None
+    for part in path.split('__'):
+        if model is None:
+            return None
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model
+    return field
+
+
+def datetime_converter():
+    """Igual que ``serializers.DateTimeField.to_representation``"""
+    output_format = api_settings.DATETIME_FORMAT
+    if output_format is None:
+        return None
+    field_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def convert(value):
+        if field_timezone is not None:
+            if timezone.is_aware(value):
+                value = value.astimezone(field_timezone)
+            else:
+                value = timezone.make_aware(value, field_timezone)
+        elif timezone.is_aware(value):
+            value = timezone.make_naive(value, datetime.timezone.utc)
+
+        if output_format.lower() != ISO_8601:
+            return value.strftime(output_format)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def date_converter():
+    """Igual que ``serializers.DateField.to_representation``"""
+    output_format = api_settings.DATE_FORMAT
+    if output_format is None:
+        return None
+    if output_format.lower() == ISO_8601:
+        return datetime.date.isoformat
+    return lambda value: value.strftime(output_format)
+
+
+def decimal_converter(field):
+    """Igual que ``serializers.DecimalField.to_representation``"""
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+
+    if not api_settings.COERCE_DECIMAL_TO_STRING:
+        return lambda value: value.quantize(exponent, context=context)
+    return lambda value: '{:f}'.format(value.quantize(exponent, context=context))
+
+
+def file_converter(field, request):
+    """Igual que ``serializers.FileField.to_representation`` con URL"""
+    storage = field.storage
+
+    def convert(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
+
+
+def get_converter(field, context):
+    """Conversión de DRF para un campo del modelo, o None si no hace falta"""
+    if field is None or field.is_relation:
+        # Las llaves foráneas se representan con su pk, como PrimaryKeyRelatedField
+        return None
+    if isinstance(field, models.DateTimeField):
+        return datetime_converter()
+    if isinstance(field, models.DateField):
+        return date_converter()
+    if isinstance(field, models.DecimalField):
+        return decimal_converter(field)
+    if isinstance(field, models.FileField):
+        return file_converter(field, context.get('request'))
+    if isinstance(field, models.UUIDField):
+        return str
+    return None
+
+
+class FastSerializer:
+    """
+    Serializador de solo lectura compilado a partir de ``Meta.fields``.
+
+    ``Meta.annotations`` se agrega al queryset antes de leer las columnas y
+    ``Meta.extra`` lista columnas que se leen sin emitirse (por ejemplo para
+    armar un árbol con ``lft``/``rght``). La primera columna es siempre la pk.
+    """
+
+    class Meta:
+        model = None
+        fields = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+
+    @classmethod
+    def compile(cls):
+        """Plan de columnas y función generada, calculados una vez por clase"""
+        compiled = cls.__dict__.get('_compiled')
+        if compiled is not None:
+            return compiled
+
+        meta = cls.Meta
+        columns = ['pk']
+        positions = {'pk': 0}
+
+        def column(source):
+            if source not in positions:
+                positions[source] = len(columns)
+                columns.append(source)
+            return positions[source]
+
+        # Argumentos de la función generada: ('converter', campo),
+        # ('function', callable) o ('related', (serializador, posición))
+        arguments = []
+        items = []
+        for name in meta.fields:
+            declared = getattr(cls, name, None)
+            if isinstance(declared, Computed):
+                sources = [column(source) for source in declared.sources]
+                arguments.append(('function', declared.function))
+                value = 'c{}({})'.format(len(arguments) - 1, ', '.join(f'v{p}' for p in sources))
+            elif isinstance(declared, Related):
+                position = column(declared.source or name)
+                arguments.append(('related', (declared.serializer_class, position)))
+                value = f'c{len(arguments) - 1}.get(v{position})'
+            elif isinstance(declared, Placeholder):
+                value = 'None'
+            else:
+                source = declared.source if isinstance(declared, Column) and declared.source else name
+                position = column(source)
+                field = resolve_field(meta.model, source)
+                value = f'v{position}'
+                if get_converter(field, {}) is not None:
+                    arguments.append(('converter', field))
+                    value = f'(None if v{position} is None else c{len(arguments) - 1}(v{position}))'
+            items.append(f'{name!r}: {value}')
+        for source in getattr(meta, 'extra', ()):
+            column(source)
+
+        code = 'def serialize(rows{}):\n    return [{{{}}} for ({},) in rows]\n'.format(
+            ''.join(f', c{i}' for i in range(len(arguments))),
+            ', '.join(items),
+            ', '.join(f'v{i}' for i in range(len(columns))),
+        )
+        namespace = {}
+        exec(compile(code, f'<{cls.__name__}>', 'exec'), namespace)
+
+        compiled = cls._compiled = (columns, arguments, namespace['serialize'])
+        return compiled
+
+    @property
+    def columns(self):
+        """Columnas que lee ``values_queryset``, en orden"""
+        return self.compile()[0]
+
+    def values_queryset(self, queryset):
+        """Queryset de tuplas con las columnas que necesita el serializador"""
+        annotations = getattr(self.Meta, 'annotations', None)
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset.values_list(*self.columns)
+
+    def serialize(self, rows):
+        """
+        Serializar tuplas leídas con ``values_queryset``.
+
+        Returns:
+            list: Un diccionario por fila, en el mismo orden
+        """
+        columns, arguments, serialize = self.compile()
+        rows = rows if isinstance(rows, list) else list(rows)
+
+        values = []
+        for kind, data in arguments:
+            if kind == 'converter':
+                values.append(get_converter(data, self.context))
+            elif kind == 'function':
+                values.append(data)
+            else:
+                serializer_class, position = data
+                values.append(self.serialize_related(serializer_class, {row[position] for row in rows}))
+
+        return serialize(rows, *values)
+
+    def serialize_related(self, serializer_class, pks):
+        """Objetos relacionados de la página, indexados por pk"""
+        pks.discard(None)
+        if not pks:
+            return {}
+        serializer = serializer_class(context=self.context)
+        model = serializer.Meta.model
+        rows = list(serializer.values_queryset(model._default_manager.filter(pk__in=pks)))
+        return dict(zip((row[0] for row in rows), serializer.serialize(rows)))
+
+    def serialize_queryset(self, queryset):
+        """Atajo para ``serialize(values_queryset(queryset))``"""
+        return self.serialize(self.values_queryset(queryset))
@@ -0,0 +1,182 @@
+"""
+Colas de trabajos en una tabla con reservas (leases) y reintentos.
+
+``emails.outbox``, ``imagenes.jobs`` y ``pacientes.procesamiento`` guardan
+sus trabajos como filas y los ejecutan desde un comando en segundo plano.
+Las tres siguen el mismo protocolo, que vive aquí; cada cola solo declara
+su modelo y los nombres de sus campos y estados con ``LeaseQueue``:
+
+- ``claim``: un worker toma los trabajos pendientes (o los ``running`` cuya
+  reserva venció porque su worker murió) marcándolos ``running`` hasta
+  ``now + lease`` y contando el intento. En PostgreSQL varios workers se
+  reparten la cola con ``SELECT ... FOR UPDATE SKIP LOCKED``; en las demás
+  bases de datos cada trabajo se reserva con un UPDATE condicional y solo es
+  del worker si el UPDATE lo modificó.
+- ``finish``: el resultado solo se guarda si la reserva sigue siendo de este
+  worker (mismo estado y mismo número de intento).
+- ``fail``: los errores se reintentan con espera exponencial
+  (``base * 2^(intento - 1)``, opcionalmente con tope y variación aleatoria)
+  hasta el máximo de intentos; los errores permanentes marcan el trabajo
+  como fallido al primer intento.
+
+La duración de la reserva y la espera base se leen de los settings en cada
+llamada, así que ``override_settings`` funciona en los tests.
+"""
+
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+def _setting(name, default):
+    return getattr(settings, name, default) if name else default
+
+
+class LeaseQueue:
+    """
+    Protocolo de reservas de una cola.
+
+    Args:
+        model: Modelo de los trabajos
+        status: Campo de estado y sus valores ``pending``, ``running`` y ``failed``
+        available_at: Campo con la fecha a partir de la cual se puede tomar
+        locked_until: Campo con el fin de la reserva
+        attempts, max_attempts: Campos con los intentos hechos y permitidos
+        error: Campo donde se guarda el último error
+        order_by: Orden en que se toman los trabajos
+        started_at, finished_at: Campos opcionales con el inicio del último
+            intento y su fin
+        lease: ``(setting, segundos por defecto)`` de la reserva
+        retry_base: ``(setting, segundos por defecto)`` de la espera base
+        retry_max: ``(setting, segundos por defecto)`` del tope de la espera
+        jitter: Esperar entre la mitad y el total de la espera calculada,
+            para que los trabajos que fallaron juntos no se reintenten juntos
+    """
+
+    def __init__(self, model, *, status, pending, running, failed, available_at, locked_until,
+                 attempts, max_attempts, error, order_by, started_at=None, finished_at=None,
+                 lease=(None, 10 * 60), retry_base=(None, 30), retry_max=(None, None), jitter=False):
+        self.model = model
+        self.status = status
+        self.pending = pending
+        self.running = running
+        self.failed = failed
+        self.available_at = available_at
+        self.locked_until = locked_until
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.error = error
+        self.order_by = tuple(order_by)
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.lease = lease
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.jitter = jitter
+
+    def due(self):
+        """Trabajos que se pueden tomar ahora"""
+        now = timezone.now()
+        return (
+            Q(**{self.status: self.pending, f'{self.available_at}__lte': now})
+            | Q(**{self.status: self.running, f'{self.locked_until}__lt': now})
+        )
+
+    def claim(self, limit, select_related=()):
+        """
+        Reservar hasta ``limit`` trabajos, en el orden de ``order_by``.
+
+        Returns:
+            list: Trabajos reservados, ya marcados ``running`` y con el
+            intento contado
+        """
+        using = router.db_for_write(self.model)
+        manager = self.model._default_manager.using(using)
+        now = timezone.now()
+        reserva = {
+            self.status: self.running,
+            self.locked_until: now + timedelta(seconds=_setting(*self.lease)),
+            self.attempts: F(self.attempts) + 1,
+        }
+        if self.started_at:
+            reserva[self.started_at] = now
+        queryset = manager.filter(self.due()).order_by(*self.order_by)
+
+        if connections[using].features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=using):
+                ids = list(
+                    queryset.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit]
+                )
+                manager.filter(pk__in=ids).update(**reserva)
+        else:
+            ids = [
+                pk for pk in queryset.values_list('pk', flat=True)[:limit]
+                if manager.filter(self.due(), pk=pk).update(**reserva)
+            ]
+
+        if not ids:
+            return []
+        queryset = manager.filter(pk__in=ids).order_by(*self.order_by)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        return list(queryset)
+
+    def finish(self, job, **fields):
+        """
+        Guardar el resultado si la reserva sigue siendo de este worker.
+
+        Returns:
+            int: 1 si se guardó, 0 si otro worker tomó el trabajo
+        """
+        fields[self.locked_until] = None
+        if self.finished_at:
+            fields.setdefault(self.finished_at, timezone.now())
+        return self.model._default_manager.filter(**{
+            'pk': job.pk,
+            self.status: self.running,
+            self.attempts: getattr(job, self.attempts),
+        }).update(**fields)
+
+    def retry_delay(self, attempts, retry_after=None):
+        """
+        Segundos de espera antes del siguiente intento.
+
+        Args:
+            attempts: Intentos hechos
+            retry_after: Espera mínima pedida por el servicio externo
+        """
+        delay = _setting(*self.retry_base) * 2 ** max(attempts - 1, 0)
+        maximum = _setting(*self.retry_max)
+        if maximum is not None:
+            delay = min(maximum, delay)
+        if self.jitter:
+            delay = random.uniform(delay / 2, delay)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def fail(self, job, error, permanent=False, retry_after=None, **fields):
+        """
+        Reintentar el trabajo más tarde o marcarlo como fallido.
+
+        Args:
+            permanent: No reintentar aunque queden intentos
+            retry_after: Ver ``retry_delay``
+            fields: Otros campos a guardar
+
+        Returns:
+            str: El estado en que queda: ``pending`` o ``failed``
+        """
+        fields[self.error] = str(error)
+        attempts = getattr(job, self.attempts)
+        if permanent or attempts >= getattr(job, self.max_attempts):
+            self.finish(job, **{self.status: self.failed}, **fields)
+            return self.failed
+        delay = self.retry_delay(attempts, retry_after)
+        fields[self.available_at] = timezone.now() + timedelta(seconds=delay)
+        self.finish(job, **{self.status: self.pending}, **fields)
+        return self.pending
@@ -0,0 +1,322 @@
+"""
+Paginación de los listados de la API.
+
+``StandardPagination`` es la clase por defecto (``DEFAULT_PAGINATION_CLASS``).
+Por defecto se comporta igual que ``PageNumberPagination`` y añade dos
+opciones que el cliente elige en cada petición:
+
+- ``?pagination=cursor``: paginación por clave (keyset). En lugar de
+  ``OFFSET`` se filtra a partir de la última fila vista usando el orden
+  indexado de la vista (``cursor_ordering``) más la clave primaria como
+  desempate, de modo que la página 500 cuesta lo mismo que la primera.
+  Las respuestas incluyen enlaces ``next``/``previous`` con un ``cursor``
+  opaco; cualquier petición con ``cursor`` sigue en este modo.
+- ``?count=exact|approx|none``: cómo calcular el total. ``approx`` usa la
+  estimación del planificador en PostgreSQL y un conteo acotado en otras
+  bases de datos; ``none`` omite el ``COUNT``. En modo cursor el total se
+  omite salvo que se pida.
+
+Las vistas activan el modo cursor declarando ``cursor_ordering``, por
+ejemplo ``cursor_ordering = ('-fecha_movimiento',)``.
+"""
+
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+COUNT_MODES = ('exact', 'approx', 'none')
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Conserva los microsegundos, que DjangoJSONEncoder recorta"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def get_approx_count_cap():
+    return getattr(settings, 'PAGINATION_APPROX_COUNT_CAP', 1000)
+
+
+def estimate_count(queryset):
+    """
+    Estimar el número de filas de un queryset sin recorrerlo completo.
+
+    Returns:
+        tuple: (total, es_estimado)
+    """
+    connection = connections[queryset.db]
+
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), True
+
+    # Conteo acotado: como mucho se leen ``cap`` filas
+    cap = get_approx_count_cap()
+    total = queryset.order_by()[:cap].count()
+    return total, total >= cap
+
+
+class KeysetPaginator:
+    """
+    Paginación por clave sobre un orden fijo más la clave primaria.
+
+    Args:
+        ordering: Campos de orden, con ``-`` para descendente
+        page_size: Filas por página
+    """
+
+    def __init__(self, ordering, page_size):
+        self.ordering = list(ordering)
+        self.page_size = page_size
+
+    def _order_fields(self, reverse):
+        fields = self.ordering + ['-pk' if self.ordering[-1].startswith('-') else 'pk']
+        if reverse:
+            fields = [f[1:] if f.startswith('-') else f'-{f}' for f in fields]
+        return fields
+
+    def _position(self, instance):
+        return [getattr(instance, f.lstrip('-')) for f in self.ordering] + [instance.pk]
+
+    def _after(self, fields, position):
+        """
+        Filtro "después de ``position``" en el orden de ``fields``.
+
+        Se expresa como un rango sobre el primer campo más la comparación
+        lexicográfica del resto, para que la base de datos pueda usar el
+        índice del primer campo.
+        """
+        names = [f.lstrip('-') for f in fields]
+        lookups = ['lt' if f.startswith('-') else 'gt' for f in fields]
+
+        condition = Q()
+        for i in range(len(fields)):
+            term = Q(**{f'{names[i]}__{lookups[i]}': position[i]})
+            for j in range(i):
+                term &= Q(**{names[j]: position[j]})
+            condition |= term
+
+        first = f"{names[0]}__{'lte' if lookups[0] == 'lt' else 'gte'}"
+        return Q(**{first: position[0]}) & condition
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, cls=CursorEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            raw = payload['p']
+            model_fields = [
+                queryset.model._meta.get_field(f.lstrip('-')) for f in self.ordering
+            ] + [queryset.model._meta.pk]
+            if len(raw) != len(model_fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(model_fields, raw)]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound('Cursor inválido')
+
+    def paginate(self, queryset, cursor=None):
+        """
+        Obtener una página.
+
+        Returns:
+            tuple: (filas, cursor_siguiente, cursor_anterior)
+        """
+        position, reverse = (None, False)
+        if cursor:
+            position, reverse = self.decode_cursor(queryset, cursor)
+
+        fields = self._order_fields(reverse)
+        queryset = queryset.order_by(*fields)
+        if position is not None:
+            queryset = queryset.filter(self._after(fields, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return rows, None, None
+
+        first, last = self._position(rows[0]), self._position(rows[-1])
+        if reverse:
+            next_cursor = self.encode_cursor(last, False)
+            previous_cursor = self.encode_cursor(first, True) if has_more else None
+        else:
+            next_cursor = self.encode_cursor(last, False) if has_more else None
+            previous_cursor = self.encode_cursor(first, True) if position is not None else None
+
+        return rows, next_cursor, previous_cursor
+
+
+class StandardPagination(PageNumberPagination):
+    """
+    Paginación por número de página con modo cursor y conteo opcionales.
+
+    Ver el docstring del módulo para los parámetros que acepta.
+    """
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def get_count_mode(self, request, default):
+        mode = request.query_params.get(self.count_query_param, default)
+        if mode not in COUNT_MODES:
+            raise ValidationError({
+                self.count_query_param: f"Debe ser uno de: {', '.join(COUNT_MODES)}"
+            })
+        return mode
+
+    def get_cursor_ordering(self, request, view):
+        """
+        Orden para el modo cursor, o None si la vista no lo admite.
+
+        Si el cliente pidió ``?ordering=`` con el mismo campo en sentido
+        contrario se respeta; cualquier otro orden no es compatible.
+        """
+        ordering = list(getattr(view, 'cursor_ordering', None) or [])
+        if not ordering:
+            return None
+
+        requested = request.query_params.get('ordering')
+        if requested and len(ordering) == 1:
+            field = ordering[0].lstrip('-')
+            if requested.lstrip('-') == field:
+                return [requested]
+            raise ValidationError({
+                'ordering': f"La paginación por cursor solo admite ordenar por '{field}'"
+            })
+        return ordering
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.mode = 'page'
+        self.count = None
+        self.count_is_estimate = False
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        if self.use_cursor(request):
+            ordering = self.get_cursor_ordering(request, view)
+            if ordering is None:
+                raise ValidationError({
+                    self.mode_query_param: 'Este listado no admite paginación por cursor'
+                })
+            return self._paginate_cursor(queryset, request, ordering, page_size)
+
+        count_mode = self.get_count_mode(request, 'exact')
+        if count_mode == 'exact':
+            return super().paginate_queryset(queryset, request, view)
+        return self._paginate_offset(queryset, request, page_size, count_mode)
+
+    def _paginate_cursor(self, queryset, request, ordering, page_size):
+        self.mode = 'cursor'
+        count_mode = self.get_count_mode(request, 'none')
+        if count_mode == 'exact':
+            self.count = queryset.count()
+        elif count_mode == 'approx':
+            self.count, self.count_is_estimate = estimate_count(queryset)
+
+        paginator = KeysetPaginator(ordering, page_size)
+        rows, self.next_cursor, self.previous_cursor = paginator.paginate(
+            queryset, request.query_params.get(self.cursor_query_param)
+        )
+        return rows
+
+    def _paginate_offset(self, queryset, request, page_size, count_mode):
+        """Paginación por número de página sin el COUNT exacto"""
+        self.mode = 'offset'
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+            if self.page_number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound('Página inválida')
+
+        if count_mode == 'approx':
+            self.count, self.count_is_estimate = estimate_count(queryset)
+
+        start = (self.page_number - 1) * page_size
+        rows = list(queryset[start:start + page_size + 1])
+        if not rows and self.page_number > 1:
+            raise NotFound('Página inválida')
+
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def _cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if self.mode == 'cursor':
+            return self._cursor_link(self.next_cursor)
+        if self.mode == 'offset':
+            if not self.has_next:
+                return None
+            url = self.request.build_absolute_uri()
+            return replace_query_param(url, self.page_query_param, self.page_number + 1)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.mode == 'cursor':
+            return self._cursor_link(self.previous_cursor)
+        if self.mode == 'offset':
+            if self.page_number <= 1:
+                return None
+            url = self.request.build_absolute_uri()
+            if self.page_number == 2:
+                return remove_query_param(url, self.page_query_param)
+            return replace_query_param(url, self.page_query_param, self.page_number - 1)
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        if self.mode == 'page':
+            return super().get_paginated_response(data)
+
+        payload = {}
+        if self.count is not None or self.mode == 'offset':
+            payload['count'] = self.count
+            payload['count_is_estimate'] = self.count_is_estimate
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['count_is_estimate'] = {'type': 'boolean'}
+        response['properties']['count']['nullable'] = True
+        return response
@@ -0,0 +1,24 @@
+"""
+Accesores en caché para las tablas de referencia del ERP.
+
+Las funciones de este módulo sustituyen a las consultas directas sobre
+tablas pequeñas que se leen en casi todas las peticiones. Cada una se
+invalida sola cuando su modelo se guarda o se elimina.
+"""
+
+from .cache import ReadThroughCache
+
+
+def _cargar_especialidades():
+    from dentistas.models import Especialidad
+    return list(Especialidad.objects.filter(activo=True).order_by('nombre'))
+
+
+especialidades_cache = ReadThroughCache(
+    'especialidades', _cargar_especialidades, models=['dentistas.Especialidad']
+)
+
+
+def get_especialidades():
+    """Especialidades activas ordenadas por nombre"""
+    return especialidades_cache.get()
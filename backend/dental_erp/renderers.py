@@ -0,0 +1,49 @@
+"""
+Renderizador JSON de la API.
+
+``FastJSONRenderer`` reemplaza a ``rest_framework.renderers.JSONRenderer``
+en ``DEFAULT_RENDERER_CLASSES``. Si ``orjson`` está instalado lo usa para
+codificar la respuesta; la salida es la misma que la de DRF (UTF-8 compacto,
+decimales como número, fechas en ISO 8601 con ``Z``, U+2028/U+2029
+escapados). Si falta ``orjson``, si el cliente pide ``indent`` o si el valor
+no se puede codificar (por ejemplo enteros de más de 64 bits), se usa el
+renderizador de DRF.
+"""
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer de DRF codificado con orjson cuando está disponible"""
+
+    def __init__(self):
+        self.encoder = JSONEncoder()
+
+    def default(self, obj):
+        # Los tipos que orjson no conoce se convierten como en DRF
+        return self.encoder.default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Igual que DRF: U+2028 y U+2029 son válidos en JSON pero no en JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
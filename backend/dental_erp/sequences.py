@@ -0,0 +1,139 @@
+"""
+Números consecutivos sin colisiones.
+
+``numero_cita``, ``numero_factura``, ``numero_pago`` y ``numero_expediente``
+se calculaban con un ``COUNT(*)`` del día, año o dentista en cada alta: una
+consulta completa por inserción y dos altas simultáneas podían obtener el
+mismo número. Este módulo reparte los números desde la tabla de contadores
+``usuarios.Secuencia``:
+
+- PostgreSQL y SQLite: un solo ``UPDATE ... SET valor = valor + n RETURNING
+  valor``, atómico por sí mismo.
+- Otras bases de datos: ``SELECT ... FOR UPDATE`` y ``UPDATE`` dentro de una
+  transacción.
+
+Cada contador (por ejemplo ``cita:20250608``) se crea la primera vez que se
+usa, partiendo del mayor número ya existente para que la migración desde el
+esquema anterior no repita números. ``allocate`` reserva bloques de números
+con una sola operación, para importaciones masivas.
+
+Si la transacción que usó un número se revierte, ese número queda sin usar:
+los consecutivos son únicos, pero pueden tener huecos.
+"""
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+
+def _secuencia_model():
+    from usuarios.models import Secuencia
+    return Secuencia
+
+
+def _supports_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        import sqlite3
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return False
+
+
+def _increment_returning(connection, table, nombre, cantidad):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET valor = valor + %s, fecha_actualizacion = %s "
+            f"WHERE nombre = %s RETURNING valor",
+            [cantidad, connection.ops.adapt_datetimefield_value(timezone.now()), nombre]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _increment_locked(model, using, nombre, cantidad):
+    with transaction.atomic(using=using):
+        secuencia = model.objects.using(using).select_for_update().filter(nombre=nombre).first()
+        if secuencia is None:
+            return None
+        secuencia.valor += cantidad
+        secuencia.save(using=using, update_fields=['valor', 'fecha_actualizacion'])
+        return secuencia.valor
+
+
+def allocate(nombre, cantidad=1, seed=None, using=None):
+    """
+    Reservar ``cantidad`` números consecutivos de un contador.
+
+    Args:
+        nombre: Nombre del contador, por ejemplo ``'factura:2025'``
+        cantidad: Números a reservar
+        seed: Función sin argumentos que devuelve el último número ya usado;
+            solo se llama si el contador todavía no existe
+        using: Alias de base de datos (default: el de escritura de Secuencia)
+
+    Returns:
+        range: Números reservados
+    """
+    if cantidad < 1:
+        raise ValueError("La cantidad debe ser al menos 1")
+
+    model = _secuencia_model()
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+
+    for _ in range(2):
+        if _supports_returning(connection):
+            ultimo = _increment_returning(connection, table, nombre, cantidad)
+        else:
+            ultimo = _increment_locked(model, using, nombre, cantidad)
+
+        if ultimo is not None:
+            return range(ultimo - cantidad + 1, ultimo + 1)
+
+        # Primer uso del contador: crearlo a partir de los números existentes.
+        # Si otro proceso lo crea al mismo tiempo, se conserva el suyo.
+        inicial = seed() if seed else 0
+        model.objects.using(using).bulk_create(
+            [model(nombre=nombre, valor=inicial)], ignore_conflicts=True
+        )
+
+    raise RuntimeError(f"No se pudo inicializar la secuencia '{nombre}'")
+
+
+def next_value(nombre, seed=None, using=None):
+    """Siguiente número de un contador"""
+    return allocate(nombre, 1, seed=seed, using=using)[0]
+
+
+def max_suffix(queryset, field, prefix):
+    """
+    Mayor número usado con un prefijo, para inicializar un contador.
+
+    Ejemplo: ``max_suffix(Factura.objects, 'numero_factura', 'FAC-2025-')``
+    """
+    ultimo = 0
+    valores = queryset.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+    for valor in valores.iterator():
+        sufijo = valor[len(prefix):]
+        if sufijo.isdigit():
+            ultimo = max(ultimo, int(sufijo))
+    return ultimo
+
+
+def advance(nombre, valor, using=None):
+    """
+    Asegurar que un contador no vuelva a repartir números hasta ``valor``,
+    por ejemplo tras importar registros que conservan su número original.
+    Si el contador todavía no existe no hace nada: se inicializará a partir
+    de los números existentes la primera vez que se use.
+
+    Returns:
+        bool: Si el contador se adelantó
+    """
+    model = _secuencia_model()
+    using = using or router.db_for_write(model)
+    return bool(
+        model.objects.using(using).filter(nombre=nombre, valor__lt=valor)
+        .update(valor=valor, fecha_actualizacion=timezone.now())
+    )
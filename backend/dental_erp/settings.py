@@ -182,6 +182,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Variaciones de imágenes (imagenes.jobs) y miniaturas y metadatos de las
+# imágenes médicas (pacientes.procesamiento)
+# Las subidas encolan trabajos que procesa el comando process_image_jobs.
+# Con True se generan dentro de la petición de subida, como antes.
+IMAGENES_DERIVADOS_SINCRONOS = config('IMAGENES_DERIVADOS_SINCRONOS', default=False, cast=bool)
+# Tiempo que un worker reserva un trabajo antes de que otro pueda tomarlo
+IMAGENES_JOB_LEASE_SECONDS = config('IMAGENES_JOB_LEASE_SECONDS', default=10 * 60, cast=int)
+# Reintentos con espera exponencial: base * 2^(intento - 1) segundos
+IMAGENES_JOB_RETRY_BASE_SECONDS = config('IMAGENES_JOB_RETRY_BASE_SECONDS', default=30, cast=int)
+
+# Variaciones bajo demanda (imagenes.variants): /media/v/<id>/<tamaño>.<formato>
+# genera cada variación al pedirla y la guarda en una caché LRU en disco.
+# Con False se generan todas al subir y se guardan sus URLs en Image.
+IMAGENES_VARIANTES_BAJO_DEMANDA = config('IMAGENES_VARIANTES_BAJO_DEMANDA', default=True, cast=bool)
+IMAGENES_VARIANTES_CACHE_DIR = config('IMAGENES_VARIANTES_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'variantes'))
+IMAGENES_VARIANTES_CACHE_MAX_BYTES = config('IMAGENES_VARIANTES_CACHE_MAX_BYTES', default=2 * 1024 ** 3, cast=int)
+# Variaciones que se generan al subir la imagen, sin esperar a que se pidan
+IMAGENES_VARIANTES_PRECALENTAR = ['thumbnail']
+
+# Subidas por partes de imágenes médicas (pacientes.cargas)
+# Las partes se escriben en este directorio; conviene que esté en el mismo
+# disco que MEDIA_ROOT para que el archivo completo se mueva sin copiarlo.
+IMAGENES_MEDICAS_CARGAS_DIR = config('IMAGENES_MEDICAS_CARGAS_DIR', default=str(BASE_DIR / 'cache' / 'cargas'))
+IMAGENES_MEDICAS_CARGA_MAX_BYTES = config('IMAGENES_MEDICAS_CARGA_MAX_BYTES', default=2 * 1024 ** 3, cast=int)
+# Horas sin recibir partes antes de que limpiar_cargas borre la subida
+IMAGENES_MEDICAS_CARGA_CADUCIDAD_HORAS = config('IMAGENES_MEDICAS_CARGA_CADUCIDAD_HORAS', default=24, cast=int)
+
 # Configuración para desarrollo
 if DEBUG:
     ALLOWED_HOSTS.extend(['localhost', '127.0.0.1', '0.0.0.0'])
@@ -203,6 +230,14 @@ CORS_ALLOWED_ORIGINS = [
 # Permitir credenciales en solicitudes CORS
 CORS_ALLOW_CREDENTIALS = True
 
+# Cabeceras de las subidas por partes (pacientes.cargas)
+CORS_ALLOW_HEADERS = [
+    'accept', 'authorization', 'content-type', 'user-agent', 'x-csrftoken',
+    'x-requested-with', 'upload-offset',
+]
+# Cabeceras que puede leer el navegador (subidas por partes e importación de pacientes)
+CORS_EXPOSE_HEADERS = ['Upload-Offset', 'Upload-Length', 'Location', 'X-Importados', 'X-Rechazados']
+
 # Configuración de archivos estáticos
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -274,14 +309,35 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'dental_erp.pagination.StandardPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        # JSONRenderer de DRF codificado con orjson si está instalado (ver dental_erp.renderers)
+        'dental_erp.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
 
+# Filas que lee como máximo ?count=approx fuera de PostgreSQL (ver dental_erp.pagination)
+PAGINATION_APPROX_COUNT_CAP = config('PAGINATION_APPROX_COUNT_CAP', default=1000, cast=int)
+
+# Búsqueda de texto completo (ver categorias.search_index)
+SEARCH_FULLTEXT_ENABLED = config('SEARCH_FULLTEXT_ENABLED', default=True, cast=bool)
+
+# Autocompletado de pacientes (ver pacientes.autocomplete)
+# 'auto' usa pg_trgm en PostgreSQL y el índice en memoria en otras bases de datos
+PACIENTE_AUTOCOMPLETE_BACKEND = config('PACIENTE_AUTOCOMPLETE_BACKEND', default='auto')
+PACIENTE_AUTOCOMPLETE_THRESHOLD = config('PACIENTE_AUTOCOMPLETE_THRESHOLD', default=0.5, cast=float)
+PACIENTE_AUTOCOMPLETE_REFRESH_SECONDS = config('PACIENTE_AUTOCOMPLETE_REFRESH_SECONDS', default=30, cast=int)
+
+# Agenda de citas (ver citas.scheduling)
+# Duración máxima de una cita en minutos; acota la consulta de traslapes
+CITA_DURACION_MAXIMA = config('CITA_DURACION_MAXIMA', default=480, cast=int)
+# Usar la restricción de exclusión de PostgreSQL cuando existe
+CITA_EXCLUSION_CONSTRAINT = config('CITA_EXCLUSION_CONSTRAINT', default=True, cast=bool)
+# Segundos que se guardan en caché los horarios libres de cada dentista
+CITA_DISPONIBILIDAD_CACHE_TIMEOUT = config('CITA_DISPONIBILIDAD_CACHE_TIMEOUT', default=600, cast=int)
+
 # JWT Configuration
 from datetime import timedelta
 
@@ -346,10 +402,34 @@ SEND_REVIEW_NOTIFICATIONS = config('SEND_REVIEW_NOTIFICATIONS', default=True, ca
 SEND_MODERATION_NOTIFICATIONS = config('SEND_MODERATION_NOTIFICATIONS', default=True, cast=bool)
 SEND_HELPFUL_NOTIFICATIONS = config('SEND_HELPFUL_NOTIFICATIONS', default=False, cast=bool)
 
+# Contadores de reseñas (reviews.counters): acumular los votos útiles en memoria
+# y escribirlos juntos cada REVIEW_COUNTERS_FLUSH_SECONDS (conteo aproximado)
+REVIEW_COUNTERS_BUFFERED = config('REVIEW_COUNTERS_BUFFERED', default=False, cast=bool)
+REVIEW_COUNTERS_FLUSH_SECONDS = config('REVIEW_COUNTERS_FLUSH_SECONDS', default=5, cast=int)
+
 # Notification Email Settings
 ADMIN_EMAIL = config('ADMIN_EMAIL', default='admin@dentalerp.com')
 NOTIFICATION_EMAIL_FROM = config('NOTIFICATION_EMAIL_FROM', default='notifications@dentalerp.com')
 
+# Cola de emails salientes (emails.outbox)
+# Las vistas y señales solo encolan; el comando process_email_outbox envía.
+# Sin clave, el proveedor 'resend' rechaza los envíos (quedan como fallidos)
+RESEND_API_KEY = config('RESEND_API_KEY', default='')
+# Proveedor por tipo de email: 'resend' (citas y pacientes) y 'django' (reseñas).
+# EMAIL_OUTBOX_PROVIDERS permite sustituirlos, p. ej. por emails.providers.FakeProvider
+EMAIL_OUTBOX_PROVIDERS = {}
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+# Reintentos con espera exponencial: base * 2^(intento - 1), hasta el máximo (segundos)
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = config('EMAIL_OUTBOX_RETRY_BASE_SECONDS', default=30, cast=int)
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = config('EMAIL_OUTBOX_RETRY_MAX_SECONDS', default=60 * 60, cast=int)
+# Tiempo que un worker reserva un email antes de que otro pueda tomarlo
+EMAIL_OUTBOX_LEASE_SECONDS = config('EMAIL_OUTBOX_LEASE_SECONDS', default=5 * 60, cast=int)
+# Envíos por segundo por proveedor (Resend admite 2 por segundo por defecto)
+EMAIL_OUTBOX_RATE_LIMITS = {
+    'resend': config('EMAIL_OUTBOX_RESEND_RATE', default=2, cast=float),
+    'django': config('EMAIL_OUTBOX_DJANGO_RATE', default=10, cast=float),
+}
+
 # Configuración de django-compressor para minimizar CSS y JS
 COMPRESS_ENABLED = not DEBUG
 COMPRESS_CSS_FILTERS = [
@@ -368,43 +448,31 @@ COMPRESS_OFFLINE_CONTEXT = {
 }
 
 # Configuración del sistema de caché
-# En desarrollo usamos caché en memoria, en producción recomendamos Redis o Memcached
+# CACHE_URL (django-cache-url) permite elegir el backend sin tocar el código:
+#   locmem://dental-erp-cache          -> caché en memoria (desarrollo y tests)
+#   file:///ruta/django_cache          -> caché basada en archivos
+#   redis://:password@host:6379/0      -> Redis (recomendado en producción)
+import django_cache_url
+
 if DEBUG:
     # Caché en memoria para desarrollo
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-            'LOCATION': 'dental-erp-cache',
-        }
-    }
+    DEFAULT_CACHE_URL = 'locmem://dental-erp-cache'
 else:
     # Caché para producción - usar Redis si está disponible, sino archivo
     REDIS_URL = config('REDIS_URL', default=None)
-    
-    if REDIS_URL:
-        # Configuración para Redis
-        CACHES = {
-            'default': {
-                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-                'LOCATION': REDIS_URL,
-                'OPTIONS': {
-                    'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-                    'IGNORE_EXCEPTIONS': True,
-                }
-            }
-        }
-    else:
-        # Caché basada en archivos como fallback
-        CACHES = {
-            'default': {
-                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-                'LOCATION': os.path.join(BASE_DIR, 'django_cache'),
-                'TIMEOUT': 60 * 60 * 24,  # 24 horas
-                'OPTIONS': {
-                    'MAX_ENTRIES': 1000
-                }
-            }
-        }
+    DEFAULT_CACHE_URL = REDIS_URL or 'file://{}?timeout={}&max_entries=1000'.format(
+        os.path.join(BASE_DIR, 'django_cache'),
+        60 * 60 * 24,  # 24 horas
+    )
+
+CACHE_URL = config('CACHE_URL', default=DEFAULT_CACHE_URL)
+CACHES = {
+    'default': django_cache_url.parse(CACHE_URL),
+}
+
+# Caché de lectura para datos de referencia (ver dental_erp.cache)
+REFERENCE_CACHE_ALIAS = config('REFERENCE_CACHE_ALIAS', default='default')
+REFERENCE_CACHE_TIMEOUT = config('REFERENCE_CACHE_TIMEOUT', default=60 * 60, cast=int)
 
 # Configuraciones de caché para diferentes partes del sistema
 CACHE_MIDDLEWARE_ALIAS = 'default'
@@ -0,0 +1,56 @@
+"""
+Utilidades compartidas por los tests de las aplicaciones.
+"""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Aserciones sobre el número de consultas de los listados de la API.
+
+    Pensado para ``APITestCase``: un listado cumple el presupuesto si hace
+    O(1) consultas por página, es decir, si pedirlo con una página llena no
+    cuesta más consultas que pedirlo con una sola fila.
+    """
+
+    def _get_list(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        data = response.data
+        results = data['results'] if isinstance(data, dict) and 'results' in data else data
+        return len(results), queries
+
+    def assertListQueryBudget(self, url, create_rows, rows=5, max_queries=None, params=None):
+        """
+        Verificar que un listado no hace consultas por fila.
+
+        Se pide el listado con una fila, se crean ``rows - 1`` más y se vuelve
+        a pedir: la segunda petición no puede hacer más consultas que la
+        primera.
+
+        Args:
+            url: Endpoint del listado
+            create_rows: Callable que recibe ``n`` y crea ``n`` filas visibles
+                en el listado
+            rows: Filas de la segunda petición (no más de una página)
+            max_queries: Tope absoluto opcional de consultas por petición
+            params: Parámetros de la petición
+        """
+        create_rows(1)
+        first_count, first = self._get_list(url, params)
+        create_rows(rows - 1)
+        second_count, second = self._get_list(url, params)
+
+        self.assertEqual(second_count, first_count + rows - 1, "Las filas creadas no aparecen en el listado")
+        self.assertLessEqual(
+            len(second), len(first),
+            "{} hace consultas por fila: {} con {} fila(s) y {} con {}:\n{}".format(
+                url, len(first), first_count, len(second), second_count,
+                "\n".join(query['sql'] for query in second.captured_queries)
+            )
+        )
+        if max_queries is not None:
+            self.assertLessEqual(len(second), max_queries)
@@ -29,8 +29,10 @@ urlpatterns = [
     path('', include('citas.urls')),      # URLs de citas
     path('', include('tratamientos.urls')),  # URLs de tratamientos
     path('', include('inventario.urls')), # URLs de inventario
+    path('', include('facturacion.urls')),  # URLs de facturación
     path('', include('dentistas.urls')),  # URLs de dentistas
     path('', include('emails.urls')),     # URLs de emails
+    path('', include('usuarios.urls')),   # URLs de sistema
 ]
 
 # Servir archivos media en desarrollo
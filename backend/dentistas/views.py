@@ -8,6 +8,7 @@ from django.contrib.auth.models import User
 from django.db import transaction
 from .models import Dentista, Especialidad
 from .serializers import DentistaRegistroSerializer, DentistaSerializer
+from dental_erp.reference_data import get_especialidades
 import logging
 
 logger = logging.getLogger(__name__)
@@ -136,7 +137,7 @@ def listar_especialidades(request):
     Vista para listar todas las especialidades disponibles
     """
     try:
-        especialidades = Especialidad.objects.filter(activo=True).order_by('nombre')
+        especialidades = get_especialidades()
         data = [
             {
                 'id': str(esp.id),
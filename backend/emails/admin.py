@@ -0,0 +1,17 @@
+from django.contrib import admin
+from .models import EmailSaliente, EnvioMasivo
+
+
+@admin.register(EmailSaliente)
+class EmailSalienteAdmin(admin.ModelAdmin):
+    list_display = ['asunto', 'categoria', 'proveedor', 'estado', 'intentos', 'proximo_intento', 'fecha_creacion']
+    list_filter = ['estado', 'proveedor', 'categoria']
+    search_fields = ['asunto', 'clave_idempotencia', 'id_proveedor']
+    readonly_fields = ['fecha_creacion', 'fecha_envio', 'id_proveedor', 'ultimo_error']
+
+
+@admin.register(EnvioMasivo)
+class EnvioMasivoAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'asunto', 'estado', 'enviados', 'fallidos', 'ultimo_id', 'fecha_actualizacion']
+    list_filter = ['estado']
+    search_fields = ['nombre', 'asunto']
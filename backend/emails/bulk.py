@@ -0,0 +1,207 @@
+"""
+Envío masivo de emails.
+
+``send_bulk_notification`` mandaba bloques de 50 destinatarios en un solo
+mensaje (todos en el mismo ``To:``), abría una conexión con el servidor por
+bloque y, si el bloque fallaba, daba por perdidos a los 50. ``BulkSender``
+envía un mensaje por destinatario:
+
+- Conexiones persistentes: cada hilo abre una conexión (SMTP o el backend
+  que se use) al empezar y la reutiliza para todos sus mensajes. Con
+  ``concurrency=1`` hay una sola conexión para todo el envío. Si el
+  servidor corta la conexión se abre otra y se reintenta ese mensaje una
+  vez; un destinatario rechazado solo cuenta como fallo de ese destinatario.
+- Paralelismo acotado: como mucho ``concurrency`` envíos simultáneos y el
+  doble de mensajes preparados en memoria, así que los destinatarios pueden
+  venir de un ``iterator()`` de un queryset sin cargarlos todos.
+- Punto de control: los destinatarios llegan como pares ``(clave, email)``
+  en orden creciente de clave. ``checkpoint`` recibe periódicamente la mayor
+  clave hasta la que todo está enviado (o fallado); al reanudar basta con
+  filtrar ``pk > ultimo_id``. Tras una caída solo pueden repetirse los
+  mensajes que estaban en vuelo.
+- Resultados por destinatario con ``on_result`` y un resumen con el
+  rendimiento (mensajes por segundo).
+"""
+
+import smtplib
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.mail import get_connection
+
+# Resultado del envío a un destinatario
+RecipientResult = namedtuple('RecipientResult', ['clave', 'email', 'enviado', 'error', 'duracion_ms'])
+
+# Errores del servidor sobre un mensaje concreto: no se reintentan
+RECIPIENT_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+
+class BulkSender:
+    """
+    Envío de un mensaje individual a cada destinatario.
+
+    Args:
+        build_message: Función ``(clave, email) -> EmailMessage`` que arma el
+            mensaje de un destinatario
+        concurrency: Envíos simultáneos (y conexiones abiertas)
+        connection_factory: Función que devuelve una conexión de Django
+            (default: ``get_connection`` con ``EMAIL_BACKEND``)
+        limiter: ``emails.outbox.RateLimiter`` opcional
+        proveedor: Nombre con el que se consulta ``limiter``
+        on_result: Función llamada con cada ``RecipientResult``
+        checkpoint: Función ``(ultimo_id, enviados, fallidos)`` para guardar
+            el avance
+        checkpoint_every: Resultados entre dos llamadas a ``checkpoint``
+    """
+
+    def __init__(self, build_message, concurrency=4, connection_factory=None, limiter=None,
+                 proveedor='django', on_result=None, checkpoint=None, checkpoint_every=100):
+        self.build_message = build_message
+        self.concurrency = max(1, concurrency)
+        self.connection_factory = connection_factory or (lambda: get_connection(fail_silently=False))
+        self.limiter = limiter
+        self.proveedor = proveedor
+        self.on_result = on_result
+        self.checkpoint = checkpoint
+        self.checkpoint_every = max(1, checkpoint_every)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self.connection_factory()
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _reset_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _send_one(self, clave, email):
+        inicio = time.monotonic()
+        error = None
+        try:
+            message = self.build_message(clave, email)
+            if self.limiter is not None:
+                self.limiter.acquire(self.proveedor)
+            for intento in (1, 2):
+                try:
+                    if not self._connection().send_messages([message]):
+                        raise smtplib.SMTPException('El backend no envió el mensaje')
+                    break
+                except RECIPIENT_ERRORS:
+                    raise
+                except OSError:
+                    # Conexión caída (smtplib.SMTPServerDisconnected, timeout...):
+                    # se abre otra y se reintenta una vez
+                    self._reset_connection()
+                    if intento == 2:
+                        raise
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+
+        return RecipientResult(
+            clave, email, error is None, error, round((time.monotonic() - inicio) * 1000, 1)
+        )
+
+    def send(self, recipients):
+        """
+        Enviar a todos los destinatarios.
+
+        Args:
+            recipients: Iterable de pares ``(clave, email)`` con claves
+                crecientes
+
+        Returns:
+            dict: ``enviados``, ``fallidos``, ``ultimo_id``, ``segundos`` y
+            ``por_segundo``
+        """
+        inicio = time.monotonic()
+        self.enviados = self.fallidos = 0
+        self.ultimo_id = None
+        self._order = deque()
+        self._done = set()
+        self._since_checkpoint = 0
+        pending = {}
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            for clave, email in recipients:
+                while len(pending) >= self.concurrency * 2:
+                    self._collect(pending, FIRST_COMPLETED)
+                pending[executor.submit(self._send_one, clave, email)] = clave
+                self._order.append(clave)
+            self._collect(pending)
+        finally:
+            # Si se interrumpe, los mensajes que no empezaron se cancelan y el
+            # punto de control queda antes del primero de ellos
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            self._collect({f: c for f, c in pending.items() if not f.cancelled()})
+            self._close_connections()
+            self._save_checkpoint()
+
+        segundos = time.monotonic() - inicio
+        total = self.enviados + self.fallidos
+        return {
+            'enviados': self.enviados,
+            'fallidos': self.fallidos,
+            'ultimo_id': self.ultimo_id,
+            'segundos': round(segundos, 3),
+            'por_segundo': round(total / segundos, 1) if segundos else 0.0,
+        }
+
+    def _collect(self, pending, return_when=ALL_COMPLETED):
+        """Procesar los envíos terminados y avanzar el punto de control"""
+        if not pending:
+            return
+        done, _ = wait(list(pending), return_when=return_when)
+        for future in done:
+            clave = pending.pop(future)
+            result = future.result()
+            if result.enviado:
+                self.enviados += 1
+            else:
+                self.fallidos += 1
+            if self.on_result is not None:
+                self.on_result(result)
+            self._done.add(clave)
+
+        while self._order and self._order[0] in self._done:
+            self.ultimo_id = self._order.popleft()
+            self._done.discard(self.ultimo_id)
+
+        self._since_checkpoint += len(done)
+        if self._since_checkpoint >= self.checkpoint_every:
+            self._save_checkpoint()
+
+    def _save_checkpoint(self):
+        self._since_checkpoint = 0
+        if self.checkpoint is not None and self.ultimo_id is not None:
+            self.checkpoint(self.ultimo_id, self.enviados, self.fallidos)
+
+    def _close_connections(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
@@ -4,18 +4,15 @@ Handles welcome emails, reminder emails, and general information emails.
 """
 
 import logging
-import resend
 from typing import Optional, Dict, Any
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils import timezone
+from emails import outbox
 
 logger = logging.getLogger(__name__)
 
-# Configure Resend API
-resend.api_key = "re_FPCt2fuB_6Fct8cxW19Bct73QqFjZGbEV"
-
 
 class GeneralEmailServiceError(Exception):
     """Custom exception for general email service errors."""
@@ -30,73 +27,64 @@ class GeneralEmailService:
     - Welcome emails for new patients
     - Reminder emails
     - General information emails
-    - Integration with Resend API
+    - Delivery through the email outbox (Resend provider)
     - Error handling and logging
     """
     
     def __init__(self):
         self.from_email = "DentalERP <onboarding@resend.dev>"
         self.subject_prefix = getattr(settings, 'EMAIL_SUBJECT_PREFIX', '[Dental ERP] ')
+        self.ultimo_email = None
 
     def _send_email_with_resend(
         self, 
         to_email: str,
         subject: str, 
         html_content: str,
-        text_content: Optional[str] = None
+        text_content: Optional[str] = None,
+        categoria: str = '',
+        clave_idempotencia: Optional[str] = None
     ) -> bool:
         """
-        Internal method to send email using Resend API.
+        Queue an email for delivery through Resend.
+        
+        The email is stored in the outbox (see ``emails.outbox``) and sent by
+        the ``process_email_outbox`` worker, so the request never waits on
+        the provider. The queued message is kept in ``self.ultimo_email``.
         
         Args:
             to_email: Recipient email address
             subject: Email subject
             html_content: HTML version of the message
             text_content: Optional plain text version
+            categoria: Notification type stored with the queued email
+            clave_idempotencia: Optional key; queuing the same key twice
+                returns the email already queued
             
         Returns:
-            bool: True if email was sent successfully, False otherwise
+            bool: True if the email was queued, False otherwise
         """
+        self.ultimo_email = None
         try:
             if not to_email:
                 logger.warning("No recipient email provided")
                 return False
-                
-            # Add subject prefix
-            full_subject = f"{self.subject_prefix}{subject}"
-            
-            email_data = {
-                "from": self.from_email,
-                "to": to_email,
-                "subject": full_subject,
-                "html": html_content
-            }
-            
-            if text_content:
-                email_data["text"] = text_content
             
-            # Send email using Resend
-            response = resend.Emails.send(email_data)
-            
-            logger.info(f"Email sent successfully to {to_email}: {subject} - ID: {response}")
+            self.ultimo_email = outbox.enqueue(
+                destinatarios=[to_email],
+                asunto=f"{self.subject_prefix}{subject}",
+                html=html_content,
+                texto=text_content or '',
+                remitente=self.from_email,
+                proveedor='resend',
+                categoria=categoria,
+                clave_idempotencia=clave_idempotencia,
+            )
+            logger.info(f"Email queued for {to_email}: {subject} - ID: {self.ultimo_email.pk}")
             return True
             
         except Exception as e:
-            error_message = str(e)
-            logger.error(f"Failed to send email to {to_email} with subject '{subject}': {error_message}")
-            
-            # Handle Resend testing limitations gracefully
-            if "testing emails" in error_message or "verify a domain" in error_message:
-                logger.warning(f"Resend testing limitation for {to_email}. In production, this would work with a verified domain.")
-                # For development/testing purposes, we'll return True and log the limitation
-                # In production, you would have a verified domain and this wouldn't happen
-                return True
-            elif "Invalid `to` field" in error_message:
-                logger.warning(f"Invalid email domain for {to_email}. Skipping send for testing purposes.")
-                # For invalid domains, we'll also return True in testing
-                return True
-            
-            # For other errors, return False
+            logger.error(f"Failed to queue email to {to_email} with subject '{subject}': {str(e)}")
             return False
 
     def _generate_welcome_email_html(self, paciente: Dict[str, Any]) -> str:
@@ -362,15 +350,16 @@ class GeneralEmailService:
         </html>
         """
 
-    def send_welcome_email(self, paciente: Dict[str, Any]) -> bool:
+    def send_welcome_email(self, paciente: Dict[str, Any], clave_idempotencia: Optional[str] = None) -> bool:
         """
         Send welcome email to a patient.
         
         Args:
             paciente: Dictionary with patient information
+            clave_idempotencia: Optional key to avoid queuing the email twice
             
         Returns:
-            bool: True if email was sent successfully
+            bool: True if the email was queued
         """
         try:
             to_email = paciente.get('email')
@@ -386,23 +375,26 @@ class GeneralEmailService:
                 to_email=to_email,
                 subject=subject,
                 html_content=html_content,
-                text_content=text_content
+                text_content=text_content,
+                categoria='paciente_bienvenida',
+                clave_idempotencia=clave_idempotencia
             )
             
         except Exception as e:
             logger.error(f"Failed to send welcome email: {str(e)}")
             return False
 
-    def send_reminder_email(self, paciente: Dict[str, Any], cita: Optional[Dict[str, Any]] = None) -> bool:
+    def send_reminder_email(self, paciente: Dict[str, Any], cita: Optional[Dict[str, Any]] = None, clave_idempotencia: Optional[str] = None) -> bool:
         """
         Send reminder email to a patient.
         
         Args:
             paciente: Dictionary with patient information
             cita: Optional dictionary with appointment information
+            clave_idempotencia: Optional key to avoid queuing the email twice
             
         Returns:
-            bool: True if email was sent successfully
+            bool: True if the email was queued
         """
         try:
             to_email = paciente.get('email')
@@ -418,14 +410,16 @@ class GeneralEmailService:
                 to_email=to_email,
                 subject=subject,
                 html_content=html_content,
-                text_content=text_content
+                text_content=text_content,
+                categoria='paciente_recordatorio',
+                clave_idempotencia=clave_idempotencia
             )
             
         except Exception as e:
             logger.error(f"Failed to send reminder email: {str(e)}")
             return False
 
-    def send_general_email(self, paciente: Dict[str, Any], subject: str, message: str) -> bool:
+    def send_general_email(self, paciente: Dict[str, Any], subject: str, message: str, clave_idempotencia: Optional[str] = None) -> bool:
         """
         Send general information email to a patient.
         
@@ -433,9 +427,10 @@ class GeneralEmailService:
             paciente: Dictionary with patient information
             subject: Email subject
             message: Email message content
+            clave_idempotencia: Optional key to avoid queuing the email twice
             
         Returns:
-            bool: True if email was sent successfully
+            bool: True if the email was queued
         """
         try:
             to_email = paciente.get('email')
@@ -450,7 +445,9 @@ class GeneralEmailService:
                 to_email=to_email,
                 subject=subject,
                 html_content=html_content,
-                text_content=text_content
+                text_content=text_content,
+                categoria='paciente_general',
+                clave_idempotencia=clave_idempotencia
             )
             
         except Exception as e:
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from emails import outbox
+from emails.models import EmailSaliente
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Envía los emails de la cola (emails.outbox) con un grupo de hilos, '
+        'reintentando los errores temporales. Sin --once se queda en espera '
+        'de nuevos emails.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Hilos de envío')
+        parser.add_argument('--batch', type=int, default=50, help='Emails reservados por lote')
+        parser.add_argument('--poll', type=float, default=5.0, help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--once', action='store_true', help='Vaciar los emails pendientes y terminar')
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        batch = max(1, options['batch'])
+        limiter = outbox.RateLimiter()
+        totales = {'enviado': 0, 'pendiente': 0, 'fallido': 0}
+
+        self.stdout.write(f"Procesando la cola de emails con {threads} hilo(s)...")
+        executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        try:
+            while True:
+                resumen = outbox.process_batch(batch, executor=executor, limiter=limiter)
+                for estado, cantidad in resumen.items():
+                    totales[estado] += cantidad
+                procesados = sum(resumen.values())
+                if procesados:
+                    self.stdout.write(
+                        f"- Lote: {resumen['enviado']} enviados, "
+                        f"{resumen['pendiente']} por reintentar, {resumen['fallido']} fallidos"
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            self.stdout.write("Interrumpido")
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        pendientes = EmailSaliente.objects.filter(estado='pendiente').count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {totales['enviado']} enviados, {totales['pendiente']} por reintentar, "
+            f"{totales['fallido']} fallidos; {pendientes} pendientes en la cola"
+        ))
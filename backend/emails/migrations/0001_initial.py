@@ -0,0 +1,44 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:59
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSaliente',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('clave_idempotencia', models.CharField(blank=True, help_text='Evita encolar dos veces el mismo email', max_length=200, null=True, unique=True)),
+                ('categoria', models.CharField(blank=True, help_text='Tipo de notificación, por ejemplo cita_confirmacion', max_length=50)),
+                ('proveedor', models.CharField(default='resend', max_length=20)),
+                ('remitente', models.CharField(max_length=200)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('asunto', models.CharField(max_length=255)),
+                ('html', models.TextField(blank=True)),
+                ('texto', models.TextField(blank=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('fallido', 'Fallido')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('max_intentos', models.PositiveIntegerField(default=6)),
+                ('proximo_intento', models.DateTimeField()),
+                ('bloqueado_hasta', models.DateTimeField(blank=True, help_text='Fin de la reserva del worker que lo está enviando', null=True)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('id_proveedor', models.CharField(blank=True, help_text='Id del mensaje en el proveedor', max_length=200)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Email saliente',
+                'verbose_name_plural': 'Emails salientes',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='emails_emai_estado_ccb57b_idx')],
+            },
+        ),
+    ]
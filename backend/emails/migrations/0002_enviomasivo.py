@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioMasivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('asunto', models.CharField(max_length=255)),
+                ('audiencia', models.CharField(blank=True, max_length=50)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('enviados', models.PositiveIntegerField(default=0)),
+                ('fallidos', models.PositiveIntegerField(default=0)),
+                ('estado', models.CharField(choices=[('en_proceso', 'En proceso'), ('completado', 'Completado'), ('interrumpido', 'Interrumpido')], default='en_proceso', max_length=15)),
+                ('fecha_inicio', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Envío masivo',
+                'verbose_name_plural': 'Envíos masivos',
+                'ordering': ['-fecha_inicio'],
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+from django.db import models
+import uuid
+
+
+class EmailSaliente(models.Model):
+    """
+    Email en la cola de salida (outbox).
+    
+    Las vistas y señales solo crean registros; el comando
+    ``process_email_outbox`` los envía con reintentos (ver ``emails.outbox``).
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    clave_idempotencia = models.CharField(
+        max_length=200, unique=True, null=True, blank=True,
+        help_text="Evita encolar dos veces el mismo email"
+    )
+    categoria = models.CharField(max_length=50, blank=True, help_text="Tipo de notificación, por ejemplo cita_confirmacion")
+    proveedor = models.CharField(max_length=20, default='resend')
+    
+    # Contenido
+    remitente = models.CharField(max_length=200)
+    destinatarios = models.JSONField(default=list)
+    asunto = models.CharField(max_length=255)
+    html = models.TextField(blank=True)
+    texto = models.TextField(blank=True)
+    
+    # Entrega
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=6)
+    proximo_intento = models.DateTimeField()
+    bloqueado_hasta = models.DateTimeField(null=True, blank=True, help_text="Fin de la reserva del worker que lo está enviando")
+    ultimo_error = models.TextField(blank=True)
+    id_proveedor = models.CharField(max_length=200, blank=True, help_text="Id del mensaje en el proveedor")
+    
+    # Metadatos
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Email saliente"
+        verbose_name_plural = "Emails salientes"
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento']),
+        ]
+    
+    def __str__(self):
+        return f"{self.asunto} -> {', '.join(self.destinatarios)} ({self.estado})"
+
+
+class EnvioMasivo(models.Model):
+    """
+    Avance de un envío masivo (ver ``emails.bulk``).
+    
+    ``ultimo_id`` es la mayor clave de destinatario hasta la que todo está
+    procesado; el comando ``send_bulk_emails`` reanuda a partir de ella.
+    """
+    ESTADOS = [
+        ('en_proceso', 'En proceso'),
+        ('completado', 'Completado'),
+        ('interrumpido', 'Interrumpido'),
+    ]
+    
+    nombre = models.CharField(max_length=100, unique=True)
+    asunto = models.CharField(max_length=255)
+    audiencia = models.CharField(max_length=50, blank=True)
+    ultimo_id = models.BigIntegerField(default=0)
+    enviados = models.PositiveIntegerField(default=0)
+    fallidos = models.PositiveIntegerField(default=0)
+    estado = models.CharField(max_length=15, choices=ESTADOS, default='en_proceso')
+    fecha_inicio = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Envío masivo"
+        verbose_name_plural = "Envíos masivos"
+        ordering = ['-fecha_inicio']
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.estado}: {self.enviados} enviados, {self.fallidos} fallidos)"
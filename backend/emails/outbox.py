@@ -0,0 +1,259 @@
+"""
+Cola persistente de emails salientes (outbox).
+
+Las vistas y señales no hablan con el proveedor de email: ``enqueue`` guarda
+un ``EmailSaliente`` en la misma transacción que el cambio que lo origina, y
+el comando ``process_email_outbox`` los envía en segundo plano con un grupo
+de hilos. Así una petición nunca espera a Resend ni falla porque Resend
+falle, y si la transacción se revierte el email tampoco sale.
+
+- Idempotencia: ``clave_idempotencia`` es única, así que encolar dos veces
+  la misma notificación (por ejemplo, confirmar una cita dos veces) devuelve
+  el email existente. La misma clave se envía a Resend, que descarta el
+  duplicado si un reintento llega después de un envío que sí se completó.
+- Reintentos: los errores temporales se reintentan con espera exponencial
+  con variación aleatoria (``EMAIL_OUTBOX_RETRY_BASE_SECONDS``,
+  ``EMAIL_OUTBOX_RETRY_MAX_SECONDS``) hasta ``max_intentos``; los errores
+  permanentes marcan el email como fallido al primer intento.
+- Reservas: un worker toma los emails pendientes marcándolos ``enviando``
+  durante ``EMAIL_OUTBOX_LEASE_SECONDS``. Si el worker muere, al vencer la
+  reserva otro worker los vuelve a tomar. En PostgreSQL varios workers
+  reparten la cola con ``SELECT ... FOR UPDATE SKIP LOCKED``. Las reservas
+  y los reintentos son los de ``dental_erp.lease_queue``.
+- Límite por proveedor: un token bucket por proveedor
+  (``EMAIL_OUTBOX_RATE_LIMITS``, envíos por segundo) compartido por todos
+  los hilos del worker.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from dental_erp.lease_queue import LeaseQueue
+from .models import EmailSaliente
+from .providers import PermanentError, TransientError, get_provider
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(destinatarios, asunto, html='', texto='', remitente=None, proveedor='resend',
+            categoria='', clave_idempotencia=None, max_intentos=None, enviar_despues=None):
+    """
+    Encolar un email.
+
+    Args:
+        destinatarios: Email o lista de emails
+        asunto: Asunto
+        html, texto: Contenido en HTML y en texto plano
+        remitente: Remitente (default: ``DEFAULT_FROM_EMAIL``)
+        proveedor: Proveedor que lo enviará (ver ``emails.providers``)
+        categoria: Tipo de notificación, para consultas y métricas
+        clave_idempotencia: Si ya existe un email con esta clave se devuelve
+            ese en lugar de crear otro
+        max_intentos: Intentos antes de marcarlo como fallido
+        enviar_despues: No enviarlo antes de esta fecha
+
+    Returns:
+        EmailSaliente: El email encolado (o el existente con la misma clave)
+    """
+    if isinstance(destinatarios, str):
+        destinatarios = [destinatarios]
+    destinatarios = [email for email in destinatarios if email]
+    if not destinatarios:
+        raise ValueError("El email no tiene destinatarios")
+
+    if clave_idempotencia:
+        existente = EmailSaliente.objects.filter(clave_idempotencia=clave_idempotencia).first()
+        if existente is not None:
+            return existente
+
+    message = EmailSaliente(
+        clave_idempotencia=clave_idempotencia or None,
+        categoria=categoria,
+        proveedor=proveedor,
+        remitente=remitente or settings.DEFAULT_FROM_EMAIL,
+        destinatarios=destinatarios,
+        asunto=asunto[:255],
+        html=html or '',
+        texto=texto or '',
+        max_intentos=max_intentos or _setting('EMAIL_OUTBOX_MAX_ATTEMPTS', 6),
+        proximo_intento=enviar_despues or timezone.now(),
+    )
+    try:
+        # Punto de guardado propio: si otra petición encoló la misma clave al
+        # mismo tiempo, la transacción del llamador sigue siendo válida
+        with transaction.atomic():
+            message.save(force_insert=True)
+    except IntegrityError:
+        if not clave_idempotencia:
+            raise
+        return EmailSaliente.objects.get(clave_idempotencia=clave_idempotencia)
+    return message
+
+
+queue = LeaseQueue(
+    EmailSaliente,
+    status='estado', pending='pendiente', running='enviando', failed='fallido',
+    available_at='proximo_intento', locked_until='bloqueado_hasta',
+    attempts='intentos', max_attempts='max_intentos', error='ultimo_error',
+    order_by=('proximo_intento',),
+    lease=('EMAIL_OUTBOX_LEASE_SECONDS', 5 * 60),
+    retry_base=('EMAIL_OUTBOX_RETRY_BASE_SECONDS', 30),
+    retry_max=('EMAIL_OUTBOX_RETRY_MAX_SECONDS', 60 * 60),
+    jitter=True,
+)
+
+
+def retry_delay(intentos, retry_after=None):
+    """
+    Segundos de espera antes del siguiente intento.
+
+    Espera exponencial con variación aleatoria entre la mitad y el total,
+    para que los emails que fallaron juntos no se reintenten juntos.
+    """
+    return queue.retry_delay(intentos, retry_after)
+
+
+class RateLimiter:
+    """
+    Token bucket por proveedor, compartido entre hilos.
+
+    Args:
+        rates: Envíos por segundo por proveedor; los que no aparecen (o
+            tienen 0) no se limitan
+    """
+
+    def __init__(self, rates=None):
+        self.rates = dict(_setting('EMAIL_OUTBOX_RATE_LIMITS', {}) if rates is None else rates)
+        self._tokens = {}
+        self._updated = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self, proveedor):
+        """Tomar un token; devuelve los segundos a esperar si no hay"""
+        rate = self.rates.get(proveedor)
+        if not rate:
+            return 0
+        capacity = max(rate, 1)
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens.get(proveedor, capacity)
+            tokens = min(capacity, tokens + (now - self._updated.get(proveedor, now)) * rate)
+            self._updated[proveedor] = now
+            if tokens >= 1:
+                self._tokens[proveedor] = tokens - 1
+                return 0
+            self._tokens[proveedor] = tokens
+            return (1 - tokens) / rate
+
+    def acquire(self, proveedor):
+        """Esperar hasta poder enviar por ``proveedor``"""
+        while True:
+            wait = self._reserve(proveedor)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+def claim(limit):
+    """
+    Reservar hasta ``limit`` emails listos para enviarse.
+
+    Returns:
+        list: Emails reservados, ya marcados como ``enviando`` y con el
+        intento contado
+    """
+    return queue.claim(limit)
+
+
+def deliver(message, limiter=None):
+    """
+    Enviar un email reservado con ``claim`` y registrar el resultado.
+
+    Returns:
+        str: Estado final del intento: ``enviado``, ``pendiente`` (se
+        reintentará) o ``fallido``
+    """
+    if limiter is not None:
+        limiter.acquire(message.proveedor)
+
+    try:
+        provider_id = get_provider(message.proveedor).send(message)
+    except PermanentError as e:
+        logger.warning("Email %s rechazado: %s", message.pk, e)
+        return queue.fail(message, e, permanent=True)
+    except Exception as e:
+        retry_after = e.retry_after if isinstance(e, TransientError) else None
+        if not isinstance(e, TransientError):
+            logger.exception("Error inesperado enviando el email %s", message.pk)
+        return queue.fail(message, e, retry_after=retry_after)
+
+    queue.finish(
+        message,
+        estado='enviado',
+        id_proveedor=provider_id or '',
+        ultimo_error='',
+        fecha_envio=timezone.now(),
+    )
+    return 'enviado'
+
+
+def _deliver_in_thread(message, limiter):
+    try:
+        return deliver(message, limiter)
+    finally:
+        close_old_connections()
+
+
+def process_batch(limit=50, executor=None, limiter=None):
+    """
+    Reservar y enviar un lote de emails.
+
+    Args:
+        limit: Máximo de emails del lote
+        executor: ``ThreadPoolExecutor`` para enviar en paralelo; sin él se
+            envían uno tras otro en el hilo actual
+        limiter: ``RateLimiter`` compartido entre lotes
+
+    Returns:
+        dict: Número de emails por estado final del intento
+    """
+    limiter = limiter or RateLimiter()
+    messages = claim(limit)
+    if executor is None:
+        results = [deliver(message, limiter) for message in messages]
+    else:
+        results = list(executor.map(lambda m: _deliver_in_thread(m, limiter), messages))
+
+    summary = {'enviado': 0, 'pendiente': 0, 'fallido': 0}
+    for result in results:
+        summary[result] += 1
+    return summary
+
+
+def request_key(request, prefix):
+    """
+    Clave de idempotencia a partir de la cabecera ``Idempotency-Key``.
+
+    Si el cliente no la envía devuelve None: cada petición encola un email.
+    """
+    key = request.headers.get('Idempotency-Key', '').strip()
+    return f'{prefix}:{key}'[:200] if key else None
+
+
+def response_fields(message):
+    """Campos del email encolado para las respuestas de la API"""
+    if message is None:
+        return {'email_id': None, 'email_estado': None}
+    return {
+        'email_id': str(message.pk),
+        'email_estado': message.estado,
+    }
@@ -0,0 +1,162 @@
+"""
+Proveedores de envío para la cola de emails (ver ``emails.outbox``).
+
+Cada proveedor expone ``send(message)``, que recibe un ``EmailSaliente`` y
+devuelve el id del mensaje en el proveedor. Los errores se clasifican en
+``TransientError`` (se reintenta más tarde) y ``PermanentError`` (el email
+se marca como fallido sin más intentos).
+
+``FakeProvider`` guarda los mensajes en memoria y sustituye a Resend en las
+pruebas y en desarrollo (``EMAIL_OUTBOX_PROVIDERS``).
+"""
+
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.utils.module_loading import import_string
+
+
+class ProviderError(Exception):
+    """Error al entregar un email"""
+
+
+class TransientError(ProviderError):
+    """Error temporal: límite de peticiones, red o error del servidor"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentError(ProviderError):
+    """Error definitivo: destinatario o contenido inválido"""
+
+
+class BaseProvider:
+    name = None
+
+    def send(self, message):
+        raise NotImplementedError
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResendProvider(BaseProvider):
+    """Envío por la API de Resend, con la clave de idempotencia del mensaje"""
+    name = 'resend'
+
+    def send(self, message):
+        import resend
+        from resend import exceptions
+
+        api_key = getattr(settings, 'RESEND_API_KEY', '')
+        if not api_key:
+            raise PermanentError("RESEND_API_KEY no está configurada")
+        resend.api_key = api_key
+
+        params = {
+            'from': message.remitente,
+            'to': list(message.destinatarios),
+            'subject': message.asunto,
+            'html': message.html,
+            'text': message.texto,
+        }
+        # Resend ignora la segunda petición con la misma clave, así que un
+        # reintento después de un timeout no duplica el email
+        options = {'idempotency_key': message.clave_idempotencia or str(message.id)}
+
+        try:
+            response = resend.Emails.send(params, options)
+        except exceptions.RateLimitError as e:
+            raise TransientError(str(e), retry_after=_retry_after(e.headers))
+        except exceptions.ApplicationError as e:
+            raise TransientError(str(e))
+        except exceptions.ResendError as e:
+            raise PermanentError(str(e))
+        except (OSError, ValueError) as e:
+            # Errores de red o respuestas ilegibles
+            raise TransientError(str(e))
+
+        if isinstance(response, dict):
+            return response.get('id', '')
+        return getattr(response, 'id', '') or ''
+
+
+class DjangoMailProvider(BaseProvider):
+    """Envío con el ``EMAIL_BACKEND`` de Django (SMTP, consola, etc.)"""
+    name = 'django'
+
+    def send(self, message):
+        email = EmailMultiAlternatives(
+            subject=message.asunto,
+            body=message.texto,
+            from_email=message.remitente,
+            to=list(message.destinatarios),
+        )
+        if message.html:
+            email.attach_alternative(message.html, 'text/html')
+        try:
+            email.send(fail_silently=False)
+        except OSError as e:
+            raise TransientError(str(e))
+        return ''
+
+
+class FakeProvider(BaseProvider):
+    """
+    Proveedor en memoria para pruebas.
+
+    ``sent`` contiene los mensajes entregados. ``fail_next(n, error)`` hace
+    que los siguientes ``n`` envíos lancen ``error``.
+    """
+    name = 'fake'
+
+    sent = []
+    _failures = []
+    _lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            if self._failures:
+                raise self._failures.pop(0)
+            provider_id = f'fake-{uuid.uuid4().hex[:12]}'
+            self.sent.append({
+                'id': provider_id,
+                'to': list(message.destinatarios),
+                'subject': message.asunto,
+                'idempotency_key': message.clave_idempotencia,
+            })
+        return provider_id
+
+    @classmethod
+    def fail_next(cls, count=1, error=None):
+        with cls._lock:
+            cls._failures.extend([error or TransientError('Fallo simulado')] * count)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.sent.clear()
+            cls._failures.clear()
+
+
+DEFAULT_PROVIDERS = {
+    'resend': 'emails.providers.ResendProvider',
+    'django': 'emails.providers.DjangoMailProvider',
+    'fake': 'emails.providers.FakeProvider',
+}
+
+
+def get_provider(name):
+    """Instancia del proveedor configurado para ``name``"""
+    providers = {**DEFAULT_PROVIDERS, **getattr(settings, 'EMAIL_OUTBOX_PROVIDERS', {})}
+    if name not in providers:
+        raise PermanentError(f"Proveedor de email desconocido: {name}")
+    return import_string(providers[name])()
@@ -0,0 +1,304 @@
+from datetime import timedelta
+from unittest import mock
+
+import smtplib
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from citas.models import Cita
+from pacientes.tests import crear_dentista, crear_paciente
+from . import outbox
+from .bulk import BulkSender
+from .models import EmailSaliente, EnvioMasivo
+from .providers import FakeProvider, PermanentError, TransientError
+
+FAKE_PROVIDERS = {
+    'resend': 'emails.providers.FakeProvider',
+    'django': 'emails.providers.FakeProvider',
+}
+
+
+@override_settings(EMAIL_OUTBOX_PROVIDERS=FAKE_PROVIDERS, EMAIL_OUTBOX_RATE_LIMITS={})
+class OutboxTest(TestCase):
+    """Tests para la cola de emails salientes"""
+
+    def setUp(self):
+        FakeProvider.reset()
+
+    def encolar(self, **kwargs):
+        kwargs.setdefault('destinatarios', ['paciente@example.com'])
+        kwargs.setdefault('asunto', 'Confirmación de cita')
+        return outbox.enqueue(**kwargs)
+
+    def test_enqueue_does_not_send(self):
+        email = self.encolar()
+        self.assertEqual(email.estado, 'pendiente')
+        self.assertEqual(FakeProvider.sent, [])
+
+    def test_idempotency_key_returns_existing_email(self):
+        primero = self.encolar(clave_idempotencia='cita-confirmacion:1')
+        segundo = self.encolar(clave_idempotencia='cita-confirmacion:1')
+        self.assertEqual(primero.pk, segundo.pk)
+        self.assertEqual(EmailSaliente.objects.count(), 1)
+
+    def test_process_batch_sends_pending(self):
+        self.encolar(clave_idempotencia='k1')
+        self.encolar(destinatarios='otro@example.com')
+
+        resumen = outbox.process_batch()
+
+        self.assertEqual(resumen['enviado'], 2)
+        self.assertEqual(len(FakeProvider.sent), 2)
+        self.assertEqual(FakeProvider.sent[0]['idempotency_key'], 'k1')
+        email = EmailSaliente.objects.get(clave_idempotencia='k1')
+        self.assertEqual(email.estado, 'enviado')
+        self.assertEqual(email.intentos, 1)
+        self.assertTrue(email.id_proveedor.startswith('fake-'))
+        # Ya no queda nada por enviar
+        self.assertEqual(outbox.process_batch(), {'enviado': 0, 'pendiente': 0, 'fallido': 0})
+
+    @override_settings(EMAIL_OUTBOX_RETRY_BASE_SECONDS=60, EMAIL_OUTBOX_RETRY_MAX_SECONDS=600)
+    def test_transient_error_is_retried_with_backoff(self):
+        email = self.encolar(max_intentos=3)
+        FakeProvider.fail_next(1, TransientError('429'))
+
+        antes = timezone.now()
+        self.assertEqual(outbox.process_batch()['pendiente'], 1)
+        email.refresh_from_db()
+        self.assertEqual(email.estado, 'pendiente')
+        self.assertEqual(email.ultimo_error, '429')
+        # Primer reintento entre 30 y 60 segundos después
+        espera = (email.proximo_intento - antes).total_seconds()
+        self.assertGreaterEqual(espera, 29)
+        self.assertLessEqual(espera, 61)
+
+        # Antes de tiempo no se reintenta
+        self.assertEqual(outbox.process_batch()['enviado'], 0)
+
+        EmailSaliente.objects.filter(pk=email.pk).update(proximo_intento=timezone.now())
+        self.assertEqual(outbox.process_batch()['enviado'], 1)
+        email.refresh_from_db()
+        self.assertEqual(email.estado, 'enviado')
+        self.assertEqual(email.intentos, 2)
+        self.assertEqual(email.ultimo_error, '')
+
+    def test_retry_delay_grows_and_is_capped(self):
+        with override_settings(EMAIL_OUTBOX_RETRY_BASE_SECONDS=10, EMAIL_OUTBOX_RETRY_MAX_SECONDS=100):
+            self.assertLessEqual(outbox.retry_delay(1), 10)
+            self.assertGreaterEqual(outbox.retry_delay(4), 40)
+            self.assertLessEqual(outbox.retry_delay(20), 100)
+            # Retry-After del proveedor manda si es mayor
+            self.assertEqual(outbox.retry_delay(1, retry_after=300), 300)
+
+    def test_attempts_exhausted_marks_failed(self):
+        email = self.encolar(max_intentos=1)
+        FakeProvider.fail_next(1, TransientError('timeout'))
+        self.assertEqual(outbox.process_batch()['fallido'], 1)
+        email.refresh_from_db()
+        self.assertEqual(email.estado, 'fallido')
+
+    def test_permanent_error_is_not_retried(self):
+        email = self.encolar()
+        FakeProvider.fail_next(1, PermanentError('destinatario inválido'))
+        self.assertEqual(outbox.process_batch()['fallido'], 1)
+        email.refresh_from_db()
+        self.assertEqual(email.estado, 'fallido')
+        self.assertEqual(email.intentos, 1)
+
+    def test_expired_lease_is_reclaimed(self):
+        """Un email que quedó 'enviando' por un worker caído se vuelve a tomar"""
+        email = self.encolar()
+        self.assertEqual(len(outbox.claim(10)), 1)
+        self.assertEqual(outbox.claim(10), [])
+
+        EmailSaliente.objects.filter(pk=email.pk).update(
+            bloqueado_hasta=timezone.now() - timedelta(seconds=1)
+        )
+        reclamados = outbox.claim(10)
+        self.assertEqual([e.pk for e in reclamados], [email.pk])
+        self.assertEqual(reclamados[0].intentos, 2)
+
+    def test_rate_limiter_spaces_sends(self):
+        limiter = outbox.RateLimiter({'resend': 2})
+        with mock.patch('emails.outbox.time.sleep') as sleep:
+            for _ in range(3):
+                limiter.acquire('resend')
+        # Capacidad de 2 envíos; el tercero espera
+        self.assertTrue(sleep.called)
+        limiter.acquire('fake')
+
+    def test_worker_command_drains_queue(self):
+        for i in range(3):
+            self.encolar(destinatarios=f'p{i}@example.com')
+        call_command('process_email_outbox', '--once', '--threads', '1', stdout=mock.MagicMock())
+        self.assertEqual(EmailSaliente.objects.filter(estado='enviado').count(), 3)
+
+    @override_settings(EMAIL_OUTBOX_PROVIDERS={}, RESEND_API_KEY='')
+    def test_resend_without_api_key_fails(self):
+        """Sin RESEND_API_KEY no se intenta enviar por Resend"""
+        email = self.encolar(proveedor='resend')
+        with mock.patch('resend.Emails.send') as send:
+            outbox.process_batch()
+        send.assert_not_called()
+        email.refresh_from_db()
+        self.assertEqual(email.estado, 'fallido')
+        self.assertIn('RESEND_API_KEY', email.ultimo_error)
+
+
+@override_settings(EMAIL_OUTBOX_PROVIDERS=FAKE_PROVIDERS)
+class OutboxAPITest(APITestCase):
+    """Las vistas solo encolan el email"""
+
+    def setUp(self):
+        FakeProvider.reset()
+        self.dentista = crear_dentista()
+        self.paciente = crear_paciente(self.dentista, 'María', 'García', email='maria@example.com')
+        self.cita = Cita.objects.create(
+            paciente=self.paciente,
+            dentista=self.dentista,
+            fecha_hora=(timezone.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0),
+            duracion_estimada=60,
+            motivo_consulta='Revisión',
+        )
+
+    def test_confirm_enqueues_confirmation_once(self):
+        response = self.client.post(f'/api/citas/{self.cita.pk}/confirm/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['email_enviado'])
+        self.assertEqual(response.data['email_estado'], 'pendiente')
+        self.assertEqual(FakeProvider.sent, [])
+
+        email = EmailSaliente.objects.get(pk=response.data['email_id'])
+        self.assertEqual(email.categoria, 'cita_confirmacion')
+        self.assertEqual(email.destinatarios, ['maria@example.com'])
+
+        # Volver a confirmar con el mismo horario no encola otro email
+        Cita.objects.filter(pk=self.cita.pk).update(estado='programada')
+        self.client.post(f'/api/citas/{self.cita.pk}/confirm/')
+        self.assertEqual(EmailSaliente.objects.count(), 1)
+
+    def test_general_email_honours_idempotency_header(self):
+        data = {
+            'email': 'maria@example.com',
+            'nombre_completo': 'María García',
+            'subject': 'Aviso',
+            'message': 'La clínica cierra el lunes',
+        }
+        for _ in range(2):
+            response = self.client.post(
+                '/api/emails/send-general/', data, format='json', HTTP_IDEMPOTENCY_KEY='aviso-1'
+            )
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(EmailSaliente.objects.count(), 1)
+
+
+class FlakyBackend(LocmemBackend):
+    """Backend en memoria que rechaza ciertos destinatarios y cuenta conexiones"""
+    opened = 0
+    rejected = set()
+    disconnect_once = set()
+
+    def open(self):
+        FlakyBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            email = message.to[0]
+            if email in self.rejected:
+                raise smtplib.SMTPRecipientsRefused({email: (550, b'No such user')})
+            if email in self.disconnect_once:
+                self.disconnect_once.discard(email)
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+class BulkSenderTest(TestCase):
+    """Tests para el envío masivo"""
+
+    def setUp(self):
+        FlakyBackend.opened = 0
+        FlakyBackend.rejected = set()
+        FlakyBackend.disconnect_once = set()
+
+    def sender(self, **kwargs):
+        def build(clave, email):
+            return mail.EmailMessage('Aviso', 'Texto', 'clinica@example.com', [email])
+        return BulkSender(build, connection_factory=FlakyBackend, **kwargs)
+
+    def test_individual_messages_over_reused_connections(self):
+        recipients = [(i, f'p{i}@example.com') for i in range(1, 51)]
+        resumen = self.sender(concurrency=2).send(iter(recipients))
+
+        self.assertEqual(resumen['enviados'], 50)
+        self.assertEqual(resumen['ultimo_id'], 50)
+        self.assertEqual(len(mail.outbox), 50)
+        self.assertTrue(all(len(m.to) == 1 for m in mail.outbox))
+        # Una conexión por hilo, no una por mensaje ni por bloque
+        self.assertLessEqual(FlakyBackend.opened, 2)
+
+    def test_rejected_recipient_does_not_fail_others(self):
+        FlakyBackend.rejected = {'p2@example.com'}
+        FlakyBackend.disconnect_once = {'p3@example.com'}
+        resultados = []
+        resumen = self.sender(concurrency=1, on_result=resultados.append).send(
+            [(i, f'p{i}@example.com') for i in range(1, 5)]
+        )
+
+        self.assertEqual((resumen['enviados'], resumen['fallidos']), (3, 1))
+        por_email = {r.email: r for r in resultados}
+        self.assertFalse(por_email['p2@example.com'].enviado)
+        self.assertIn('No such user', por_email['p2@example.com'].error)
+        # La desconexión se resolvió abriendo otra conexión y reintentando
+        self.assertTrue(por_email['p3@example.com'].enviado)
+        self.assertEqual(FlakyBackend.opened, 2)
+
+    def test_checkpoint_stops_before_unfinished_recipients(self):
+        checkpoints = []
+
+        def recipients():
+            yield from [(i, f'p{i}@example.com') for i in range(1, 11)]
+            raise KeyboardInterrupt
+
+        sender = self.sender(concurrency=3, checkpoint_every=1,
+                             checkpoint=lambda *args: checkpoints.append(args))
+        with self.assertRaises(KeyboardInterrupt):
+            sender.send(recipients())
+        # Los envíos que no habían empezado se cancelan: el punto de control
+        # cubre exactamente a los destinatarios ya enviados
+        ultimo, enviados, _ = checkpoints[-1]
+        self.assertEqual(enviados, len(mail.outbox))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         sorted(f'p{i}@example.com' for i in range(1, ultimo + 1)))
+        self.assertEqual([c[0] for c in checkpoints], sorted(c[0] for c in checkpoints))
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_command_streams_audience_and_resumes_job(self):
+        for i in range(5):
+            User.objects.create_user(f'user{i}', f'user{i}@example.com')
+        User.objects.create_user('sin_email', '')
+        usuarios = list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+        # Un envío anterior se interrumpió después del segundo usuario
+        EnvioMasivo.objects.create(nombre='aviso-junio', asunto='Aviso', ultimo_id=usuarios[1],
+                                   enviados=2, estado='interrumpido')
+        argumentos = ['--type', 'bulk_notification', '--subject', 'Aviso', '--message', 'Texto',
+                      '--audience', 'users', '--job', 'aviso-junio', '--concurrency', '2']
+        call_command('send_bulk_emails', *argumentos, stdout=mock.MagicMock())
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['user2@example.com', 'user3@example.com', 'user4@example.com'])
+        job = EnvioMasivo.objects.get(nombre='aviso-junio')
+        self.assertEqual((job.estado, job.enviados, job.fallidos), ('completado', 5, 0))
+        self.assertEqual(job.ultimo_id, usuarios[4])
+
+        # Un trabajo completado no se vuelve a enviar
+        call_command('send_bulk_emails', *argumentos, stdout=mock.MagicMock())
+        self.assertEqual(len(mail.outbox), 3)
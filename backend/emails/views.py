@@ -3,6 +3,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from .email_service import GeneralEmailService
+from . import outbox
 import logging
 
 logger = logging.getLogger(__name__)
@@ -35,17 +36,18 @@ def send_welcome_email(request):
         
         # Enviar email
         email_service = GeneralEmailService()
-        email_enviado = email_service.send_welcome_email(paciente)
+        email_enviado = email_service.send_welcome_email(paciente, clave_idempotencia=outbox.request_key(request, 'email-welcome'))
         
         if email_enviado:
-            logger.info(f"Welcome email sent successfully to {paciente['email']}")
+            logger.info(f"Welcome email queued for {paciente['email']}")
             return Response({
                 'success': True,
-                'message': 'Email de bienvenida enviado exitosamente',
+                'message': 'Email de bienvenida encolado para envío',
                 'email_enviado': True,
+                **outbox.response_fields(email_service.ultimo_email),
                 'destinatario': paciente['email'],
                 'note': 'En modo desarrollo, algunos emails pueden estar limitados por Resend. En producción con dominio verificado, todos los emails funcionarán normalmente.'
-            })
+            }, status=status.HTTP_202_ACCEPTED)
         else:
             return Response({
                 'success': False,
@@ -93,16 +95,17 @@ def send_reminder_email(request):
         
         # Enviar email
         email_service = GeneralEmailService()
-        email_enviado = email_service.send_reminder_email(paciente, cita)
+        email_enviado = email_service.send_reminder_email(paciente, cita, clave_idempotencia=outbox.request_key(request, 'email-reminder'))
         
         if email_enviado:
-            logger.info(f"Reminder email sent successfully to {paciente['email']}")
+            logger.info(f"Reminder email queued for {paciente['email']}")
             return Response({
                 'success': True,
-                'message': 'Email de recordatorio enviado exitosamente',
+                'message': 'Email de recordatorio encolado para envío',
                 'email_enviado': True,
+                **outbox.response_fields(email_service.ultimo_email),
                 'destinatario': paciente['email']
-            })
+            }, status=status.HTTP_202_ACCEPTED)
         else:
             return Response({
                 'success': False,
@@ -150,16 +153,17 @@ def send_general_email(request):
         
         # Enviar email
         email_service = GeneralEmailService()
-        email_enviado = email_service.send_general_email(paciente, subject, message)
+        email_enviado = email_service.send_general_email(paciente, subject, message, clave_idempotencia=outbox.request_key(request, 'email-general'))
         
         if email_enviado:
-            logger.info(f"General email sent successfully to {paciente['email']}")
+            logger.info(f"General email queued for {paciente['email']}")
             return Response({
                 'success': True,
-                'message': 'Email enviado exitosamente',
+                'message': 'Email encolado para envío',
                 'email_enviado': True,
+                **outbox.response_fields(email_service.ultimo_email),
                 'destinatario': paciente['email']
-            })
+            }, status=status.HTTP_202_ACCEPTED)
         else:
             return Response({
                 'success': False,
@@ -1,5 +1,7 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from dental_erp import sequences
 from decimal import Decimal
 import uuid
 
@@ -80,11 +82,14 @@ class Factura(models.Model):
     def save(self, *args, **kwargs):
         if not self.numero_factura:
             # Generar número de factura automático
-            año_actual = self.fecha_emision.year
-            ultimo_numero = Factura.objects.filter(
-                fecha_emision__year=año_actual
-            ).count() + 1
-            self.numero_factura = f"FAC-{año_actual}-{ultimo_numero:06d}"
+            # fecha_emision es auto_now_add: aún no tiene valor en una factura nueva
+            año_actual = (self.fecha_emision or timezone.now()).year
+            prefijo = f"FAC-{año_actual}-"
+            numero = sequences.next_value(
+                f'factura:{año_actual}',
+                seed=lambda: sequences.max_suffix(Factura.objects, 'numero_factura', prefijo)
+            )
+            self.numero_factura = f"{prefijo}{numero:06d}"
         
         # Calcular total
         self.total = self.subtotal - self.descuento + self.impuestos
@@ -188,11 +193,13 @@ class Pago(models.Model):
     def save(self, *args, **kwargs):
         if not self.numero_pago:
             # Generar número de pago automático
-            fecha_str = self.fecha_pago.strftime('%Y%m%d')
-            ultimo_numero = Pago.objects.filter(
-                fecha_pago__date=self.fecha_pago.date()
-            ).count() + 1
-            self.numero_pago = f"PAG-{fecha_str}-{ultimo_numero:04d}"
+            fecha_str = (self.fecha_pago or timezone.now()).strftime('%Y%m%d')
+            prefijo = f"PAG-{fecha_str}-"
+            numero = sequences.next_value(
+                f'pago:{fecha_str}',
+                seed=lambda: sequences.max_suffix(Pago.objects, 'numero_pago', prefijo)
+            )
+            self.numero_pago = f"{prefijo}{numero:04d}"
         
         super().save(*args, **kwargs)
         
@@ -0,0 +1,12 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from . import views
+
+router = DefaultRouter()
+router.register(r'facturas', views.FacturaViewSet)
+
+app_name = 'facturacion'
+
+urlpatterns = [
+    path('api/', include(router.urls)),
+]
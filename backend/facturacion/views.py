@@ -1,3 +1,61 @@
-from django.shortcuts import render
+from datetime import datetime
 
-# Create your views here.
+from rest_framework import viewsets
+
+from dental_erp.exports import Columna, ExportMixin
+from .models import Factura
+
+
+class FacturaViewSet(ExportMixin, viewsets.GenericViewSet):
+    """
+    Facturas. Por ahora solo la exportación masiva (``exportar``), con
+    filtros por estado, paciente y fecha de emisión.
+    """
+    queryset = Factura.objects.all()
+    export_name = 'facturas'
+    export_columns = (
+        Columna('numero_factura', 'Número de factura'),
+        Columna('fecha_emision', 'Fecha de emisión'),
+        Columna('fecha_vencimiento', 'Fecha de vencimiento'),
+        Columna('tipo_factura', 'Tipo'),
+        Columna('estado', 'Estado'),
+        Columna('paciente', 'Expediente del paciente', 'paciente__numero_expediente'),
+        Columna('cita', 'Número de cita', 'cita__numero_cita'),
+        Columna('subtotal', 'Subtotal'),
+        Columna('descuento', 'Descuento'),
+        Columna('impuestos', 'Impuestos'),
+        Columna('total', 'Total'),
+        Columna('saldo_pendiente', 'Saldo pendiente'),
+        Columna('notas', 'Notas'),
+    )
+    
+    def get_queryset(self):
+        queryset = Factura.objects.all()
+        
+        estado = self.request.query_params.get('estado', None)
+        if estado:
+            queryset = queryset.filter(estado=estado)
+        
+        paciente_id = self.request.query_params.get('paciente', None)
+        if paciente_id:
+            queryset = queryset.filter(paciente_id=paciente_id)
+        
+        # Filter by date range
+        fecha_desde = self.request.query_params.get('fecha_desde', None)
+        fecha_hasta = self.request.query_params.get('fecha_hasta', None)
+        
+        if fecha_desde:
+            try:
+                fecha_desde_dt = datetime.fromisoformat(fecha_desde).date()
+                queryset = queryset.filter(fecha_emision__date__gte=fecha_desde_dt)
+            except ValueError:
+                pass
+                
+        if fecha_hasta:
+            try:
+                fecha_hasta_dt = datetime.fromisoformat(fecha_hasta).date()
+                queryset = queryset.filter(fecha_emision__date__lte=fecha_hasta_dt)
+            except ValueError:
+                pass
+        
+        return queryset.order_by('fecha_emision')
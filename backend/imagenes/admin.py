@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Image
+from .models import Image, ImageJob, MediaBlob, OptimizationRun
 
 
 @admin.register(Image)
@@ -23,3 +23,27 @@ class ImageAdmin(admin.ModelAdmin):
             'classes': ('collapse',),
         })
     )
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'image', 'priority', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'priority')
+    search_fields = ('image__title', 'image__object_id')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'error')
+
+
+@admin.register(OptimizationRun)
+class OptimizationRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'content_type', 'object_id', 'force', 'status', 'total',
+                    'processed', 'skipped', 'errors', 'created_at', 'finished_at')
+    list_filter = ('status', 'force')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'last_image_id')
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'name', 'size', 'refcount', 'created_at', 'updated_at')
+    list_filter = ('refcount',)
+    search_fields = ('digest', 'name')
+    readonly_fields = ('digest', 'name', 'size', 'refcount', 'created_at', 'updated_at')
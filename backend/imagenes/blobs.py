@@ -0,0 +1,256 @@
+"""
+Almacenamiento por contenido de los archivos subidos.
+
+Antes cada subida recibía un nombre UUID nuevo: volver a subir la misma
+radiografía o el mismo logo guardaba otro original completo y regeneraba
+sus 18 variaciones. Ahora cada archivo se guarda una sola vez, con el
+nombre de su SHA-256 (``blobs/ab/cd/<sha256>.<ext>``):
+
+- Al guardar una fila con un archivo nuevo (``attach``, desde ``pre_save``)
+  se calcula el resumen leyendo la subida por bloques. Si ya hay un blob
+  con ese resumen no se escribe nada y la fila apunta a él.
+- ``MediaBlob.refcount`` cuenta las filas que usan cada blob. Borrar una
+  fila o cambiarle el archivo solo descuenta la referencia; ``sweep``
+  (comando ``dedupe_media``) borra los blobs sin referencias pasado
+  ``SWEEP_GRACE``, para no competir con una subida en curso.
+- Las variaciones se nombran a partir del blob (``derivative_name`` o la
+  caché de ``imagenes.variants``), así que una subida repetida reutiliza
+  las de la primera y ``sweep`` las borra junto con el blob.
+
+Campos guardados por contenido: ``FIELDS``.
+"""
+
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import MediaBlob
+
+logger = logging.getLogger(__name__)
+
+# (modelo, campo) de los archivos guardados por contenido
+FIELDS = (
+    ('imagenes.Image', 'image'),
+    ('pacientes.ImagenMedica', 'archivo'),
+)
+
+BLOB_PREFIX = 'blobs'
+
+CHUNK_SIZE = 64 * 1024
+
+# Tiempo sin referencias antes de poder borrar un blob
+SWEEP_GRACE = timedelta(hours=1)
+
+
+def blob_name(digest, ext):
+    return f"{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f"{BLOB_PREFIX}/")
+
+
+def derivative_name(name, suffix):
+    """Nombre de un archivo derivado del blob: ``<blob>_thumb.jpg``"""
+    return f"{os.path.splitext(name)[0]}{suffix}"
+
+
+class HashedFile(File):
+    """
+    Archivo cuyo SHA-256 ya se conoce (p. ej. una carga por partes ya
+    verificada): ``store`` no lo vuelve a leer para calcularlo.
+    """
+
+    def __init__(self, file, digest, name=None):
+        super().__init__(file, name)
+        self.digest = digest
+
+
+def digest_file(content):
+    """
+    SHA-256 y tamaño de un archivo, leyéndolo por bloques.
+
+    Args:
+        content: ``File`` de Django (subida o archivo del almacenamiento)
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks(CHUNK_SIZE):
+        sha256.update(chunk)
+        size += len(chunk)
+    content.seek(0)
+    return sha256.hexdigest(), size
+
+
+def acquire(digest, size, ext):
+    """
+    Sumar una referencia al blob del resumen, creándolo si no existe.
+
+    Returns:
+        tuple: (``MediaBlob``, True si se acaba de crear)
+    """
+    for _ in range(3):
+        if MediaBlob.objects.filter(pk=digest).update(refcount=F('refcount') + 1, updated_at=timezone.now()):
+            return MediaBlob.objects.get(pk=digest), False
+        try:
+            with transaction.atomic():
+                return MediaBlob.objects.create(
+                    digest=digest, name=blob_name(digest, ext), size=size, refcount=1
+                ), True
+        except IntegrityError:
+            # Otra subida del mismo archivo lo creó a la vez
+            continue
+    raise RuntimeError(f"No se pudo registrar el blob {digest}")
+
+
+def release(name):
+    """
+    Descontar una referencia al blob.
+
+    Returns:
+        bool: False si ``name`` no es un blob
+    """
+    if not is_blob(name):
+        return False
+    MediaBlob.objects.filter(name=name, refcount__gt=0).update(
+        refcount=F('refcount') - 1, updated_at=timezone.now()
+    )
+    return True
+
+
+def store(field_file):
+    """
+    Guardar un archivo aún no guardado en su blob y hacer que el campo
+    apunte a él. Solo se escribe si el blob no existía.
+
+    Returns:
+        MediaBlob: El blob, con la referencia ya sumada
+    """
+    content = field_file.file
+    if isinstance(content, HashedFile):
+        digest, size = content.digest, content.size
+    else:
+        digest, size = digest_file(content)
+    blob, _ = acquire(digest, size, os.path.splitext(field_file.name)[1].lower())
+
+    storage = field_file.storage
+    if not storage.exists(blob.name):
+        saved = storage.save(blob.name, content)
+        if saved != blob.name:
+            # Otra subida escribió el mismo blob mientras tanto
+            storage.delete(saved)
+
+    field_file.name = blob.name
+    field_file._committed = True
+    return blob
+
+
+def attach(instance, field_name):
+    """
+    Para ``pre_save``: si el campo tiene un archivo nuevo, guardarlo por
+    contenido y descontar la referencia al archivo anterior de la fila.
+
+    Returns:
+        MediaBlob: El blob del archivo nuevo, o None si no había
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file or field_file._committed:
+        return None
+
+    previous = None
+    if not instance._state.adding:
+        previous = (
+            type(instance)._default_manager.filter(pk=instance.pk)
+            .values_list(field_name, flat=True).first()
+        )
+    blob = store(field_file)
+    if previous:
+        release(previous)
+    return blob
+
+
+def references(name):
+    """Filas que usan el archivo ``name`` en cualquiera de ``FIELDS``"""
+    return sum(
+        apps.get_model(label)._default_manager.filter(**{field: name}).count()
+        for label, field in FIELDS
+    )
+
+
+def recount():
+    """
+    Recalcular ``refcount`` a partir de las filas que usan cada blob
+    (por si quedó desfasado por un guardado fallido).
+
+    Returns:
+        int: Blobs corregidos
+    """
+    counts = {}
+    for label, field in FIELDS:
+        rows = (
+            apps.get_model(label)._default_manager
+            .filter(**{f'{field}__startswith': f'{BLOB_PREFIX}/'})
+            .values(field).annotate(total=Count('pk'))
+        )
+        for row in rows:
+            counts[row[field]] = counts.get(row[field], 0) + row['total']
+
+    fixed = 0
+    for blob in MediaBlob.objects.only('digest', 'name', 'refcount').iterator(chunk_size=500):
+        actual = counts.get(blob.name, 0)
+        if actual != blob.refcount:
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=actual, updated_at=timezone.now())
+            fixed += 1
+    return fixed
+
+
+def _derivatives(storage, name):
+    """Archivos derivados del blob guardados junto a él"""
+    directory, filename = os.path.split(name)
+    base = os.path.splitext(filename)[0]
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(directory, f) for f in files
+        if f.startswith(f"{base}_")
+    ]
+
+
+def sweep(dry_run=False):
+    """
+    Borrar los blobs sin referencias desde hace ``SWEEP_GRACE``, con sus
+    archivos derivados y sus variaciones en caché.
+
+    Returns:
+        tuple: (blobs borrados, bytes liberados)
+    """
+    from .variants import invalidate
+
+    storage = default_storage
+    removed = freed = 0
+    stale = MediaBlob.objects.filter(refcount=0, updated_at__lt=timezone.now() - SWEEP_GRACE)
+    for blob in stale.iterator(chunk_size=200):
+        files = [blob.name] + _derivatives(storage, blob.name)
+        nbytes = sum(storage.size(name) for name in files if storage.exists(name))
+        if not dry_run:
+            # Solo si sigue sin referencias: una subida pudo volver a usarlo
+            if not MediaBlob.objects.filter(pk=blob.pk, refcount=0).delete()[0]:
+                continue
+            for name in files:
+                storage.delete(name)
+            invalidate(blob.name)
+        removed += 1
+        freed += nbytes
+    if removed and not dry_run:
+        logger.info("Blobs sin referencias borrados: %s (%s bytes)", removed, freed)
+    return removed, freed
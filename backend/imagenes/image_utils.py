@@ -13,9 +13,9 @@ import io
 from PIL import Image, ImageOps
 import time
 import logging
-from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 import uuid
 from pathlib import Path
 from functools import lru_cache
@@ -40,6 +40,17 @@ except ImportError:
     logger.warning("El soporte para AVIF no está disponible. Instala pillow-avif-plugin para habilitarlo.")
 
 
+# Tamaños de las variaciones: ancho en px, altura proporcional
+VARIATIONS = {
+    'thumbnail': (150, None),      # Ancho de 150px, altura proporcional 
+    'xs': (320, None),             # Móviles pequeños
+    'small': (480, None),          # Móviles
+    'medium': (768, None),         # Tablets/móviles grandes
+    'large': (1024, None),         # Escritorios pequeños/tablets horizontales
+    'xl': (1440, None),            # Escritorios grandes (opcional)
+}
+
+
 @lru_cache(maxsize=32)
 def get_image_format_options():
     """
@@ -151,63 +162,183 @@ def convert_to_avif(img, quality=70):
     return output_io
 
 
-def process_variation(params):
+# Margen de draft(): la imagen se decodifica al menos al doble del tamaño
+# final, como hace Image.thumbnail(), para que LANCZOS tenga detalle que
+# promediar
+DRAFT_GAP = 2
+
+# Formatos que se guardan además del formato original: (clave, extensión, formato PIL)
+EXTRA_FORMATS = [('webp', '.webp', 'WEBP')]
+if AVIF_SUPPORT:
+    EXTRA_FORMATS.append(('avif', '.avif', 'AVIF'))
+
+
+def _oriented_size(img):
+    """Tamaño de la imagen con la orientación EXIF aplicada, sin decodificarla"""
+    orientation = img.getexif().get(0x0112, 1)
+    if orientation in (5, 6, 7, 8):
+        return img.height, img.width
+    return img.size
+
+
+def open_source(image_path, max_width=None):
     """
-    Función auxiliar para procesar una variación de imagen en paralelo.
+    Abre y decodifica una imagen una sola vez para generar sus variaciones.
+    
+    - En JPEG usa ``draft()`` para que libjpeg la decodifique ya reducida
+      (1/2, 1/4 o 1/8) cuando la variación más grande lo permite.
+    - Aplica la orientación EXIF una sola vez.
+    - Convierte a RGB/RGBA los modos que LANCZOS no admite (P, 1, CMYK...).
     
     Args:
-        params (dict): Parámetros para procesar la variación
-            {
-                'img': Imagen PIL,
-                'size': Tamaño destino (ancho, alto),
-                'original_format': Formato original de la imagen,
-                'base_path': Directorio base para guardar,
-                'filename': Nombre de archivo base,
-                'variation_name': Nombre de la variación (thumbnail, medium, etc.)
-            }
+        image_path (str): Ruta de la imagen
+        max_width (int): Ancho de la variación más grande que se va a generar
     
     Returns:
-        dict: Diccionario con las rutas resultantes para esta variación
+        tuple: (imagen decodificada, formato original, tamaño original orientado)
     """
-    img = params['img']
-    size = params['size']
-    original_format = params['original_format']
-    base_path = params['base_path']
-    filename = params['filename']
-    variation_name = params['variation_name']
-    extension = params['extension']
-    
-    result = {}
-    
-    # Generar versión original redimensionada
-    resized_io = create_resized_image(img, size, format_name=original_format)
-    variation_path = os.path.join(base_path, f"{filename}_{variation_name}{extension}")
-    with open(variation_path, 'wb') as f:
-        f.write(resized_io.getvalue())
-    result[variation_name] = variation_path
-    
-    # Generar versión WebP
-    webp_io = convert_to_webp(ImageOps.exif_transpose(img.resize(size, Image.Resampling.LANCZOS)))
-    webp_path = os.path.join(base_path, f"{filename}_{variation_name}.webp")
-    with open(webp_path, 'wb') as f:
-        f.write(webp_io.getvalue())
-    result[f'{variation_name}_webp'] = webp_path
-    
-    # Generar versión AVIF si está soportada
-    if AVIF_SUPPORT:
-        avif_io = convert_to_avif(ImageOps.exif_transpose(img.resize(size, Image.Resampling.LANCZOS)))
-        if avif_io:
-            avif_path = os.path.join(base_path, f"{filename}_{variation_name}.avif")
-            with open(avif_path, 'wb') as f:
-                f.write(avif_io.getvalue())
-            result[f'{variation_name}_avif'] = avif_path
+    img = Image.open(image_path)
+    source_format = img.format
+    original_size = _oriented_size(img)
+    
+    if max_width and source_format in ('JPEG', 'MPO') and max_width * DRAFT_GAP < original_size[0]:
+        scale = max_width * DRAFT_GAP / original_size[0]
+        img.draft(img.mode, (int(img.width * scale), int(img.height * scale)))
+    
+    img.load()
+    ImageOps.exif_transpose(img, in_place=True)
+    
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        has_alpha = img.mode in ('LA', 'PA', 'RGBa') or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    
+    return img, source_format, original_size
+
+
+def resize_ladder(img, sizes, original_size=None):
+    """
+    Genera las variaciones de mayor a menor, cada una a partir de la anterior.
+    
+    Cada paso reduce poco (1440 -> 1024 -> 768 -> ...), así que ninguna
+    variación vuelve a recorrer la imagen a resolución completa. No amplía:
+    si la imagen es más pequeña que una variación, se usa tal cual.
+    
+    Args:
+        img (PIL.Image): Imagen decodificada (ver ``open_source``)
+        sizes (dict): Nombre -> (ancho, alto), con alto None para mantener proporción
+        original_size (tuple): Tamaño original, para calcular la proporción exacta
+    
+    Yields:
+        tuple: (nombre de la variación, imagen redimensionada)
+    """
+    original_width, original_height = original_size or img.size
+    current = img
+    for name, (width, height) in sorted(sizes.items(), key=lambda item: -item[1][0]):
+        height = height or max(1, round(original_height * width / original_width))
+        if width < current.width:
+            current = current.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        yield name, current
+
+
+def encode_image(img, format_name):
+    """Codifica una imagen con las opciones de ``get_image_format_options``"""
+    if format_name in ('JPEG', 'AVIF') and img.mode == 'RGBA':
+        img = img.convert('RGB')
+    output_io = io.BytesIO()
+    img.save(output_io, format=format_name, **get_image_format_options().get(format_name, {}))
+    return output_io.getvalue()
+
+
+def _write_atomic(path, data):
+    """Escribe un archivo sin que un lector pueda verlo a medias"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def render_variant(image_path, size, format_name):
+    """
+    Genera una sola variación en un solo formato (ver ``imagenes.variants``).
+    
+    Args:
+        image_path (str): Ruta de la imagen original
+        size (tuple): (ancho, alto) de ``VARIATIONS``
+        format_name (str): Formato PIL de salida ('JPEG', 'WEBP', 'AVIF', 'PNG')
+    
+    Returns:
+        bytes: La variación codificada
+    """
+    img, _, original_size = open_source(image_path, size[0])
+    try:
+        for _, resized in resize_ladder(img, {'variant': size}, original_size):
+            return encode_image(resized, format_name)
+    finally:
+        img.close()
+
+
+def encode_variation(img, source_format, extension):
+    """
+    Codifica una variación en su formato original y en los formatos extra.
+    
+    Returns:
+        list: Tuplas (sufijo de la clave, extensión, bytes); el formato
+        original tiene sufijo vacío
+    """
+    source_format = 'JPEG' if source_format == 'MPO' else source_format
+    encoded = []
+    flattened = None
+    
+    for suffix, ext, format_name in [('', extension, source_format)] + EXTRA_FORMATS:
+        target = img
+        # JPEG y AVIF no guardan transparencia: se convierte una vez para ambos
+        if format_name in ('JPEG', 'AVIF') and img.mode == 'RGBA':
+            flattened = flattened or img.convert('RGB')
+            target = flattened
+        encoded.append((suffix, ext, encode_image(target, format_name)))
+    
+    return encoded
+
+
+def write_variations(image_path, variations, output_path, native=None):
+    """
+    Genera y guarda las variaciones de una imagen decodificándola una sola vez.
+    
+    Args:
+        image_path (str): Ruta de la imagen original
+        variations (dict): Nombre -> (ancho, alto) de las variaciones a generar
+        output_path (callable): Función ``(nombre, extension) -> ruta`` donde
+            guardar cada archivo
+        native (tuple): (extensión, formato PIL) del archivo principal de cada
+            variación; por defecto los del original
+    
+    Returns:
+        dict: Ruta de cada archivo generado (claves ``thumbnail``,
+        ``thumbnail_webp``...) y ``width``/``height`` de la imagen original
+    """
+    extension = os.path.splitext(image_path)[1].lower()
+    max_width = max(width for width, _ in variations.values())
+    img, source_format, original_size = open_source(image_path, max_width)
+    if native is not None:
+        extension, source_format = native
+    
+    result = {'width': original_size[0], 'height': original_size[1]}
+    try:
+        for variation_name, resized in resize_ladder(img, variations, original_size):
+            for suffix, ext, data in encode_variation(resized, source_format, extension):
+                path = output_path(variation_name, ext)
+                _write_atomic(path, data)
+                result[f'{variation_name}_{suffix}' if suffix else variation_name] = path
+    finally:
+        img.close()
     
     return result
 
 
 def generate_image_variations(original_image_path):
     """
-    Genera diferentes variaciones de una imagen (thumbnails, WebP, AVIF, etc.) en paralelo.
+    Genera diferentes variaciones de una imagen (thumbnails, WebP, AVIF, etc.).
     
     Args:
         original_image_path (str): Ruta a la imagen original
@@ -217,59 +348,22 @@ def generate_image_variations(original_image_path):
     """
     start_time = time.time()
     
-    # Cargar la imagen con PIL
-    img = Image.open(original_image_path)
-    
-    # Obtener información de la ruta
     path = Path(original_image_path)
-    directory = path.parent
-    filename = path.stem
-    extension = path.suffix.lower()
     
-    # Definir los tamaños para diferentes variaciones
-    variations = {
-        'thumbnail': (150, None),      # Ancho de 150px, altura proporcional 
-        'xs': (320, None),             # Móviles pequeños
-        'small': (480, None),          # Móviles
-        'medium': (768, None),         # Tablets/móviles grandes
-        'large': (1024, None),         # Escritorios pequeños/tablets horizontales
-        'xl': (1440, None),            # Escritorios grandes (opcional)
-    }
+    def output_path(variation_name, ext):
+        return str(path.parent / f"{path.stem}_{variation_name}{ext}")
     
-    # Resultado inicial
-    result_paths = {'original': original_image_path}
+    result_paths = write_variations(original_image_path, VARIATIONS, output_path)
+    result_paths.pop('width')
+    result_paths.pop('height')
+    result_paths['original'] = original_image_path
     
-    # Preparar parámetros para procesamiento en paralelo
-    params_list = []
-    for variation_name, size in variations.items():
-        params = {
-            'img': img,
-            'size': size,
-            'original_format': img.format,
-            'base_path': directory,
-            'filename': filename,
-            'variation_name': variation_name,
-            'extension': extension
-        }
-        params_list.append(params)
-    
-    # Procesar en paralelo
-    with ThreadPoolExecutor() as executor:
-        results = executor.map(process_variation, params_list)
-    
-    # Combinar resultados
-    for result in results:
-        result_paths.update(result)
-    
-    # Cerrar la imagen para liberar memoria
-    img.close()
-    
-    logger.debug(f"Generadas {len(variations)} variaciones en {time.time() - start_time:.2f} segundos")
+    logger.debug(f"Generadas {len(VARIATIONS)} variaciones en {time.time() - start_time:.2f} segundos")
     
     return result_paths
 
 
-def process_image(image_field, instance=None, commit=True):
+def process_image(image_field, instance=None, commit=True, variations=None):
     """
     Procesa una imagen cargada en un ImageField, generando versiones optimizadas.
     
@@ -277,6 +371,7 @@ def process_image(image_field, instance=None, commit=True):
         image_field (ImageField): El campo de imagen de Django
         instance (Model): Instancia del modelo (opcional)
         commit (bool): Si guardar los cambios a la base de datos
+        variations (list): Nombres de las variaciones a generar (default: todas)
     
     Returns:
         dict: Diccionario con información de las imágenes generadas
@@ -284,8 +379,6 @@ def process_image(image_field, instance=None, commit=True):
     if not image_field:
         return None
     
-    start_time = time.time()
-    
     # Guardar temporalmente si es un campo no guardado
     if not image_field.name:
         if instance:
@@ -293,108 +386,50 @@ def process_image(image_field, instance=None, commit=True):
         else:
             return None
     
-    # Abrir la imagen original con PIL
-    image_path = image_field.path
-    img = Image.open(image_path)
+    return render_variations(image_field.name, variations)
+
+
+def render_variations(storage_name, variations=None):
+    """
+    Genera las variaciones de una imagen guardada en el almacenamiento.
+    
+    Solo recibe y devuelve datos simples, así que puede ejecutarse en otro
+    proceso (ver ``imagenes.jobs``).
     
-    # Definir tamaños para las diferentes variaciones
+    Args:
+        storage_name (str): Nombre del archivo en el almacenamiento (``image.name``)
+        variations (list): Nombres de las variaciones a generar (default: todas)
+    
+    Returns:
+        dict: URL de cada variación generada, por ejemplo ``thumbnail`` y
+        ``thumbnail_webp``, además de ``original``, ``width``, ``height`` y
+        ``file_size`` de la imagen original
+    """
+    start_time = time.time()
+    
+    image_path = default_storage.path(storage_name)
     variations = {
-        'thumbnail': (150, None),      # Ancho de 150px, altura proporcional 
-        'xs': (320, None),             # Móviles pequeños
-        'small': (480, None),          # Móviles
-        'medium': (768, None),         # Tablets/móviles grandes
-        'large': (1024, None),         # Escritorios pequeños/tablets horizontales
-        'xl': (1440, None),            # Escritorios grandes (opcional)
+        variation_name: VARIATIONS[variation_name]
+        for variation_name in (variations or VARIATIONS)
     }
     
-    # Obtener información del archivo
-    filename = os.path.basename(image_field.name)
-    name, ext = os.path.splitext(filename)
-    base_path = os.path.dirname(image_field.name)
+    # Las variaciones se guardan junto al original: <nombre>_<variación>.<ext>
+    name = os.path.splitext(storage_name)[0]
     
-    # Preparar diccionario de resultados
-    result = {'original': image_field.url}
+    def output_path(variation_name, ext):
+        return os.path.join(settings.MEDIA_ROOT, f"{name}_{variation_name}{ext}")
     
-    # Lista para almacenar tareas
-    tasks = []
+    paths = write_variations(image_path, variations, output_path)
     
-    # Preparar tareas para procesamiento paralelo
-    for variation_name, size in variations.items():
-        # Obtener rutas relativas para las variaciones
-        resized_filename = f"{name}_{variation_name}{ext}"
-        webp_filename = f"{name}_{variation_name}.webp"
-        avif_filename = f"{name}_{variation_name}.avif"
-        
-        resized_relative_path = os.path.join(base_path, resized_filename)
-        webp_relative_path = os.path.join(base_path, webp_filename)
-        avif_relative_path = os.path.join(base_path, avif_filename)
-        
-        # Generar rutas absolutas para guardar los archivos
-        resized_abs_path = os.path.join(settings.MEDIA_ROOT, resized_relative_path)
-        webp_abs_path = os.path.join(settings.MEDIA_ROOT, webp_relative_path)
-        avif_abs_path = os.path.join(settings.MEDIA_ROOT, avif_relative_path)
-        
-        # Asegurar que el directorio existe
-        os.makedirs(os.path.dirname(resized_abs_path), exist_ok=True)
-        
-        tasks.append({
-            'variation_name': variation_name,
-            'size': size,
-            'img': img,
-            'format': img.format.upper(),
-            'resized_abs_path': resized_abs_path,
-            'webp_abs_path': webp_abs_path,
-            'avif_abs_path': avif_abs_path,
-            'resized_url': os.path.join(settings.MEDIA_URL, resized_relative_path).replace('\\', '/'),
-            'webp_url': os.path.join(settings.MEDIA_URL, webp_relative_path).replace('\\', '/'),
-            'avif_url': os.path.join(settings.MEDIA_URL, avif_relative_path).replace('\\', '/'),
-        })
-    
-    # Procesar las tareas en paralelo
-    def process_task(task):
-        # Generar versión redimensionada
-        resized_io = create_resized_image(task['img'], task['size'], format_name=task['format'])
-        with open(task['resized_abs_path'], 'wb') as f:
-            f.write(resized_io.getvalue())
-        
-        # Generar versión WebP
-        webp_io = convert_to_webp(ImageOps.exif_transpose(task['img'].resize(task['size'], Image.Resampling.LANCZOS)))
-        with open(task['webp_abs_path'], 'wb') as f:
-            f.write(webp_io.getvalue())
-        
-        # Generar versión AVIF si está soportada
-        if AVIF_SUPPORT:
-            avif_io = convert_to_avif(ImageOps.exif_transpose(task['img'].resize(task['size'], Image.Resampling.LANCZOS)))
-            if avif_io:
-                with open(task['avif_abs_path'], 'wb') as f:
-                    f.write(avif_io.getvalue())
-                return {
-                    'variation_name': task['variation_name'],
-                    'url': task['resized_url'],
-                    'webp_url': task['webp_url'],
-                    'avif_url': task['avif_url'],
-                }
-        
-        return {
-            'variation_name': task['variation_name'],
-            'url': task['resized_url'],
-            'webp_url': task['webp_url'],
-        }
-    
-    # Ejecutar tareas en paralelo
-    with ThreadPoolExecutor() as executor:
-        task_results = list(executor.map(process_task, tasks))
-    
-    # Actualizar resultado con las URLs
-    for task_result in task_results:
-        variation_name = task_result['variation_name']
-        result[variation_name] = task_result['url']
-        result[f'{variation_name}_webp'] = task_result['webp_url']
-        if 'avif_url' in task_result:
-            result[f'{variation_name}_avif'] = task_result['avif_url']
-    
-    # Cerrar la imagen para liberar memoria
-    img.close()
+    result = {
+        'original': default_storage.url(storage_name),
+        'width': paths.pop('width'),
+        'height': paths.pop('height'),
+        'file_size': os.path.getsize(image_path),
+    }
+    for key, path in paths.items():
+        relative_path = os.path.relpath(path, settings.MEDIA_ROOT)
+        result[key] = os.path.join(settings.MEDIA_URL, relative_path).replace('\\', '/')
     
     logger.debug(f"Procesadas {len(variations)} variaciones en {time.time() - start_time:.2f} segundos")
     
@@ -447,7 +482,7 @@ def smart_thumbnail_process(image_field, instance=None, commit=True, target_size
     if SMART_CROP_SUPPORT:
         try:
             # Usar recorte inteligente y redimensionar
-            img_cropped = smart_crop_and_resize(img, target_size[0], target_size[1])
+            img_cropped = smart_crop_and_resize(ImageOps.exif_transpose(img), target_size)
             
             # Guardar imagen recortada en formato original
             img_cropped.save(smart_thumbnail_path, format=img.format)
@@ -0,0 +1,442 @@
+"""
+Cola de trabajos para generar las variaciones de las imágenes.
+
+Antes la señal ``post_save`` de ``Image`` generaba las 6 variaciones × 2-3
+formatos dentro de la petición de subida, con hilos que el GIL serializa
+porque el trabajo de Pillow es de CPU. Ahora la subida solo crea filas de
+``ImageJob`` y responde con ``optimized=False``; el comando
+``process_image_jobs`` las ejecuta en un ``ProcessPoolExecutor``.
+
+- Prioridades: cada imagen se divide en trabajos por grupo de tamaños
+  (``PRIORITY_GROUPS``). El worker toma primero los de menor prioridad, así
+  las miniaturas de todas las subidas recientes salen antes que los tamaños
+  grandes de cualquiera de ellas. Las regeneraciones masivas suman
+  ``priority_offset`` para no adelantarse a las subidas.
+- Los procesos del grupo solo reciben el nombre del archivo y la lista de
+  variaciones, y devuelven las URLs; las escrituras en la base de datos las
+  hace el proceso principal del worker.
+- Reservas y reintentos con ``dental_erp.lease_queue``, como en
+  ``emails.outbox``: el trabajo queda ``running`` durante
+  ``IMAGENES_JOB_LEASE_SECONDS`` y los errores se reintentan con espera
+  exponencial (base ``IMAGENES_JOB_RETRY_BASE_SECONDS``) hasta
+  ``max_attempts``.
+
+Las regeneraciones masivas (``OptimizationRun``) no crean un trabajo por
+imagen: ``process_run`` recorre las imágenes con ``iterator()`` por lotes,
+reparte cada lote en el mismo grupo de procesos y guarda tras cada lote la
+última imagen terminada. Las imágenes cuyo original tiene el mismo SHA-256
+que cuando se optimizaron se saltan sin decodificarlas.
+"""
+
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from dental_erp.lease_queue import LeaseQueue
+from . import variants
+from .image_utils import VARIATIONS, render_variations
+from .models import Image, ImageJob, OptimizationRun
+
+logger = logging.getLogger(__name__)
+
+# Grupos de variaciones y su prioridad (menor = antes)
+PRIORITY_GROUPS = (
+    (0, ('thumbnail',)),
+    (5, ('xs', 'small')),
+    (10, ('medium', 'large', 'xl')),
+)
+
+# Prioridad extra de las regeneraciones masivas frente a las subidas
+BATCH_PRIORITY_OFFSET = 20
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+def enqueue_variations(image, variations=None, priority_offset=0, skip_if_pending=False):
+    """
+    Encolar la generación de variaciones de una imagen.
+
+    Args:
+        image: Instancia de ``Image``
+        variations: Variaciones a generar (default: todas)
+        priority_offset: Se suma a la prioridad de cada grupo
+        skip_if_pending: No encolar si la imagen ya tiene trabajos activos
+
+    Returns:
+        list: Trabajos creados, en orden de prioridad
+    """
+    if skip_if_pending and ImageJob.objects.filter(image=image, status__in=ACTIVE_STATUSES).exists():
+        return []
+
+    requested = set(variations or VARIATIONS)
+    unknown = requested - set(VARIATIONS)
+    if unknown:
+        raise ValueError(f"Variaciones desconocidas: {', '.join(sorted(unknown))}")
+
+    now = timezone.now()
+    jobs = [
+        ImageJob(
+            image=image,
+            variations=[name for name in group if name in requested],
+            priority=priority + priority_offset,
+            available_at=now,
+        )
+        for priority, group in PRIORITY_GROUPS
+        if requested.intersection(group)
+    ]
+    return ImageJob.objects.bulk_create(jobs)
+
+
+queue = LeaseQueue(
+    ImageJob,
+    status='status', pending='pending', running='running', failed='failed',
+    available_at='available_at', locked_until='locked_until',
+    attempts='attempts', max_attempts='max_attempts', error='error',
+    order_by=('priority', 'available_at'), started_at='started_at', finished_at='finished_at',
+    lease=('IMAGENES_JOB_LEASE_SECONDS', 10 * 60),
+    retry_base=('IMAGENES_JOB_RETRY_BASE_SECONDS', 30),
+)
+
+
+def claim(limit):
+    """
+    Reservar hasta ``limit`` trabajos, los de menor prioridad primero.
+
+    Returns:
+        list: Trabajos reservados (con su imagen), ya marcados ``running``
+    """
+    return queue.claim(limit, select_related=('image',))
+
+
+def complete(job, result):
+    job.image.apply_variations(result)
+    queue.finish(job, status='done', error='')
+    return 'done'
+
+
+def fail(job, error):
+    """Reintentar el trabajo más tarde o marcarlo como fallido"""
+    status = queue.fail(job, error, permanent=isinstance(error, FileNotFoundError))
+    if status == 'failed':
+        logger.error("Trabajo de imagen %s fallido: %s", job.pk, error)
+    return status
+
+
+def source_hash(storage_name):
+    """SHA-256 del archivo original"""
+    from django.core.files.storage import default_storage
+
+    with default_storage.open(storage_name, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def render(storage_name, variations, digest=None):
+    """
+    Generar las variaciones de un trabajo. Se ejecuta en los procesos del
+    grupo: con variaciones bajo demanda las deja en la caché de
+    ``imagenes.variants``; si no, junto al original.
+    """
+    if variants.on_demand():
+        result = variants.prewarm(storage_name, variations)
+    else:
+        result = render_variations(storage_name, variations)
+    result['source_hash'] = digest or source_hash(storage_name)
+    return result
+
+
+def _init_worker():
+    # Con el método 'spawn' los procesos hijos no heredan la configuración
+    import django
+    django.setup()
+
+
+def create_pool(workers):
+    """
+    Grupo de procesos para ``process_batch``.
+
+    Se cierran antes las conexiones a la base de datos para que los
+    procesos hijos no hereden sus sockets; el proceso principal las vuelve
+    a abrir al siguiente uso.
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def process_batch(limit=10, executor=None):
+    """
+    Reservar y ejecutar un lote de trabajos.
+
+    Args:
+        limit: Máximo de trabajos del lote
+        executor: ``ProcessPoolExecutor`` (ver ``create_pool``); sin él se
+            ejecutan en el proceso actual
+
+    Returns:
+        dict: Número de trabajos por estado final del intento
+    """
+    summary = {'done': 0, 'pending': 0, 'failed': 0}
+    jobs = claim(limit)
+
+    if executor is None:
+        for job in jobs:
+            try:
+                result = render(job.image.image.name, job.variations)
+            except Exception as e:
+                summary[fail(job, e)] += 1
+            else:
+                summary[complete(job, result)] += 1
+        return summary
+
+    futures = {
+        executor.submit(render, job.image.image.name, job.variations): job
+        for job in jobs
+    }
+    # Guardar cada resultado en cuanto termina: las miniaturas no esperan al lote
+    for future in as_completed(futures):
+        job = futures[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            summary[fail(job, e)] += 1
+        else:
+            summary[complete(job, result)] += 1
+    return summary
+
+
+def reoptimize(storage_name, known_hash=''):
+    """
+    Regenerar todas las variaciones de una imagen de una regeneración
+    masiva. Se ejecuta en los procesos del grupo.
+
+    Args:
+        known_hash: SHA-256 con el que ya está optimizada; si el original
+            no ha cambiado no se regenera
+
+    Returns:
+        dict: Resultado para ``Image.apply_variations``, o None si se salta
+    """
+    digest = source_hash(storage_name)
+    if digest == known_hash:
+        return None
+    if variants.on_demand():
+        # Las variaciones viejas se vuelven a generar al pedirlas
+        variants.invalidate(storage_name)
+        return render(storage_name, getattr(settings, 'IMAGENES_VARIANTES_PRECALENTAR', None), digest)
+    return render(storage_name, None, digest)
+
+
+def start_run(content_type='', object_id='', force=False):
+    """Crear una regeneración masiva pendiente"""
+    return OptimizationRun.objects.create(
+        content_type=content_type or '', object_id=object_id or '', force=force
+    )
+
+
+def claim_run(run_id=None):
+    """
+    Reservar una regeneración masiva pendiente (o abandonada por un worker
+    caído), la más antigua o la indicada.
+
+    Returns:
+        OptimizationRun: La regeneración reservada, o None
+    """
+    lease = timedelta(seconds=getattr(settings, 'IMAGENES_JOB_LEASE_SECONDS', 10 * 60))
+
+    def due():
+        return Q(status='pending') | Q(status='running', locked_until__lt=timezone.now())
+
+    queryset = OptimizationRun.objects.filter(due()).order_by('created_at')
+    if run_id is not None:
+        queryset = queryset.filter(pk=run_id)
+    for pk in queryset.values_list('pk', flat=True)[:5]:
+        now = timezone.now()
+        reserved = OptimizationRun.objects.filter(due(), pk=pk).update(
+            status='running',
+            locked_until=now + lease,
+            started_at=Coalesce('started_at', Value(now)),
+            attempts=F('attempts') + 1,
+        )
+        if reserved:
+            return OptimizationRun.objects.get(pk=pk)
+    return None
+
+
+def run_queryset(run):
+    """Imágenes de una regeneración masiva en el orden en que se recorren"""
+    queryset = Image.objects.exclude(image='').order_by('pk')
+    if run.content_type:
+        queryset = queryset.filter(content_type=run.content_type)
+    if run.object_id:
+        queryset = queryset.filter(object_id=run.object_id)
+    return queryset
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _reoptimize_chunk(run, images, executor):
+    """Regenerar un lote y guardar cada resultado en cuanto termina"""
+    counts = {'processed': 0, 'skipped': 0, 'errors': 0}
+
+    def tasks():
+        for image in images:
+            known = '' if run.force or not image.optimized else image.source_hash
+            yield image, (image.image.name, known)
+
+    def apply(image, result):
+        if result is None:
+            counts['skipped'] += 1
+        else:
+            image.apply_variations(result)
+            counts['processed'] += 1
+
+    if executor is None:
+        for image, args in tasks():
+            try:
+                result = reoptimize(*args)
+            except Exception as e:
+                logger.error("Regeneración de la imagen %s fallida: %s", image.pk, e)
+                counts['errors'] += 1
+            else:
+                apply(image, result)
+        return counts
+
+    futures = {executor.submit(reoptimize, *args): image for image, args in tasks()}
+    for future in as_completed(futures):
+        image = futures[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error("Regeneración de la imagen %s fallida: %s", image.pk, e)
+            counts['errors'] += 1
+        else:
+            apply(image, result)
+    return counts
+
+
+def process_run(run, executor=None, chunk_size=100, limit=None, on_chunk=None):
+    """
+    Ejecutar una regeneración masiva reservada con ``claim_run``.
+
+    Tras cada lote guarda el progreso y ``last_image_id`` y renueva la
+    reserva. Si se pierde la reserva (otro worker la tomó al vencer) se
+    detiene sin guardar nada más.
+
+    Args:
+        run: ``OptimizationRun`` reservada
+        executor: ``ProcessPoolExecutor`` (ver ``create_pool``); sin él se
+            ejecuta en el proceso actual
+        chunk_size: Imágenes por lote
+        limit: Detenerse después de unas ``limit`` imágenes (redondeado al
+            lote) y dejar la regeneración pendiente para continuar después
+        on_chunk: Función llamada con ``run`` tras cada lote
+
+    Returns:
+        bool: True si la regeneración terminó
+    """
+    lease = timedelta(seconds=getattr(settings, 'IMAGENES_JOB_LEASE_SECONDS', 10 * 60))
+    mine = OptimizationRun.objects.filter(pk=run.pk, status='running', attempts=run.attempts)
+    if limit:
+        chunk_size = min(chunk_size, limit)
+
+    queryset = run_queryset(run)
+    if not run.total:
+        run.total = queryset.count()
+        mine.update(total=run.total)
+    if run.last_image_id:
+        queryset = queryset.filter(pk__gt=run.last_image_id)
+
+    rows = queryset.only('id', 'image', 'optimized', 'source_hash').iterator(chunk_size=chunk_size)
+    done = 0
+    for images in _chunks(rows, chunk_size):
+        counts = _reoptimize_chunk(run, images, executor)
+        run.last_image_id = images[-1].pk
+        for field, value in counts.items():
+            setattr(run, field, getattr(run, field) + value)
+        saved = mine.update(
+            last_image_id=run.last_image_id,
+            processed=run.processed,
+            skipped=run.skipped,
+            errors=run.errors,
+            locked_until=timezone.now() + lease,
+        )
+        if not saved:
+            logger.warning("Regeneración %s reservada por otro worker; se detiene", run.pk)
+            return False
+        if on_chunk:
+            on_chunk(run)
+        done += len(images)
+        if limit and done >= limit:
+            mine.update(status='pending', locked_until=None)
+            run.status = 'pending'
+            return False
+
+    run.status = 'done'
+    run.finished_at = timezone.now()
+    mine.update(status='done', locked_until=None, finished_at=run.finished_at)
+    return True
+
+
+def run_status(run):
+    """Progreso de una regeneración masiva, para la API"""
+    return {
+        'id': str(run.pk),
+        'status': run.status,
+        'content_type': run.content_type or None,
+        'object_id': run.object_id or None,
+        'force': run.force,
+        'total': run.total,
+        'processed': run.processed,
+        'skipped': run.skipped,
+        'errors': run.errors,
+        'created_at': run.created_at,
+        'started_at': run.started_at,
+        'finished_at': run.finished_at,
+    }
+
+
+def image_status(image):
+    """Estado de las variaciones y trabajos de una imagen, para la API"""
+    jobs = list(image.jobs.order_by('created_at', 'priority'))
+    return {
+        'id': str(image.pk),
+        'optimized': image.optimized,
+        'variations': {name: bool(image.variant_url(name)) for name in VARIATIONS},
+        'pending_jobs': sum(1 for job in jobs if job.status in ACTIVE_STATUSES),
+        'jobs': [
+            {
+                'id': str(job.pk),
+                'variations': job.variations,
+                'priority': job.priority,
+                'status': job.status,
+                'attempts': job.attempts,
+                'error': job.error or None,
+                'created_at': job.created_at,
+                'finished_at': job.finished_at,
+            }
+            for job in jobs
+        ],
+    }
+
+
+def queue_stats():
+    """Trabajos por estado"""
+    rows = ImageJob.objects.values('status').annotate(total=Count('pk'))
+    stats = {status: 0 for status, _ in ImageJob.STATUS_CHOICES}
+    stats.update({row['status']: row['total'] for row in rows})
+    return stats
@@ -0,0 +1,97 @@
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from imagenes import jobs
+from imagenes.models import Image, ImageJob
+from PIL import Image as PILImage
+import io
+import random
+import shutil
+import tempfile
+import time
+
+
+def imagen_sintetica(rng, size):
+    """JPEG con ruido para que la compresión se parezca a una foto"""
+    width, height = size
+    small = PILImage.effect_noise((width // 8, height // 8), 60).convert('RGB')
+    tinte = PILImage.new('RGB', small.size, tuple(rng.randint(40, 220) for _ in range(3)))
+    img = PILImage.blend(small, tinte, 0.5).resize(size, PILImage.BILINEAR)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara las subidas por segundo generando las variaciones en la petición '
+        'contra encolarlas (imagenes.jobs), y mide cuánto tarda el worker en vaciar '
+        'la cola. Usa un MEDIA_ROOT temporal y revierte los datos al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=20, help='Imágenes a subir por modo')
+        parser.add_argument('--width', type=int, default=3000, help='Ancho de las imágenes')
+        parser.add_argument('--height', type=int, default=2000, help='Alto de las imágenes')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla aleatoria')
+
+    def subir(self, contenidos, sincronos):
+        with override_settings(IMAGENES_DERIVADOS_SINCRONOS=sincronos):
+            inicio = time.perf_counter()
+            for i, contenido in enumerate(contenidos):
+                Image.objects.create(
+                    image=ContentFile(contenido, name=f'benchmark-{i}.jpg'),
+                    content_type='otro',
+                    object_id='benchmark',
+                )
+            return time.perf_counter() - inicio
+
+    def handle(self, *args, **options):
+        uploads = options['uploads']
+        rng = random.Random(options['seed'])
+
+        self.stdout.write(f"Generando {uploads} imágenes de {options['width']}x{options['height']}...")
+        contenidos = [
+            imagen_sintetica(rng, (options['width'], options['height'])) for _ in range(uploads)
+        ]
+
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root), transaction.atomic():
+                segundos = self.subir(contenidos, sincronos=True)
+                self.stdout.write(
+                    f"- En la petición: {uploads / segundos:.2f} subidas/s "
+                    f"({segundos * 1000 / uploads:.0f} ms por subida)"
+                )
+
+                segundos = self.subir(contenidos, sincronos=False)
+                self.stdout.write(
+                    f"- Encoladas: {uploads / segundos:.2f} subidas/s "
+                    f"({segundos * 1000 / uploads:.0f} ms por subida)"
+                )
+
+                # El vaciado se mide en el proceso actual: los procesos de
+                # process_image_jobs no verían la transacción sin confirmar
+                inicio = time.perf_counter()
+                miniaturas = None
+                while True:
+                    resumen = jobs.process_batch(2)
+                    if not sum(resumen.values()):
+                        break
+                    if miniaturas is None and not ImageJob.objects.filter(
+                        priority=jobs.PRIORITY_GROUPS[0][0], status__in=jobs.ACTIVE_STATUSES
+                    ).exists():
+                        miniaturas = time.perf_counter() - inicio
+                total = time.perf_counter() - inicio
+                self.stdout.write(
+                    f"- Worker: miniaturas listas en {miniaturas or total:.2f} s, "
+                    f"cola vacía en {total:.2f} s ({uploads / total:.2f} imágenes/s)"
+                )
+
+                # No dejar datos sintéticos en la base de datos
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark completado (datos revertidos)"))
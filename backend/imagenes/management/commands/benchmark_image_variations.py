@@ -0,0 +1,143 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from imagenes import image_utils
+from PIL import Image as PILImage, ImageOps
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+
+def imagen_sintetica(path, rng, size, orientation=1):
+    """JPEG con ruido y degradado, para que se comprima como una foto"""
+    width, height = size
+    ruido = PILImage.effect_noise((width // 4, height // 4), 40).convert('RGB')
+    tinte = PILImage.linear_gradient('L').resize(ruido.size).convert('RGB')
+    img = PILImage.blend(ruido, tinte, rng.uniform(0.3, 0.7)).resize(size, PILImage.BICUBIC)
+    exif = PILImage.Exif()
+    exif[0x0112] = orientation
+    img.save(path, format='JPEG', quality=92, exif=exif)
+
+
+def rss_actual_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def motor_anterior(image_path, output_dir):
+    """
+    Algoritmo anterior de render_variations: cada variación redimensiona la
+    imagen completa una vez por formato y vuelve a aplicar la orientación EXIF.
+    """
+    img = PILImage.open(image_path)
+    img.load()
+    name, ext = os.path.splitext(os.path.basename(image_path))
+
+    def variacion(item):
+        variation_name, (width, _) = item
+        size = (width, max(1, round(img.height * width / img.width)))
+        resized_io = image_utils.create_resized_image(img, size, format_name=img.format)
+        with open(os.path.join(output_dir, f"{name}_{variation_name}{ext}"), 'wb') as f:
+            f.write(resized_io.getvalue())
+        webp_io = image_utils.convert_to_webp(
+            ImageOps.exif_transpose(img.resize(size, PILImage.Resampling.LANCZOS))
+        )
+        with open(os.path.join(output_dir, f"{name}_{variation_name}.webp"), 'wb') as f:
+            f.write(webp_io.getvalue())
+        if image_utils.AVIF_SUPPORT:
+            avif_io = image_utils.convert_to_avif(
+                ImageOps.exif_transpose(img.resize(size, PILImage.Resampling.LANCZOS))
+            )
+            with open(os.path.join(output_dir, f"{name}_{variation_name}.avif"), 'wb') as f:
+                f.write(avif_io.getvalue())
+
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(variacion, image_utils.VARIATIONS.items()))
+    img.close()
+
+
+def motor_actual(image_path, output_dir):
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    image_utils.write_variations(
+        image_path,
+        image_utils.VARIATIONS,
+        lambda variation_name, ext: os.path.join(output_dir, f"{name}_{variation_name}{ext}"),
+    )
+
+
+MOTORES = {'anterior': motor_anterior, 'actual': motor_actual}
+
+
+def medir(motor, paths, output_dir):
+    """Se ejecuta en un proceso nuevo para medir su pico de memoria por separado"""
+    inicio_rss = rss_actual_kb()
+    tiempos = []
+    for path in paths:
+        inicio = time.perf_counter()
+        MOTORES[motor](path, output_dir)
+        tiempos.append(time.perf_counter() - inicio)
+    pico_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    salida = sum(os.path.getsize(os.path.join(output_dir, f)) for f in os.listdir(output_dir))
+    return tiempos, inicio_rss, pico_kb, salida
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el motor de variaciones anterior (un redimensionado de la imagen '
+        'completa por tamaño y formato) con el actual (una decodificación con draft, '
+        'pirámide de tamaños y todos los formatos desde cada tamaño). Mide tiempo '
+        'y pico de memoria (RSS) de cada motor en un proceso aparte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='*', help='Fotos a usar (default: sintéticas de 12 MP)')
+        parser.add_argument('--count', type=int, default=5, help='Fotos sintéticas a generar')
+        parser.add_argument('--width', type=int, default=4000, help='Ancho de las fotos sintéticas')
+        parser.add_argument('--height', type=int, default=3000, help='Alto de las fotos sintéticas')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla aleatoria')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp()
+        try:
+            paths = list(options['images'])
+            for path in paths:
+                if not os.path.isfile(path):
+                    raise CommandError(f"No existe la imagen: {path}")
+            if not paths:
+                rng = random.Random(options['seed'])
+                size = (options['width'], options['height'])
+                self.stdout.write(
+                    f"Generando {options['count']} fotos de {size[0]}x{size[1]} "
+                    f"({size[0] * size[1] / 1e6:.0f} MP)..."
+                )
+                for i in range(options['count']):
+                    path = os.path.join(workdir, f'foto-{i}.jpg')
+                    # La mitad con orientación EXIF girada, como las de móvil
+                    imagen_sintetica(path, rng, size, orientation=6 if i % 2 else 1)
+                    paths.append(path)
+
+            # 'spawn' para que cada medición empiece con un proceso limpio
+            context = multiprocessing.get_context('spawn')
+            for motor in MOTORES:
+                output_dir = os.path.join(workdir, motor)
+                os.makedirs(output_dir)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    tiempos, inicio_rss, pico_kb, salida = executor.submit(
+                        medir, motor, paths, output_dir
+                    ).result()
+                self.stdout.write(
+                    f"- {motor}: {sum(tiempos):.2f} s en total, "
+                    f"{sum(tiempos) * 1000 / len(tiempos):.0f} ms por foto; "
+                    f"pico RSS {pico_kb / 1024:.0f} MB (+{(pico_kb - inicio_rss) / 1024:.0f} MB); "
+                    f"{salida / 1024 / 1024:.1f} MB generados"
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark completado"))
@@ -0,0 +1,147 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from imagenes import blobs, variants
+from imagenes.image_utils import VARIATIONS
+import os
+
+
+# Columnas *_url de Image con variaciones guardadas junto al original
+IMAGE_URL_COLUMNS = [
+    f'{name}{suffix}_url'
+    for name in VARIATIONS
+    for suffix in ('', '_webp', '_avif')
+]
+
+
+def tamaño_legible(nbytes):
+    for unidad in ('B', 'KB', 'MB', 'GB'):
+        if nbytes < 1024 or unidad == 'GB':
+            return f"{nbytes:.1f} {unidad}" if unidad != 'B' else f"{nbytes} B"
+        nbytes /= 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Pasa los archivos subidos antes del almacenamiento por contenido '
+        '(imagenes.blobs) a un blob por SHA-256: los duplicados pasan a '
+        'apuntar al mismo archivo y se borran las copias. Después recalcula '
+        'las referencias, borra los blobs que nadie usa y muestra el espacio '
+        'liberado. Se puede interrumpir y volver a ejecutar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=200, help='Filas leídas por lote')
+        parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se liberaría sin hacer cambios')
+
+    def handle(self, *args, **options):
+        self.storage = default_storage
+        self.dry_run = options['dry_run']
+        self.stats = {'files': 0, 'duplicates': 0, 'missing': 0, 'bytes': 0}
+        # Resúmenes vistos en esta ejecución (para --dry-run)
+        self.seen = set()
+
+        for label, field in blobs.FIELDS:
+            model = apps.get_model(label)
+            legacy = (
+                model._default_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .exclude(**{f'{field}__startswith': f'{blobs.BLOB_PREFIX}/'}).order_by('pk')
+            )
+            total = legacy.count()
+            self.stdout.write(f"{label}.{field}: {total} archivos sin pasar a blobs")
+            for row in legacy.iterator(chunk_size=options['batch']):
+                self.dedupe_row(model, field, row)
+
+        if not self.dry_run:
+            fixed = blobs.recount()
+            if fixed:
+                self.stdout.write(f"Referencias corregidas en {fixed} blobs")
+        swept, freed = blobs.sweep(dry_run=self.dry_run)
+        self.stats['bytes'] += freed
+
+        verbo = 'Se liberarían' if self.dry_run else 'Liberados'
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.stats['files']} archivos revisados, {self.stats['duplicates']} duplicados, "
+            f"{swept} blobs sin referencias, {self.stats['missing']} no encontrados. "
+            f"{verbo} {tamaño_legible(self.stats['bytes'])} ({self.stats['bytes']} bytes)"
+        ))
+
+    def size(self, name):
+        return self.storage.size(name) if self.storage.exists(name) else 0
+
+    def dedupe_row(self, model, field, row):
+        name = getattr(row, field).name
+        if not self.storage.exists(name):
+            self.stats['missing'] += 1
+            return
+        with self.storage.open(name, 'rb') as content:
+            digest, size = blobs.digest_file(content)
+        self.stats['files'] += 1
+
+        if self.dry_run:
+            if digest in self.seen or blobs.MediaBlob.objects.filter(pk=digest).exists():
+                self.stats['duplicates'] += 1
+                self.stats['bytes'] += size
+            self.seen.add(digest)
+            return
+
+        blob, _ = blobs.acquire(digest, size, os.path.splitext(name)[1].lower())
+        if self.storage.exists(blob.name):
+            self.stats['duplicates'] += 1
+            self.stats['bytes'] += size
+        else:
+            with self.storage.open(name, 'rb') as content:
+                self.storage.save(blob.name, content)
+
+        updates = {field: blob.name}
+        updates.update(self.move_derivatives(row, name, blob.name))
+        model._default_manager.filter(pk=row.pk).update(**updates)
+        if not blobs.references(name):
+            self.storage.delete(name)
+            # Variaciones bajo demanda del nombre anterior
+            variants.invalidate(name)
+
+    def move_derivatives(self, row, old_name, new_name):
+        """
+        Pasar junto al blob los derivados del archivo anterior (variaciones
+        de ``Image`` o miniatura de ``ImagenMedica``). Si el blob ya tiene
+        ese derivado se borra la copia.
+
+        Returns:
+            dict: Campos de la fila a actualizar
+        """
+        derivatives = {}
+        old_base = os.path.splitext(old_name)[0]
+        for column in IMAGE_URL_COLUMNS:
+            url = getattr(row, column, None)
+            if url and url.startswith(settings.MEDIA_URL):
+                derivatives[column] = url[len(settings.MEDIA_URL):]
+        miniatura = getattr(row, 'miniatura', None)
+        if miniatura:
+            derivatives['miniatura'] = miniatura.name
+
+        updates = {}
+        for column, derived in derivatives.items():
+            if column == 'miniatura':
+                suffix = '_thumb.jpg'
+            elif derived.startswith(f"{old_base}_"):
+                suffix = derived[len(old_base):]
+            else:
+                continue
+            target = blobs.derivative_name(new_name, suffix)
+            if self.storage.exists(target):
+                self.stats['bytes'] += self.size(derived)
+                if self.storage.exists(derived):
+                    self.storage.delete(derived)
+            elif self.storage.exists(derived):
+                with self.storage.open(derived, 'rb') as content:
+                    self.storage.save(target, content)
+                self.storage.delete(derived)
+            else:
+                continue
+            if column == 'miniatura':
+                updates[column] = target
+            else:
+                updates[column] = f"{settings.MEDIA_URL}{target}"
+        return updates
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from imagenes import variants
+from imagenes.image_utils import VARIATIONS
+from imagenes.models import Image
+import os
+import shutil
+
+
+# Columnas *_url de Image: (variación, formato de la columna)
+URL_COLUMNS = [
+    (name, fmt)
+    for name in VARIATIONS
+    for fmt in (None, 'webp', 'avif')
+]
+
+
+def column_name(size, fmt):
+    return f"{size}{'_' + fmt if fmt else ''}_url"
+
+
+class Command(BaseCommand):
+    help = (
+        'Pasa las imágenes con variaciones guardadas (columnas *_url) a las '
+        'variaciones bajo demanda: mueve los archivos ya generados a la caché de '
+        'imagenes.variants y vacía las columnas. Se puede interrumpir y volver a '
+        'ejecutar; cuando no queden filas con columnas *_url, las columnas pueden '
+        'eliminarse del modelo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=200, help='Imágenes por lote')
+        parser.add_argument('--keep-files', action='store_true', help='Copiar los archivos en lugar de moverlos')
+        parser.add_argument('--dry-run', action='store_true', help='Mostrar qué se haría sin hacer cambios')
+
+    def media_path(self, url):
+        """Ruta en MEDIA_ROOT de una URL guardada, o None si no es de MEDIA_URL"""
+        if not url.startswith(settings.MEDIA_URL):
+            return None
+        return os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+
+    def handle(self, *args, **options):
+        stored = Q()
+        for size, fmt in URL_COLUMNS:
+            column = column_name(size, fmt)
+            stored |= Q(**{f'{column}__isnull': False}) & ~Q(**{column: ''})
+
+        queryset = Image.objects.filter(stored).order_by('pk')
+        total = queryset.count()
+        self.stdout.write(f"{total} imágenes con variaciones guardadas")
+        if options['dry_run'] or not total:
+            return
+
+        cache = variants.get_cache()
+        transfer = shutil.copy2 if options['keep_files'] else shutil.move
+        cleared = {column_name(size, fmt): None for size, fmt in URL_COLUMNS}
+        images = files = missing = 0
+        last_pk = None
+
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch[:options['batch']])
+            if not batch:
+                break
+            for image in batch:
+                nbytes = 0
+                for size, fmt in URL_COLUMNS:
+                    url = getattr(image, column_name(size, fmt))
+                    source = self.media_path(url) if url else None
+                    if source is None:
+                        continue
+                    if not os.path.exists(source):
+                        missing += 1
+                        continue
+                    target_fmt = fmt or variants.native_format(image.image.name)
+                    target = cache.path(variants.cache_key(image.image.name, size, target_fmt))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    transfer(source, target)
+                    nbytes += os.path.getsize(target)
+                    files += 1
+                Image.objects.filter(pk=image.pk).update(**cleared)
+                cache.added(nbytes)
+                images += 1
+            last_pk = batch[-1].pk
+            self.stdout.write(f"- {images}/{total} imágenes, {files} archivos en la caché")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Migradas {images} imágenes: {files} archivos pasados a la caché, "
+            f"{missing} no encontrados (se generarán al pedirlos)"
+        ))
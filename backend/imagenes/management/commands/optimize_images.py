@@ -1,17 +1,27 @@
 from django.core.management.base import BaseCommand, CommandError
-from imagenes.models import Image
-from django.core.files.storage import default_storage
-from django.db.models import Q
-import os
+from imagenes import jobs
+from imagenes.models import OptimizationRun
 import time
 
 
+def duracion(segundos):
+    minutos, segundos = divmod(int(segundos), 60)
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas}h{minutos:02d}m{segundos:02d}s" if horas else f"{minutos}m{segundos:02d}s"
+
+
 class Command(BaseCommand):
-    help = 'Optimiza las imágenes existentes, generando thumbnails y versiones WebP'
-    
+    help = (
+        'Regenera las variaciones de las imágenes existentes en un grupo de '
+        'procesos. Salta las imágenes cuyo original no ha cambiado desde que se '
+        'optimizaron (SHA-256) y guarda el progreso tras cada lote: si se '
+        'interrumpe, al volver a ejecutarlo con los mismos filtros continúa '
+        'donde se quedó.'
+    )
+
     def add_arguments(self, parser):
         parser.add_argument(
-            '--content-type', 
+            '--content-type',
             dest='content_type',
             help='Filtrar por tipo de contenido (paciente, dentista, etc.)'
         )
@@ -21,9 +31,9 @@ class Command(BaseCommand):
             help='Filtrar por ID de objeto'
         )
         parser.add_argument(
-            '--force', 
+            '--force',
             action='store_true',
-            help='Forzar regeneración incluso para imágenes ya optimizadas'
+            help='Regenerar también las imágenes cuyo original no ha cambiado'
         )
         parser.add_argument(
             '--dry-run',
@@ -33,92 +43,99 @@ class Command(BaseCommand):
         parser.add_argument(
             '--limit',
             type=int,
-            help='Limitar el número de imágenes a procesar'
+            help='Procesar como mucho este número de imágenes y dejar el resto para otra ejecución'
         )
-    
+        parser.add_argument('--workers', type=int, default=2, help='Procesos (1 = en el proceso actual)')
+        parser.add_argument('--chunk-size', type=int, default=100, help='Imágenes por lote (y por punto de control)')
+        parser.add_argument('--run', dest='run_id', help='Continuar la regeneración indicada (p. ej. creada desde la API)')
+        parser.add_argument('--restart', action='store_true', help='Empezar de cero aunque haya una regeneración sin terminar')
+
+    def get_run(self, options):
+        """Regeneración a continuar o una nueva con los filtros indicados"""
+        if options['run_id']:
+            try:
+                return OptimizationRun.objects.get(pk=options['run_id'])
+            except (OptimizationRun.DoesNotExist, ValueError):
+                raise CommandError(f"No existe la regeneración {options['run_id']}")
+
+        filters = {
+            'content_type': options.get('content_type') or '',
+            'object_id': options.get('object_id') or '',
+            'force': options['force'],
+        }
+        if not options['restart']:
+            unfinished = (
+                OptimizationRun.objects.filter(**filters)
+                .exclude(status='done').order_by('-created_at').first()
+            )
+            if unfinished:
+                return unfinished
+        return jobs.start_run(**filters)
+
     def handle(self, *args, **options):
-        content_type = options.get('content_type')
-        object_id = options.get('object_id')
-        force = options.get('force')
-        dry_run = options.get('dry_run')
-        limit = options.get('limit')
-        
-        # Construir la consulta base
-        query = Q()
-        
-        # Si no se fuerza la regeneración, solo procesar imágenes no optimizadas
-        if not force:
-            query &= Q(optimized=False)
-        
-        # Filtrar por tipo de contenido si se especifica
-        if content_type:
-            query &= Q(content_type=content_type)
-            
-        # Filtrar por ID de objeto si se especifica
-        if object_id:
-            query &= Q(object_id=object_id)
-        
-        # Obtener las imágenes a procesar
-        images = Image.objects.filter(query)
-        
-        # Limitar si es necesario
-        if limit:
-            images = images[:limit]
-        
-        # Contar el total
-        total = images.count()
-        
-        if dry_run:
-            self.stdout.write(f"Se procesarían {total} imágenes")
-            for img in images:
+        if options['dry_run']:
+            run = OptimizationRun(
+                content_type=options.get('content_type') or '',
+                object_id=options.get('object_id') or '',
+                force=options['force'],
+            )
+            images = jobs.run_queryset(run)
+            self.stdout.write(f"Se revisarían {images.count()} imágenes")
+            for img in images.only('id', 'title', 'content_type').iterator(chunk_size=options['chunk_size']):
                 self.stdout.write(f"- {img.id}: {img.title or 'Sin título'} ({img.content_type})")
             return
-        
-        if total == 0:
-            self.stdout.write(self.style.WARNING("No se encontraron imágenes para optimizar"))
-            return
-        
-        self.stdout.write(f"Procesando {total} imágenes...")
-        
-        processed = 0
-        errors = 0
-        start_time = time.time()
-        
-        # Procesar cada imagen
-        for img in images:
-            try:
-                self.stdout.write(f"Procesando imagen {img.id}...", ending='')
-                
-                # Verificar que el archivo existe
-                if not default_storage.exists(img.image.name):
-                    self.stdout.write(self.style.ERROR(" ERROR: Archivo no encontrado"))
-                    errors += 1
-                    continue
-                
-                # Generar versiones optimizadas
-                result = img.generate_optimized_versions(force=True)
-                
-                if result:
-                    self.stdout.write(self.style.SUCCESS(" OPTIMIZADA"))
-                    processed += 1
-                else:
-                    self.stdout.write(self.style.ERROR(" ERROR: No se pudo optimizar"))
-                    errors += 1
-                    
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f" ERROR: {str(e)}"))
-                errors += 1
-        
+
+        run = self.get_run(options)
+        if run.last_image_id:
+            self.stdout.write(
+                f"Reanudando la regeneración {run.pk}: {run.completed}/{run.total} imágenes ya revisadas"
+            )
+        claimed = jobs.claim_run(run.pk)
+        if claimed is None:
+            raise CommandError(f"La regeneración {run.pk} está terminada o la está ejecutando otro proceso")
+        run = claimed
+
+        workers = max(1, options['workers'])
+        chunk_size = max(1, options['chunk_size'])
+        inicio = time.monotonic()
+        previas = run.completed
+
+        def progreso(run):
+            revisadas = run.completed - previas
+            transcurrido = time.monotonic() - inicio
+            ritmo = revisadas / transcurrido if transcurrido else 0
+            restantes = max(0, run.total - run.completed)
+            eta = duracion(restantes / ritmo) if ritmo else '?'
+            self.stdout.write(
+                f"- {run.completed}/{run.total} imágenes ({run.processed} regeneradas, "
+                f"{run.skipped} sin cambios, {run.errors} errores) · "
+                f"{ritmo:.1f} img/s · ETA {eta}"
+            )
+
+        self.stdout.write(f"Regeneración {run.pk} con {workers} proceso(s)...")
+        executor = jobs.create_pool(workers) if workers > 1 else None
+        try:
+            finished = jobs.process_run(
+                run, executor=executor, chunk_size=chunk_size,
+                limit=options.get('limit'), on_chunk=progreso,
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
         # Calcular tiempo total
-        elapsed_time = time.time() - start_time
-        
+        elapsed_time = time.monotonic() - inicio
+
         # Mostrar resumen
         self.stdout.write("\nResumen de optimización:")
-        self.stdout.write(f"- Imágenes procesadas: {processed}")
-        self.stdout.write(f"- Errores: {errors}")
+        self.stdout.write(f"- Imágenes regeneradas: {run.processed}")
+        self.stdout.write(f"- Sin cambios: {run.skipped}")
+        self.stdout.write(f"- Errores: {run.errors}")
         self.stdout.write(f"- Tiempo total: {elapsed_time:.2f} segundos")
-        
-        if processed > 0:
-            self.stdout.write(self.style.SUCCESS(f"\nOptimización completada con éxito para {processed} imágenes"))
+
+        if finished:
+            self.stdout.write(self.style.SUCCESS(f"\nRegeneración {run.pk} completada"))
         else:
-            self.stdout.write(self.style.ERROR("\nNo se pudo optimizar ninguna imagen"))
+            self.stdout.write(self.style.WARNING(
+                f"\nRegeneración {run.pk} sin terminar: vuelve a ejecutar el comando para continuar"
+            ))
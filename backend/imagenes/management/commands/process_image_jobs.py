@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from imagenes import jobs
+from pacientes import procesamiento
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera las variaciones de imágenes encoladas (imagenes.jobs) con un '
+        'grupo de procesos, las miniaturas primero, y las miniaturas y metadatos '
+        'de las imágenes médicas (pacientes.procesamiento). Cuando no quedan trabajos '
+        'avanza por lotes las regeneraciones masivas pendientes. Sin --once se '
+        'queda en espera de nuevos trabajos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Procesos (1 = en el proceso actual)')
+        parser.add_argument('--batch', type=int, default=None, help='Trabajos reservados por lote (default: 2 por proceso)')
+        parser.add_argument('--poll', type=float, default=2.0, help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--once', action='store_true', help='Procesar los trabajos pendientes y terminar')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch = max(1, options['batch'] or workers * 2)
+        totales = {'done': 0, 'pending': 0, 'failed': 0}
+
+        self.stdout.write(f"Procesando trabajos de imágenes con {workers} proceso(s)...")
+        executor = jobs.create_pool(workers) if workers > 1 else None
+        inicio = time.monotonic()
+        try:
+            while True:
+                resumen = jobs.process_batch(batch, executor=executor)
+                for estado, cantidad in procesamiento.procesar_lote(batch, executor=executor).items():
+                    resumen[estado] += cantidad
+                for estado, cantidad in resumen.items():
+                    totales[estado] += cantidad
+                if sum(resumen.values()):
+                    self.stdout.write(
+                        f"- Lote: {resumen['done']} completados, "
+                        f"{resumen['pending']} por reintentar, {resumen['failed']} fallidos"
+                    )
+                    continue
+                # Sin subidas pendientes: un lote de una regeneración masiva
+                run = jobs.claim_run()
+                if run is not None:
+                    jobs.process_run(run, executor=executor, limit=batch * 5)
+                    self.stdout.write(f"- Regeneración {run.pk}: {run.completed}/{run.total} imágenes")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            self.stdout.write("Interrumpido")
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        stats = jobs.queue_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {totales['done']} completados, {totales['pending']} por reintentar, "
+            f"{totales['failed']} fallidos en {time.monotonic() - inicio:.1f}s; "
+            f"{stats['pending']} pendientes en la cola"
+        ))
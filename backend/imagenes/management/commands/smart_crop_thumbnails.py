@@ -3,19 +3,19 @@ Management command to apply smart cropping to existing images.
 """
 
 from django.core.management.base import BaseCommand
+from django.db import connections
 from django.db.models import Q
 from imagenes.models import Image
-from PIL import Image as PILImage
-from imagenes.smart_crop import smart_crop_and_resize
-import io
+from imagenes.smart_crop import batch_smart_crop
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+THUMBNAIL_SIZE = (150, 150)
+
 
 class Command(BaseCommand):
     help = 'Applies intelligent cropping to existing image thumbnails'
@@ -32,65 +32,68 @@ class Command(BaseCommand):
             type=int,
             help='Limit the number of images to process',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Worker processes (default: one per CPU; 1 = in this process)',
+        )
 
     def handle(self, *args, **options):
         start_time = time.time()
         force = options['force']
         limit = options.get('limit')
-        
+
         # Query for images
         query = Q()
         if not force:
             # Only process images that are already optimized but need smart thumbnails
             query &= Q(optimized=True)
-            
-        images = Image.objects.filter(query)
+
+        images = Image.objects.filter(query).only('id', 'image')
         if limit:
             images = images[:limit]
-            
-        total_images = images.count()
-        self.stdout.write(f"Applying smart cropping to {total_images} images...")
-        
-        # Process images
+        # Deduplicated uploads share one file: crop it once, update every row
+        images_by_path = {}
+        for image in images:
+            if image.image:
+                images_by_path.setdefault(image.image.path, []).append(image)
+
+        self.stdout.write(
+            f"Applying smart cropping to {sum(map(len, images_by_path.values()))} images "
+            f"({len(images_by_path)} files)..."
+        )
+
+        # Crop in a process pool; child processes must not inherit DB sockets
+        connections.close_all()
+        results = batch_smart_crop(
+            list(images_by_path), {'thumbnail': THUMBNAIL_SIZE},
+            workers=options['workers'], format_name=None,
+        )
+
         processed = 0
         errors = 0
-        
-        def process_image(image):
-            try:
-                # Open the original image
-                with PILImage.open(image.image.path) as img:
-                    # Create thumbnail with smart cropping
-                    thumbnail_size = (150, 150)
-                    thumbnail_img = smart_crop_and_resize(img, thumbnail_size)
-                    
-                    # Save thumbnail
-                    name, ext = os.path.splitext(image.filename)
-                    thumbnail_path = os.path.join(os.path.dirname(image.image.path), 
-                                              f"{name}_thumbnail{ext}")
-                    
-                    # Save the new thumbnail
-                    thumbnail_img.save(thumbnail_path)
-                    
-                    # Update the image model
-                    # Get relative path for URLs
-                    rel_path = os.path.relpath(thumbnail_path, settings.MEDIA_ROOT)
-                    url_path = os.path.join(settings.MEDIA_URL, rel_path).replace('\\', '/')
-                    image.thumbnail_url = url_path
-                    image.save(update_fields=['thumbnail_url'])
-                    
-                return True
-            except Exception as e:
-                logger.error(f"Error processing image {image.id}: {e}")
-                return False
-        
-        # Process images in parallel
-        with ThreadPoolExecutor() as executor:
-            results = list(executor.map(process_image, images))
-            
-        # Count results
-        processed = sum(1 for r in results if r)
-        errors = sum(1 for r in results if not r)
-        
+        for path, result in results.items():
+            images = images_by_path[path]
+            if 'error' in result:
+                errors += len(images)
+                for image in images:
+                    logger.error(f"Error processing image {image.id}: {result['error']}")
+                continue
+
+            # Save the new thumbnail next to the original
+            name, ext = os.path.splitext(images[0].filename)
+            thumbnail_path = os.path.join(os.path.dirname(path), f"{name}_thumbnail{ext}")
+            with open(thumbnail_path, 'wb') as f:
+                f.write(result['thumbnail'].getvalue())
+
+            # Update the image model without re-triggering post_save
+            rel_path = os.path.relpath(thumbnail_path, settings.MEDIA_ROOT)
+            url_path = os.path.join(settings.MEDIA_URL, rel_path).replace('\\', '/')
+            processed += Image.objects.filter(pk__in=[image.pk for image in images]).update(
+                thumbnail_url=url_path
+            )
+
         elapsed_time = time.time() - start_time
         self.stdout.write(self.style.SUCCESS(
             f"Processed {processed} images in {elapsed_time:.2f} seconds "
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:24
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imagenes', '0004_imagejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptimizationRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('content_type', models.CharField(blank=True, max_length=20)),
+                ('object_id', models.CharField(blank=True, max_length=255)),
+                ('force', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'En proceso'), ('done', 'Completada')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_image_id', models.UUIDField(blank=True, null=True)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Regeneración masiva',
+                'verbose_name_plural': 'Regeneraciones masivas',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
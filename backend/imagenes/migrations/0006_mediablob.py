@@ -0,0 +1,30 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imagenes', '0005_optimizationrun_image_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Archivo por contenido',
+                'verbose_name_plural': 'Archivos por contenido',
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='imagenes_me_refcoun_b0ef7c_idx')],
+            },
+        ),
+    ]
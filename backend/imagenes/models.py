@@ -1,20 +1,49 @@
 from django.db import models
 import uuid
 import os
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 
 def get_file_path(instance, filename):
     """
     Genera un path único para cada imagen subida.
     El path incluye el tipo de objeto (paciente, dentista, etc.) y un UUID único.
+    
+    Las subidas nuevas se guardan por contenido (ver ``imagenes.blobs``) y
+    este nombre solo se usa si se guarda el archivo sin pasar por ``save()``.
     """
     ext = filename.split('.')[-1]
     filename = f"{uuid.uuid4()}.{ext}"
     return os.path.join(f"{instance.content_type}", filename)
 
 
+class MediaBlob(models.Model):
+    """
+    Archivo subido guardado una sola vez por contenido (ver ``imagenes.blobs``).
+    ``refcount`` es el número de filas que lo usan.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Último cambio de refcount; los blobs sin referencias se borran pasado un margen
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.name} ({self.refcount} referencias)"
+    
+    class Meta:
+        verbose_name = "Archivo por contenido"
+        verbose_name_plural = "Archivos por contenido"
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at']),
+        ]
+
+
 class Image(models.Model):
     """
     Modelo para manejar imágenes asociadas a diferentes entidades del sistema.
@@ -89,6 +118,8 @@ class Image(models.Model):
     height = models.PositiveIntegerField(null=True, blank=True)
     file_size = models.PositiveIntegerField(null=True, blank=True)  # En bytes
     optimized = models.BooleanField(default=False)
+    # SHA-256 del original con el que se generaron las variaciones
+    source_hash = models.CharField(max_length=64, blank=True, default='')
     
     @property
     def filename(self):
@@ -100,14 +131,110 @@ class Image(models.Model):
             return self.image.size
         return 0
     
-    def generate_optimized_versions(self, force=False):
+    def variant_url(self, size, fmt=None):
+        """
+        URL de una variación.
+        
+        Usa la URL guardada en la columna ``<size>[_<fmt>]_url`` si la hay
+        (imágenes procesadas antes de las variaciones bajo demanda); si no,
+        la URL calculada de ``imagenes.variants``.
+        
+        Args:
+            size (str): Nombre de la variación (thumbnail, xs, ...)
+            fmt (str): 'webp', 'avif', 'auto' o None para el formato original
+        """
+        from . import variants
+        
+        if fmt in (None, 'webp', 'avif'):
+            stored = getattr(self, f"{size}{'_' + fmt if fmt else ''}_url", None)
+            if stored:
+                return stored
+        if not variants.on_demand():
+            return None
+        return variants.variant_url(self, size, fmt or variants.native_format(self.image.name))
+    
+    def apply_variations(self, result):
+        """
+        Guarda las URLs de las variaciones generadas por ``render_variations``.
+        
+        Solo actualiza los campos de las variaciones recibidas (un trabajo
+        puede generar solo las miniaturas) con un ``UPDATE``, sin volver a
+        disparar ``post_save``. La imagen queda como optimizada cuando tiene
+        todas sus variaciones, o en cuanto tiene sus metadatos si las
+        variaciones se generan bajo demanda.
+        """
+        from .image_utils import VARIATIONS
+        
+        fields = {}
+        for variation_name in VARIATIONS:
+            for suffix in ('', '_webp', '_avif'):
+                key = f'{variation_name}{suffix}'
+                if key in result:
+                    fields[f'{key}_url'] = result[key]
+        for field in ('width', 'height', 'file_size', 'source_hash'):
+            if field in result:
+                fields[field] = result[field]
+        
+        for field, value in fields.items():
+            setattr(self, field, value)
+        
+        # Bajo demanda no se guardan URLs: basta con los metadatos
+        from .variants import on_demand
+        if on_demand():
+            fields['optimized'] = self.optimized = True
+        Image.objects.filter(pk=self.pk).update(**fields)
+        if self.optimized:
+            return
+
+        # Se comprueba en la base de datos: otro trabajo de la misma imagen
+        # puede haber guardado las demás variaciones mientras tanto
+        missing = models.Q()
+        for name in VARIATIONS:
+            missing |= models.Q(**{f'{name}_url': ''}) | models.Q(**{f'{name}_url__isnull': True})
+        if Image.objects.filter(pk=self.pk).exclude(missing).update(optimized=True):
+            self.optimized = True
+    
+    def reuse_variations(self):
+        """
+        Copiar las variaciones y metadatos de otra imagen optimizada con el
+        mismo archivo (una subida repetida, ver ``imagenes.blobs``).
+        
+        Las variaciones se nombran a partir del archivo original, así que
+        sirven tal cual para esta imagen.
+        
+        Returns:
+            bool: True si había una imagen de la que copiarlas
+        """
+        from .image_utils import VARIATIONS
+        
+        fields = ['width', 'height', 'file_size', 'source_hash'] + [
+            f'{name}{suffix}_url' for name in VARIATIONS for suffix in ('', '_webp', '_avif')
+        ]
+        sibling = (
+            Image.objects.filter(image=self.image.name, optimized=True)
+            .exclude(pk=self.pk).values(*fields).first()
+        )
+        if sibling is None:
+            return False
+        for field, value in sibling.items():
+            setattr(self, field, value)
+        self.optimized = True
+        Image.objects.filter(pk=self.pk).update(optimized=True, **sibling)
+        return True
+    
+    def generate_optimized_versions(self, force=False, variations=None):
         """
         Genera versiones optimizadas de la imagen si no existen o si se fuerza
         
+        Se ejecuta en el proceso actual; las subidas normalmente encolan el
+        trabajo en ``ImageJob`` (ver ``imagenes.jobs``).
+        
         Args:
             force (bool): Si es True, regenera las imágenes aunque ya existan
+            variations (list): Variaciones a generar (default: todas)
         """
         from .image_utils import process_image
+        from . import variants
         import logging
         
         logger = logging.getLogger(__name__)
@@ -115,49 +242,13 @@ class Image(models.Model):
         if self.image and (not self.optimized or force):
             try:
                 # Procesar la imagen para generar versiones optimizadas
-                result = process_image(self.image, self)
+                if variants.on_demand():
+                    result = variants.prewarm(self.image.name, variations)
+                else:
+                    result = process_image(self.image, self, variations=variations)
                 
                 if result:
-                    # Actualizar URLs para todas las variaciones
-                    # Thumbnail (150px)
-                    self.thumbnail_url = result.get('thumbnail', '')
-                    self.thumbnail_webp_url = result.get('thumbnail_webp', '')
-                    self.thumbnail_avif_url = result.get('thumbnail_avif', '')
-                    
-                    # XS (320px)
-                    self.xs_url = result.get('xs', '')
-                    self.xs_webp_url = result.get('xs_webp', '')
-                    self.xs_avif_url = result.get('xs_avif', '')
-                    
-                    # Small (480px)
-                    self.small_url = result.get('small', '')
-                    self.small_webp_url = result.get('small_webp', '')
-                    self.small_avif_url = result.get('small_avif', '')
-                    
-                    # Medium (768px)
-                    self.medium_url = result.get('medium', '')
-                    self.medium_webp_url = result.get('medium_webp', '')
-                    self.medium_avif_url = result.get('medium_avif', '')
-                    
-                    # Large (1024px)
-                    self.large_url = result.get('large', '')
-                    self.large_webp_url = result.get('large_webp', '')
-                    self.large_avif_url = result.get('large_avif', '')
-                    
-                    # XL (1440px)
-                    self.xl_url = result.get('xl', '')
-                    self.xl_webp_url = result.get('xl_webp', '')
-                    self.xl_avif_url = result.get('xl_avif', '')
-                    
-                    # Actualizar metadatos
-                    from PIL import Image
-                    with Image.open(self.image.path) as img:
-                        self.width = img.width
-                        self.height = img.height
-                    
-                    self.file_size = os.path.getsize(self.image.path)
-                    self.optimized = True
-                    self.save()
+                    self.apply_variations(result)
                     
                 return result
             except Exception as e:
@@ -174,11 +265,138 @@ class Image(models.Model):
         ordering = ['content_type', 'order', '-uploaded_at']
 
 
+class ImageJob(models.Model):
+    """
+    Trabajo pendiente de generación de variaciones de una imagen.
+    
+    Las subidas no generan las variaciones en la petición: encolan trabajos
+    que el comando ``process_image_jobs`` ejecuta en un grupo de procesos
+    (ver ``imagenes.jobs``). Los trabajos con menor ``priority`` se atienden
+    primero, así las miniaturas están listas antes que los tamaños grandes.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pendiente'),
+        ('running', 'En proceso'),
+        ('done', 'Completado'),
+        ('failed', 'Fallido'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='jobs')
+    variations = models.JSONField(default=list)
+    priority = models.PositiveSmallIntegerField(default=10)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    available_at = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Trabajo {self.id} - {', '.join(self.variations)} ({self.status})"
+    
+    class Meta:
+        verbose_name = "Trabajo de imagen"
+        verbose_name_plural = "Trabajos de imágenes"
+        ordering = ['priority', 'created_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'available_at']),
+        ]
+
+
+class OptimizationRun(models.Model):
+    """
+    Regeneración masiva de las variaciones de un conjunto de imágenes.
+    
+    La crea ``ImageViewSet.batch_optimize`` o el comando ``optimize_images``
+    y la ejecutan ``optimize_images`` o ``process_image_jobs`` (cuando no
+    hay subidas pendientes). Recorre las imágenes por ``id`` y guarda en
+    ``last_image_id`` la última de cada lote terminado, así que al
+    interrumpirse continúa desde ahí (ver ``imagenes.jobs.process_run``).
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pendiente'),
+        ('running', 'En proceso'),
+        ('done', 'Completada'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    content_type = models.CharField(max_length=20, blank=True)
+    object_id = models.CharField(max_length=255, blank=True)
+    # Regenerar también las imágenes cuyo original no ha cambiado
+    force = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_image_id = models.UUIDField(null=True, blank=True)
+    
+    # Progreso
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    @property
+    def completed(self):
+        return self.processed + self.skipped + self.errors
+    
+    def __str__(self):
+        return f"Regeneración {self.id} ({self.status}, {self.completed}/{self.total})"
+    
+    class Meta:
+        verbose_name = "Regeneración masiva"
+        verbose_name_plural = "Regeneraciones masivas"
+        ordering = ['created_at']
+
+
+@receiver(pre_save, sender=Image)
+def store_image_blob(sender, instance, raw=False, **kwargs):
+    """Guarda el archivo subido por contenido: una subida repetida no se vuelve a escribir"""
+    if not raw:
+        from . import blobs
+        blobs.attach(instance, 'image')
+
+
 @receiver(post_save, sender=Image)
 def optimize_image_after_save(sender, instance, created, **kwargs):
     """
-    Procesa automáticamente las imágenes después de guardar para crear versiones optimizadas.
-    Solo lo hace si la imagen es nueva o si ha cambiado.
+    Encola la generación de versiones optimizadas después de guardar.
+    Solo lo hace si la imagen es nueva o todavía no está optimizada, y no
+    tiene ya trabajos pendientes. Con ``IMAGENES_DERIVADOS_SINCRONOS`` las
+    genera en la misma petición, como antes.
+    
+    Con variaciones bajo demanda solo se generan por adelantado las de
+    ``IMAGENES_VARIANTES_PRECALENTAR`` (y los metadatos de la imagen). Si el
+    archivo ya estaba subido se reutilizan sus variaciones.
     """
+    if created and instance.image and instance.reuse_variations():
+        return
     if created or not instance.optimized:
-        instance.generate_optimized_versions()
+        from .variants import on_demand
+        variations = getattr(settings, 'IMAGENES_VARIANTES_PRECALENTAR', None) if on_demand() else None
+        if getattr(settings, 'IMAGENES_DERIVADOS_SINCRONOS', False):
+            instance.generate_optimized_versions(variations=variations)
+        else:
+            from . import jobs
+            jobs.enqueue_variations(instance, variations=variations, skip_if_pending=not created)
+
+
+@receiver(post_delete, sender=Image)
+def release_image_blob(sender, instance, **kwargs):
+    """
+    Descuenta la referencia al archivo de la imagen eliminada. El archivo y
+    sus variaciones se borran cuando nadie más lo usa (``dedupe_media``).
+    """
+    from . import blobs
+    from .variants import invalidate
+    if instance.image and not blobs.release(instance.image.name):
+        # Archivo anterior al almacenamiento por contenido: es solo suyo
+        invalidate(instance.image.name)
@@ -2,6 +2,24 @@ from rest_framework import serializers
 from .models import Image
 
 
+class VariantURLField(serializers.Field):
+    """
+    URL absoluta de una variación de la imagen (ver ``Image.variant_url``):
+    la guardada en su columna o la calculada bajo demanda.
+    """
+
+    def __init__(self, size, fmt=None, **kwargs):
+        self.size = size
+        self.fmt = fmt
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        url = obj.variant_url(self.size, self.fmt)
+        return self.parent.get_absolute_url(url) if url else None
+
+
 class ImageSerializer(serializers.ModelSerializer):
     """
     Serializer para el modelo de imágenes.
@@ -10,34 +28,34 @@ class ImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
     
     # Thumbnail (150px)
-    thumbnail_url = serializers.SerializerMethodField()
-    thumbnail_webp_url = serializers.SerializerMethodField()
-    thumbnail_avif_url = serializers.SerializerMethodField()
+    thumbnail_url = VariantURLField('thumbnail')
+    thumbnail_webp_url = VariantURLField('thumbnail', 'webp')
+    thumbnail_avif_url = VariantURLField('thumbnail', 'avif')
     
     # XS (320px)
-    xs_url = serializers.SerializerMethodField()
-    xs_webp_url = serializers.SerializerMethodField()
-    xs_avif_url = serializers.SerializerMethodField()
+    xs_url = VariantURLField('xs')
+    xs_webp_url = VariantURLField('xs', 'webp')
+    xs_avif_url = VariantURLField('xs', 'avif')
     
     # Small (480px)
-    small_url = serializers.SerializerMethodField()
-    small_webp_url = serializers.SerializerMethodField()
-    small_avif_url = serializers.SerializerMethodField()
+    small_url = VariantURLField('small')
+    small_webp_url = VariantURLField('small', 'webp')
+    small_avif_url = VariantURLField('small', 'avif')
     
     # Medium (768px)
-    medium_url = serializers.SerializerMethodField()
-    medium_webp_url = serializers.SerializerMethodField()
-    medium_avif_url = serializers.SerializerMethodField()
+    medium_url = VariantURLField('medium')
+    medium_webp_url = VariantURLField('medium', 'webp')
+    medium_avif_url = VariantURLField('medium', 'avif')
     
     # Large (1024px)
-    large_url = serializers.SerializerMethodField()
-    large_webp_url = serializers.SerializerMethodField()
-    large_avif_url = serializers.SerializerMethodField()
+    large_url = VariantURLField('large')
+    large_webp_url = VariantURLField('large', 'webp')
+    large_avif_url = VariantURLField('large', 'avif')
     
     # XL (1440px)
-    xl_url = serializers.SerializerMethodField()
-    xl_webp_url = serializers.SerializerMethodField()
-    xl_avif_url = serializers.SerializerMethodField()
+    xl_url = VariantURLField('xl')
+    xl_webp_url = VariantURLField('xl', 'webp')
+    xl_avif_url = VariantURLField('xl', 'avif')
     
     # Metadatos adicionales
     dimensions = serializers.SerializerMethodField()
@@ -94,78 +112,6 @@ class ImageSerializer(serializers.ModelSerializer):
         """Retorna la URL completa de la imagen original"""
         return self.get_absolute_url(obj.image.url) if obj.image else None
     
-    def get_thumbnail_url(self, obj):
-        """Retorna la URL completa del thumbnail"""
-        return self.get_absolute_url(obj.thumbnail_url) if obj.thumbnail_url else None
-    
-    def get_thumbnail_webp_url(self, obj):
-        """Retorna la URL completa del thumbnail WebP"""
-        return self.get_absolute_url(obj.thumbnail_webp_url) if obj.thumbnail_webp_url else None
-    
-    def get_thumbnail_avif_url(self, obj):
-        """Retorna la URL completa del thumbnail en formato AVIF"""
-        return self.get_absolute_url(obj.thumbnail_avif_url) if obj.thumbnail_avif_url else None
-    
-    def get_xs_url(self, obj):
-        """Retorna la URL completa de la versión XS"""
-        return self.get_absolute_url(obj.xs_url) if obj.xs_url else None
-    
-    def get_xs_webp_url(self, obj):
-        """Retorna la URL completa de la versión XS en WebP"""
-        return self.get_absolute_url(obj.xs_webp_url) if obj.xs_webp_url else None
-    
-    def get_xs_avif_url(self, obj):
-        """Retorna la URL completa de la versión XS en AVIF"""
-        return self.get_absolute_url(obj.xs_avif_url) if obj.xs_avif_url else None
-    
-    def get_small_url(self, obj):
-        """Retorna la URL completa de la versión Small"""
-        return self.get_absolute_url(obj.small_url) if obj.small_url else None
-    
-    def get_small_webp_url(self, obj):
-        """Retorna la URL completa de la versión Small en WebP"""
-        return self.get_absolute_url(obj.small_webp_url) if obj.small_webp_url else None
-    
-    def get_small_avif_url(self, obj):
-        """Retorna la URL completa de la versión Small en AVIF"""
-        return self.get_absolute_url(obj.small_avif_url) if obj.small_avif_url else None
-    
-    def get_medium_url(self, obj):
-        """Retorna la URL completa de la versión mediana"""
-        return self.get_absolute_url(obj.medium_url) if obj.medium_url else None
-    
-    def get_medium_webp_url(self, obj):
-        """Retorna la URL completa de la versión mediana WebP"""
-        return self.get_absolute_url(obj.medium_webp_url) if obj.medium_webp_url else None
-    
-    def get_medium_avif_url(self, obj):
-        """Retorna la URL completa de la versión Medium en AVIF"""
-        return self.get_absolute_url(obj.medium_avif_url) if obj.medium_avif_url else None
-    
-    def get_large_url(self, obj):
-        """Retorna la URL completa de la versión grande"""
-        return self.get_absolute_url(obj.large_url) if obj.large_url else None
-    
-    def get_large_webp_url(self, obj):
-        """Retorna la URL completa de la versión grande WebP"""
-        return self.get_absolute_url(obj.large_webp_url) if obj.large_webp_url else None
-    
-    def get_large_avif_url(self, obj):
-        """Retorna la URL completa de la versión Large en AVIF"""
-        return self.get_absolute_url(obj.large_avif_url) if obj.large_avif_url else None
-    
-    def get_xl_url(self, obj):
-        """Retorna la URL completa de la versión XL"""
-        return self.get_absolute_url(obj.xl_url) if obj.xl_url else None
-    
-    def get_xl_webp_url(self, obj):
-        """Retorna la URL completa de la versión XL en WebP"""
-        return self.get_absolute_url(obj.xl_webp_url) if obj.xl_webp_url else None
-    
-    def get_xl_avif_url(self, obj):
-        """Retorna la URL completa de la versión XL en AVIF"""
-        return self.get_absolute_url(obj.xl_avif_url) if obj.xl_avif_url else None
-    
     def get_dimensions(self, obj):
         """Retorna las dimensiones de la imagen"""
         if obj.width and obj.height:
@@ -175,7 +121,27 @@ class ImageSerializer(serializers.ModelSerializer):
                 'aspect_ratio': round(obj.width / obj.height, 3) if obj.height > 0 else None
             }
         return None
-    
+
+    def get_srcset(self, obj):
+        """Retorna el srcset de las variaciones disponibles por formato"""
+        from .image_utils import VARIATIONS
+
+        srcset = {}
+        for fmt in ('jpg', 'webp', 'avif'):
+            entries = []
+            for name, (width, _) in VARIATIONS.items():
+                url = obj.variant_url(name, None if fmt == 'jpg' else fmt)
+                if url:
+                    entries.append(f"{self.get_absolute_url(url)} {width}w")
+            if entries:
+                srcset[fmt] = ', '.join(entries)
+        return srcset or None
+
+    def get_picture_tag(self, obj):
+        """Retorna la etiqueta <picture> para incrustar la imagen"""
+        from .templatetags.image_tags import responsive_image
+        return str(responsive_image(obj, alt_text=obj.title or ''))
+
     def validate_image(self, value):
         """
         Valida que la imagen tenga un tipo de archivo permitido y un tamaño adecuado
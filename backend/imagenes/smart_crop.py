@@ -1,25 +1,24 @@
 """
-Utilidades para el recorte inteligente de imágenes usando detección de objetos.
+Utilidades para el recorte inteligente de imágenes basado en saliencia.
 
 Este módulo proporciona funciones para:
-- Detectar regiones de interés en imágenes
-- Realizar recortes inteligentes preservando el sujeto principal
-- Optimizar miniaturas para distintos formatos (cuadrado, panorámico, etc.)
+- Calcular una sola vez, sobre una copia reducida de la imagen, un mapa de
+  saliencia (entropía local + energía de bordes, y rostros si está
+  disponible face_recognition)
+- Encontrar la ventana más saliente de cada relación de aspecto con una
+  tabla de sumas acumuladas (summed-area table), evaluando todas las
+  posiciones posibles a la vez
+- Recortar todos los tamaños pedidos (cuadrado, panorámico, etc.) a partir
+  de ese único mapa
+- Procesar lotes de imágenes en un grupo de procesos
 """
 import io
-import numpy as np
-from PIL import Image, ImageOps
 import logging
-from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# Intentar importar OpenCV para detección avanzada
-try:
-    import cv2
-    OPENCV_SUPPORT = True
-except ImportError:
-    OPENCV_SUPPORT = False
-    logging.warning("OpenCV no está disponible. Se usará recorte simple basado en entropía.")
+import numpy as np
+from PIL import Image, ImageOps
 
 # Intentar importar face_recognition para detección facial
 try:
@@ -31,311 +30,372 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Lado mayor de la copia reducida sobre la que se calcula la saliencia
+ANALYSIS_SIDE = 256
+
+# Lado mayor de la copia usada para detectar rostros
+FACE_SIDE = 640
+
+# Niveles de gris del histograma de entropía local y lado de su ventana (px del mapa)
+ENTROPY_BINS = 16
+ENTROPY_WINDOW = 9
+
+# Peso de un rostro frente a la entropía y los bordes (ambos normalizados a 0..1)
+FACE_WEIGHT = 4.0
+
+# Posiciones cuya saliencia difiere menos de esta fracción del máximo se
+# consideran empatadas y gana la más centrada (p. ej. en un fondo liso)
+CENTER_TOLERANCE = 0.01
+
 
 def calculate_entropy(img_array):
     """
     Calcula la entropía de una región de imagen utilizando histograma.
     Regiones con más información (detalles) tienen mayor entropía.
-    
+
     Args:
-        img_array: Array NumPy representando la imagen en escala de grises
-        
+        img_array: Array NumPy representando la imagen en escala de grises (uint8)
+
     Returns:
         float: Valor de entropía
     """
-    histogram = np.histogram(img_array, bins=256, range=(0, 256))[0]
-    histogram_length = sum(histogram)
-    
-    samples_probability = [float(h) / histogram_length for h in histogram]
-    entropy = -sum([p * np.log2(p) for p in samples_probability if p != 0])
-    
+    histogram = np.bincount(np.asarray(img_array, dtype=np.uint8).ravel(), minlength=256)
+    total = histogram.sum()
+    if not total:
+        return 0.0
+    probabilities = histogram[histogram > 0] / total
+    return float(-(probabilities * np.log2(probabilities)).sum())
+
+
+def summed_area_table(values):
+    """
+    Tabla de sumas acumuladas con una fila y columna de ceros al principio:
+    ``sat[y, x]`` es la suma de ``values[:y, :x]``.
+    """
+    height, width = values.shape
+    sat = np.zeros((height + 1, width + 1), dtype=np.float64)
+    sat[1:, 1:] = values.cumsum(axis=0, dtype=np.float64).cumsum(axis=1)
+    return sat
+
+
+def window_sums(sat, height, width):
+    """
+    Suma de todas las ventanas de ``height`` x ``width`` con cuatro lecturas
+    de la tabla por ventana.
+
+    Returns:
+        ndarray: ``sums[y, x]`` es la suma de la ventana con esquina en (x, y)
+    """
+    return sat[height:, width:] - sat[:-height, width:] - sat[height:, :-width] + sat[:-height, :-width]
+
+
+def local_entropy(gray):
+    """
+    Entropía del histograma de la vecindad de cada píxel.
+
+    Cuenta cada nivel de gris (cuantizado a ``ENTROPY_BINS``) en una ventana
+    de ``ENTROPY_WINDOW`` px con una tabla de sumas acumuladas por nivel.
+
+    Args:
+        gray: Array 2D uint8
+    """
+    pad = ENTROPY_WINDOW // 2
+    levels = np.pad((gray.astype(np.uint16) * ENTROPY_BINS) >> 8, pad, mode='edge')
+    area = ENTROPY_WINDOW * ENTROPY_WINDOW
+    entropy = np.zeros(gray.shape, dtype=np.float32)
+    for level in range(ENTROPY_BINS):
+        mask = levels == level
+        if not mask.any():
+            continue
+        probability = window_sums(summed_area_table(mask), ENTROPY_WINDOW, ENTROPY_WINDOW) / area
+        nonzero = probability > 0
+        entropy[nonzero] -= probability[nonzero] * np.log2(probability[nonzero])
     return entropy
 
 
+def edge_energy(gray):
+    """Magnitud del gradiente (diferencias centrales) de cada píxel"""
+    gray = gray.astype(np.float32)
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    return np.hypot(gx, gy)
+
+
+def _normalize(values):
+    peak = values.max()
+    return values / peak if peak > 0 else values
+
+
+def _reduced_copy(img, side, mode):
+    """Copia de la imagen con su lado mayor en ``side`` px como mucho"""
+    factor = max(img.size) // (side * 2)
+    small = img.reduce(factor) if factor > 1 and img.mode in ('L', 'RGB', 'RGBA') else img
+    small = small.convert(mode)
+    small.thumbnail((side, side), Image.Resampling.BILINEAR)
+    return small
+
+
+def _face_boxes(img, map_size):
+    """Rostros detectados, en coordenadas del mapa de saliencia"""
+    small = _reduced_copy(img, FACE_SIDE, 'RGB')
+    try:
+        locations = face_recognition.face_locations(np.asarray(small))
+    except Exception as e:
+        logger.error(f"Error en la detección de rostros: {e}")
+        return []
+    logger.debug(f"Detectados {len(locations)} rostros en la imagen")
+    sx = map_size[0] / small.width
+    sy = map_size[1] / small.height
+    return [(int(left * sx), int(top * sy), int(np.ceil(right * sx)), int(np.ceil(bottom * sy)))
+            for top, right, bottom, left in locations]
+
+
+def saliency_map(img):
+    """
+    Mapa de saliencia de la imagen sobre una copia de ``ANALYSIS_SIDE`` px.
+
+    Suma la entropía local y la energía de bordes, normalizadas, más
+    ``FACE_WEIGHT`` sobre cada rostro detectado.
+
+    Args:
+        img: Imagen PIL
+
+    Returns:
+        tuple: (mapa float32 de alto x ancho, escala (x, y) del mapa respecto a la imagen)
+    """
+    small = _reduced_copy(img, ANALYSIS_SIDE, 'L')
+    gray = np.asarray(small)
+    saliency = _normalize(local_entropy(gray)) + _normalize(edge_energy(gray))
+    if FACE_DETECTION:
+        for left, top, right, bottom in _face_boxes(img, small.size):
+            saliency[top:bottom, left:right] += FACE_WEIGHT
+    return saliency, (small.width / img.width, small.height / img.height)
+
+
+def crop_window(img_size, target_size):
+    """Tamaño del mayor recorte de la imagen con la relación de aspecto del objetivo"""
+    img_width, img_height = img_size
+    target_width, target_height = target_size
+    if img_width * target_height > img_height * target_width:
+        return max(1, min(img_width, round(img_height * target_width / target_height))), img_height
+    return img_width, max(1, min(img_height, round(img_width * target_height / target_width)))
+
+
+def _place_window(sat, scale, img_size, crop_size):
+    """Posición del recorte ``crop_size`` que encierra más saliencia"""
+    map_height, map_width = sat.shape[0] - 1, sat.shape[1] - 1
+    window_width = min(map_width, max(1, round(crop_size[0] * scale[0])))
+    window_height = min(map_height, max(1, round(crop_size[1] * scale[1])))
+
+    scores = window_sums(sat, window_height, window_width)
+    ys, xs = np.nonzero(scores >= scores.max() * (1 - CENTER_TOLERANCE))
+    center_y, center_x = (scores.shape[0] - 1) / 2, (scores.shape[1] - 1) / 2
+    best = np.argmin((ys - center_y) ** 2 + (xs - center_x) ** 2)
+
+    left = min(max(0, round(xs[best] / scale[0])), img_size[0] - crop_size[0])
+    top = min(max(0, round(ys[best] / scale[1])), img_size[1] - crop_size[1])
+    return (left, top, left + crop_size[0], top + crop_size[1])
+
+
+def find_crops(img, output_sizes):
+    """
+    Encuentra el mejor recorte de cada tamaño de salida con un solo mapa de saliencia.
+
+    Los tamaños con la misma relación de aspecto comparten recorte.
+
+    Args:
+        img: Imagen PIL
+        output_sizes: Diccionario de tamaños {nombre: (ancho, alto)}
+
+    Returns:
+        dict: {nombre: (left, top, right, bottom)} en coordenadas de la imagen
+    """
+    saliency, scale = saliency_map(img)
+    sat = summed_area_table(saliency)
+
+    boxes = {}
+    by_window = {}
+    for name, size in output_sizes.items():
+        window = crop_window(img.size, size)
+        if window not in by_window:
+            by_window[window] = _place_window(sat, scale, img.size, window)
+        boxes[name] = by_window[window]
+    return boxes
+
+
 def find_best_crop(img, target_width, target_height):
     """
-    Encuentra el mejor recorte para una imagen en base a entropía y detección de objetos.
-    
+    Encuentra el mejor recorte para una imagen en base a su saliencia.
+
     Args:
         img: Imagen PIL
         target_width: Ancho objetivo del recorte
         target_height: Alto objetivo del recorte
-        
+
     Returns:
         tuple: Coordenadas del recorte (left, top, right, bottom)
     """
-    img_width, img_height = img.size
-    
-    # Si la imagen es más pequeña que el objetivo, no recortamos
-    if img_width <= target_width and img_height <= target_height:
-        return (0, 0, img_width, img_height)
-    
-    # Calcular relación de aspecto
-    target_ratio = target_width / target_height
-    img_ratio = img_width / img_height
-    
-    # Detectar rostros si está disponible
-    face_locations = []
-    if FACE_DETECTION:
-        try:
-            # Convertir a RGB si es necesario
-            if img.mode != 'RGB':
-                rgb_img = img.convert('RGB')
-            else:
-                rgb_img = img
-                
-            # Convertir a NumPy array
-            img_array = np.array(rgb_img)
-            
-            # Reducir tamaño para acelerar la detección
-            scale = min(1.0, 640 / max(img_width, img_height))
-            if scale < 1.0:
-                small_img = cv2.resize(img_array, (0, 0), fx=scale, fy=scale)
-            else:
-                small_img = img_array
-                
-            # Detectar rostros
-            face_locations = face_recognition.face_locations(small_img)
-            
-            # Ajustar coordenadas al tamaño original
-            if scale < 1.0:
-                face_locations = [(int(top/scale), int(right/scale),
-                                  int(bottom/scale), int(left/scale))
-                                  for top, right, bottom, left in face_locations]
-                                  
-            logger.debug(f"Detectados {len(face_locations)} rostros en la imagen")
-        except Exception as e:
-            logger.error(f"Error en la detección de rostros: {e}")
-            face_locations = []
-    
-    # Si encontramos rostros, priorizamos esa área
-    if face_locations:
-        # Calcular un recuadro que incluya todos los rostros con margen
-        margin = 0.2  # 20% de margen
-        
-        # Extraer coordenadas de todos los rostros
-        tops = [loc[0] for loc in face_locations]
-        rights = [loc[1] for loc in face_locations]
-        bottoms = [loc[2] for loc in face_locations]
-        lefts = [loc[3] for loc in face_locations]
-        
-        # Calcular el área que contiene todos los rostros
-        face_left = max(0, min(lefts) - int(img_width * margin))
-        face_top = max(0, min(tops) - int(img_height * margin))
-        face_right = min(img_width, max(rights) + int(img_width * margin))
-        face_bottom = min(img_height, max(bottoms) + int(img_height * margin))
-        
-        # Calcular centro de interés
-        center_x = (face_left + face_right) // 2
-        center_y = (face_top + face_bottom) // 2
-    else:
-        # Si no hay rostros, usar OpenCV para detectar otros objetos
-        if OPENCV_SUPPORT:
-            try:
-                # Convertir a escala de grises
-                if img.mode != 'RGB':
-                    rgb_img = img.convert('RGB')
-                else:
-                    rgb_img = img
-                    
-                # Convertir a NumPy array
-                img_array = np.array(rgb_img)
-                gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-                
-                # Detectar bordes
-                edges = cv2.Canny(gray, 100, 200)
-                
-                # Encontrar contornos
-                contours, _ = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-                
-                # Filtrar contornos pequeños
-                significant_contours = [c for c in contours if cv2.contourArea(c) > 100]
-                
-                if significant_contours:
-                    # Crear una máscara para los contornos
-                    mask = np.zeros_like(gray)
-                    cv2.drawContours(mask, significant_contours, -1, 255, -1)
-                    
-                    # Calcular momentos y centro de masa
-                    M = cv2.moments(mask)
-                    if M["m00"] != 0:
-                        center_x = int(M["m10"] / M["m00"])
-                        center_y = int(M["m01"] / M["m00"])
-                    else:
-                        # Fallback al centro de la imagen
-                        center_x, center_y = img_width // 2, img_height // 2
-                else:
-                    # Fallback al centro de la imagen
-                    center_x, center_y = img_width // 2, img_height // 2
-            except Exception as e:
-                logger.error(f"Error en la detección de objetos: {e}")
-                # Fallback al centro de la imagen
-                center_x, center_y = img_width // 2, img_height // 2
-        else:
-            # Si no está disponible OpenCV, usar método basado en entropía por regiones
-            # Convertir imagen a escala de grises
-            gray_img = img.convert('L')
-            gray_array = np.array(gray_img)
-            
-            # Dividir la imagen en una cuadrícula 3x3
-            h_step, v_step = img_width // 3, img_height // 3
-            regions = []
-            
-            for i in range(3):
-                for j in range(3):
-                    left = i * h_step
-                    top = j * v_step
-                    right = left + h_step
-                    bottom = top + v_step
-                    
-                    # Extraer región
-                    region = gray_array[top:bottom, left:right]
-                    entropy = calculate_entropy(region)
-                    
-                    regions.append((left, top, entropy))
-            
-            # Encontrar región con mayor entropía
-            best_region = max(regions, key=lambda r: r[2])
-            
-            # Centro de la región más interesante
-            center_x = best_region[0] + h_step // 2
-            center_y = best_region[1] + v_step // 2
-    
-    # Calcular las dimensiones del recorte
-    if target_ratio > img_ratio:
-        # El recorte es más ancho que la imagen original
-        crop_height = int(img_width / target_ratio)
-        # Centrar verticalmente alrededor del punto de interés
-        crop_top = center_y - crop_height // 2
-        # Ajustar si se sale de los límites
-        if crop_top < 0:
-            crop_top = 0
-        elif crop_top + crop_height > img_height:
-            crop_top = img_height - crop_height
-            
-        return (0, crop_top, img_width, crop_top + crop_height)
-    else:
-        # El recorte es más alto que la imagen original
-        crop_width = int(img_height * target_ratio)
-        # Centrar horizontalmente alrededor del punto de interés
-        crop_left = center_x - crop_width // 2
-        # Ajustar si se sale de los límites
-        if crop_left < 0:
-            crop_left = 0
-        elif crop_left + crop_width > img_width:
-            crop_left = img_width - crop_width
-            
-        return (crop_left, 0, crop_left + crop_width, img_height)
+    return find_crops(img, {'crop': (target_width, target_height)})['crop']
+
+
+def smart_crops(img, output_sizes):
+    """
+    Recorta y redimensiona la imagen a cada tamaño de salida.
+
+    Args:
+        img: Imagen PIL
+        output_sizes: Diccionario de tamaños {nombre: (ancho, alto)}
+
+    Returns:
+        dict: {nombre: imagen PIL}
+    """
+    boxes = find_crops(img, output_sizes)
+    return {
+        name: img.resize(size, Image.Resampling.LANCZOS, box=boxes[name], reducing_gap=3.0)
+        for name, size in output_sizes.items()
+    }
 
 
 def smart_crop_and_resize(img, output_size):
     """
     Recorta inteligentemente una imagen y luego la redimensiona.
-    
+
     Args:
         img: Imagen PIL
         output_size: Tupla (ancho, alto) para el tamaño final
-        
+
     Returns:
         PIL.Image: Imagen recortada y redimensionada
     """
-    target_width, target_height = output_size
-    
-    # Obtener el mejor recorte
-    crop_box = find_best_crop(img, target_width, target_height)
-    
-    # Recortar la imagen
-    cropped_img = img.crop(crop_box)
-    
-    # Redimensionar la imagen recortada
-    resized_img = cropped_img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-    
-    return resized_img
+    return smart_crops(img, {'crop': tuple(output_size)})['crop']
 
 
 def process_smart_thumbnail(img, size, format_name='JPEG', quality=None):
     """
     Crea un thumbnail inteligente preservando la región de interés.
-    
+
     Args:
         img: Imagen PIL
         size: Tamaño deseado (ancho, alto)
         format_name: Formato de salida
         quality: Calidad de compresión
-        
+
     Returns:
         io.BytesIO: Imagen procesada como objeto BytesIO
     """
     from imagenes.image_utils import get_image_format_options
-    
+
     # Asegurar que tenemos tupla de tamaño
     if isinstance(size, int):
         size = (size, size)
-        
-    # Recortar y redimensionar
-    processed_img = smart_crop_and_resize(img, size)
-    
-    # Preservar la orientación EXIF
-    processed_img = ImageOps.exif_transpose(processed_img)
-    
+
+    # Aplicar la orientación EXIF antes de buscar el recorte
+    processed_img = smart_crop_and_resize(ImageOps.exif_transpose(img), size)
+
     # Convertir a RGB si es RGBA y el formato lo requiere
     if format_name in ('JPEG', 'AVIF') and processed_img.mode == 'RGBA':
         processed_img = processed_img.convert('RGB')
-    
+
     # Obtener opciones de formato
     format_options = get_image_format_options().get(format_name, {}).copy()
     if quality is not None:
         format_options['quality'] = quality
-    
+
     # Guardar la imagen en memoria
     output_io = io.BytesIO()
     processed_img.save(output_io, format=format_name, **format_options)
     output_io.seek(0)
-    
+
     # Liberar memoria
     processed_img.close()
-    
+
     return output_io
 
 
-def batch_smart_crop(image_paths, output_sizes, output_dir=None):
+def crop_file(image_path, output_sizes, output_dir=None, format_name='JPEG'):
     """
-    Procesa un lote de imágenes con recorte inteligente.
-    
+    Recorta una imagen del disco a todos los tamaños con una sola decodificación.
+
+    En JPEG decodifica con ``draft()`` a la menor escala que todavía cubre
+    el recorte más exigente.
+
+    Args:
+        image_path: Ruta de la imagen
+        output_sizes: Diccionario de tamaños {nombre: (ancho, alto)}
+        output_dir: Directorio de salida; sin él se devuelven los datos
+        format_name: Formato de salida, o None para el formato original
+
+    Returns:
+        dict: {nombre: ruta del archivo o io.BytesIO}
+    """
+    from imagenes.image_utils import _oriented_size, encode_image, open_source
+
+    with Image.open(image_path) as probe:
+        original_size = _oriented_size(probe)
+    needed_width = max(
+        size[0] * original_size[0] / crop_window(original_size, size)[0]
+        for size in output_sizes.values()
+    )
+    img, source_format, _ = open_source(image_path, int(np.ceil(needed_width)))
+    format_name = format_name or ('JPEG' if source_format == 'MPO' else source_format)
+    img_name = os.path.splitext(os.path.basename(image_path))[0]
+
+    results = {}
+    try:
+        for name, cropped in smart_crops(img, output_sizes).items():
+            data = encode_image(cropped, format_name)
+            cropped.close()
+            if output_dir:
+                output_path = os.path.join(output_dir, f"{img_name}_{name}.{'jpg' if format_name == 'JPEG' else format_name.lower()}")
+                with open(output_path, 'wb') as f:
+                    f.write(data)
+                results[name] = output_path
+            else:
+                results[name] = io.BytesIO(data)
+    finally:
+        img.close()
+    return results
+
+
+def batch_smart_crop(image_paths, output_sizes, output_dir=None, workers=None, format_name='JPEG'):
+    """
+    Procesa un lote de imágenes con recorte inteligente en un grupo de procesos.
+
     Args:
         image_paths: Lista de rutas a imágenes
         output_sizes: Diccionario de tamaños {nombre: (ancho, alto)}
         output_dir: Directorio de salida (opcional)
-        
+        workers: Procesos (default: uno por CPU; 1 = en el proceso actual)
+        format_name: Formato de salida, o None para el formato original
+
     Returns:
         dict: Resultados del procesamiento
     """
     results = {}
-    
-    # Procesar cada imagen
-    for img_path in image_paths:
-        try:
-            img = Image.open(img_path)
-            img_name = img_path.split("/")[-1].split(".")[0]
-            
-            # Procesar cada tamaño
-            img_results = {}
-            for name, size in output_sizes.items():
-                output_io = process_smart_thumbnail(img, size)
-                
-                # Si se proporcionó un directorio de salida, guardar allí
-                if output_dir:
-                    output_path = f"{output_dir}/{img_name}_{name}.jpg"
-                    with open(output_path, "wb") as f:
-                        f.write(output_io.getvalue())
-                    img_results[name] = output_path
-                else:
-                    img_results[name] = output_io
-            
-            results[img_path] = img_results
-            img.close()
-        except Exception as e:
-            logger.error(f"Error procesando {img_path}: {e}")
-            results[img_path] = {"error": str(e)}
-    
+    workers = min(workers or os.cpu_count() or 1, len(image_paths))
+
+    if workers <= 1:
+        for img_path in image_paths:
+            try:
+                results[img_path] = crop_file(img_path, output_sizes, output_dir, format_name)
+            except Exception as e:
+                logger.error(f"Error procesando {img_path}: {e}")
+                results[img_path] = {"error": str(e)}
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(crop_file, img_path, output_sizes, output_dir, format_name): img_path
+            for img_path in image_paths
+        }
+        for future in as_completed(futures):
+            img_path = futures[future]
+            try:
+                results[img_path] = future.result()
+            except Exception as e:
+                logger.error(f"Error procesando {img_path}: {e}")
+                results[img_path] = {"error": str(e)}
+
     return results
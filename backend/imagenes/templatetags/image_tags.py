@@ -6,6 +6,8 @@ from django.conf import settings
 from django.utils.safestring import mark_safe
 import logging
 
+from imagenes.variants import on_demand
+
 register = template.Library()
 logger = logging.getLogger(__name__)
 
@@ -32,8 +34,8 @@ def responsive_image(image, alt_text="", css_class="", lazy=True, sizes="100vw")
     # Agregar loading="lazy" si corresponde
     lazy_attr = 'loading="lazy"' if lazy else ''
     
-    # Verificar si la imagen está optimizada
-    if not image.optimized:
+    # Verificar si la imagen está optimizada (bajo demanda siempre hay variaciones)
+    if not image.optimized and not on_demand():
         # Si no está optimizada, devolver la imagen original con lazy loading
         return mark_safe(
             f'<img src="{image.image.url}" alt="{alt_text}" '
@@ -57,22 +59,12 @@ def responsive_image(image, alt_text="", css_class="", lazy=True, sizes="100vw")
         'xl': 1440
     }
     
-    # Construir srcsets para cada formato
+    # Construir srcsets para cada formato (URL guardada o calculada bajo demanda)
     for size_name, width in sizes_map.items():
-        # Original format (JPG/PNG)
-        url_attr = f"{size_name}_url"
-        if hasattr(image, url_attr) and getattr(image, url_attr):
-            srcsets['jpg'].append(f"{getattr(image, url_attr)} {width}w")
-        
-        # WebP format
-        webp_attr = f"{size_name}_webp_url"
-        if hasattr(image, webp_attr) and getattr(image, webp_attr):
-            srcsets['webp'].append(f"{getattr(image, webp_attr)} {width}w")
-        
-        # AVIF format
-        avif_attr = f"{size_name}_avif_url"
-        if hasattr(image, avif_attr) and getattr(image, avif_attr):
-            srcsets['avif'].append(f"{getattr(image, avif_attr)} {width}w")
+        for fmt, variant_fmt in (('jpg', None), ('webp', 'webp'), ('avif', 'avif')):
+            url = image.variant_url(size_name, variant_fmt)
+            if url:
+                srcsets[fmt].append(f"{url} {width}w")
     
     # Construir el HTML para la imagen responsiva
     html = f'<picture>'
@@ -90,7 +82,7 @@ def responsive_image(image, alt_text="", css_class="", lazy=True, sizes="100vw")
     # Original format fallback
     if srcsets['jpg']:
         jpg_srcset = ', '.join(srcsets['jpg'])
-        img_url = image.large_url if image.large_url else image.image.url
+        img_url = image.variant_url('large') or image.image.url
         html += (
             f'<img src="{img_url}" srcset="{jpg_srcset}" sizes="{sizes}" '
             f'alt="{alt_text}" class="{css_class}" '
@@ -1,3 +1,635 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage, JpegImagePlugin
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from . import blobs, image_utils, jobs, variants
+from .models import Image, ImageJob, OptimizationRun
+
+
+def imagen_de_prueba(nombre='foto.jpg', size=(640, 480), color=(120, 80, 200)):
+    buffer = io.BytesIO()
+    PILImage.new('RGB', size, color).save(buffer, format='JPEG')
+    return SimpleUploadedFile(nombre, buffer.getvalue(), content_type='image/jpeg')
+
+
+class VariationEngineTest(TestCase):
+    """Tests para la generación de variaciones con una sola decodificación"""
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def guardar(self, size, orientation=1, nombre='foto.jpg'):
+        path = f'{self.workdir}/{nombre}'
+        exif = PILImage.Exif()
+        exif[0x0112] = orientation
+        PILImage.new('RGB', size, (90, 140, 60)).save(path, format='JPEG', exif=exif)
+        return path
+
+    def generar(self, path, variations):
+        return image_utils.write_variations(
+            path,
+            {name: image_utils.VARIATIONS[name] for name in variations},
+            lambda name, ext: f'{self.workdir}/out_{name}{ext}',
+        )
+
+    def test_exif_orientation_applied_once(self):
+        path = self.guardar((1600, 1200), orientation=6)
+
+        result = self.generar(path, ['medium', 'thumbnail'])
+
+        self.assertEqual((result['width'], result['height']), (1200, 1600))
+        with PILImage.open(result['medium']) as medium:
+            self.assertEqual(medium.size, (768, 1024))
+        with PILImage.open(result['thumbnail_webp']) as thumbnail:
+            self.assertEqual(thumbnail.size, (150, 200))
+
+    def test_small_variations_decode_with_draft(self):
+        path = self.guardar((2400, 1800))
+        original_draft = JpegImagePlugin.JpegImageFile.draft
+
+        with mock.patch.object(JpegImagePlugin.JpegImageFile, 'draft', autospec=True,
+                               side_effect=original_draft) as jpeg_draft:
+            result = self.generar(path, ['thumbnail'])
+
+        self.assertTrue(jpeg_draft.called)
+        self.assertEqual((result['width'], result['height']), (2400, 1800))
+        with PILImage.open(result['thumbnail']) as thumbnail:
+            self.assertEqual(thumbnail.size, (150, 112))
+
+    def test_never_upscales(self):
+        path = self.guardar((400, 300))
+
+        result = self.generar(path, ['xl', 'xs'])
+
+        with PILImage.open(result['xl']) as xl:
+            self.assertEqual(xl.size, (400, 300))
+        with PILImage.open(result['xs']) as xs:
+            self.assertEqual(xs.size, (320, 240))
+
+
+@skipUnless(image_utils.SMART_CROP_SUPPORT, 'Recorte inteligente no disponible (numpy)')
+class SmartCropTest(TestCase):
+    """Tests para el recorte inteligente por mapa de saliencia"""
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def imagen_con_detalle(self, size=(1200, 600), posicion=(900, 300)):
+        """Fondo liso con un recuadro de ruido: la única zona saliente"""
+        img = PILImage.new('RGB', size, (128, 128, 128))
+        img.paste(PILImage.effect_noise((200, 200), 80).convert('RGB'), posicion)
+        return img
+
+    def test_window_sums_match_direct_sums(self):
+        import numpy as np
+        from .smart_crop import summed_area_table, window_sums
+
+        values = np.random.default_rng(1).random((7, 9), dtype=np.float32)
+
+        sums = window_sums(summed_area_table(values), 3, 4)
+
+        self.assertEqual(sums.shape, (5, 6))
+        self.assertAlmostEqual(sums[2, 3], values[2:5, 3:7].sum(), places=4)
+
+    def test_crops_keep_salient_region_for_every_size(self):
+        from . import smart_crop
+
+        img = self.imagen_con_detalle()
+        with mock.patch.object(smart_crop, 'saliency_map', wraps=smart_crop.saliency_map) as saliency:
+            boxes = smart_crop.find_crops(img, {
+                'cuadrado': (150, 150), 'cuadrado_grande': (300, 300),
+                'panoramico': (400, 100), 'vertical': (150, 300),
+            })
+
+        saliency.assert_called_once()
+        self.assertEqual(boxes['cuadrado'], boxes['cuadrado_grande'])
+        for name, (left, top, right, bottom) in boxes.items():
+            self.assertLessEqual(left, 900, name)
+            self.assertLessEqual(top, 300, name)
+            self.assertGreaterEqual(right, 1100, name)
+            self.assertGreaterEqual(bottom, 500, name)
+
+    def test_flat_image_crops_center(self):
+        from .smart_crop import find_best_crop
+
+        img = PILImage.new('L', (800, 400), 50)
+
+        self.assertEqual(find_best_crop(img, 100, 100), (200, 0, 600, 400))
+
+    def test_batch_runs_in_process_pool(self):
+        from .smart_crop import batch_smart_crop
+
+        paths = []
+        for i in range(2):
+            path = f'{self.workdir}/foto-{i}.jpg'
+            self.imagen_con_detalle(posicion=(100 + i * 700, 100)).save(path, format='JPEG')
+            paths.append(path)
+
+        results = batch_smart_crop(paths, {'thumb': (150, 150)}, output_dir=self.workdir, workers=2)
+
+        for path in paths:
+            with PILImage.open(results[path]['thumb']) as thumb:
+                self.assertEqual(thumb.size, (150, 150))
+
+
+class MediaTestMixin:
+    """MEDIA_ROOT y caché de variaciones temporales para no escribir en media/"""
+
+    # Variaciones bajo demanda o guardadas en las columnas *_url
+    on_demand = False
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            IMAGENES_DERIVADOS_SINCRONOS=False,
+            IMAGENES_VARIANTES_BAJO_DEMANDA=self.on_demand,
+            IMAGENES_VARIANTES_CACHE_DIR=f'{self.media_root}/cache',
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def crear_imagen(self, archivo=None, **kwargs):
+        kwargs.setdefault('content_type', 'paciente')
+        kwargs.setdefault('object_id', '1')
+        if archivo is None:
+            # Cada imagen con su propio contenido, como subidas distintas
+            self.imagenes_creadas = getattr(self, 'imagenes_creadas', 0) + 1
+            archivo = imagen_de_prueba(color=(120, 80, 200 - self.imagenes_creadas * 10))
+        return Image.objects.create(image=archivo, **kwargs)
+
+
+class ImageJobTest(MediaTestMixin, TestCase):
+    """Tests para la cola de variaciones de imágenes"""
+
+    def test_create_enqueues_jobs_by_priority(self):
+        image = self.crear_imagen()
+        image.refresh_from_db()
+
+        self.assertFalse(image.optimized)
+        self.assertFalse(image.thumbnail_url)
+        queued = list(image.jobs.order_by('priority'))
+        self.assertEqual(
+            [job.variations for job in queued],
+            [['thumbnail'], ['xs', 'small'], ['medium', 'large', 'xl']],
+        )
+        self.assertTrue(all(job.status == 'pending' for job in queued))
+
+    def test_claim_takes_thumbnails_first(self):
+        primera = self.crear_imagen()
+        segunda = self.crear_imagen()
+
+        claimed = jobs.claim(2)
+
+        self.assertEqual([job.variations for job in claimed], [['thumbnail'], ['thumbnail']])
+        self.assertEqual({job.image_id for job in claimed}, {primera.pk, segunda.pk})
+        self.assertTrue(all(job.status == 'running' and job.attempts == 1 for job in claimed))
+
+    def test_process_batch_completes_image(self):
+        image = self.crear_imagen()
+
+        resumen = jobs.process_batch(10)
+
+        self.assertEqual(resumen, {'done': 3, 'pending': 0, 'failed': 0})
+        image.refresh_from_db()
+        self.assertTrue(image.optimized)
+        self.assertTrue(image.thumbnail_url)
+        self.assertTrue(image.xl_webp_url)
+        self.assertEqual((image.width, image.height), (640, 480))
+        self.assertFalse(ImageJob.objects.exclude(status='done').exists())
+
+    def test_thumbnail_alone_does_not_mark_optimized(self):
+        image = self.crear_imagen()
+
+        jobs.process_batch(1)
+
+        image.refresh_from_db()
+        self.assertTrue(image.thumbnail_url)
+        self.assertFalse(image.medium_url)
+        self.assertFalse(image.optimized)
+
+    def test_failed_job_is_retried_later(self):
+        self.crear_imagen()
+
+        with override_settings(IMAGENES_JOB_RETRY_BASE_SECONDS=120), \
+                mock.patch.object(jobs, 'render_variations', side_effect=OSError('disco lleno')):
+            resumen = jobs.process_batch(1)
+
+        self.assertEqual(resumen['pending'], 1)
+        job = ImageJob.objects.get(variations=['thumbnail'])
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.error, 'disco lleno')
+        self.assertGreater(job.available_at, timezone.now() + timedelta(seconds=60))
+        # No está disponible hasta que pase la espera
+        self.assertNotIn(job.pk, [j.pk for j in jobs.claim(10)])
+
+    def test_missing_file_fails_without_retry(self):
+        image = self.crear_imagen()
+        image.image.storage.delete(image.image.name)
+
+        resumen = jobs.process_batch(1)
+
+        self.assertEqual(resumen['failed'], 1)
+        self.assertEqual(ImageJob.objects.get(variations=['thumbnail']).status, 'failed')
+
+
+class ImageJobAPITest(MediaTestMixin, APITestCase):
+    """Tests para la subida y el estado de las variaciones por la API"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'x', is_staff=True)
+        self.client.force_authenticate(self.user)
+
+    def test_upload_returns_before_variations(self):
+        response = self.client.post('/api/images/upload/', {
+            'image': imagen_de_prueba(),
+            'content_type': 'paciente',
+            'object_id': '7',
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.data['optimized'])
+        self.assertEqual(ImageJob.objects.filter(image_id=response.data['id']).count(), 3)
+
+    def test_status_reports_progress(self):
+        image = self.crear_imagen()
+        jobs.process_batch(1)
+
+        response = self.client.get(f'/api/images/{image.pk}/status/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['optimized'])
+        self.assertTrue(response.data['variations']['thumbnail'])
+        self.assertFalse(response.data['variations']['xl'])
+        self.assertEqual(response.data['pending_jobs'], 2)
+
+    def test_optimize_enqueues_regeneration(self):
+        image = self.crear_imagen()
+        jobs.process_batch(10)
+
+        response = self.client.post(f'/api/images/{image.pk}/optimize/')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(len(response.data['jobs']), 3)
+        self.assertEqual(image.jobs.filter(status='pending').count(), 3)
+
+    def test_batch_optimize_only_enqueues(self):
+        self.crear_imagen(content_type='dentista')
+
+        with mock.patch.object(jobs, 'reoptimize') as reoptimize:
+            response = self.client.post('/api/images/batch-optimize/', {
+                'content_type': 'dentista', 'force': 'true',
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        reoptimize.assert_not_called()
+        run = OptimizationRun.objects.get(pk=response.data['job'])
+        self.assertEqual((run.status, run.content_type, run.force), ('pending', 'dentista', True))
+
+        response = self.client.get(f"/api/images/batch-optimize/{run.pk}/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'pending')
+
+        for run_id in ('----', 'abc', str(run.pk)[:-1]):
+            response = self.client.get(f"/api/images/batch-optimize/{run_id}/")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OptimizationRunTest(MediaTestMixin, TestCase):
+    """Tests para las regeneraciones masivas"""
+
+    def setUp(self):
+        super().setUp()
+        self.images = sorted((self.crear_imagen() for _ in range(3)), key=lambda image: image.pk)
+        ImageJob.objects.all().delete()
+
+    def ejecutar(self, **kwargs):
+        run = jobs.claim_run(jobs.start_run(**kwargs.pop('filters', {})).pk)
+        finished = jobs.process_run(run, **kwargs)
+        return run, finished
+
+    def test_unchanged_sources_are_skipped(self):
+        self.ejecutar()
+        with open(self.images[0].image.path, 'wb') as f:
+            f.write(imagen_de_prueba(size=(320, 200)).read())
+
+        run, finished = self.ejecutar()
+
+        self.assertTrue(finished)
+        self.assertEqual((run.total, run.processed, run.skipped, run.errors), (3, 1, 2, 0))
+        self.images[0].refresh_from_db()
+        self.assertEqual((self.images[0].width, self.images[0].height), (320, 200))
+        self.assertTrue(self.images[0].optimized)
+
+    def test_force_regenerates_unchanged_sources(self):
+        self.ejecutar()
+
+        run, _ = self.ejecutar(filters={'force': True})
+
+        self.assertEqual((run.processed, run.skipped), (3, 0))
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        run, finished = self.ejecutar(chunk_size=1, limit=2)
+
+        self.assertFalse(finished)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'pending')
+        self.assertEqual(run.last_image_id, self.images[1].pk)
+
+        with mock.patch.object(jobs, 'reoptimize', wraps=jobs.reoptimize) as reoptimize:
+            self.assertTrue(jobs.process_run(jobs.claim_run()))
+
+        self.assertEqual([c.args[0] for c in reoptimize.call_args_list], [self.images[2].image.name])
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.processed), ('done', 3))
+
+    def test_missing_file_counts_as_error(self):
+        self.images[1].image.storage.delete(self.images[1].image.name)
+
+        run, finished = self.ejecutar()
+
+        self.assertTrue(finished)
+        self.assertEqual((run.processed, run.errors), (2, 1))
+
+    def test_command_resumes_unfinished_run(self):
+        out = io.StringIO()
+        call_command('optimize_images', '--workers', '1', '--chunk-size', '1', '--limit', '1', stdout=out)
+        call_command('optimize_images', '--workers', '1', stdout=out)
+
+        run = OptimizationRun.objects.get()
+        self.assertEqual((run.status, run.processed), ('done', 3))
+        self.assertIn('Reanudando', out.getvalue())
+        self.assertIn('img/s', out.getvalue())
+
+
+class VariantServerTest(MediaTestMixin, APITestCase):
+    """Tests para las variaciones bajo demanda"""
+
+    on_demand = True
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'x', is_staff=True)
+        self.client.force_authenticate(self.user)
+
+    def pedir(self, image, name, **headers):
+        response = self.client.get(f'/media/v/{image.pk}/{name}', **headers)
+        if response.status_code == 200:
+            response.content_bytes = b''.join(response.streaming_content)
+        return response
+
+    def test_upload_prewarms_thumbnail_only(self):
+        image = self.crear_imagen()
+
+        self.assertEqual([job.variations for job in image.jobs.all()], [['thumbnail']])
+        jobs.process_batch(10)
+
+        image.refresh_from_db()
+        self.assertTrue(image.optimized)
+        self.assertEqual((image.width, image.height), (640, 480))
+        self.assertIsNone(image.thumbnail_url)
+        self.assertIsNotNone(variants.get_cache().get(
+            variants.cache_key(image.image.name, 'thumbnail', 'webp')
+        ))
+
+    def test_prewarm_uses_native_format_key(self):
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (640, 480), (10, 20, 30)).save(buffer, format='GIF')
+        image = self.crear_imagen(
+            archivo=SimpleUploadedFile('anim.gif', buffer.getvalue(), content_type='image/gif')
+        )
+        jobs.process_batch(10)
+
+        # Un GIF se sirve como PNG: la variación precalentada se reutiliza
+        with mock.patch.object(variants, 'render_variant') as render:
+            path = variants.get_or_render(image.image.name, 'thumbnail', 'png')
+        render.assert_not_called()
+        with PILImage.open(path) as variant:
+            self.assertEqual(variant.format, 'PNG')
+
+    def test_serializer_returns_computed_urls(self):
+        image = self.crear_imagen()
+
+        response = self.client.get(f'/api/images/{image.pk}/')
+
+        token = variants.source_token(image.image.name)
+        self.assertEqual(
+            response.data['medium_webp_url'],
+            f'http://testserver/media/v/{image.pk}/medium.webp?v={token}',
+        )
+        self.assertTrue(response.data['xl_url'].endswith(f'/xl.jpg?v={token}'))
+
+    def test_variant_rendered_once_then_cached(self):
+        image = self.crear_imagen()
+
+        response = self.pedir(image, 'medium.webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with PILImage.open(io.BytesIO(response.content_bytes)) as variant:
+            self.assertEqual(variant.size, (640, 480))  # no amplía
+
+        with mock.patch.object(variants, 'render_variant', return_value=b'webp') as render:
+            response = self.pedir(image, 'small.webp')
+            response = self.pedir(image, 'medium.webp')
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+
+    def test_auto_negotiates_format(self):
+        image = self.crear_imagen()
+
+        response = self.pedir(image, 'xs.auto', HTTP_ACCEPT='image/avif;q=0,image/webp,*/*;q=0.8')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'].split(', '))
+        with PILImage.open(io.BytesIO(response.content_bytes)) as variant:
+            self.assertEqual(variant.size, (320, 240))
+
+        response = self.pedir(image, 'xs.auto', HTTP_ACCEPT='*/*')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_etag_and_unknown_variants(self):
+        image = self.crear_imagen()
+        token = variants.source_token(image.image.name)
+
+        response = self.client.get(f'/media/v/{image.pk}/xs.jpg?v={token}')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(f'/media/v/{image.pk}/xs.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(self.client.get(f'/media/v/{image.pk}/huge.jpg').status_code, 404)
+        self.assertEqual(self.client.get(f'/media/v/{image.pk}/xs.tiff').status_code, 404)
+
+    def test_concurrent_requests_render_once(self):
+        image = self.crear_imagen()
+        real_render = variants.render_variant
+        calls = []
+
+        def slow_render(*args):
+            calls.append(args)
+            time.sleep(0.2)
+            return real_render(*args)
+
+        paths = []
+        with mock.patch.object(variants, 'render_variant', side_effect=slow_render):
+            threads = [
+                threading.Thread(target=lambda: paths.append(
+                    variants.get_or_render(image.image.name, 'small', 'jpg')
+                ))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(paths)), 1)
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = variants.DiskLRU(f'{self.media_root}/lru', max_bytes=350)
+        for i, key in enumerate(['a', 'b', 'c']):
+            cache.put(key, b'x' * 100)
+            os.utime(cache.path(key), (1000 + i, 1000 + i))
+        os.utime(cache.path('a'), (2000, 2000))  # 'a' usado recientemente
+
+        cache.put('d', b'x' * 100)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertIsNotNone(cache.get('d'))
+
+    def test_migrate_stored_variants_to_cache(self):
+        with override_settings(IMAGENES_VARIANTES_BAJO_DEMANDA=False):
+            image = self.crear_imagen()
+            jobs.process_batch(10)
+        image.refresh_from_db()
+        self.assertTrue(image.medium_webp_url)
+        # Mientras no se migra, se usan las URLs guardadas
+        self.assertEqual(image.variant_url('medium', 'webp'), image.medium_webp_url)
+
+        call_command('migrate_image_variants', stdout=io.StringIO())
+
+        image.refresh_from_db()
+        self.assertIsNone(image.medium_webp_url)
+        self.assertIn('/media/v/', image.variant_url('medium', 'webp'))
+        with mock.patch.object(variants, 'render_variant') as render:
+            response = self.pedir(image, 'medium.webp')
+        self.assertEqual(response.status_code, 200)
+        render.assert_not_called()
+
+    def test_delete_removes_cached_variants_when_unreferenced(self):
+        image = self.crear_imagen()
+        path = variants.get_or_render(image.image.name, 'xs', 'jpg')
+
+        image.delete()
+
+        # Solo se descuenta la referencia; el barrido borra blob y variaciones
+        self.assertTrue(os.path.exists(path))
+        with mock.patch.object(blobs, 'SWEEP_GRACE', timedelta(0)):
+            self.assertEqual(blobs.sweep()[0], 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(f'{self.media_root}/{image.image.name}'))
+
+
+class ContentAddressedStorageTest(MediaTestMixin, TestCase):
+    """Tests para el almacenamiento por contenido de las subidas"""
+
+    def archivos_blob(self):
+        return [
+            os.path.join(root, f)
+            for root, _, files in os.walk(f'{self.media_root}/blobs') for f in files
+        ]
+
+    def test_repeated_upload_reuses_blob_and_variations(self):
+        primera = self.crear_imagen(archivo=imagen_de_prueba())
+        jobs.process_batch(10)
+        primera.refresh_from_db()
+
+        segunda = self.crear_imagen(archivo=imagen_de_prueba(nombre='otra.jpg'))
+
+        self.assertTrue(blobs.is_blob(primera.image.name))
+        self.assertEqual(segunda.image.name, primera.image.name)
+        self.assertEqual(blobs.MediaBlob.objects.get(name=primera.image.name).refcount, 2)
+        self.assertTrue(segunda.optimized)
+        self.assertEqual(segunda.thumbnail_url, primera.thumbnail_url)
+        self.assertFalse(segunda.jobs.exists())
+        originales = [f for f in self.archivos_blob() if f.endswith(primera.image.name)]
+        self.assertEqual(len(originales), 1)
+
+    def test_smart_crop_updates_every_row_of_a_shared_file(self):
+        primera = self.crear_imagen(archivo=imagen_de_prueba())
+        jobs.process_batch(10)
+        segunda = self.crear_imagen(archivo=imagen_de_prueba(nombre='otra.jpg'))
+        Image.objects.update(thumbnail_url='')
+
+        out = io.StringIO()
+        call_command('smart_crop_thumbnails', '--workers', '1', stdout=out)
+
+        primera.refresh_from_db()
+        segunda.refresh_from_db()
+        self.assertIn('Processed 2 images', out.getvalue())
+        self.assertTrue(primera.thumbnail_url)
+        self.assertEqual(segunda.thumbnail_url, primera.thumbnail_url)
+
+    def test_replacing_file_releases_previous_blob(self):
+        image = self.crear_imagen()
+        anterior = image.image.name
+
+        image.image = imagen_de_prueba(color=(1, 2, 3))
+        image.save()
+
+        self.assertNotEqual(image.image.name, anterior)
+        self.assertEqual(blobs.MediaBlob.objects.get(name=anterior).refcount, 0)
+        self.assertEqual(blobs.MediaBlob.objects.get(name=image.image.name).refcount, 1)
+
+    def test_dedupe_media_merges_legacy_files(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+
+        contenido = imagen_de_prueba().read()
+        legacy = []
+        for nombre in ('a', 'b'):
+            default_storage.save(f'paciente/{nombre}.jpg', ContentFile(contenido))
+            default_storage.save(f'paciente/{nombre}_thumbnail.jpg', ContentFile(b'miniatura'))
+            legacy.append(Image(
+                image=f'paciente/{nombre}.jpg', content_type='paciente', object_id='1',
+                thumbnail_url=f'/media/paciente/{nombre}_thumbnail.jpg',
+            ))
+        # bulk_create no envía señales: quedan como subidas anteriores
+        Image.objects.bulk_create(legacy)
+
+        out = io.StringIO()
+        call_command('dedupe_media', '--dry-run', stdout=out)
+        self.assertIn(f'Se liberarían {len(contenido) / 1024:.1f} KB', out.getvalue())
+        self.assertTrue(os.path.exists(f'{self.media_root}/paciente/a.jpg'))
+
+        call_command('dedupe_media', stdout=out)
+
+        a, b = Image.objects.order_by('object_id', 'pk')
+        self.assertEqual(a.image.name, b.image.name)
+        self.assertTrue(blobs.is_blob(a.image.name))
+        self.assertEqual(a.thumbnail_url, b.thumbnail_url)
+        self.assertEqual(a.thumbnail_url, f"/media/{blobs.derivative_name(a.image.name, '_thumbnail.jpg')}")
+        self.assertEqual(os.listdir(f'{self.media_root}/paciente'), [])
+        self.assertEqual(blobs.MediaBlob.objects.get(name=a.image.name).refcount, 2)
+        self.assertIn(f'Liberados {(len(contenido) + 9) / 1024:.1f} KB', out.getvalue())
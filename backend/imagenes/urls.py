@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ImageViewSet, ImageGalleryView, gallery_demo
+from .views import ImageViewSet, ImageGalleryView, gallery_demo, image_variant
 
 router = DefaultRouter()
 router.register(r'images', ImageViewSet)
@@ -9,4 +9,5 @@ urlpatterns = [
     path('api/', include(router.urls)),
     path('gallery/', ImageGalleryView.as_view(), name='image_gallery'),
     path('gallery/demo/', gallery_demo, name='gallery_demo'),
+    path('media/v/<uuid:pk>/<str:size>.<str:fmt>', image_variant, name='image_variant'),
 ]
@@ -0,0 +1,339 @@
+"""
+Variaciones de imágenes bajo demanda.
+
+En lugar de generar de antemano 6 tamaños × 2-3 formatos por imagen (y
+guardar sus 18 URLs en ``Image``), ``/media/v/<id>/<tamaño>.<formato>``
+genera cada variación la primera vez que alguien la pide:
+
+- Formatos: ``jpg``, ``png``, ``webp``, ``avif`` (si está pillow-avif) o
+  ``auto``, que elige AVIF, WebP o JPEG según la cabecera ``Accept`` y
+  responde con ``Vary: Accept``.
+- Caché en disco (``IMAGENES_VARIANTES_CACHE_DIR``) con un límite de tamaño
+  (``IMAGENES_VARIANTES_CACHE_MAX_BYTES``). Cada acierto actualiza la fecha
+  de modificación del archivo y, al pasar el límite, se borran los menos
+  usados recientemente hasta bajar al 90 %.
+- Un candado por variación evita que varias peticiones simultáneas generen
+  la misma: la primera la genera y las demás esperan y la leen de la caché.
+  Dentro del proceso es un ``threading.Lock`` por clave; entre procesos,
+  un ``flock`` sobre uno de ``LOCK_STRIPES`` archivos de candado.
+- Las claves se forman con un resumen del nombre del archivo original:
+  reemplazar la imagen no sirve variaciones viejas, y las imágenes que
+  comparten archivo (subidas repetidas, ver ``imagenes.blobs``) comparten
+  también sus variaciones.
+
+Las URLs calculadas (``variant_url``) sustituyen a las columnas ``*_url``
+de ``Image``. Las filas que ya tienen variaciones guardadas siguen usando
+esas URLs hasta que ``migrate_image_variants`` mueve los archivos a la
+caché y vacía las columnas.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+from django.conf import settings
+from django.urls import reverse
+
+from .image_utils import AVIF_SUPPORT, VARIATIONS, _write_atomic, render_variant, write_variations
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo el candado dentro del proceso
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Formato de la URL -> (formato PIL, tipo MIME)
+FORMATS = {
+    'jpg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+}
+if AVIF_SUPPORT:
+    FORMATS['avif'] = ('AVIF', 'image/avif')
+
+# Preferencia de ``auto``, de mejor a peor compresión
+NEGOTIATED_FORMATS = [fmt for fmt in ('avif', 'webp') if fmt in FORMATS]
+
+# Archivos de candado entre procesos
+LOCK_STRIPES = 64
+
+# Segundos entre actualizaciones de la fecha de uso de un archivo
+TOUCH_INTERVAL = 60
+
+
+def on_demand():
+    """True si las variaciones se generan bajo demanda en lugar de guardarse en ``Image``"""
+    return getattr(settings, 'IMAGENES_VARIANTES_BAJO_DEMANDA', True)
+
+
+def native_format(storage_name):
+    """Formato de la URL equivalente al del archivo original (jpg o png)"""
+    ext = os.path.splitext(storage_name)[1].lower()
+    return 'png' if ext in ('.png', '.gif') else 'jpg'
+
+
+def source_token(storage_name):
+    """Resumen del nombre del original: cambia si se reemplaza el archivo"""
+    return hashlib.sha1(storage_name.encode()).hexdigest()[:10]
+
+
+def variant_url(image, size, fmt='auto'):
+    """
+    URL calculada de una variación.
+
+    Lleva ``?v=`` con el resumen del original para que el navegador pueda
+    guardarla indefinidamente.
+    """
+    if not image.image or size not in VARIATIONS or (fmt != 'auto' and fmt not in FORMATS):
+        return None
+    path = reverse('image_variant', kwargs={'pk': image.pk, 'size': size, 'fmt': fmt})
+    return f"{path}?v={source_token(image.image.name)}"
+
+
+def negotiate(accept):
+    """
+    Elegir el formato de ``auto`` según la cabecera ``Accept``.
+
+    Los navegadores que admiten AVIF o WebP los anuncian explícitamente
+    (``image/avif,image/webp,*/*``); ``*/*`` solo no basta para arriesgarse.
+    """
+    accepted = {}
+    for part in accept.split(','):
+        media_type, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_type.strip().lower()] = quality
+
+    for fmt in NEGOTIATED_FORMATS:
+        if accepted.get(FORMATS[fmt][1], 0) > 0:
+            return fmt
+    return 'jpg'
+
+
+class DiskLRU:
+    """
+    Caché de archivos en disco con límite de tamaño y expulsión LRU.
+
+    El uso se registra en la fecha de modificación de cada archivo. El
+    tamaño total se estima en memoria y se recalcula recorriendo el
+    directorio al expulsar, así que con varios procesos puede pasarse del
+    límite por lo que escriban entre dos recorridos.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Ruta del archivo si está en la caché, marcándolo como usado"""
+        path = self.path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        if time.time() - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+        return path
+
+    def put(self, key, data):
+        path = self.path(key)
+        _write_atomic(path, data)
+        self.added(len(data))
+        return path
+
+    def added(self, nbytes):
+        """Registrar bytes escritos en la caché por fuera de ``put``"""
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += nbytes
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp') or root.endswith('locks'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Borrar los archivos usados hace más tiempo hasta bajar al 90 % del límite"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._size = total
+        if removed:
+            logger.info("Caché de variaciones: %s archivos expulsados", removed)
+        return removed
+
+    def remove_prefix(self, prefix):
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+        with self._lock:
+            self._size = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Caché del proceso, creada de nuevo si cambia la configuración"""
+    global _cache
+    directory = str(getattr(settings, 'IMAGENES_VARIANTES_CACHE_DIR', settings.BASE_DIR / 'cache' / 'variantes'))
+    max_bytes = getattr(settings, 'IMAGENES_VARIANTES_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+    with _cache_lock:
+        if _cache is None or (_cache.directory, _cache.max_bytes) != (directory, max_bytes):
+            _cache = DiskLRU(directory, max_bytes)
+        return _cache
+
+
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+class _KeyLock:
+    """Candado por clave dentro del proceso y por franja entre procesos"""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+
+    def __enter__(self):
+        with _key_locks_guard:
+            lock, users = _key_locks.get(self.key, (None, 0))
+            lock = lock or threading.Lock()
+            _key_locks[self.key] = (lock, users + 1)
+        self.lock = lock
+        lock.acquire()
+
+        self.lock_file = None
+        if fcntl is not None:
+            stripe = int(hashlib.sha1(self.key.encode()).hexdigest(), 16) % LOCK_STRIPES
+            lock_path = os.path.join(self.cache.directory, 'locks', f'{stripe:02d}.lock')
+            os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+            self.lock_file = open(lock_path, 'a')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+        self.lock.release()
+        with _key_locks_guard:
+            lock, users = _key_locks[self.key]
+            if users == 1:
+                del _key_locks[self.key]
+            else:
+                _key_locks[self.key] = (lock, users - 1)
+
+
+def _source_prefix(storage_name):
+    token = source_token(storage_name)
+    return os.path.join(token[:2], token)
+
+
+def cache_key(storage_name, size, fmt):
+    return os.path.join(_source_prefix(storage_name), f"{size}.{fmt}")
+
+
+def get_or_render(storage_name, size, fmt):
+    """
+    Ruta de la variación en la caché, generándola si no está.
+
+    Raises:
+        FileNotFoundError: Si el archivo original no existe
+    """
+    from django.core.files.storage import default_storage
+
+    cache = get_cache()
+    key = cache_key(storage_name, size, fmt)
+    path = cache.get(key)
+    if path is not None:
+        return path
+
+    with _KeyLock(cache, key):
+        # Otra petición pudo generarla mientras se esperaba el candado
+        path = cache.get(key)
+        if path is not None:
+            return path
+        data = render_variant(default_storage.path(storage_name), VARIATIONS[size], FORMATS[fmt][0])
+        return cache.put(key, data)
+
+
+def prewarm(storage_name, variations=None):
+    """
+    Generar por adelantado variaciones en la caché (JPEG/PNG, WebP y AVIF)
+    con una sola decodificación. Lo usan los trabajos de ``imagenes.jobs``
+    en modo bajo demanda.
+
+    Returns:
+        dict: ``width``, ``height`` y ``file_size`` del original
+    """
+    from django.core.files.storage import default_storage
+
+    cache = get_cache()
+    image_path = default_storage.path(storage_name)
+    native = native_format(storage_name)
+    variations = {name: VARIATIONS[name] for name in (variations or VARIATIONS)}
+
+    def output_path(variation_name, ext):
+        return cache.path(cache_key(storage_name, variation_name, ext.lstrip('.')))
+
+    # El archivo principal se codifica y se guarda con el mismo formato que
+    # pide ``get_or_render`` para la URL sin formato (``native_format``)
+    written = write_variations(
+        image_path, variations, output_path, native=(f'.{native}', FORMATS[native][0])
+    )
+    result = {
+        'width': written.pop('width'),
+        'height': written.pop('height'),
+        'file_size': os.path.getsize(image_path),
+    }
+    cache.added(sum(os.path.getsize(path) for path in written.values()))
+    return result
+
+
+def invalidate(storage_name):
+    """Borrar de la caché todas las variaciones de un archivo original"""
+    get_cache().remove_prefix(_source_prefix(storage_name))
@@ -2,12 +2,16 @@ from rest_framework import viewsets, status, parsers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404, render
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
 from django.views.generic import ListView, DetailView
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.conf import settings
-from .models import Image
+from . import jobs, variants
+from .models import Image, OptimizationRun
 from .serializers import ImageSerializer, ImageUploadSerializer
 
 
@@ -93,7 +97,8 @@ class ImageViewSet(viewsets.ModelViewSet):
                 is_featured=image_data.get('is_featured', False)
             )
             
-            # La generación de versiones optimizadas ocurre automáticamente por la señal post_save
+            # La señal post_save encola la generación de las versiones
+            # optimizadas; el avance se consulta en el endpoint status
             
             # Devuelve la imagen creada usando el serializer completo
             return Response(
@@ -106,60 +111,117 @@ class ImageViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], url_path='optimize')
     def optimize(self, request, pk=None):
         """
-        Regenera las versiones optimizadas de una imagen específica.
+        Encola la regeneración de las versiones optimizadas de una imagen.
         Útil si se necesita actualizar thumbnails o cambiar formatos.
+        El avance se consulta en ``status``.
         """
         image = self.get_object()
         
-        # Forzar la regeneración de todas las versiones
-        result = image.generate_optimized_versions(force=True)
-        
-        if result:
-            return Response({
-                'status': 'success',
-                'message': 'Las versiones optimizadas han sido regeneradas',
-                'image': ImageSerializer(image, context=self.get_serializer_context()).data
-            })
-        else:
+        if not image.image:
             return Response({
                 'status': 'error',
-                'message': 'No se pudieron generar las versiones optimizadas'
+                'message': 'La imagen no tiene archivo'
             }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Forzar la regeneración de todas las versiones; bajo demanda basta
+        # con vaciar la caché y precalentar las habituales
+        if variants.on_demand():
+            variants.invalidate(image.image.name)
+            queued = jobs.enqueue_variations(
+                image, variations=getattr(settings, 'IMAGENES_VARIANTES_PRECALENTAR', None)
+            )
+        else:
+            queued = jobs.enqueue_variations(image)
+        
+        return Response({
+            'status': 'queued',
+            'message': 'La regeneración de las versiones optimizadas está en cola',
+            'jobs': [str(job.pk) for job in queued],
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'], url_path='status')
+    def processing_status(self, request, pk=None):
+        """
+        Estado de las versiones optimizadas: qué variaciones están listas y
+        los trabajos de la cola de la imagen.
+        """
+        return Response(jobs.image_status(self.get_object()))
             
     @action(detail=False, methods=['post'], url_path='batch-optimize')
     def batch_optimize(self, request):
         """
-        Regenera las versiones optimizadas de todas las imágenes o un conjunto filtrado.
+        Encola la regeneración de las versiones optimizadas de todas las
+        imágenes o un conjunto filtrado. La ejecutan ``process_image_jobs``
+        u ``optimize_images --run <id>``; el avance se consulta en
+        ``batch-optimize/<id>``.
         """
-        # Aplicar filtros si se proporcionan
-        content_type = request.data.get('content_type')
-        object_id = request.data.get('object_id')
-        
-        queryset = self.get_queryset()
-        
-        if content_type:
-            queryset = queryset.filter(content_type=content_type)
-        
-        if object_id:
-            queryset = queryset.filter(object_id=object_id)
+        force = request.data.get('force', False)
+        if isinstance(force, str):
+            force = force.lower() == 'true'
         
-        # Procesar las imágenes
-        processed = 0
-        errors = 0
-        
-        for image in queryset:
-            try:
-                if image.generate_optimized_versions(force=True):
-                    processed += 1
-            except Exception:
-                errors += 1
+        run = jobs.start_run(
+            content_type=request.data.get('content_type'),
+            object_id=request.data.get('object_id'),
+            force=bool(force),
+        )
         
         return Response({
-            'status': 'completed',
-            'processed': processed,
-            'errors': errors,
-            'total': processed + errors
-        })
+            'status': 'queued',
+            'message': 'La regeneración de las versiones optimizadas está en cola',
+            'job': str(run.pk),
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(
+        detail=False, methods=['get'],
+        url_path=r'batch-optimize/(?P<run_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})',
+    )
+    def batch_optimize_status(self, request, run_id=None):
+        """Progreso de una regeneración masiva encolada con ``batch-optimize``"""
+        run = get_object_or_404(OptimizationRun, pk=run_id)
+        return Response(jobs.run_status(run))
+
+
+def image_variant(request, pk, size, fmt):
+    """
+    Sirve una variación de una imagen, generándola la primera vez que se
+    pide (ver ``imagenes.variants``). Con ``auto`` el formato se elige según
+    la cabecera ``Accept``.
+    """
+    if size not in variants.VARIATIONS:
+        raise Http404("Variación desconocida")
+    negotiated = fmt == 'auto'
+    if negotiated:
+        fmt = variants.negotiate(request.headers.get('Accept', ''))
+    elif fmt not in variants.FORMATS:
+        raise Http404("Formato no disponible")
+    
+    image = get_object_or_404(Image.objects.only('id', 'image'), pk=pk)
+    if not image.image:
+        raise Http404("La imagen no tiene archivo")
+    token = variants.source_token(image.image.name)
+    
+    headers = {
+        'ETag': quote_etag(f'{token}-{size}-{fmt}'),
+        # Con el resumen del original en la URL la respuesta no cambia nunca
+        'Cache-Control': (
+            'public, max-age=31536000, immutable' if request.GET.get('v') == token
+            else 'public, max-age=3600'
+        ),
+    }
+    
+    if request.headers.get('If-None-Match') == headers['ETag']:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            path = variants.get_or_render(image.image.name, size, fmt)
+        except FileNotFoundError:
+            raise Http404("No se encontró el archivo original")
+        response = FileResponse(open(path, 'rb'), content_type=variants.FORMATS[fmt][1])
+    for header, value in headers.items():
+        response[header] = value
+    if negotiated:
+        patch_vary_headers(response, ['Accept'])
+    return response
 
 
 class ImageGalleryView(ListView):
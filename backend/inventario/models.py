@@ -98,11 +98,16 @@ class ArticuloInventario(models.Model):
     @property
     def estado_stock(self):
         """Determina el estado del stock"""
-        if self.stock_actual <= self.stock_minimo * 0.5:
+        return self.calcular_estado_stock(self.stock_actual, self.stock_minimo, self.stock_maximo)
+    
+    @staticmethod
+    def calcular_estado_stock(stock_actual, stock_minimo, stock_maximo):
+        """Estado del stock a partir de sus valores (también lo usan los listados por values())"""
+        if stock_actual <= stock_minimo * 0.5:
             return 'critico'
-        elif self.stock_actual <= self.stock_minimo:
+        elif stock_actual <= stock_minimo:
             return 'bajo'
-        elif self.stock_actual >= self.stock_maximo * 0.9:
+        elif stock_actual >= stock_maximo * 0.9:
             return 'alto'
         else:
             return 'normal'
@@ -153,6 +158,7 @@ class MovimientoInventario(models.Model):
         indexes = [
             models.Index(fields=['articulo', 'fecha_movimiento']),
             models.Index(fields=['tipo', 'fecha_movimiento']),
+            models.Index(fields=['fecha_movimiento', 'id']),
         ]
     
     def __str__(self):
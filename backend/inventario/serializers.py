@@ -1,5 +1,7 @@
+import operator
+
 from rest_framework import serializers
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, Q, OuterRef
 from django.utils import timezone
 from datetime import timedelta
 from .models import (
@@ -9,6 +11,8 @@ from .models import (
     MovimientoInventario, 
     AlertaInventario
 )
+from dental_erp.eager_loading import SubqueryCount
+from dental_erp.fast_serializers import FastSerializer, Computed, Related
 
 class CategoriaInventarioSerializer(serializers.ModelSerializer):
     total_articulos = serializers.SerializerMethodField()
@@ -171,3 +175,42 @@ class ArticuloInventarioListSerializer(serializers.ModelSerializer):
             'precio_venta', 'stock_actual', 'stock_minimo', 'stock_maximo',
             'ubicacion', 'fecha_vencimiento', 'lote', 'estado_stock', 'valor_total'
         ]
+
+
+# Ruta rápida de solo lectura para el listado (ver dental_erp.fast_serializers);
+# la salida coincide con la de ArticuloInventarioListSerializer
+
+class CategoriaInventarioReadSerializer(FastSerializer):
+    class Meta:
+        model = CategoriaInventario
+        fields = CategoriaInventarioSerializer.Meta.fields
+        annotations = {
+            'total_articulos': SubqueryCount(
+                ArticuloInventario.objects.filter(categoria=OuterRef('pk'), activo=True)
+            ),
+        }
+
+
+class ProveedorReadSerializer(FastSerializer):
+    class Meta:
+        model = Proveedor
+        fields = ProveedorSerializer.Meta.fields
+        annotations = {
+            'total_articulos': SubqueryCount(
+                ArticuloInventario.objects.filter(proveedor=OuterRef('pk'), activo=True)
+            ),
+        }
+
+
+class ArticuloInventarioReadSerializer(FastSerializer):
+    categoria = Related(CategoriaInventarioReadSerializer)
+    proveedor = Related(ProveedorReadSerializer)
+    estado_stock = Computed(
+        ('stock_actual', 'stock_minimo', 'stock_maximo'),
+        ArticuloInventario.calcular_estado_stock
+    )
+    valor_total = Computed(('precio_compra', 'stock_actual'), operator.mul)
+    
+    class Meta:
+        model = ArticuloInventario
+        fields = ArticuloInventarioListSerializer.Meta.fields
@@ -0,0 +1,57 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from .models import ArticuloInventario, CategoriaInventario, Proveedor
+from .serializers import ArticuloInventarioListSerializer
+
+
+class ArticuloInventarioListTest(APITestCase):
+    """Tests del listado de artículos con el serializador de lectura rápida"""
+
+    def setUp(self):
+        self.categoria = CategoriaInventario.objects.create(nombre="Anestésicos")
+        self.proveedor = Proveedor.objects.create(nombre="Dental Supply", email="ventas@dental.com")
+        ArticuloInventario.objects.create(
+            codigo="ANE-001",
+            nombre="Lidocaína",
+            descripcion="Cartucho al 2%",
+            categoria=self.categoria,
+            proveedor=self.proveedor,
+            unidad_medida='cartucho',
+            precio_compra=Decimal('12.50'),
+            precio_venta=Decimal('20.00'),
+            stock_actual=3,
+            stock_minimo=5,
+            fecha_vencimiento=date(2030, 1, 31),
+        )
+        ArticuloInventario.objects.create(
+            codigo="ANE-002",
+            nombre="Articaína",
+            descripcion="Cartucho al 4%",
+            categoria=self.categoria,
+            unidad_medida='cartucho',
+            precio_compra=Decimal('15.00'),
+            precio_venta=Decimal('27.30'),
+            stock_actual=95,
+        )
+
+    def test_list_matches_model_serializer(self):
+        """El listado coincide con ArticuloInventarioListSerializer"""
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/inventario/')
+        self.assertEqual(response.status_code, 200)
+
+        request = APIRequestFactory().get('/api/inventario/')
+        queryset = ArticuloInventario.objects.select_related('categoria', 'proveedor').order_by(
+            'categoria__nombre', 'nombre'
+        )
+        expected = ArticuloInventarioListSerializer(queryset, many=True, context={'request': request}).data
+        self.assertEqual(response.json()['results'], json.loads(JSONRenderer().render(expected)))
+
+        data = {item['codigo']: item for item in response.json()['results']}
+        self.assertEqual(data['ANE-001']['estado_stock'], 'bajo')
+        self.assertIsNone(data['ANE-002']['proveedor'])
@@ -7,6 +7,7 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from dental_erp.exports import Columna, ExportMixin
 
 from .models import (
     ArticuloInventario, 
@@ -19,6 +20,7 @@ from .serializers import (
     ArticuloInventarioSerializer,
     ArticuloInventarioListSerializer,
     ArticuloInventarioCreateSerializer,
+    ArticuloInventarioReadSerializer,
     CategoriaInventarioSerializer,
     ProveedorSerializer,
     MovimientoInventarioSerializer,
@@ -77,6 +79,19 @@ class ArticuloInventarioViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """
+        List items through the read-only fast path (dental_erp.fast_serializers):
+        same output as ArticuloInventarioListSerializer, built from values() rows
+        """
+        serializer = ArticuloInventarioReadSerializer(context=self.get_serializer_context())
+        rows = serializer.values_queryset(self.filter_queryset(self.get_queryset()))
+        
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
+    
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get inventory statistics"""
@@ -195,7 +210,7 @@ class ProveedorViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class MovimientoInventarioViewSet(viewsets.ModelViewSet):
+class MovimientoInventarioViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing inventory movements
     """
@@ -206,6 +221,21 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
     search_fields = ['articulo__nombre', 'articulo__codigo', 'motivo']
     ordering_fields = ['fecha_movimiento']
     ordering = ['-fecha_movimiento']
+    cursor_ordering = ('-fecha_movimiento',)
+    export_name = 'movimientos-inventario'
+    export_columns = (
+        Columna('fecha_movimiento', 'Fecha'),
+        Columna('articulo_codigo', 'Código del artículo', 'articulo__codigo'),
+        Columna('articulo', 'Artículo', 'articulo__nombre'),
+        Columna('tipo', 'Tipo'),
+        Columna('cantidad', 'Cantidad'),
+        Columna('cantidad_anterior', 'Cantidad anterior'),
+        Columna('cantidad_nueva', 'Cantidad nueva'),
+        Columna('motivo', 'Motivo'),
+        Columna('numero_factura', 'Factura del proveedor'),
+        Columna('costo_unitario', 'Costo unitario'),
+        Columna('registrado_por', 'Registrado por', 'registrado_por__username'),
+    )
     
     def get_serializer_class(self):
         if self.action == 'create':
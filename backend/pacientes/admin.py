@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Paciente
+from .models import Paciente, CargaImagenMedica, TrabajoImagenMedica
 
 @admin.register(Paciente)
 class PacienteAdmin(admin.ModelAdmin):
@@ -29,3 +29,17 @@ class PacienteAdmin(admin.ModelAdmin):
     def nombre_completo(self, obj):
         return obj.nombre_completo
     nombre_completo.short_description = 'Nombre Completo'
+
+
+@admin.register(CargaImagenMedica)
+class CargaImagenMedicaAdmin(admin.ModelAdmin):
+    list_display = ('nombre_archivo', 'recibido', 'tamaño', 'estado', 'dentista', 'fecha_actualizacion')
+    list_filter = ('estado',)
+    readonly_fields = ('id', 'sha256', 'datos', 'recibido', 'bloqueada_hasta', 'imagen', 'fecha_creacion', 'fecha_actualizacion')
+
+
+@admin.register(TrabajoImagenMedica)
+class TrabajoImagenMedicaAdmin(admin.ModelAdmin):
+    list_display = ('imagen', 'estado', 'intentos', 'disponible_desde', 'fecha_fin')
+    list_filter = ('estado',)
+    readonly_fields = ('id', 'fecha_creacion', 'fecha_inicio', 'fecha_fin')
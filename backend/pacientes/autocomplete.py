@@ -0,0 +1,371 @@
+"""
+Autocompletado de pacientes para recepción.
+
+Sustituye los seis ``icontains`` que se ejecutan en cada tecla por una
+búsqueda por trigramas, tolerante a errores de escritura en apellidos:
+
+- PostgreSQL: extensión ``pg_trgm`` con un índice GIN sobre una expresión
+  normalizada (minúsculas y sin acentos) de nombre, apellidos, expediente,
+  email y teléfono. La migración ``0005_paciente_trigram_index`` lo crea.
+- Otras bases de datos: índice de n-gramas en memoria del proceso. Los
+  trigramas se calculan sobre el vocabulario de palabras (unos miles de
+  apellidos distintos), no sobre cada paciente, y cada palabra apunta a los
+  pacientes que la contienen. Los identificadores (expediente, email,
+  teléfono) son únicos por paciente, así que solo se buscan por prefijo.
+
+En ambos casos solo se devuelven los campos que necesita el desplegable.
+"""
+
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .models import Paciente
+
+# Campos que se devuelven al desplegable
+AUTOCOMPLETE_FIELDS = ('id', 'nombre', 'apellido_paterno', 'apellido_materno',
+                       'numero_expediente', 'telefono', 'email')
+
+# Campos que forman el texto buscable de cada paciente
+SEARCH_FIELDS = ('nombre', 'apellido_paterno', 'apellido_materno',
+                 'numero_expediente', 'email', 'telefono')
+
+INDEX_VERSION_KEY = 'pacientes:autocomplete:version'
+
+# Máximo de palabras del vocabulario a las que se expande un prefijo
+MAX_PREFIX_EXPANSION = 50
+
+
+def normalize(text):
+    """Minúsculas y sin acentos, para comparar 'Núñez' con 'nunez'"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def trigrams(word):
+    """Trigramas de una palabra, con el mismo relleno que pg_trgm"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _is_fuzzy(word):
+    """Solo las palabras (nombres y apellidos) admiten errores de escritura"""
+    return word.isalpha()
+
+
+def get_threshold():
+    return getattr(settings, 'PACIENTE_AUTOCOMPLETE_THRESHOLD', 0.5)
+
+
+class NGramIndex:
+    """
+    Índice de trigramas en memoria para autocompletado tolerante a errores.
+
+    Cada término de la consulta se compara contra el vocabulario por
+    similitud de trigramas (y por prefijo, en el último término, que es el
+    que se está escribiendo). Un paciente aparece en los resultados si todos
+    los términos coinciden con alguna de sus palabras; la puntuación es la
+    suma de las mejores similitudes.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(set)      # palabra -> ids de pacientes
+        self._gram_words = defaultdict(set)    # trigrama -> palabras
+        self._word_grams = {}                  # palabra -> número de trigramas
+        self._vocabulary = set()               # todas las palabras (prefijos)
+        self._doc_words = {}                   # id -> palabras del paciente
+        self._sorted_words = None              # vocabulario ordenado (prefijos)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_words)
+
+    def add(self, doc_id, text):
+        """Agregar o reemplazar un paciente"""
+        words = tuple(set(normalize(text).split()))
+        with self._lock:
+            self.remove(doc_id)
+            self._doc_words[doc_id] = words
+            for word in words:
+                if word not in self._vocabulary:
+                    self._vocabulary.add(word)
+                    self._sorted_words = None
+                    if _is_fuzzy(word):
+                        grams = trigrams(word)
+                        self._word_grams[word] = len(grams)
+                        for gram in grams:
+                            self._gram_words[gram].add(word)
+                self._postings[word].add(doc_id)
+
+    def remove(self, doc_id):
+        """Quitar un paciente del índice"""
+        with self._lock:
+            for word in self._doc_words.pop(doc_id, ()):
+                postings = self._postings.get(word)
+                if postings is None:
+                    continue
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[word]
+                    self._vocabulary.discard(word)
+                    self._sorted_words = None
+                    if self._word_grams.pop(word, None) is not None:
+                        for gram in trigrams(word):
+                            self._gram_words[gram].discard(word)
+
+    def sorted_words(self):
+        """Vocabulario ordenado para buscar prefijos con bisect"""
+        with self._lock:
+            if self._sorted_words is None:
+                self._sorted_words = sorted(self._vocabulary)
+            return self._sorted_words
+
+    def _match_words(self, term, threshold, prefix):
+        """Palabras del vocabulario parecidas al término, con su similitud"""
+        grams = trigrams(term)
+        counts = Counter()
+        for gram in grams:
+            counts.update(self._gram_words.get(gram, ()))
+
+        matches = {}
+        for word, common in counts.items():
+            similarity = common / max(len(grams), self._word_grams[word])
+            if similarity >= threshold:
+                matches[word] = similarity
+
+        if prefix:
+            words = self.sorted_words()
+            start = bisect_left(words, term)
+            for word in words[start:start + MAX_PREFIX_EXPANSION]:
+                if not word.startswith(term):
+                    break
+                matches[word] = max(matches.get(word, 0), 1.0 if word == term else 0.9)
+
+        return matches
+
+    def search(self, query, limit=10, threshold=None):
+        """
+        Buscar pacientes.
+
+        Returns:
+            list: Tuplas (id, puntuación) ordenadas de mayor a menor
+        """
+        threshold = get_threshold() if threshold is None else threshold
+        terms = normalize(query).split()
+        if not terms:
+            return []
+
+        with self._lock:
+            # Los términos más largos son los más selectivos: se procesan primero
+            order = sorted(range(len(terms)), key=lambda i: -len(terms[i]))
+            scores = None
+            for i in order:
+                matches = self._match_words(terms[i], threshold, prefix=(i == len(terms) - 1))
+                term_scores = {}
+                for word, similarity in matches.items():
+                    for doc_id in self._postings[word]:
+                        if scores is not None and doc_id not in scores:
+                            continue
+                        if similarity > term_scores.get(doc_id, 0):
+                            term_scores[doc_id] = similarity
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc_id: scores[doc_id] + s for doc_id, s in term_scores.items()}
+                if not scores:
+                    return []
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+# Índice en memoria del proceso (solo se usa sin PostgreSQL)
+_memory_index = None
+_memory_version = None
+_memory_built_at = 0
+_memory_lock = threading.Lock()
+
+
+def _search_text(values):
+    return ' '.join(value for value in values if value)
+
+
+def _get_shared_version():
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(INDEX_VERSION_KEY, 1, timeout=None)
+        version = cache.get(INDEX_VERSION_KEY, 1)
+    return version
+
+
+def build_memory_index():
+    """Construir el índice en memoria con los pacientes activos"""
+    index = NGramIndex()
+    rows = Paciente.objects.filter(activo=True).values_list('id', *SEARCH_FIELDS)
+    for row in rows.iterator(chunk_size=5000):
+        index.add(row[0], _search_text(row[1:]))
+    # Ordenar el vocabulario aquí y no en la primera tecla
+    index.sorted_words()
+    return index
+
+
+def get_memory_index():
+    """
+    Obtener el índice en memoria, reconstruyéndolo si otro proceso cambió pacientes.
+
+    Los cambios hechos en este proceso se aplican al momento (ver
+    ``paciente_changed``); los de otros procesos se detectan por la versión
+    compartida en caché y se incorporan como mucho cada
+    ``PACIENTE_AUTOCOMPLETE_REFRESH_SECONDS``.
+    """
+    global _memory_index, _memory_version, _memory_built_at
+
+    refresh = getattr(settings, 'PACIENTE_AUTOCOMPLETE_REFRESH_SECONDS', 30)
+    with _memory_lock:
+        version = _get_shared_version()
+        stale = _memory_index is None or (
+            version != _memory_version and time.monotonic() - _memory_built_at >= refresh
+        )
+        if stale:
+            _memory_index = build_memory_index()
+            _memory_version = version
+            _memory_built_at = time.monotonic()
+        return _memory_index
+
+
+def reset_memory_index():
+    global _memory_index, _memory_version
+    with _memory_lock:
+        _memory_index = None
+        _memory_version = None
+
+
+def paciente_changed(instance, deleted=False):
+    """Aplicar un cambio de paciente al índice en memoria y avisar a otros procesos"""
+    global _memory_version
+
+    try:
+        new_version = cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(INDEX_VERSION_KEY, 2, timeout=None)
+        new_version = 2
+
+    with _memory_lock:
+        if _memory_index is None:
+            return
+        if deleted or not instance.activo:
+            _memory_index.remove(instance.pk)
+        else:
+            _memory_index.add(instance.pk, _search_text(
+                getattr(instance, field) for field in SEARCH_FIELDS
+            ))
+        # El índice local ya incluye este cambio
+        if _memory_version == new_version - 1:
+            _memory_version = new_version
+
+
+def pacientes_added(rows):
+    """
+    Añadir al índice en memoria los pacientes creados por la importación
+    masiva (que no envía ``post_save``), avisando a otros procesos una
+    sola vez
+
+    Args:
+        rows: Diccionarios con ``id``, ``activo`` y los campos de búsqueda
+    """
+    global _memory_version
+
+    if not rows:
+        return
+    try:
+        new_version = cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(INDEX_VERSION_KEY, 2, timeout=None)
+        new_version = 2
+
+    with _memory_lock:
+        if _memory_index is None:
+            return
+        for row in rows:
+            if row.get('activo', True):
+                _memory_index.add(row['id'], _search_text(row.get(field) for field in SEARCH_FIELDS))
+        if _memory_version == new_version - 1:
+            _memory_version = new_version
+
+
+def uses_trigram_extension(using='default'):
+    backend = getattr(settings, 'PACIENTE_AUTOCOMPLETE_BACKEND', 'auto')
+    if backend == 'auto':
+        return connections[using].vendor == 'postgresql'
+    return backend == 'trigram'
+
+
+def _search_postgres(query, limit, using='default'):
+    """Búsqueda con pg_trgm usando el índice GIN de la migración 0005"""
+    expression = (
+        "paciente_busqueda_texto(nombre, apellido_paterno, apellido_materno, "
+        "numero_expediente, email, telefono)"
+    )
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)",
+            [str(get_threshold())]
+        )
+        cursor.execute(f"""
+            SELECT {', '.join(AUTOCOMPLETE_FIELDS)}
+            FROM pacientes_paciente
+            WHERE activo AND %s <%% {expression}
+            ORDER BY %s <<-> {expression}, apellido_paterno, nombre
+            LIMIT %s
+        """, [query, query, limit])
+        return [dict(zip(AUTOCOMPLETE_FIELDS, row)) for row in cursor.fetchall()]
+
+
+def _search_memory(query, limit):
+    ranked = get_memory_index().search(query, limit)
+    if not ranked:
+        return []
+
+    ids = [doc_id for doc_id, _ in ranked]
+    # Una consulta por clave primaria: datos frescos y solo pacientes activos
+    rows = Paciente.objects.filter(pk__in=ids, activo=True).values(*AUTOCOMPLETE_FIELDS)
+    by_id = {row['id']: row for row in rows}
+    return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+
+def autocomplete(query, limit=10, using='default'):
+    """
+    Sugerencias de pacientes para el texto escrito.
+
+    Returns:
+        list: Diccionarios con id, nombre_completo, numero_expediente,
+        telefono y email, del más al menos parecido
+    """
+    query = normalize(query).strip()
+    if len(query) < 2:
+        return []
+
+    if uses_trigram_extension(using):
+        rows = _search_postgres(query, limit, using)
+    else:
+        rows = _search_memory(query, limit)
+
+    return [
+        {
+            'id': str(row['id']),
+            'nombre_completo': _search_text([
+                row['nombre'], row['apellido_paterno'], row['apellido_materno']
+            ]),
+            'numero_expediente': row['numero_expediente'],
+            'telefono': row['telefono'],
+            'email': row['email'],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,244 @@
+"""
+Subidas por partes de imágenes médicas.
+
+Las exportaciones CBCT y las panorámicas en PNG pesan cientos de MB. Con
+una sola petición multipart el archivo entero pasa por la petición y, si
+la conexión se corta, hay que empezar de cero. El protocolo (parecido a
+tus) es:
+
+1. ``POST /api/imagenes-medicas/cargas/`` con los datos de la imagen y el
+   nombre, el tamaño y el SHA-256 del archivo: crea una
+   ``CargaImagenMedica`` y un archivo temporal vacío.
+2. ``PATCH /api/imagenes-medicas/cargas/<id>/`` con la cabecera
+   ``Upload-Offset`` y los bytes de la parte como cuerpo
+   (``application/offset+octet-stream``). El cuerpo se copia al archivo
+   temporal por bloques de ``CHUNK_SIZE``, así que la memoria no depende
+   del tamaño del archivo. Si la conexión se corta se conserva lo que llegó.
+3. ``HEAD /api/imagenes-medicas/cargas/<id>/`` devuelve en ``Upload-Offset``
+   los bytes recibidos: el cliente continúa desde ahí.
+4. Al recibir la última parte se verifica el SHA-256 y se crea la
+   ``ImagenMedica``. El archivo temporal se mueve a su blob
+   (``imagenes.blobs``) sin copiarlo ni volver a calcular el resumen.
+
+Una parte que no empieza en el offset esperado, o que llega mientras otra
+petición escribe en la misma carga, se rechaza con ``OffsetInvalido``.
+"""
+
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+
+from imagenes import blobs
+from .models import CargaImagenMedica
+
+logger = logging.getLogger(__name__)
+
+# Bytes leídos del cuerpo de la petición en cada escritura
+CHUNK_SIZE = 1024 * 1024
+
+# Tiempo que una petición reserva la carga mientras escribe su parte
+RESERVA = timedelta(minutes=10)
+
+
+class OffsetInvalido(Exception):
+    """La parte no empieza donde termina lo recibido, o la carga está ocupada"""
+
+    def __init__(self, offset):
+        super().__init__(f"La carga espera el offset {offset}")
+        self.offset = offset
+
+
+class ChecksumInvalido(Exception):
+    """El archivo completo no coincide con el SHA-256 declarado"""
+
+
+class ArchivoCargado(blobs.HashedFile):
+    """
+    Archivo temporal de una carga ya verificada. Con ``temporary_file_path``
+    el almacenamiento lo mueve en lugar de copiarlo y la validación de
+    imagen lo abre desde disco en lugar de leerlo en memoria.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def directorio():
+    return getattr(settings, 'IMAGENES_MEDICAS_CARGAS_DIR', os.path.join(settings.BASE_DIR, 'cache', 'cargas'))
+
+
+def ruta_temporal(carga):
+    return os.path.join(directorio(), f"{carga.pk}.part")
+
+
+def _borrar_temporal(carga):
+    try:
+        os.remove(ruta_temporal(carga))
+    except FileNotFoundError:
+        pass
+
+
+def iniciar(**campos):
+    """
+    Crear una carga y su archivo temporal vacío.
+
+    Args:
+        **campos: Campos de ``CargaImagenMedica`` (nombre, tamaño, sha256, datos...)
+    """
+    carga = CargaImagenMedica.objects.create(**campos)
+    os.makedirs(directorio(), exist_ok=True)
+    open(ruta_temporal(carga), 'wb').close()
+    return carga
+
+
+def cancelar(carga):
+    """Borrar la carga y lo recibido hasta ahora"""
+    CargaImagenMedica.objects.filter(pk=carga.pk).delete()
+    _borrar_temporal(carga)
+
+
+def _offset_actual(carga):
+    return CargaImagenMedica.objects.filter(pk=carga.pk).values_list('recibido', flat=True).first()
+
+
+def _reservar(carga, offset):
+    """
+    Reservar la carga para escribir a partir de ``offset`` (UPDATE
+    condicional: falla si lo recibido no termina ahí o si otra petición
+    la tiene reservada).
+
+    Returns:
+        datetime: Fin de la reserva, que identifica a esta petición
+    """
+    now = timezone.now()
+    reserva = now + RESERVA
+    reservada = CargaImagenMedica.objects.filter(
+        Q(bloqueada_hasta__isnull=True) | Q(bloqueada_hasta__lt=now),
+        pk=carga.pk, estado='pendiente', recibido=offset,
+    ).update(bloqueada_hasta=reserva)
+    if not reservada:
+        raise OffsetInvalido(_offset_actual(carga))
+    return reserva
+
+
+def _actualizar(carga, reserva, **campos):
+    """Guardar el avance si la reserva sigue siendo de esta petición"""
+    return CargaImagenMedica.objects.filter(pk=carga.pk, bloqueada_hasta=reserva).update(
+        fecha_actualizacion=timezone.now(), **campos
+    )
+
+
+def _copiar(stream, destino, longitud):
+    """
+    Copiar hasta ``longitud`` bytes del cuerpo de la petición al archivo.
+    Si la conexión se corta devuelve lo copiado hasta ese momento.
+
+    Returns:
+        int: Bytes escritos
+    """
+    escritos = 0
+    try:
+        while escritos < longitud:
+            bloque = stream.read(min(CHUNK_SIZE, longitud - escritos))
+            if not bloque:
+                break
+            destino.write(bloque)
+            escritos += len(bloque)
+    except OSError as e:
+        logger.warning("Parte interrumpida tras %s bytes: %s", escritos, e)
+    return escritos
+
+
+def recibir(carga, offset, stream, longitud, crear_imagen):
+    """
+    Escribir una parte de la carga a partir de ``offset`` y, si era la
+    última, completarla.
+
+    Args:
+        carga: CargaImagenMedica
+        offset: Posición de la parte (cabecera ``Upload-Offset``)
+        stream: Cuerpo de la petición (se lee por bloques)
+        longitud: Bytes de la parte (``Content-Length``)
+        crear_imagen: Recibe el archivo verificado y devuelve la ``ImagenMedica``
+
+    Returns:
+        CargaImagenMedica: La carga actualizada, con ``imagen`` si se completó
+
+    Raises:
+        OffsetInvalido: La parte no empieza en lo recibido hasta ahora
+        ChecksumInvalido: El archivo completo no coincide; la carga vuelve a 0
+    """
+    reserva = _reservar(carga, offset)
+    try:
+        with open(ruta_temporal(carga), 'r+b') as destino:
+            destino.seek(offset)
+            escritos = _copiar(stream, destino, longitud)
+            # Descartar lo que quedara de un intento anterior interrumpido
+            destino.truncate()
+
+        recibido = offset + escritos
+        completa = recibido == carga.tamaño
+        campos = {'recibido': recibido}
+        if not completa:
+            campos['bloqueada_hasta'] = None
+        if not _actualizar(carga, reserva, **campos):
+            # Reserva caducada: otra petición continuó la carga
+            raise OffsetInvalido(_offset_actual(carga))
+        carga.recibido = recibido
+
+        if completa:
+            _completar(carga, reserva, crear_imagen)
+        return carga
+    except BaseException:
+        _actualizar(carga, reserva, bloqueada_hasta=None)
+        raise
+
+
+def _completar(carga, reserva, crear_imagen):
+    """Verificar el SHA-256 del archivo recibido y crear la imagen"""
+    ruta = ruta_temporal(carga)
+    with open(ruta, 'rb') as archivo:
+        digest, _ = blobs.digest_file(File(archivo))
+        if digest == carga.sha256:
+            carga.imagen = crear_imagen(ArchivoCargado(archivo, digest, name=carga.nombre_archivo))
+
+    if digest != carga.sha256:
+        open(ruta, 'wb').close()
+        _actualizar(carga, reserva, recibido=0, bloqueada_hasta=None)
+        carga.recibido = 0
+        raise ChecksumInvalido(
+            f"El SHA-256 del archivo recibido ({digest}) no coincide con el declarado; "
+            "hay que volver a enviarlo desde el principio"
+        )
+
+    carga.estado = 'completa'
+    _actualizar(carga, reserva, estado='completa', imagen=carga.imagen, bloqueada_hasta=None)
+    # Si el blob ya existía el archivo temporal no se movió
+    _borrar_temporal(carga)
+
+
+def limpiar(horas=None):
+    """
+    Borrar las cargas sin actividad desde hace ``horas`` (por defecto
+    ``IMAGENES_MEDICAS_CARGA_CADUCIDAD_HORAS``) y sus archivos temporales.
+
+    Returns:
+        int: Cargas borradas
+    """
+    if horas is None:
+        horas = getattr(settings, 'IMAGENES_MEDICAS_CARGA_CADUCIDAD_HORAS', 24)
+    now = timezone.now()
+    caducadas = CargaImagenMedica.objects.filter(
+        Q(bloqueada_hasta__isnull=True) | Q(bloqueada_hasta__lt=now),
+        fecha_actualizacion__lt=now - timedelta(hours=horas),
+    )
+    borradas = 0
+    for carga in caducadas.only('pk').iterator(chunk_size=200):
+        cancelar(carga)
+        borradas += 1
+    return borradas
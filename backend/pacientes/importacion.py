@@ -0,0 +1,618 @@
+"""
+Importación masiva de pacientes.
+
+Migrar el historial de una clínica por ``POST /api/pacientes/`` tardaba
+horas: cada alta validaba el email con su propia consulta, resolvía
+``creado_por`` y ``dentista_asignado`` por separado, reservaba su número
+de expediente y hacía un INSERT. Aquí el archivo (CSV, NDJSON o un arreglo
+JSON) se lee en streaming y se procesa por lotes de ``LOTE`` filas:
+
+1. Cada fila se valida con los campos del modelo, sin consultas.
+2. Los dentistas se resuelven por cédula profesional o id con una consulta
+   por lote para los que no se habían visto antes.
+3. Los emails y números de expediente repetidos se buscan con un solo
+   ``IN`` por lote, además de los repetidos dentro del propio archivo.
+4. Los números de expediente se reservan con una sola operación por
+   dentista (``Paciente.reservar_numeros_expediente``).
+5. El lote se inserta en una transacción: con ``bulk_create`` o, en
+   SQLite, con un INSERT preparado y ``executemany`` (ver ``_ejecutar``).
+   Si otro proceso dio de alta el mismo email mientras tanto, el lote se
+   reintenta fila por fila.
+
+Las filas con errores no detienen la importación: se escriben en el
+archivo de rechazos (``Rechazos``) con su número de fila y sus errores,
+con las mismas columnas que la entrada para corregirlas y volver a
+importarlas.
+
+Se usa desde el comando ``importar_pacientes`` y desde
+``POST /api/pacientes/importar/``; ``benchmark_importacion`` mide el ritmo.
+"""
+
+import csv
+import io
+import json
+import re
+import time
+import uuid
+from collections import defaultdict
+from itertools import chain
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxLengthValidator
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from categorias import search_index
+from dental_erp import sequences
+from dentistas.models import Dentista
+from . import autocomplete
+from .models import Paciente
+
+# Filas validadas e insertadas juntas
+LOTE = 1000
+
+# Caracteres leídos de un arreglo JSON en cada lectura
+BLOQUE_JSON = 64 * 1024
+
+# Errores incluidos en el resumen (el archivo de rechazos los tiene todos)
+MAX_ERRORES = 100
+
+CAMPOS_PACIENTE = (
+    'nombre', 'apellido_paterno', 'apellido_materno', 'fecha_nacimiento', 'sexo',
+    'telefono', 'email', 'direccion', 'tipo_sangre', 'alergias', 'medicamentos',
+    'enfermedades_cronicas', 'contacto_emergencia_nombre', 'contacto_emergencia_telefono',
+    'contacto_emergencia_relacion', 'numero_expediente', 'activo',
+)
+
+# Se indican con la cédula profesional o el id del dentista
+CAMPOS_DENTISTA = ('creado_por', 'dentista_asignado')
+
+CAMPOS = CAMPOS_PACIENTE + CAMPOS_DENTISTA
+
+# Números con el formato de ``Paciente.reservar_numeros_expediente``
+NUMERO_EXPEDIENTE = re.compile(r'^((?:DEN[0-9A-F]{3}-)?PAC-)(\d+)$')
+
+VERDADERO = {'true', 't', '1', 'si', 'sí', 'yes'}
+FALSO = {'false', 'f', '0', 'no'}
+
+
+class ErrorImportacion(Exception):
+    """El archivo no se puede leer (formato desconocido o JSON mal formado)"""
+
+
+def formato_de(nombre):
+    """Formato según la extensión del archivo, o None"""
+    extension = nombre.rsplit('.', 1)[-1].lower() if '.' in nombre else ''
+    return extension if extension in LECTORES else None
+
+
+def _texto(archivo):
+    """Texto del archivo binario, sin cargarlo completo en memoria"""
+    return io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+
+
+def leer_csv(archivo):
+    """
+    Filas de un CSV con encabezado.
+
+    Yields:
+        tuple: (número de fila del archivo, dict con los valores)
+    """
+    lector = csv.DictReader(_texto(archivo))
+    try:
+        for datos in lector:
+            # Valores sin columna en el encabezado
+            if None in datos:
+                datos.pop(None)
+                datos['__error__'] = "La fila tiene más columnas que el encabezado"
+            yield lector.line_num, datos
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ErrorImportacion(f"CSV inválido cerca de la línea {lector.line_num}: {e}")
+
+
+def _leer_arreglo(texto, inicio):
+    """Elementos de un arreglo JSON leyendo el archivo por bloques"""
+    decoder = json.JSONDecoder()
+    espacios = re.compile(r'\s*')
+    buffer, pos, fin = inicio, 0, False
+    numero = 0
+    separador = False
+
+    def leer():
+        nonlocal buffer, pos, fin
+        bloque = texto.read(BLOQUE_JSON)
+        fin = not bloque
+        buffer = buffer[pos:] + bloque
+        pos = 0
+
+    while True:
+        pos = espacios.match(buffer, pos).end()
+        if pos == len(buffer):
+            if fin:
+                raise ErrorImportacion("El arreglo JSON no está cerrado")
+            leer()
+            continue
+        if buffer[pos] == ']':
+            return
+        if separador:
+            if buffer[pos] != ',':
+                raise ErrorImportacion(f"Falta una coma después del elemento {numero}")
+            pos += 1
+            separador = False
+            continue
+        try:
+            valor, final = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # El elemento puede estar cortado al final del bloque
+            if not fin:
+                leer()
+                continue
+            raise ErrorImportacion(f"JSON inválido en el elemento {numero + 1}: {e.msg}")
+        if final == len(buffer) and not fin and not isinstance(valor, (dict, list)):
+            # Un número o literal al final del bloque puede estar incompleto
+            leer()
+            continue
+        numero += 1
+        pos = final
+        separador = True
+        yield numero, valor
+
+
+def _lineas(bloques):
+    """Líneas de un texto leído por bloques"""
+    pendiente = ''
+    for bloque in bloques:
+        partes = (pendiente + bloque).split('\n')
+        pendiente = partes.pop()
+        yield from partes
+    if pendiente:
+        yield pendiente
+
+
+def leer_json(archivo):
+    """
+    Filas de un arreglo JSON o de NDJSON (un objeto por línea). Una línea
+    de NDJSON mal formada se rechaza sola; un arreglo mal formado detiene
+    la importación.
+
+    Yields:
+        tuple: (número de línea o de elemento, valor)
+    """
+    texto = _texto(archivo)
+    try:
+        inicio = ''
+        while not inicio.strip():
+            bloque = texto.read(BLOQUE_JSON)
+            if not bloque:
+                return
+            inicio += bloque
+        if inicio.lstrip()[0] == '[':
+            yield from _leer_arreglo(texto, inicio.lstrip()[1:])
+            return
+
+        bloques = chain([inicio], iter(lambda: texto.read(BLOQUE_JSON), ''))
+        for numero, linea in enumerate(_lineas(bloques), start=1):
+            if not linea.strip():
+                continue
+            try:
+                yield numero, json.loads(linea)
+            except json.JSONDecodeError as e:
+                yield numero, {'__error__': f"JSON inválido: {e.msg}"}
+    except UnicodeDecodeError as e:
+        raise ErrorImportacion(f"El archivo no está en UTF-8: {e}")
+
+
+LECTORES = {
+    'csv': leer_csv,
+    'json': leer_json,
+    'ndjson': leer_json,
+}
+
+
+def leer(archivo, formato):
+    """Filas del archivo binario ``archivo`` según su formato"""
+    try:
+        return LECTORES[formato](archivo)
+    except KeyError:
+        raise ErrorImportacion(f"Formato no soportado: {formato}")
+
+
+def alias_de(columnas):
+    """Títulos de columnas de ``dental_erp.exports`` a nombres de campo"""
+    return {columna.titulo: columna.clave for columna in columnas}
+
+
+def _mensajes(errores):
+    return '; '.join(f"{campo}: {' '.join(mensajes)}" for campo, mensajes in errores.items())
+
+
+class Rechazos:
+    """
+    Archivo con las filas rechazadas: los datos originales más las columnas
+    ``fila`` y ``errores``, que se ignoran al volver a importarlo. Un CSV
+    produce un CSV y el JSON produce NDJSON.
+    """
+
+    def __init__(self, destino, formato):
+        self.destino = destino
+        self.csv = formato == 'csv'
+        self.writer = None
+        self.total = 0
+
+    def escribir(self, numero, datos, errores):
+        self.total += 1
+        if not isinstance(datos, dict):
+            datos = {'valor': datos}
+        datos = {clave: valor for clave, valor in datos.items() if clave != '__error__'}
+        if not self.csv:
+            fila = {'fila': numero, 'errores': errores, **datos}
+            self.destino.write(json.dumps(fila, ensure_ascii=False, default=str) + '\n')
+            return
+        if self.writer is None:
+            self.writer = csv.DictWriter(
+                self.destino, ['fila', 'errores', *datos], extrasaction='ignore'
+            )
+            self.writer.writeheader()
+        self.writer.writerow({'fila': numero, 'errores': _mensajes(errores), **datos})
+
+
+def _existentes(campo, valores, tamaño=500):
+    """Valores de ``campo`` que ya existen (en bloques, por el límite de parámetros de SQLite)"""
+    existentes = set()
+    for i in range(0, len(valores), tamaño):
+        existentes.update(
+            Paciente.objects.filter(**{f'{campo}__in': valores[i:i + tamaño]}).values_list(campo, flat=True)
+        )
+    return existentes
+
+
+def _convertidor(field, connection):
+    """
+    Valor de la columna de ``field`` a partir de los campos limpios de una
+    fila, con las mismas conversiones que ``bulk_create`` (``pre_save`` y
+    ``get_db_prep_save``). Los textos ya limpios se pasan tal cual y los
+    valores que se repiten (dentistas, fechas) se convierten una sola vez.
+    """
+    nombre = field.name
+    automatico = getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    if field.primary_key:
+        return lambda campos, ahora: field.get_db_prep_save(campos[nombre], connection)
+    if isinstance(field, (models.CharField, models.TextField)):
+        default = field.get_default()
+        return lambda campos, ahora: campos.get(nombre, default)
+
+    cache = {}
+
+    def convertir(campos, ahora):
+        if automatico:
+            valor = ahora
+        elif nombre in campos:
+            valor = campos[nombre]
+        else:
+            valor = field.get_default()
+        if field.is_relation and valor is not None:
+            valor = valor.pk
+        try:
+            return cache[valor]
+        except KeyError:
+            if len(cache) > 10000:
+                cache.clear()
+            convertido = cache[valor] = field.get_db_prep_save(valor, connection)
+            return convertido
+    return convertir
+
+
+def _insercion_preparada(connection):
+    """INSERT de una fila de ``Paciente`` y el convertidor de cada columna"""
+    fields = Paciente._meta.concrete_fields
+    quote = connection.ops.quote_name
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        quote(Paciente._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    return sql, [_convertidor(field, connection) for field in fields]
+
+
+class Importacion:
+    """
+    Importación de un archivo de pacientes.
+
+    Args:
+        creado_por: Dentista que registra a los pacientes sin ``creado_por``
+        lote: Filas validadas e insertadas juntas
+        rechazos: ``Rechazos`` donde escribir las filas con errores
+        alias: Nombres alternativos de columnas (por ejemplo los títulos de
+            la exportación) a nombres de campo
+    """
+
+    def __init__(self, creado_por, lote=LOTE, rechazos=None, alias=None):
+        self.creado_por = creado_por
+        self.lote = max(int(lote), 1)
+        self.rechazos = rechazos
+        self.alias = alias or {}
+        self.campos = {nombre: Paciente._meta.get_field(nombre) for nombre in CAMPOS_PACIENTE}
+        # Campos de texto libre: solo hay que comprobar su longitud
+        self.textos = {
+            nombre: field.max_length for nombre, field in self.campos.items()
+            if isinstance(field, (models.CharField, models.TextField)) and not field.choices
+            and all(isinstance(validator, MaxLengthValidator) for validator in field.validators)
+        }
+        self.dentistas = {}
+        if creado_por is not None:
+            self.dentistas[creado_por.cedula_profesional] = creado_por
+            self.dentistas[str(creado_por.pk)] = creado_por
+        # Vistos en el archivo, para detectar repetidos entre lotes
+        self.emails = set()
+        self.numeros = set()
+        self.resumen = {'filas': 0, 'importados': 0, 'rechazados': 0, 'errores': []}
+        self.using = router.db_for_write(Paciente)
+        connection = connections[self.using]
+        self.insercion = _insercion_preparada(connection) if connection.vendor == 'sqlite' else None
+
+    def importar(self, filas):
+        """
+        Importar las filas de ``leer``.
+
+        Returns:
+            dict: Filas leídas, importadas y rechazadas, los primeros
+            errores y la velocidad
+        """
+        inicio = time.perf_counter()
+        lote = []
+        for numero, datos in filas:
+            lote.append((numero, datos))
+            if len(lote) >= self.lote:
+                self._procesar(lote)
+                lote = []
+        if lote:
+            self._procesar(lote)
+
+        segundos = time.perf_counter() - inicio
+        self.resumen['segundos'] = round(segundos, 3)
+        self.resumen['filas_por_segundo'] = round(self.resumen['filas'] / segundos) if segundos else 0
+        return self.resumen
+
+    def _rechazar(self, numero, datos, errores):
+        self.resumen['rechazados'] += 1
+        if len(self.resumen['errores']) < MAX_ERRORES:
+            self.resumen['errores'].append({'fila': numero, 'errores': errores})
+        if self.rechazos is not None:
+            self.rechazos.escribir(numero, datos, errores)
+
+    def _procesar(self, lote):
+        self.resumen['filas'] += len(lote)
+        validas = []
+        for numero, datos in lote:
+            campos, errores = self._limpiar(datos)
+            if errores:
+                self._rechazar(numero, datos, errores)
+            else:
+                validas.append((numero, datos, campos))
+
+        validas = self._resolver_dentistas(validas)
+        validas = self._comprobar_unicos(validas)
+        if not validas:
+            return
+        self._reservar_numeros(validas)
+        creados = self._insertar(validas)
+        self.resumen['importados'] += len(creados)
+        autocomplete.pacientes_added(creados)
+        # Sin post_save, el índice de texto completo tampoco se entera
+        search_index.index_instances((Paciente(**campos) for campos in creados), using=self.using)
+
+    def _limpiar(self, datos):
+        """Validar una fila con los campos del modelo, sin consultas"""
+        if not isinstance(datos, dict):
+            return None, {'fila': ["Se esperaba un objeto con los datos del paciente"]}
+        errores = {}
+        if '__error__' in datos:
+            errores['fila'] = [datos['__error__']]
+
+        valores = {}
+        for clave, valor in datos.items():
+            nombre = self.alias.get(clave, clave)
+            if nombre in CAMPOS:
+                valores[nombre] = valor.strip() if isinstance(valor, str) else valor
+
+        campos = {}
+        for nombre, field in self.campos.items():
+            valor = valores.get(nombre)
+            if valor is None or valor == '':
+                if nombre in ('numero_expediente', 'activo'):
+                    # Se reserva un número / queda activo
+                    continue
+                if not field.blank:
+                    errores[nombre] = [str(field.error_messages['blank'])]
+                else:
+                    campos[nombre] = ''
+                continue
+            if nombre in self.textos and isinstance(valor, str):
+                # Texto sin más validación que la longitud
+                if self.textos[nombre] is None or len(valor) <= self.textos[nombre]:
+                    campos[nombre] = valor
+                    continue
+            elif nombre in ('sexo', 'tipo_sangre') and isinstance(valor, str):
+                valor = valor.upper()
+            elif nombre == 'activo' and isinstance(valor, str):
+                if valor.lower() in VERDADERO:
+                    valor = True
+                elif valor.lower() in FALSO:
+                    valor = False
+            try:
+                campos[nombre] = field.clean(valor, None)
+            except ValidationError as e:
+                errores[nombre] = e.messages
+
+        for nombre in CAMPOS_DENTISTA:
+            valor = valores.get(nombre)
+            if valor not in (None, ''):
+                campos[nombre] = str(valor)
+        return campos, errores
+
+    def _resolver_dentistas(self, validas):
+        """Cambiar cédulas e ids por dentistas, consultando solo los nuevos"""
+        claves = {
+            campos[nombre] for _, _, campos in validas for nombre in CAMPOS_DENTISTA
+            if nombre in campos and campos[nombre] not in self.dentistas
+        }
+        if claves:
+            ids = []
+            for clave in claves:
+                try:
+                    ids.append(uuid.UUID(clave))
+                except ValueError:
+                    pass
+            for dentista in Dentista.objects.filter(Q(cedula_profesional__in=claves) | Q(pk__in=ids)):
+                self.dentistas[dentista.cedula_profesional] = dentista
+                self.dentistas[str(dentista.pk)] = dentista
+            for clave in claves:
+                self.dentistas.setdefault(clave, None)
+
+        resueltas = []
+        for numero, datos, campos in validas:
+            errores = {}
+            for nombre in CAMPOS_DENTISTA:
+                if nombre in campos:
+                    campos[nombre] = self.dentistas[campos[nombre]]
+                    if campos[nombre] is None:
+                        errores[nombre] = ["No existe un dentista con esa cédula profesional o id"]
+            campos.setdefault('creado_por', self.creado_por)
+            if campos['creado_por'] is None and 'creado_por' not in errores:
+                errores['creado_por'] = ["Hay que indicar el dentista que registra al paciente"]
+            # Como en Paciente.save
+            if not campos.get('dentista_asignado'):
+                campos['dentista_asignado'] = campos['creado_por']
+            if errores:
+                self._rechazar(numero, datos, errores)
+            else:
+                resueltas.append((numero, datos, campos))
+        return resueltas
+
+    def _comprobar_unicos(self, validas):
+        """Rechazar emails y números de expediente repetidos con una consulta por campo"""
+        existentes_email = _existentes('email', [campos['email'] for _, _, campos in validas])
+        existentes_numero = _existentes('numero_expediente', [
+            campos['numero_expediente'] for _, _, campos in validas if 'numero_expediente' in campos
+        ])
+
+        unicas = []
+        for numero, datos, campos in validas:
+            errores = {}
+            email = campos['email']
+            if email in existentes_email:
+                errores['email'] = ["Ya existe un paciente con este email."]
+            elif email in self.emails:
+                errores['email'] = ["Email repetido en el archivo."]
+            expediente = campos.get('numero_expediente')
+            if expediente in existentes_numero:
+                errores['numero_expediente'] = ["Ya existe un paciente con este número de expediente."]
+            elif expediente and expediente in self.numeros:
+                errores['numero_expediente'] = ["Número de expediente repetido en el archivo."]
+            if errores:
+                self._rechazar(numero, datos, errores)
+                continue
+            self.emails.add(email)
+            if expediente:
+                self.numeros.add(expediente)
+            unicas.append((numero, datos, campos))
+        return unicas
+
+    def _reservar_numeros(self, validas):
+        """
+        Reservar de una vez los números de expediente de cada dentista del
+        lote. Antes se adelantan los contadores por encima de los números
+        originales del archivo, para que no se vuelvan a repartir.
+        """
+        ultimos = {}
+        sin_numero = defaultdict(list)
+        for _, _, campos in validas:
+            expediente = campos.get('numero_expediente')
+            if not expediente:
+                sin_numero[campos['creado_por'].pk].append(campos)
+                continue
+            coincide = NUMERO_EXPEDIENTE.match(expediente)
+            if coincide:
+                prefijo, valor = coincide.group(1), int(coincide.group(2))
+                ultimos[prefijo] = max(ultimos.get(prefijo, 0), valor)
+
+        for prefijo, valor in ultimos.items():
+            sequences.advance(f'expediente:{prefijo}', valor)
+
+        for filas in sin_numero.values():
+            numeros = Paciente.reservar_numeros_expediente(filas[0]['creado_por'], len(filas))
+            for campos, expediente in zip(filas, numeros):
+                campos['numero_expediente'] = expediente
+
+    def _insertar(self, validas):
+        """
+        Insertar el lote en una transacción. Si choca con un alta hecha por
+        otro proceso, se insertan las filas una a una para rechazar solo
+        las que fallan.
+
+        Returns:
+            list: Campos de los pacientes creados
+        """
+        filas = [campos for _, _, campos in validas]
+        for campos in filas:
+            campos['id'] = uuid.uuid4()
+        try:
+            with transaction.atomic(using=self.using):
+                self._ejecutar(filas)
+            return filas
+        except IntegrityError:
+            pass
+
+        creados = []
+        for numero, datos, campos in validas:
+            try:
+                with transaction.atomic(using=self.using):
+                    self._ejecutar([campos])
+            except IntegrityError as e:
+                self._rechazar(numero, datos, {'fila': [f"No se pudo guardar: {e}"]})
+            else:
+                creados.append(campos)
+        return creados
+
+    def _ejecutar(self, filas):
+        """
+        INSERT de las filas. En SQLite, que limita ``bulk_create`` a 999
+        parámetros por consulta (unas 45 filas de pacientes), la consulta
+        se prepara una vez y se ejecuta con ``executemany``; en las demás
+        bases de datos se usa ``bulk_create`` con ``batch_size``.
+        """
+        if self.insercion is None:
+            Paciente.objects.using(self.using).bulk_create(
+                [Paciente(**campos) for campos in filas], batch_size=self.lote
+            )
+            return
+        sql, columnas = self.insercion
+        ahora = timezone.now()
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(sql, [
+                tuple(convertir(campos, ahora) for convertir in columnas) for campos in filas
+            ])
+
+
+def importar(archivo, formato, creado_por, rechazos=None, **kwargs):
+    """
+    Importar pacientes desde un archivo binario.
+
+    Args:
+        archivo: Archivo abierto en modo binario
+        formato: ``csv``, ``json`` o ``ndjson``
+        creado_por: Dentista que registra a los pacientes sin ``creado_por``
+        rechazos: Archivo de texto donde escribir las filas rechazadas
+        **kwargs: ``lote`` y ``alias`` de ``Importacion``
+
+    Returns:
+        dict: Resumen de ``Importacion.importar``
+
+    Raises:
+        ErrorImportacion: El archivo no se puede leer
+    """
+    filas = leer(archivo, formato)
+    if rechazos is not None:
+        rechazos = Rechazos(rechazos, formato)
+    return Importacion(creado_por, rechazos=rechazos, **kwargs).importar(filas)
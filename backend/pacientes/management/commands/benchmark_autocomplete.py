@@ -0,0 +1,132 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from datetime import date
+from dentistas.models import Dentista
+from pacientes import autocomplete
+from pacientes.models import Paciente
+import random
+import statistics
+import time
+
+
+NOMBRES = [
+    'María', 'José', 'Juan', 'Guadalupe', 'Francisco', 'Ana', 'Luis', 'Carmen', 'Jesús',
+    'Sofía', 'Miguel', 'Fernanda', 'Alejandro', 'Valeria', 'Jorge', 'Daniela', 'Ricardo',
+    'Mariana', 'Eduardo', 'Camila', 'Fernando', 'Paola', 'Roberto', 'Andrea', 'Sergio',
+]
+
+APELLIDOS = [
+    'Hernández', 'García', 'Martínez', 'López', 'González', 'Pérez', 'Rodríguez', 'Sánchez',
+    'Ramírez', 'Cruz', 'Flores', 'Gómez', 'Morales', 'Vázquez', 'Reyes', 'Jiménez', 'Torres',
+    'Díaz', 'Gutiérrez', 'Ruiz', 'Mendoza', 'Aguilar', 'Ortiz', 'Moreno', 'Castillo', 'Romero',
+    'Álvarez', 'Méndez', 'Chávez', 'Rivera', 'Juárez', 'Ramos', 'Domínguez', 'Herrera', 'Medina',
+    'Castro', 'Vargas', 'Guzmán', 'Velázquez', 'Muñoz', 'Rojas', 'Contreras', 'Salazar', 'Luna',
+    'Ortega', 'Santiago', 'Guerrero', 'Estrada', 'Bautista', 'Cortés', 'Soto', 'Alvarado', 'Núñez',
+]
+
+SILABAS = ['ca', 'de', 'mo', 'lar', 'ti', 'gue', 'pro', 'ra', 'zal', 'no', 'pe', 'ri', 'ón', 'ta', 'ge', 'lu']
+
+
+def con_error(rng, palabra):
+    """Simular un error de escritura cambiando una letra"""
+    i = rng.randrange(1, len(palabra))
+    return palabra[:i] + rng.choice('aeiouscz') + palabra[i + 1:]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia del autocompletado de pacientes contra la búsqueda con icontains. '
+        'Los datos sintéticos se crean dentro de una transacción que se revierte al terminar.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Pacientes sintéticos a crear')
+        parser.add_argument('--queries', type=int, default=200, help='Consultas a medir por método')
+        parser.add_argument('--surnames', type=int, default=3000, help='Apellidos distintos adicionales')
+        parser.add_argument('--seed', type=int, default=7, help='Semilla aleatoria')
+    
+    def handle(self, *args, **options):
+        rows = options['rows']
+        rng = random.Random(options['seed'])
+        
+        # Distribución de cola larga: apellidos comunes más muchos poco frecuentes
+        raros = set()
+        while len(raros) < options['surnames']:
+            raros.add(''.join(rng.choices(SILABAS, k=rng.randint(2, 4))).capitalize())
+        apellidos = APELLIDOS * 20 + sorted(raros)
+        
+        with transaction.atomic():
+            self.stdout.write(f"Creando {rows} pacientes sintéticos...")
+            user = User.objects.create_user(username='benchmark-autocomplete')
+            dentista = Dentista.objects.create(
+                user=user, cedula_profesional='BENCH-0001', universidad='UNAM',
+                anio_graduacion=2010, telefono='5555555555', fecha_nacimiento=date(1980, 1, 1),
+                direccion='-', fecha_ingreso=date(2020, 1, 1),
+                horario_inicio='08:00', horario_fin='17:00',
+            )
+            Paciente.objects.bulk_create(
+                (
+                    Paciente(
+                        creado_por=dentista,
+                        nombre=rng.choice(NOMBRES),
+                        apellido_paterno=rng.choice(apellidos),
+                        apellido_materno=rng.choice(apellidos),
+                        fecha_nacimiento=date(1990, 1, 1),
+                        sexo=rng.choice('MF'),
+                        telefono=f"55{rng.randrange(10 ** 8):08d}",
+                        email=f"paciente{i}@ejemplo.com",
+                        direccion='-',
+                        numero_expediente=f"BEN-PAC-{i:07d}",
+                        contacto_emergencia_nombre='-',
+                        contacto_emergencia_telefono='-',
+                        contacto_emergencia_relacion='-',
+                    )
+                    for i in range(rows)
+                ),
+                batch_size=2000
+            )
+            
+            # Lo que escribe recepción: apellido con errores y el inicio del nombre
+            consultas = []
+            for _ in range(options['queries']):
+                apellido = rng.choice(apellidos)
+                nombre = rng.choice(NOMBRES)
+                consultas.append(f"{con_error(rng, apellido)} {nombre[:rng.randint(2, len(nombre))]}")
+            
+            if not autocomplete.uses_trigram_extension():
+                autocomplete.reset_memory_index()
+                start_time = time.time()
+                index = autocomplete.get_memory_index()
+                self.stdout.write(
+                    f"- Índice en memoria: {len(index)} pacientes en {time.time() - start_time:.2f} segundos"
+                )
+            
+            def icontains(query):
+                filters = Q()
+                for field in ['nombre', 'apellido_paterno', 'apellido_materno',
+                              'numero_expediente', 'email', 'telefono']:
+                    filters |= Q(**{f'{field}__icontains': query})
+                return list(Paciente.objects.filter(filters)[:10])
+            
+            metodos = [('icontains', icontains), ('autocompletado', autocomplete.autocomplete)]
+            for nombre, metodo in metodos:
+                tiempos = []
+                encontrados = 0
+                for query in consultas:
+                    inicio = time.perf_counter()
+                    encontrados += bool(metodo(query))
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                tiempos.sort()
+                p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+                self.stdout.write(
+                    f"- {nombre}: mediana {statistics.median(tiempos):.2f} ms, p95 {p95:.2f} ms, "
+                    f"consultas con resultados {encontrados}/{len(consultas)}"
+                )
+            
+            # No dejar datos sintéticos en la base de datos
+            transaction.set_rollback(True)
+        
+        autocomplete.reset_memory_index()
+        self.stdout.write(self.style.SUCCESS("Benchmark completado (datos revertidos)"))
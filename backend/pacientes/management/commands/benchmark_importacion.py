@@ -0,0 +1,117 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from datetime import date
+from dentistas.models import Dentista
+from pacientes import autocomplete, importacion
+from pacientes.management.commands.benchmark_autocomplete import APELLIDOS, NOMBRES
+from pacientes.serializers import PacienteCreateSerializer
+import csv
+import io
+import random
+import time
+
+
+# Ritmo esperado en SQLite
+OBJETIVO = 10000
+
+CAMPOS = [
+    'nombre', 'apellido_paterno', 'apellido_materno', 'fecha_nacimiento', 'sexo', 'telefono',
+    'email', 'direccion', 'tipo_sangre', 'alergias', 'contacto_emergencia_nombre',
+    'contacto_emergencia_telefono', 'contacto_emergencia_relacion', 'dentista_asignado',
+]
+
+
+def generar_csv(rng, filas, cedulas, errores):
+    """CSV sintético con una fracción ``errores`` de filas inválidas"""
+    salida = io.StringIO()
+    writer = csv.DictWriter(salida, CAMPOS)
+    writer.writeheader()
+    for i in range(filas):
+        fila = {
+            'nombre': rng.choice(NOMBRES),
+            'apellido_paterno': rng.choice(APELLIDOS),
+            'apellido_materno': rng.choice(APELLIDOS),
+            'fecha_nacimiento': date(rng.randint(1940, 2020), rng.randint(1, 12), rng.randint(1, 28)).isoformat(),
+            'sexo': rng.choice('MF'),
+            'telefono': f"55{rng.randrange(10 ** 8):08d}",
+            'email': f"importado{i}@ejemplo.com",
+            'direccion': 'Av. Reforma 100, CDMX',
+            'tipo_sangre': rng.choice(['', 'O+', 'A+', 'B-']),
+            'alergias': rng.choice(['', '', 'Penicilina']),
+            'contacto_emergencia_nombre': f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+            'contacto_emergencia_telefono': f"55{rng.randrange(10 ** 8):08d}",
+            'contacto_emergencia_relacion': 'Familiar',
+            'dentista_asignado': rng.choice(cedulas),
+        }
+        if rng.random() < errores:
+            fila[rng.choice(['telefono', 'email', 'sexo', 'fecha_nacimiento'])] = 'x'
+        writer.writerow(fila)
+    return salida.getvalue().encode('utf-8')
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la importación masiva de pacientes (pacientes.importacion) contra el alta '
+        'fila por fila de la API. Los datos sintéticos se crean dentro de una transacción '
+        'que se revierte al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Filas del archivo a importar')
+        parser.add_argument('--dentistas', type=int, default=5, help='Dentistas entre los que se reparten')
+        parser.add_argument('--errores', type=float, default=0.01, help='Fracción de filas inválidas')
+        parser.add_argument('--lote', type=int, default=importacion.LOTE, help='Filas por lote')
+        parser.add_argument('--por-fila', type=int, default=500, help='Altas a medir con el serializer de la API')
+        parser.add_argument('--seed', type=int, default=7, help='Semilla aleatoria')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            dentistas = []
+            for i in range(options['dentistas']):
+                user = User.objects.create_user(username=f'benchmark-importacion-{i}')
+                dentistas.append(Dentista.objects.create(
+                    user=user, cedula_profesional=f'BENCH-IMP-{i:04d}', universidad='UNAM',
+                    anio_graduacion=2010, telefono='5555555555', fecha_nacimiento=date(1980, 1, 1),
+                    direccion='-', fecha_ingreso=date(2020, 1, 1),
+                    horario_inicio='08:00', horario_fin='17:00',
+                ))
+            cedulas = [dentista.cedula_profesional for dentista in dentistas]
+
+            datos = generar_csv(rng, options['rows'], cedulas, options['errores'])
+            self.stdout.write(f"Importando {options['rows']} filas ({len(datos) / 1024 / 1024:.1f} MB de CSV)...")
+            resumen = importacion.importar(
+                io.BytesIO(datos), 'csv', dentistas[0], rechazos=io.StringIO(), lote=options['lote']
+            )
+            self.stdout.write(
+                f"- Importación por lotes: {resumen['importados']} importados, {resumen['rechazados']} rechazados "
+                f"en {resumen['segundos']:.2f} segundos ({resumen['filas_por_segundo']} filas/s)"
+            )
+
+            if options['por_fila']:
+                filas = list(csv.DictReader(io.StringIO(
+                    generar_csv(rng, options['por_fila'], cedulas, 0).decode('utf-8')
+                )))
+                inicio = time.perf_counter()
+                for i, fila in enumerate(filas):
+                    fila['email'] = f"por-fila{i}@ejemplo.com"
+                    serializer = PacienteCreateSerializer(data=fila)
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save(creado_por=dentistas[0])
+                segundos = time.perf_counter() - inicio
+                self.stdout.write(
+                    f"- Alta fila por fila (API): {len(filas)} pacientes en {segundos:.2f} segundos "
+                    f"({len(filas) / segundos:.0f} filas/s)"
+                )
+
+            # No dejar datos sintéticos en la base de datos
+            transaction.set_rollback(True)
+
+        autocomplete.reset_memory_index()
+        estilo = self.style.SUCCESS if resumen['filas_por_segundo'] >= OBJETIVO else self.style.WARNING
+        self.stdout.write(estilo(
+            f"Benchmark completado (datos revertidos): {resumen['filas_por_segundo']} filas/s, "
+            f"objetivo {OBJETIVO} filas/s"
+        ))
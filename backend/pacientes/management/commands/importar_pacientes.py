@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from dentistas.models import Dentista
+from pacientes import importacion
+from pacientes.views import PacienteViewSet
+import json
+import os
+import sys
+import uuid
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa pacientes desde un CSV, NDJSON o arreglo JSON (por ejemplo el '
+        'historial de otra clínica o una exportación de /api/pacientes/exportar/). '
+        'Las filas con errores se escriben en el archivo de rechazos y no '
+        'detienen la importación.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Archivo a importar ('-' para la entrada estándar)")
+        parser.add_argument('--formato', choices=sorted(importacion.LECTORES), help='Por defecto según la extensión')
+        parser.add_argument(
+            '--dentista', required=True,
+            help='Cédula profesional, usuario o id del dentista que registra a los pacientes sin creado_por'
+        )
+        parser.add_argument('--rechazos', help='Archivo de rechazos (por defecto <archivo>.rechazos.<formato>)')
+        parser.add_argument('--lote', type=int, default=importacion.LOTE, help='Filas validadas e insertadas juntas')
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        formato = options['formato'] or importacion.formato_de(ruta)
+        if formato is None:
+            raise CommandError("No se reconoce el formato del archivo; indícalo con --formato")
+
+        filtro = Q(cedula_profesional=options['dentista']) | Q(user__username=options['dentista'])
+        try:
+            filtro |= Q(pk=uuid.UUID(options['dentista']))
+        except ValueError:
+            pass
+        dentista = Dentista.objects.filter(filtro).first()
+        if dentista is None:
+            raise CommandError(f"No existe el dentista '{options['dentista']}'")
+
+        extension = 'csv' if formato == 'csv' else 'ndjson'
+        ruta_rechazos = options['rechazos'] or f"{'pacientes' if ruta == '-' else ruta}.rechazos.{extension}"
+
+        entrada = sys.stdin.buffer if ruta == '-' else open(ruta, 'rb')
+        try:
+            with open(ruta_rechazos, 'w', encoding='utf-8', newline='') as rechazos:
+                resumen = importacion.importar(
+                    entrada, formato, dentista, rechazos=rechazos,
+                    lote=options['lote'], alias=importacion.alias_de(PacienteViewSet.export_columns),
+                )
+        except importacion.ErrorImportacion as e:
+            raise CommandError(str(e))
+        finally:
+            if entrada is not sys.stdin.buffer:
+                entrada.close()
+
+        for error in resumen['errores'][:10]:
+            self.stdout.write(f"- Fila {error['fila']}: {json.dumps(error['errores'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['importados']} de {resumen['filas']} pacientes importados en "
+            f"{resumen['segundos']:.2f} segundos ({resumen['filas_por_segundo']} filas/s)"
+        ))
+        if not resumen['rechazados']:
+            os.remove(ruta_rechazos)
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{resumen['rechazados']} filas rechazadas, escritas en {ruta_rechazos}"
+            ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from pacientes import cargas
+
+
+class Command(BaseCommand):
+    help = (
+        'Borra las subidas por partes de imágenes médicas sin actividad '
+        '(y sus archivos temporales). Pensado para ejecutarse periódicamente.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas',
+            type=int,
+            help='Horas sin recibir partes (por defecto IMAGENES_MEDICAS_CARGA_CADUCIDAD_HORAS)'
+        )
+
+    def handle(self, *args, **options):
+        borradas = cargas.limpiar(options.get('horas'))
+        self.stdout.write(self.style.SUCCESS(f"{borradas} subidas sin terminar borradas"))
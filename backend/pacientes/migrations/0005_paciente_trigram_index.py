@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# Expresión normalizada (minúsculas y sin acentos) sobre la que se calcula el
+# índice de trigramas. unaccent() no es IMMUTABLE, por eso se envuelve en una
+# función propia con el diccionario explícito.
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION paciente_busqueda_texto(
+        nombre text, apellido_paterno text, apellido_materno text,
+        numero_expediente text, email text, telefono text
+    ) RETURNS text AS $$
+        SELECT lower(public.unaccent('public.unaccent'::regdictionary, concat_ws(' ',
+            nombre, apellido_paterno, apellido_materno, numero_expediente, email, telefono
+        )))
+    $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS paciente_busqueda_trgm_idx ON pacientes_paciente
+    USING gin (paciente_busqueda_texto(
+        nombre, apellido_paterno, apellido_materno, numero_expediente, email, telefono
+    ) gin_trgm_ops)
+    """,
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS paciente_busqueda_trgm_idx",
+    "DROP FUNCTION IF EXISTS paciente_busqueda_texto(text, text, text, text, text, text)",
+]
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0004_bitacoracita_imagenmedica'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dentistas', '0001_initial'),
+        ('pacientes', '0005_paciente_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacoracita',
+            index=models.Index(fields=['fecha_hora', 'id'], name='pacientes_b_fecha_h_fa714c_idx'),
+        ),
+    ]
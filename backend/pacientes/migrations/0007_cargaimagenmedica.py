@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:36
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dentistas', '0001_initial'),
+        ('pacientes', '0006_bitacoracita_pacientes_b_fecha_h_fa714c_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaImagenMedica',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre_archivo', models.CharField(max_length=100)),
+                ('tamaño', models.PositiveBigIntegerField(help_text='Tamaño total en bytes')),
+                ('sha256', models.CharField(help_text='SHA-256 del archivo completo (hexadecimal)', max_length=64)),
+                ('datos', models.JSONField(default=dict, help_text='Datos de la ImagenMedica a crear')),
+                ('recibido', models.PositiveBigIntegerField(default=0, help_text='Bytes recibidos (offset de la siguiente parte)')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('completa', 'Completa')], default='pendiente', max_length=10)),
+                ('bloqueada_hasta', models.DateTimeField(blank=True, help_text='Reserva de la petición que escribe una parte', null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('dentista', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cargas_imagenes', to='dentistas.dentista')),
+                ('imagen', models.ForeignKey(blank=True, help_text='Imagen creada al completar la subida', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pacientes.imagenmedica')),
+            ],
+            options={
+                'verbose_name': 'Carga de Imagen Médica',
+                'verbose_name_plural': 'Cargas de Imágenes Médicas',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_actualizacion'], name='pacientes_c_estado_47b7ae_idx')],
+            },
+        ),
+    ]
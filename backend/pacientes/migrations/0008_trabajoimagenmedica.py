@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:40
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0007_cargaimagenmedica'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoImagenMedica',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'En proceso'), ('lista', 'Lista'), ('fallida', 'Fallida')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('max_intentos', models.PositiveIntegerField(default=3)),
+                ('disponible_desde', models.DateTimeField()),
+                ('bloqueado_hasta', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('imagen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos', to='pacientes.imagenmedica')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Imagen Médica',
+                'verbose_name_plural': 'Trabajos de Imágenes Médicas',
+                'ordering': ['fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'disponible_desde'], name='pacientes_t_estado_1ebded_idx')],
+            },
+        ),
+    ]
@@ -3,6 +3,7 @@ import uuid
 import os
 from django.core.validators import RegexValidator
 from django.conf import settings
+from dental_erp import sequences
 
 class Paciente(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -75,23 +76,31 @@ class Paciente(models.Model):
     def nombre_completo(self):
         return f"{self.nombre} {self.apellido_paterno} {self.apellido_materno}".strip()
     
+    @staticmethod
+    def reservar_numeros_expediente(creado_por, cantidad=1):
+        """
+        Reservar números de expediente consecutivos.
+        
+        Formato DEN{dentista_id[:3]}-PAC-{numero}, o PAC-{numero} sin dentista.
+        El contador es por prefijo: dos dentistas cuyo id empieza igual
+        comparten la numeración en lugar de chocar. Con ``cantidad`` > 1 se
+        reserva un bloque con una sola operación (importaciones masivas).
+        """
+        if creado_por:
+            dentista_codigo = str(creado_por.id).replace('-', '')[:3].upper()
+            prefijo = f"DEN{dentista_codigo}-PAC-"
+        else:
+            prefijo = "PAC-"
+        
+        numeros = sequences.allocate(
+            f'expediente:{prefijo}', cantidad,
+            seed=lambda: sequences.max_suffix(Paciente.objects, 'numero_expediente', prefijo)
+        )
+        return [f"{prefijo}{numero:06d}" for numero in numeros]
+    
     def save(self, *args, **kwargs):
         if not self.numero_expediente:
-            # Generar número de expediente por dentista (formato: DEN{dentista_id[:3]}-PAC-{numero})
-            if self.creado_por:
-                dentista_codigo = str(self.creado_por.id).replace('-', '')[:3].upper()
-                # Contar pacientes creados por este dentista
-                pacientes_del_dentista = Paciente.objects.filter(creado_por=self.creado_por).count()
-                numero = pacientes_del_dentista + 1
-                self.numero_expediente = f"DEN{dentista_codigo}-PAC-{numero:06d}"
-            else:
-                # Fallback al sistema anterior si no hay dentista
-                ultimo_paciente = Paciente.objects.order_by('fecha_registro').last()
-                if ultimo_paciente:
-                    numero = int(ultimo_paciente.numero_expediente.split('-')[-1]) + 1
-                else:
-                    numero = 1
-                self.numero_expediente = f"PAC-{numero:06d}"
+            self.numero_expediente = Paciente.reservar_numeros_expediente(self.creado_por)[0]
         
         # Si no hay dentista asignado, asignar automáticamente al que lo creó
         if not self.dentista_asignado and self.creado_por:
@@ -265,6 +274,9 @@ class BitacoraCita(models.Model):
         verbose_name = "Entrada de Bitácora"
         verbose_name_plural = "Entradas de Bitácora"
         ordering = ['-fecha_hora']
+        indexes = [
+            models.Index(fields=['fecha_hora', 'id']),
+        ]
         
     def __str__(self):
         return f"Bitácora {self.paciente.nombre_completo} - {self.fecha_hora.strftime('%d/%m/%Y')}"
@@ -353,83 +365,45 @@ class ImagenMedica(models.Model):
     def __str__(self):
         return f"{self.titulo} - {self.paciente.nombre_completo}"
     
-    def save(self, *args, **kwargs):
-        # Guardar primero para obtener el archivo
-        super().save(*args, **kwargs)
-        
-        # Generar miniatura automáticamente si no existe
-        if self.archivo and not self.miniatura:
-            self.generar_miniatura()
+    def procesar_archivo(self):
+        """
+        Genera la miniatura y los metadatos técnicos en la misma petición
+        (con ``IMAGENES_DERIVADOS_SINCRONOS``; si no, los genera el worker,
+        ver ``pacientes.procesamiento``).
+        """
+        from .procesamiento import procesar
+        self.aplicar_procesamiento(procesar(self.archivo.name))
+    
+    def aplicar_procesamiento(self, resultado):
+        """Guarda la miniatura y los metadatos con un solo UPDATE, sin llamar a save()"""
+        for campo, valor in resultado.items():
+            setattr(self, campo, valor)
+        ImagenMedica.objects.filter(id=self.id).update(**resultado)
+    
+    @property
+    def procesada(self):
+        """True cuando ya tiene miniatura y metadatos técnicos"""
+        return bool(self.miniatura) and self.tamaño_archivo is not None
+    
+    def reutilizar_derivados(self):
+        """
+        Copia la miniatura y los metadatos de otra imagen con el mismo
+        archivo (una subida repetida, ver ``imagenes.blobs``).
         
-        # Actualizar metadatos del archivo si es necesario
-        if self.archivo and not self.tamaño_archivo:
-            self.actualizar_metadatos()
-    
-    def generar_miniatura(self):
-        """Genera una miniatura de la imagen médica"""
-        try:
-            from PIL import Image, ImageOps
-            import os
-            from django.core.files.base import ContentFile
-            from io import BytesIO
-            
-            # Abrir la imagen original
-            with Image.open(self.archivo.path) as img:
-                # Convertir a RGB si es necesario
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Crear miniatura manteniendo proporción
-                img.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                
-                # Guardar en BytesIO
-                output = BytesIO()
-                img.save(output, format='JPEG', quality=85, optimize=True)
-                output.seek(0)
-                
-                # Generar nombre para la miniatura
-                nombre_base = os.path.splitext(os.path.basename(self.archivo.name))[0]
-                nombre_miniatura = f"{nombre_base}_thumb.jpg"
-                
-                # Guardar miniatura
-                self.miniatura.save(
-                    nombre_miniatura,
-                    ContentFile(output.getvalue()),
-                    save=False
-                )
-                
-                # Actualizar sin llamar save() nuevamente para evitar recursión
-                ImagenMedica.objects.filter(id=self.id).update(miniatura=self.miniatura)
-                
-        except Exception as e:
-            print(f"Error generando miniatura para imagen {self.id}: {e}")
-    
-    def actualizar_metadatos(self):
-        """Actualiza los metadatos técnicos de la imagen"""
-        try:
-            from PIL import Image
-            import os
-            
-            if self.archivo and hasattr(self.archivo, 'path'):
-                # Obtener tamaño del archivo
-                self.tamaño_archivo = os.path.getsize(self.archivo.path)
-                
-                # Obtener dimensiones de la imagen
-                with Image.open(self.archivo.path) as img:
-                    self.resolucion_x = img.width
-                    self.resolucion_y = img.height
-                    self.formato = img.format.upper() if img.format else 'UNKNOWN'
-                
-                # Actualizar sin llamar save() nuevamente
-                ImagenMedica.objects.filter(id=self.id).update(
-                    tamaño_archivo=self.tamaño_archivo,
-                    resolucion_x=self.resolucion_x,
-                    resolucion_y=self.resolucion_y,
-                    formato=self.formato
-                )
-                
-        except Exception as e:
-            print(f"Error actualizando metadatos para imagen {self.id}: {e}")
+        Returns:
+            bool: True si había una imagen de la que copiarlos
+        """
+        campos = ('miniatura', 'tamaño_archivo', 'resolucion_x', 'resolucion_y', 'formato')
+        otra = (
+            ImagenMedica.objects.filter(archivo=self.archivo.name, tamaño_archivo__isnull=False)
+            .exclude(pk=self.pk).exclude(miniatura='').exclude(miniatura__isnull=True)
+            .values(*campos).first()
+        )
+        if otra is None:
+            return False
+        for campo, valor in otra.items():
+            setattr(self, campo, valor)
+        return True
     
     @property
     def nombre_archivo(self):
@@ -451,3 +425,97 @@ class ImagenMedica(models.Model):
         if self.miniatura:
             return self.miniatura.url
         return None
+
+
+class TrabajoImagenMedica(models.Model):
+    """
+    Procesamiento pendiente de una imagen médica: miniatura y metadatos
+    técnicos. Lo ejecuta el comando ``process_image_jobs`` junto con los
+    trabajos de ``imagenes`` (ver ``pacientes.procesamiento``).
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'En proceso'),
+        ('lista', 'Lista'),
+        ('fallida', 'Fallida'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    imagen = models.ForeignKey(ImagenMedica, on_delete=models.CASCADE, related_name='trabajos')
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=3)
+    disponible_desde = models.DateTimeField()
+    bloqueado_hasta = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Trabajo de Imagen Médica"
+        verbose_name_plural = "Trabajos de Imágenes Médicas"
+        ordering = ['fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde']),
+        ]
+    
+    def __str__(self):
+        return f"Trabajo {self.id} ({self.estado})"
+
+
+class CargaImagenMedica(models.Model):
+    """
+    Subida por partes de una imagen médica (ver ``pacientes.cargas``).
+    
+    Las partes se escriben directamente en un archivo temporal; al recibir
+    la última se verifica el SHA-256 declarado y se crea la ``ImagenMedica``
+    con los datos guardados en ``datos``.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('completa', 'Completa'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    dentista = models.ForeignKey(
+        'dentistas.Dentista',
+        on_delete=models.CASCADE,
+        related_name='cargas_imagenes',
+        null=True,
+        blank=True
+    )
+    imagen = models.ForeignKey(
+        ImagenMedica,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True,
+        help_text="Imagen creada al completar la subida"
+    )
+    
+    # Archivo esperado
+    nombre_archivo = models.CharField(max_length=100)
+    tamaño = models.PositiveBigIntegerField(help_text="Tamaño total en bytes")
+    sha256 = models.CharField(max_length=64, help_text="SHA-256 del archivo completo (hexadecimal)")
+    datos = models.JSONField(default=dict, help_text="Datos de la ImagenMedica a crear")
+    
+    # Progreso
+    recibido = models.PositiveBigIntegerField(default=0, help_text="Bytes recibidos (offset de la siguiente parte)")
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    bloqueada_hasta = models.DateTimeField(null=True, blank=True, help_text="Reserva de la petición que escribe una parte")
+    
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Carga de Imagen Médica"
+        verbose_name_plural = "Cargas de Imágenes Médicas"
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_actualizacion']),
+        ]
+    
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.recibido}/{self.tamaño})"
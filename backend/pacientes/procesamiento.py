@@ -0,0 +1,218 @@
+"""
+Miniaturas y metadatos de las imágenes médicas en segundo plano.
+
+Antes ``ImagenMedica.save`` generaba la miniatura y los metadatos dentro
+de la petición de subida: ``generar_miniatura`` y ``actualizar_metadatos``
+abrían el archivo cada uno por su cuenta (la miniatura decodificando la
+imagen a resolución completa) y cada uno hacía su propio UPDATE. Con las
+radiografías y tomografías de cientos de MB la subida tardaba segundos.
+
+Ahora la subida crea un ``TrabajoImagenMedica`` y responde; el comando
+``process_image_jobs`` lo ejecuta en el mismo grupo de procesos que los
+trabajos de ``imagenes.jobs``, con las mismas reservas y reintentos
+(``dental_erp.lease_queue``):
+
+- ``procesar`` abre el archivo una sola vez. En JPEG usa ``draft()`` para
+  que libjpeg lo decodifique ya reducido (``imagenes.image_utils.open_source``)
+  y de esa lectura salen la miniatura, las dimensiones, el formato y el
+  tamaño.
+- El proceso principal guarda todo con un solo UPDATE
+  (``ImagenMedica.aplicar_procesamiento``).
+- Los clientes consultan ``GET /api/imagenes-medicas/<id>/estado/``; con
+  ``?esperar=<segundos>`` la respuesta espera a que termine (long polling).
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import as_completed
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from dental_erp.lease_queue import LeaseQueue
+from imagenes import blobs
+from .models import ImagenMedica, TrabajoImagenMedica
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo de la miniatura
+MINIATURA = (300, 300)
+
+ACTIVOS = ('pendiente', 'procesando')
+
+# Segundos máximos que espera una consulta de estado con ?esperar=
+ESPERA_MAXIMA = 30
+INTERVALO_ESPERA = 0.5
+
+
+def encolar(imagen):
+    """
+    Encolar la miniatura y los metadatos de una imagen, salvo que ya tenga
+    un trabajo pendiente.
+
+    Returns:
+        TrabajoImagenMedica: El trabajo creado, o None
+    """
+    if TrabajoImagenMedica.objects.filter(imagen=imagen, estado__in=ACTIVOS).exists():
+        return None
+    return TrabajoImagenMedica.objects.create(imagen=imagen, disponible_desde=timezone.now())
+
+
+cola = LeaseQueue(
+    TrabajoImagenMedica,
+    status='estado', pending='pendiente', running='procesando', failed='fallida',
+    available_at='disponible_desde', locked_until='bloqueado_hasta',
+    attempts='intentos', max_attempts='max_intentos', error='error',
+    order_by=('disponible_desde',), started_at='fecha_inicio', finished_at='fecha_fin',
+    lease=('IMAGENES_JOB_LEASE_SECONDS', 10 * 60),
+    retry_base=('IMAGENES_JOB_RETRY_BASE_SECONDS', 30),
+)
+
+
+def reservar(limite):
+    """
+    Reservar hasta ``limite`` trabajos, los más antiguos primero.
+
+    Returns:
+        list: Trabajos reservados (con su imagen), ya marcados ``procesando``
+    """
+    return cola.claim(limite, select_related=('imagen',))
+
+
+def completar(trabajo, resultado):
+    trabajo.imagen.aplicar_procesamiento(resultado)
+    cola.finish(trabajo, estado='lista', error='')
+    return 'done'
+
+
+def fallar(trabajo, error):
+    """Reintentar el trabajo más tarde o marcarlo como fallido"""
+    estado = cola.fail(trabajo, error, permanent=isinstance(error, FileNotFoundError))
+    if estado == 'fallida':
+        logger.error("Trabajo de imagen médica %s fallido: %s", trabajo.pk, error)
+        return 'failed'
+    return 'pending'
+
+
+def _nombre_miniatura(nombre):
+    """Archivo de la miniatura: junto al blob, o en ``miniatura.upload_to``"""
+    if blobs.is_blob(nombre):
+        return blobs.derivative_name(nombre, '_thumb.jpg')
+    base = os.path.splitext(os.path.basename(nombre))[0]
+    return ImagenMedica._meta.get_field('miniatura').generate_filename(None, f"{base}_thumb.jpg")
+
+
+def procesar(nombre):
+    """
+    Miniatura y metadatos técnicos de un archivo con una sola lectura. Se
+    ejecuta en los procesos del grupo.
+
+    Args:
+        nombre: Nombre del archivo en el almacenamiento
+
+    Returns:
+        dict: Campos de ``ImagenMedica`` a guardar
+    """
+    from PIL import Image
+    from imagenes.image_utils import open_source
+
+    with default_storage.open(nombre, 'rb') as archivo:
+        img, formato, (ancho, alto) = open_source(archivo, max_width=MINIATURA[0])
+        with img:
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.thumbnail(MINIATURA, Image.Resampling.LANCZOS)
+            output = BytesIO()
+            img.save(output, format='JPEG', quality=85, optimize=True)
+
+    miniatura = _nombre_miniatura(nombre)
+    if not (blobs.is_blob(nombre) and default_storage.exists(miniatura)):
+        miniatura = default_storage.save(miniatura, ContentFile(output.getvalue()))
+
+    return {
+        'miniatura': miniatura,
+        'tamaño_archivo': default_storage.size(nombre),
+        'resolucion_x': ancho,
+        'resolucion_y': alto,
+        'formato': (formato or 'UNKNOWN').upper(),
+    }
+
+
+def procesar_lote(limite=10, executor=None):
+    """
+    Reservar y ejecutar un lote de trabajos.
+
+    Args:
+        limite: Máximo de trabajos del lote
+        executor: ``ProcessPoolExecutor`` (ver ``imagenes.jobs.create_pool``);
+            sin él se ejecutan en el proceso actual
+
+    Returns:
+        dict: Número de trabajos por estado final del intento
+    """
+    resumen = {'done': 0, 'pending': 0, 'failed': 0}
+    trabajos = reservar(limite)
+
+    if executor is None:
+        for trabajo in trabajos:
+            try:
+                resultado = procesar(trabajo.imagen.archivo.name)
+            except Exception as e:
+                resumen[fallar(trabajo, e)] += 1
+            else:
+                resumen[completar(trabajo, resultado)] += 1
+        return resumen
+
+    futures = {
+        executor.submit(procesar, trabajo.imagen.archivo.name): trabajo
+        for trabajo in trabajos
+    }
+    for future in as_completed(futures):
+        trabajo = futures[future]
+        try:
+            resultado = future.result()
+        except Exception as e:
+            resumen[fallar(trabajo, e)] += 1
+        else:
+            resumen[completar(trabajo, resultado)] += 1
+    return resumen
+
+
+def estado(imagen):
+    """Estado del procesamiento de una imagen, para la API"""
+    trabajo = imagen.trabajos.order_by('-fecha_creacion').first()
+    if imagen.procesada:
+        estado_actual = 'lista'
+    elif trabajo is not None:
+        estado_actual = trabajo.estado
+    else:
+        estado_actual = 'pendiente'
+    return {
+        'id': str(imagen.pk),
+        'procesada': imagen.procesada,
+        'estado': estado_actual,
+        'intentos': trabajo.intentos if trabajo else 0,
+        'error': (trabajo.error or None) if trabajo else None,
+        'miniatura_url': imagen.miniatura_url,
+        'tamaño_archivo': imagen.tamaño_archivo,
+        'resolucion_x': imagen.resolucion_x,
+        'resolucion_y': imagen.resolucion_y,
+        'formato': imagen.formato,
+    }
+
+
+def esperar(imagen, segundos):
+    """
+    Estado de la imagen cuando termine su procesamiento o pasados
+    ``segundos`` (como mucho ``ESPERA_MAXIMA``).
+    """
+    limite = time.monotonic() + min(max(segundos, 0), ESPERA_MAXIMA)
+    while True:
+        resultado = estado(imagen)
+        if resultado['estado'] in ('lista', 'fallida') or time.monotonic() >= limite:
+            return resultado
+        time.sleep(INTERVALO_ESPERA)
+        imagen.refresh_from_db()
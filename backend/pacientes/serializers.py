@@ -1,5 +1,10 @@
+import os
+import re
+
+from django.conf import settings
+from django.utils.text import get_valid_filename
 from rest_framework import serializers
-from .models import Paciente, ExpedienteMedico, BitacoraCita, ImagenMedica, BitacoraCita, ImagenMedica
+from .models import Paciente, ExpedienteMedico, BitacoraCita, ImagenMedica, BitacoraCita, ImagenMedica, CargaImagenMedica
 
 class PacienteSerializer(serializers.ModelSerializer):
     nombre_completo = serializers.ReadOnlyField()
@@ -147,6 +152,7 @@ class ImagenMedicaSerializer(serializers.ModelSerializer):
     nombre_archivo = serializers.SerializerMethodField()
     url_completa = serializers.SerializerMethodField()
     miniatura_url = serializers.SerializerMethodField()
+    procesada = serializers.ReadOnlyField()
     
     class Meta:
         model = ImagenMedica
@@ -156,7 +162,8 @@ class ImagenMedicaSerializer(serializers.ModelSerializer):
             'resolucion_x', 'resolucion_y', 'formato', 'diente_especifico',
             'cuadrante', 'observaciones_medicas', 'activa', 'confidencial',
             'paciente', 'paciente_nombre', 'dentista_responsable', 'dentista_nombre',
-            'bitacora_cita', 'bitacora_fecha', 'nombre_archivo', 'url_completa', 'miniatura_url'
+            'bitacora_cita', 'bitacora_fecha', 'nombre_archivo', 'url_completa', 'miniatura_url',
+            'procesada'
         ]
         read_only_fields = ['fecha_subida', 'tamaño_archivo', 'formato', 'resolucion_x', 'resolucion_y']
     
@@ -188,3 +195,52 @@ class ImagenMedicaCreateSerializer(serializers.ModelSerializer):
             'descripcion', 'fecha_toma', 'diente_especifico', 'cuadrante',
             'observaciones_medicas', 'confidencial'
         ]
+
+class ImagenMedicaDatosSerializer(ImagenMedicaCreateSerializer):
+    """Datos de una imagen médica sin el archivo (se sube por partes)"""
+    class Meta(ImagenMedicaCreateSerializer.Meta):
+        fields = [campo for campo in ImagenMedicaCreateSerializer.Meta.fields if campo != 'archivo']
+
+class CargaImagenMedicaSerializer(serializers.ModelSerializer):
+    """
+    Subida por partes (``pacientes.cargas``): además de estos campos recibe
+    los de ``ImagenMedicaCreateSerializer`` salvo ``archivo``, que se
+    validan al iniciarla y se usan al completarla.
+    """
+    offset = serializers.IntegerField(source='recibido', read_only=True)
+    
+    class Meta:
+        model = CargaImagenMedica
+        fields = [
+            'id', 'nombre_archivo', 'tamaño', 'sha256', 'offset', 'estado',
+            'imagen', 'fecha_creacion', 'fecha_actualizacion'
+        ]
+        read_only_fields = ['id', 'estado', 'imagen', 'fecha_creacion', 'fecha_actualizacion']
+    
+    def validate_nombre_archivo(self, value):
+        nombre = get_valid_filename(os.path.basename(value))
+        if not os.path.splitext(nombre)[1]:
+            raise serializers.ValidationError("El nombre del archivo debe tener extensión.")
+        return nombre
+    
+    def validate_tamaño(self, value):
+        maximo = getattr(settings, 'IMAGENES_MEDICAS_CARGA_MAX_BYTES', 2 * 1024 ** 3)
+        if not 0 < value <= maximo:
+            raise serializers.ValidationError(f"El tamaño debe estar entre 1 y {maximo} bytes.")
+        return value
+    
+    def validate_sha256(self, value):
+        value = value.lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError("El SHA-256 debe tener 64 caracteres hexadecimales.")
+        return value
+    
+    def validate(self, attrs):
+        datos = ImagenMedicaDatosSerializer(data=self.initial_data)
+        if not datos.is_valid():
+            raise serializers.ValidationError(datos.errors)
+        attrs['datos'] = {
+            campo: self.initial_data[campo]
+            for campo in datos.fields if campo in self.initial_data
+        }
+        return attrs
@@ -1,16 +1,67 @@
-from django.db.models.signals import post_save
+import logging
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import ImagenMedica
+from imagenes import blobs
+from . import autocomplete, procesamiento
+from .models import ImagenMedica, Paciente
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=ImagenMedica)
+def guardar_archivo_por_contenido(sender, instance, raw=False, **kwargs):
+    """
+    Guardar el archivo subido por contenido: si ya estaba subido no se
+    vuelve a escribir y se reutilizan su miniatura y metadatos
+    """
+    if raw:
+        return
+    adding = instance._state.adding
+    if blobs.attach(instance, 'archivo') and adding:
+        instance.reutilizar_derivados()
+
 
 @receiver(post_save, sender=ImagenMedica)
 def procesar_imagen_medica(sender, instance, created, **kwargs):
     """
-    Signal para procesar automáticamente las imágenes médicas después de ser guardadas
+    Encolar la miniatura y los metadatos de las imágenes nuevas (ver
+    ``pacientes.procesamiento``), salvo que se hayan reutilizado de otra
+    subida del mismo archivo. Con ``IMAGENES_DERIVADOS_SINCRONOS`` se
+    generan en la misma petición.
     """
-    if created and instance.archivo:
-        # Generar miniatura y actualizar metadatos de forma asíncrona
+    if not created or not instance.archivo or instance.procesada:
+        return
+    if getattr(settings, 'IMAGENES_DERIVADOS_SINCRONOS', False):
         try:
-            instance.actualizar_metadatos()
-            instance.generar_miniatura()
+            instance.procesar_archivo()
         except Exception as e:
-            print(f"Error procesando imagen {instance.id}: {e}")
+            logger.error("Error procesando imagen %s: %s", instance.id, e)
+    else:
+        procesamiento.encolar(instance)
+
+
+@receiver(post_delete, sender=ImagenMedica)
+def liberar_archivo_imagen_medica(sender, instance, **kwargs):
+    """
+    Descontar la referencia al archivo de la imagen eliminada; el archivo y
+    su miniatura se borran cuando nadie más lo usa (``dedupe_media``)
+    """
+    blobs.release(instance.archivo.name)
+
+
+@receiver(post_save, sender=Paciente)
+def actualizar_autocompletado(sender, instance, **kwargs):
+    """
+    Mantener actualizado el índice de autocompletado de pacientes
+    """
+    autocomplete.paciente_changed(instance)
+
+
+@receiver(post_delete, sender=Paciente)
+def quitar_de_autocompletado(sender, instance, **kwargs):
+    """
+    Quitar del índice de autocompletado a los pacientes eliminados
+    """
+    autocomplete.paciente_changed(instance, deleted=True)
@@ -1,3 +1,728 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import zipfile
+import shutil
+import tempfile
+from datetime import date, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from dental_erp import exports
+from dentistas.models import Dentista
+from . import autocomplete, cargas, procesamiento
+from .models import BitacoraCita, CargaImagenMedica, ImagenMedica, Paciente, TrabajoImagenMedica
+
+
+def crear_dentista(username='dentista'):
+    user = User.objects.create_user(username=username, password='test123')
+    return Dentista.objects.create(
+        user=user,
+        cedula_profesional=f'CED-{username}',
+        universidad='UNAM',
+        anio_graduacion=2010,
+        telefono='5555555555',
+        fecha_nacimiento=date(1980, 1, 1),
+        direccion='Calle 1',
+        fecha_ingreso=date(2020, 1, 1),
+        horario_inicio=time(8, 0),
+        horario_fin=time(17, 0),
+    )
+
+
+def crear_paciente(dentista, nombre, apellido_paterno, apellido_materno='', **kwargs):
+    datos = {
+        'creado_por': dentista,
+        'nombre': nombre,
+        'apellido_paterno': apellido_paterno,
+        'apellido_materno': apellido_materno,
+        'fecha_nacimiento': date(1990, 5, 10),
+        'sexo': 'F',
+        'telefono': '5512345678',
+        'email': f'{nombre}.{apellido_paterno}@ejemplo.com'.lower(),
+        'direccion': 'Calle 2',
+        'contacto_emergencia_nombre': 'Contacto',
+        'contacto_emergencia_telefono': '5500000000',
+        'contacto_emergencia_relacion': 'Familiar',
+    }
+    datos.update(kwargs)
+    return Paciente.objects.create(**datos)
+
+
+@override_settings(PACIENTE_AUTOCOMPLETE_BACKEND='memory')
+class PacienteAutocompleteTest(TestCase):
+    """Tests para el autocompletado de pacientes por trigramas"""
+    
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset_memory_index()
+        self.dentista = crear_dentista()
+        self.garcia = crear_paciente(self.dentista, 'María', 'García', 'Núñez')
+        self.gonzalez = crear_paciente(self.dentista, 'José', 'González', 'Pérez')
+        crear_paciente(self.dentista, 'Ana', 'Martínez', 'López')
+    
+    def tearDown(self):
+        autocomplete.reset_memory_index()
+    
+    def nombres(self, query):
+        return [r['nombre_completo'] for r in autocomplete.autocomplete(query)]
+    
+    def test_typo_and_accent_tolerance(self):
+        """Un apellido mal escrito y sin acentos encuentra al paciente"""
+        self.assertEqual(self.nombres('garsia'), ['María García Núñez'])
+        self.assertEqual(self.nombres('nunez maria'), ['María García Núñez'])
+    
+    def test_prefix_of_last_term(self):
+        """El último término se completa por prefijo mientras se escribe"""
+        self.assertEqual(self.nombres('gonzalez jo'), ['José González Pérez'])
+        self.assertEqual(self.nombres(self.garcia.numero_expediente.lower()), ['María García Núñez'])
+    
+    def test_short_query_returns_nothing(self):
+        self.assertEqual(autocomplete.autocomplete('g'), [])
+    
+    def test_index_follows_changes(self):
+        """Altas, cambios y desactivaciones se reflejan sin reconstruir el índice"""
+        self.assertEqual(self.nombres('garcia'), ['María García Núñez'])
+        
+        crear_paciente(self.dentista, 'Luis', 'Garcia', 'Ramos')
+        self.assertEqual(len(self.nombres('garcia')), 2)
+        
+        self.gonzalez.apellido_paterno = 'Hernández'
+        self.gonzalez.save()
+        self.assertEqual(self.nombres('hernandez'), ['José Hernández Pérez'])
+        self.assertEqual(self.nombres('gonzalez'), [])
+        
+        self.garcia.activo = False
+        self.garcia.save()
+        self.assertEqual(self.nombres('maria garcia'), [])
+    
+    def test_single_query_per_keystroke(self):
+        """Con el índice caliente, cada búsqueda hace una sola consulta"""
+        autocomplete.autocomplete('garcia')
+        with self.assertNumQueries(1):
+            autocomplete.autocomplete('martinez')
+
+
+@override_settings(PACIENTE_AUTOCOMPLETE_BACKEND='memory')
+class PacienteAutocompleteAPITest(APITestCase):
+    """Tests para el endpoint de autocompletado"""
+    
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset_memory_index()
+        self.dentista = crear_dentista()
+        crear_paciente(self.dentista, 'María', 'García', 'Núñez')
+        self.client.force_authenticate(user=self.dentista.user)
+    
+    def tearDown(self):
+        autocomplete.reset_memory_index()
+    
+    def test_autocomplete_endpoint(self):
+        response = self.client.get('/api/pacientes/autocomplete/', {'q': 'garsia'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(
+            set(response.data[0]),
+            {'id', 'nombre_completo', 'numero_expediente', 'telefono', 'email'}
+        )
+
+
+class KeysetPaginationTest(APITestCase):
+    """Tests para la paginación por cursor de la bitácora de citas"""
+    
+    def setUp(self):
+        self.dentista = crear_dentista()
+        paciente = crear_paciente(self.dentista, 'María', 'García')
+        inicio = timezone.now()
+        # Varias entradas comparten fecha para probar el desempate por id
+        for i in range(25):
+            BitacoraCita.objects.create(
+                paciente=paciente,
+                dentista=self.dentista,
+                fecha_hora=inicio - timedelta(hours=i // 2),
+                tipo_cita='consulta',
+                motivo_consulta=f'Consulta {i}',
+            )
+        self.esperado = [
+            str(pk) for pk in BitacoraCita.objects.order_by('-fecha_hora', '-id').values_list('id', flat=True)
+        ]
+    
+    def recorrer(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids, response
+    
+    def test_cursor_walks_every_row_once(self):
+        ids, response = self.recorrer('/api/bitacora-citas/?pagination=cursor')
+        self.assertEqual(ids, self.esperado)
+        self.assertNotIn('count', response.data)
+        
+        # Volver una página atrás desde la última
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in previous.data['results']], self.esperado[:20]
+        )
+    
+    def test_cursor_page_does_not_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/bitacora-citas/?pagination=cursor')
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+    
+    def test_page_mode_count_options(self):
+        response = self.client.get('/api/bitacora-citas/?count=none&page=2')
+        self.assertIsNone(response.data['count'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+        
+        with self.settings(PAGINATION_APPROX_COUNT_CAP=10):
+            response = self.client.get('/api/bitacora-citas/?count=approx')
+        self.assertEqual(response.data['count'], 10)
+        self.assertTrue(response.data['count_is_estimate'])
+        
+        # Sin parámetros la respuesta no cambia
+        response = self.client.get('/api/bitacora-citas/')
+        self.assertEqual(response.data['count'], 25)
+        self.assertNotIn('count_is_estimate', response.data)
+    
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/bitacora-citas/?cursor=no-es-un-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PacienteExportTest(APITestCase):
+    """Tests para la exportación en streaming de pacientes"""
+
+    url = '/api/pacientes/exportar/'
+
+    def setUp(self):
+        self.dentista = crear_dentista()
+        crear_paciente(self.dentista, 'Ana', 'López', 'Núñez', fecha_nacimiento=date(1990, 5, 10))
+        crear_paciente(self.dentista, 'José', 'Pérez', alergias='Penicilina, "látex"')
+        crear_paciente(self.dentista, 'Inés', 'Ruiz', activo=False)
+        self.client.force_authenticate(self.dentista.user)
+
+    def descargar(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_anonymous_export_is_rejected(self):
+        self.client.force_authenticate(None)
+        for url in (self.url, '/api/citas/exportar/', '/api/facturas/exportar/'):
+            response = self.client.get(url)
+            self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+            self.assertFalse(response.streaming)
+
+    def test_csv_streams_rows_from_one_query(self):
+        with mock.patch.object(exports, 'FLUSH_BYTES', 1), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'activo': 'true'})
+            partes = list(response.streaming_content)
+
+        self.assertEqual(len(queries), 2)  # dentista del usuario + pacientes
+        self.assertEqual(len(partes), 3)
+        filas = list(csv.reader(io.StringIO(b''.join(partes).decode('utf-8-sig'))))
+        self.assertEqual(filas[0][:3], ['Número de expediente', 'Nombre', 'Apellido paterno'])
+        self.assertEqual(len(filas), 3)
+        ana = next(fila for fila in filas if fila[1] == 'Ana')
+        self.assertEqual(ana[5], str(exports.edad(date(1990, 5, 10))))
+        jose = next(fila for fila in filas if fila[1] == 'José')
+        self.assertEqual(jose[11], 'Penicilina, "látex"')
+
+    def test_csv_escapes_formulas(self):
+        crear_paciente(self.dentista, '=HYPERLINK("http://x")', 'Mora', alergias='-2+3', telefono='+52 55 1234 5678')
+
+        filas = list(csv.reader(io.StringIO(self.descargar().decode('utf-8-sig'))))
+        mora = next(fila for fila in filas if fila[2] == 'Mora')
+        self.assertEqual(mora[1], '\'=HYPERLINK("http://x")')
+        self.assertEqual(mora[11], "'-2+3")
+        self.assertEqual(mora[7], "'+52 55 1234 5678")
+        self.assertEqual(mora[5], str(exports.edad(date(1990, 5, 10))))
+
+    def test_ndjson(self):
+        lineas = self.descargar(formato='ndjson').decode('utf-8').splitlines()
+
+        self.assertEqual(len(lineas), 3)
+        registro = json.loads(lineas[0])
+        self.assertIn('numero_expediente', registro)
+        self.assertIsInstance(registro['edad'], int)
+        self.assertIsInstance(registro['activo'], bool)
+
+    def test_xlsx(self):
+        response = self.client.get(self.url, {'formato': 'xlsx'})
+        contenido = b''.join(response.streaming_content)
+
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        libro = zipfile.ZipFile(io.BytesIO(contenido))
+        self.assertIsNone(libro.testzip())
+        self.assertIn('name="pacientes"', libro.read('xl/workbook.xml').decode('utf-8'))
+        hoja = libro.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertEqual(hoja.count('<row>'), 4)
+        self.assertIn('<t xml:space="preserve">Penicilina, "látex"</t>', hoja)
+        self.assertIn('<c t="b"><v>0</v></c>', hoja)
+
+    def test_invalid_format(self):
+        response = self.client.get(self.url, {'formato': 'pdf'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(PACIENTE_AUTOCOMPLETE_BACKEND='memory')
+class PacienteImportacionTest(APITestCase):
+    """Tests para la importación masiva de pacientes"""
+
+    url = '/api/pacientes/importar/'
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset_memory_index()
+        self.dentista = crear_dentista()
+        self.otro = crear_dentista('otro')
+        crear_paciente(self.dentista, 'Ana', 'López')
+
+    def tearDown(self):
+        autocomplete.reset_memory_index()
+
+    def fila(self, i, **kwargs):
+        fila = {
+            'nombre': f'Paciente{i}',
+            'apellido_paterno': 'Importado',
+            'fecha_nacimiento': '1985-03-0' + str(i % 9 + 1),
+            'sexo': 'm',
+            'telefono': f'55{i:08d}',
+            'email': f'importado{i}@ejemplo.com',
+            'direccion': 'Calle 3',
+            'contacto_emergencia_nombre': 'Contacto',
+            'contacto_emergencia_telefono': '5500000000',
+            'contacto_emergencia_relacion': 'Familiar',
+        }
+        fila.update(kwargs)
+        return fila
+
+    def csv(self, filas):
+        salida = io.StringIO()
+        columnas = list(dict.fromkeys(clave for fila in filas for clave in fila))
+        writer = csv.DictWriter(salida, columnas)
+        writer.writeheader()
+        writer.writerows(filas)
+        return salida.getvalue().encode('utf-8')
+
+    def test_csv_batches_and_rejects(self):
+        from . import importacion
+
+        filas = [self.fila(i) for i in range(6)] + [
+            self.fila(6, telefono='abc'),
+            self.fila(7, email='importado1@ejemplo.com'),
+            self.fila(8, email='ana.lópez@ejemplo.com'),
+            self.fila(9, creado_por='CED-nadie'),
+            self.fila(10, creado_por='CED-otro', dentista_asignado=str(self.dentista.pk)),
+        ]
+        rechazos = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            resumen = importacion.importar(
+                io.BytesIO(self.csv(filas)), 'csv', self.dentista, rechazos=rechazos, lote=4
+            )
+
+        self.assertEqual((resumen['filas'], resumen['importados'], resumen['rechazados']), (11, 7, 4))
+        # Consultas por lote, no por fila
+        self.assertLess(len(queries), 30)
+        errores = {error['fila']: error['errores'] for error in resumen['errores']}
+        self.assertEqual(set(errores), {8, 9, 10, 11})
+        self.assertIn('telefono', errores[8])
+        self.assertIn('email', errores[9])
+        self.assertIn('email', errores[10])
+        self.assertIn('creado_por', errores[11])
+
+        rechazadas = list(csv.DictReader(io.StringIO(rechazos.getvalue())))
+        self.assertEqual([fila['fila'] for fila in rechazadas], ['8', '9', '10', '11'])
+        self.assertEqual(rechazadas[0]['telefono'], 'abc')
+        self.assertIn('telefono:', rechazadas[0]['errores'])
+
+        paciente = Paciente.objects.get(email='importado0@ejemplo.com')
+        self.assertEqual(paciente.fecha_nacimiento, date(1985, 3, 1))
+        self.assertEqual(paciente.sexo, 'M')
+        self.assertTrue(paciente.activo)
+        self.assertIsNotNone(paciente.fecha_registro)
+        self.assertEqual(paciente.creado_por, self.dentista)
+        self.assertEqual(paciente.dentista_asignado, self.dentista)
+        otro = Paciente.objects.get(email='importado10@ejemplo.com')
+        self.assertEqual((otro.creado_por, otro.dentista_asignado), (self.otro, self.dentista))
+
+        # Números consecutivos por dentista, sin chocar con las altas normales
+        numeros = sorted(
+            Paciente.objects.filter(creado_por=self.dentista).values_list('numero_expediente', flat=True)
+        )
+        prefijo = numeros[0][:-6]
+        self.assertEqual(numeros, [f'{prefijo}{n:06d}' for n in range(1, 8)])
+        siguiente = crear_paciente(self.dentista, 'Luis', 'Mora')
+        self.assertEqual(siguiente.numero_expediente, f'{prefijo}000008')
+
+    def test_json_array_and_ndjson(self):
+        from . import importacion
+
+        prefijo = Paciente.reservar_numeros_expediente(self.dentista)[0][:-6]
+        filas = [self.fila(i) for i in range(3)]
+        filas[0]['numero_expediente'] = f'{prefijo}000050'
+        with mock.patch.object(importacion, 'BLOQUE_JSON', 7):
+            resumen = importacion.importar(
+                io.BytesIO(json.dumps(filas, ensure_ascii=False, indent=1).encode('utf-8')),
+                'json', self.dentista
+            )
+        self.assertEqual((resumen['importados'], resumen['rechazados']), (3, 0))
+        # El contador no vuelve a repartir el número importado
+        self.assertEqual(crear_paciente(self.dentista, 'Luis', 'Mora').numero_expediente, f'{prefijo}000053')
+
+        lineas = [json.dumps(self.fila(i)) for i in range(3, 5)] + ['{"nombre": ', '', json.dumps([1])]
+        rechazos = io.StringIO()
+        resumen = importacion.importar(
+            io.BytesIO('\n'.join(lineas).encode('utf-8')), 'ndjson', self.dentista, rechazos=rechazos
+        )
+        self.assertEqual((resumen['filas'], resumen['importados'], resumen['rechazados']), (4, 2, 2))
+        self.assertEqual([error['fila'] for error in resumen['errores']], [3, 5])
+        self.assertEqual(json.loads(rechazos.getvalue().splitlines()[0])['fila'], 3)
+
+        with self.assertRaises(importacion.ErrorImportacion):
+            importacion.importar(io.BytesIO(b'[{"nombre": "x"} {"a": 1}]'), 'json', self.dentista)
+
+    def test_api_import_and_reject_file(self):
+        autocomplete.get_memory_index()
+        # Los títulos de la exportación también sirven como columnas
+        filas = [self.fila(1, **{'Cédula del dentista asignado': 'CED-otro'}), self.fila(2, sexo='X')]
+        archivo = SimpleUploadedFile('pacientes.csv', self.csv(filas), content_type='text/csv')
+
+        self.client.force_authenticate(self.otro.user)
+        response = self.client.post(self.url, {'archivo': archivo}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['importados'], response.data['rechazados']), (1, 1))
+        self.assertEqual(response.data['errores'][0]['fila'], 3)
+        paciente = Paciente.objects.get(email='importado1@ejemplo.com')
+        self.assertEqual((paciente.creado_por, paciente.dentista_asignado), (self.otro, self.otro))
+        # bulk insert no envía post_save: el índice se actualiza aparte
+        self.assertEqual(autocomplete.autocomplete('importado')[0]['id'], str(paciente.pk))
+
+        archivo = SimpleUploadedFile('pacientes.csv', self.csv([self.fila(1)]), content_type='text/csv')
+        response = self.client.post(f'{self.url}?rechazos=1', {'archivo': archivo}, format='multipart')
+        self.assertEqual(response['X-Rechazados'], '1')
+        rechazadas = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(rechazadas[0]['email'], 'importado1@ejemplo.com')
+
+        archivo = SimpleUploadedFile('pacientes.txt', b'x', content_type='text/plain')
+        response = self.client.post(self.url, {'archivo': archivo}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_api_import_requires_dentist(self):
+        def subir():
+            archivo = SimpleUploadedFile('pacientes.csv', self.csv([self.fila(1)]), content_type='text/csv')
+            return self.client.post(self.url, {'archivo': archivo}, format='multipart')
+
+        response = subir()
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+        self.client.force_authenticate(User.objects.create_user(username='recepcion', password='test123'))
+        self.assertEqual(subir().status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Paciente.objects.filter(email='importado1@ejemplo.com').exists())
+
+    def test_command(self):
+        from django.core.management import call_command
+
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ruta = os.path.join(directorio, 'pacientes.ndjson')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write('\n'.join(json.dumps(fila) for fila in [self.fila(1), self.fila(2, sexo='')]))
+
+        salida = io.StringIO()
+        call_command('importar_pacientes', ruta, '--dentista', 'otro', stdout=salida)
+
+        self.assertIn('1 de 2 pacientes importados', salida.getvalue())
+        self.assertEqual(Paciente.objects.get(email='importado1@ejemplo.com').creado_por, self.otro)
+        with open(f'{ruta}.rechazos.ndjson', encoding='utf-8') as rechazos:
+            self.assertIn('sexo', json.loads(rechazos.readline())['errores'])
+
+
+class PacienteImportacionBusquedaTest(TestCase):
+    """Los pacientes importados entran al índice de texto completo"""
+
+    @classmethod
+    def setUpClass(cls):
+        from categorias import search_index
+        # El esquema se crea fuera de la transacción de cada test
+        search_index.create_schema()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        from categorias import search_index
+        super().tearDownClass()
+        search_index.drop_schema()
+
+    def test_imported_patients_are_searchable(self):
+        from categorias import search_index
+        from . import importacion
+
+        dentista = crear_dentista()
+        fila = {
+            'nombre': 'Eusebia', 'apellido_paterno': 'Quintanilla', 'fecha_nacimiento': '1985-03-01',
+            'sexo': 'F', 'telefono': '5511112222', 'email': 'eusebia@ejemplo.com', 'direccion': 'Calle 3',
+            'contacto_emergencia_nombre': 'Contacto', 'contacto_emergencia_telefono': '5500000000',
+            'contacto_emergencia_relacion': 'Familiar',
+        }
+        resumen = importacion.importar(io.BytesIO(json.dumps([fila]).encode('utf-8')), 'json', dentista)
+
+        self.assertEqual(resumen['importados'], 1)
+        encontrados = search_index.search('paciente', 'quintanilla')
+        self.assertEqual([paciente.email for paciente in encontrados], ['eusebia@ejemplo.com'])
+
+
+class ImagenMedicaDedupTest(TestCase):
+    """Tests para las imágenes médicas subidas más de una vez"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.dentista = crear_dentista()
+        self.paciente = crear_paciente(self.dentista, 'Ana', 'López')
+
+    def subir(self):
+        from PIL import Image as PILImage
+
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (800, 600), (30, 60, 90)).save(buffer, format='JPEG')
+        return ImagenMedica.objects.create(
+            paciente=self.paciente,
+            dentista_responsable=self.dentista,
+            archivo=SimpleUploadedFile('rx.jpg', buffer.getvalue(), content_type='image/jpeg'),
+            tipo_imagen='radiografia_panoramica',
+            titulo='Panorámica',
+            fecha_toma=timezone.now(),
+        )
+
+    def test_repeated_upload_shares_file_and_thumbnail(self):
+        from imagenes import blobs
+
+        primera = self.subir()
+        procesamiento.procesar_lote()
+        primera.refresh_from_db()
+        segunda = self.subir()
+
+        self.assertFalse(TrabajoImagenMedica.objects.filter(imagen=segunda).exists())
+        self.assertEqual(segunda.archivo.name, primera.archivo.name)
+        self.assertEqual(segunda.miniatura.name, primera.miniatura.name)
+        self.assertEqual(segunda.miniatura.name, blobs.derivative_name(primera.archivo.name, '_thumb.jpg'))
+        self.assertEqual((segunda.resolucion_x, segunda.resolucion_y), (800, 600))
+        self.assertEqual(blobs.MediaBlob.objects.get(name=primera.archivo.name).refcount, 2)
+
+        primera.delete()
+
+        self.assertEqual(blobs.MediaBlob.objects.get(name=segunda.archivo.name).refcount, 1)
+
+
+class ImagenMedicaProcesamientoTest(APITestCase):
+    """Tests para la miniatura y los metadatos generados en segundo plano"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.dentista = crear_dentista()
+        self.paciente = crear_paciente(self.dentista, 'Ana', 'López')
+
+    def subir(self, size=(2400, 1800)):
+        from PIL import Image as PILImage
+
+        buffer = io.BytesIO()
+        PILImage.linear_gradient('L').resize(size).convert('RGB').save(buffer, format='JPEG')
+        return ImagenMedica.objects.create(
+            paciente=self.paciente,
+            dentista_responsable=self.dentista,
+            archivo=SimpleUploadedFile('rx.jpg', buffer.getvalue(), content_type='image/jpeg'),
+            tipo_imagen='radiografia_panoramica',
+            titulo='Panorámica',
+            fecha_toma=timezone.now(),
+        )
+
+    def test_upload_is_processed_by_worker_in_one_update(self):
+        from PIL import Image as PILImage
+
+        imagen = self.subir()
+        self.assertFalse(imagen.procesada)
+        self.assertEqual(TrabajoImagenMedica.objects.get(imagen=imagen).estado, 'pendiente')
+
+        with mock.patch('PIL.JpegImagePlugin.JpegImageFile.draft', autospec=True,
+                        side_effect=PILImage.Image.draft) as draft, \
+                CaptureQueriesContext(connection) as queries:
+            resumen = procesamiento.procesar_lote()
+
+        self.assertEqual(resumen['done'], 1)
+        self.assertTrue(draft.called)
+        updates = [q for q in queries.captured_queries
+                   if q['sql'].startswith('UPDATE "pacientes_imagenmedica"')]
+        self.assertEqual(len(updates), 1)
+
+        imagen.refresh_from_db()
+        self.assertTrue(imagen.procesada)
+        self.assertEqual((imagen.resolucion_x, imagen.resolucion_y, imagen.formato), (2400, 1800, 'JPEG'))
+        self.assertEqual(imagen.tamaño_archivo, imagen.archivo.size)
+        with PILImage.open(imagen.miniatura.path) as miniatura:
+            self.assertEqual(miniatura.size, (300, 225))
+        self.assertEqual(TrabajoImagenMedica.objects.get(imagen=imagen).estado, 'lista')
+
+    def test_status_endpoint(self):
+        imagen = self.subir(size=(640, 480))
+        url = f'/api/imagenes-medicas/{imagen.pk}/estado/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.data['estado'], 'pendiente')
+        self.assertFalse(response.data['procesada'])
+
+        procesamiento.procesar_lote()
+        with mock.patch.object(procesamiento.time, 'sleep') as sleep:
+            response = self.client.get(url, {'esperar': 10})
+
+        sleep.assert_not_called()
+        self.assertEqual(response.data['estado'], 'lista')
+        self.assertEqual((response.data['resolucion_x'], response.data['resolucion_y']), (640, 480))
+
+    def test_failed_job_is_retried_later(self):
+        imagen = self.subir(size=(640, 480))
+
+        with override_settings(IMAGENES_JOB_RETRY_BASE_SECONDS=120), \
+                mock.patch.object(procesamiento, 'procesar', side_effect=OSError('disco lleno')):
+            resumen = procesamiento.procesar_lote()
+
+        self.assertEqual(resumen['pending'], 1)
+        trabajo = TrabajoImagenMedica.objects.get(imagen=imagen)
+        self.assertEqual((trabajo.estado, trabajo.error, trabajo.intentos), ('pendiente', 'disco lleno', 1))
+        self.assertGreater(trabajo.disponible_desde, timezone.now() + timedelta(seconds=60))
+        self.assertEqual(procesamiento.reservar(10), [])
+
+        TrabajoImagenMedica.objects.filter(pk=trabajo.pk).update(disponible_desde=timezone.now())
+        imagen.archivo.storage.delete(imagen.archivo.name)
+        self.assertEqual(procesamiento.procesar_lote()['failed'], 1)
+        self.assertEqual(TrabajoImagenMedica.objects.get(pk=trabajo.pk).estado, 'fallida')
+
+
+class CargaImagenMedicaTest(APITestCase):
+    """Tests para las subidas por partes de imágenes médicas"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        override = override_settings(
+            MEDIA_ROOT=media_root,
+            IMAGENES_MEDICAS_CARGAS_DIR=f'{media_root}/cargas',
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.dentista = crear_dentista()
+        self.paciente = crear_paciente(self.dentista, 'Ana', 'López')
+
+        from PIL import Image as PILImage
+
+        buffer = io.BytesIO()
+        PILImage.effect_noise((400, 300), 60).convert('RGB').save(buffer, format='PNG')
+        self.contenido = buffer.getvalue()
+
+    def iniciar(self, sha256=None):
+        response = self.client.post('/api/imagenes-medicas/cargas/', {
+            'nombre_archivo': 'cbct/panoramica.png',
+            'tamaño': len(self.contenido),
+            'sha256': sha256 or hashlib.sha256(self.contenido).hexdigest(),
+            'paciente': str(self.paciente.pk),
+            'tipo_imagen': 'radiografia_panoramica',
+            'titulo': 'Panorámica',
+            'fecha_toma': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response['Upload-Offset'], '0')
+        return response['Location']
+
+    def enviar(self, url, offset, parte):
+        return self.client.patch(
+            url, parte, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_resumable_upload_creates_image(self):
+        from imagenes import blobs
+
+        url = self.iniciar()
+        corte = len(self.contenido) // 3
+
+        response = self.enviar(url, 0, self.contenido[:corte])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response['Upload-Offset'], str(corte))
+
+        # Una parte repetida o fuera de orden no se escribe
+        response = self.enviar(url, 0, self.contenido[:corte])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], corte)
+
+        # Tras un corte, el cliente pregunta por dónde seguir
+        response = self.client.head(url)
+        offset = int(response['Upload-Offset'])
+        self.assertEqual(offset, corte)
+
+        response = self.enviar(url, offset, self.contenido[offset:])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        imagen = ImagenMedica.objects.get(pk=response.data['id'])
+        self.assertTrue(blobs.is_blob(imagen.archivo.name))
+        with imagen.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), self.contenido)
+        self.assertEqual(imagen.dentista_responsable, self.dentista)
+        procesamiento.procesar_lote()
+        imagen.refresh_from_db()
+        self.assertEqual((imagen.resolucion_x, imagen.resolucion_y), (400, 300))
+
+        carga = CargaImagenMedica.objects.get()
+        self.assertEqual((carga.estado, carga.imagen), ('completa', imagen))
+        self.assertFalse(os.path.exists(cargas.ruta_temporal(carga)))
+
+    def test_checksum_mismatch_restarts_upload(self):
+        url = self.iniciar(sha256='0' * 64)
+
+        response = self.enviar(url, 0, self.contenido)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Upload-Offset'], '0')
+        self.assertEqual(CargaImagenMedica.objects.get().recibido, 0)
+        self.assertFalse(ImagenMedica.objects.exists())
+
+    def test_interrupted_part_keeps_received_bytes(self):
+        url = self.iniciar()
+        carga = CargaImagenMedica.objects.get()
+
+        class Cortado(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell() >= 1000:
+                    raise OSError('conexión cerrada')
+                return super().read(min(size, 500))
+
+        with mock.patch.object(cargas, 'CHUNK_SIZE', 500):
+            cargas.recibir(carga, 0, Cortado(self.contenido), len(self.contenido), crear_imagen=None)
+
+        carga.refresh_from_db()
+        self.assertEqual(carga.recibido, 1000)
+        self.assertIsNone(carga.bloqueada_hasta)
+        response = self.enviar(url, 1000, self.contenido[1000:])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
@@ -1,27 +1,60 @@
+from django.http import FileResponse
 from django.shortcuts import render
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db.models import Q, Count
+from django.urls import reverse
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Paciente, ExpedienteMedico, BitacoraCita, ImagenMedica
+import io
+import tempfile
+from .models import Paciente, ExpedienteMedico, BitacoraCita, ImagenMedica, CargaImagenMedica
 from .serializers import (PacienteSerializer, PacienteCreateSerializer, 
                          PacienteUpdateSerializer, ExpedienteMedicoSerializer,
                          ExpedienteMedicoCreateSerializer, BitacoraCitaSerializer,
                          BitacoraCitaCreateSerializer, BitacoraCitaUpdateSerializer,
-                         ImagenMedicaSerializer, ImagenMedicaCreateSerializer)
+                         ImagenMedicaSerializer, ImagenMedicaCreateSerializer,
+                         CargaImagenMedicaSerializer)
 from dentistas.models import Dentista
+from dental_erp.exports import Columna, ExportMixin, edad
+from dental_erp.pagination import StandardPagination, estimate_count
+from .autocomplete import autocomplete
+from . import cargas, importacion, procesamiento
 
-class PacienteViewSet(viewsets.ModelViewSet):
+class PacienteViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing patients (Pacientes)
     Provides CRUD operations and additional functionality
     """
     queryset = Paciente.objects.all()
     permission_classes = [permissions.AllowAny]  # Allow unauthenticated access for development
+    export_name = 'pacientes'
+    export_columns = (
+        Columna('numero_expediente', 'Número de expediente'),
+        Columna('nombre', 'Nombre'),
+        Columna('apellido_paterno', 'Apellido paterno'),
+        Columna('apellido_materno', 'Apellido materno'),
+        Columna('fecha_nacimiento', 'Fecha de nacimiento'),
+        Columna('edad', 'Edad', 'fecha_nacimiento', edad),
+        Columna('sexo', 'Sexo'),
+        Columna('telefono', 'Teléfono'),
+        Columna('email', 'Email'),
+        Columna('direccion', 'Dirección'),
+        Columna('tipo_sangre', 'Tipo de sangre'),
+        Columna('alergias', 'Alergias'),
+        Columna('medicamentos', 'Medicamentos'),
+        Columna('enfermedades_cronicas', 'Enfermedades crónicas'),
+        Columna('contacto_emergencia_nombre', 'Contacto de emergencia'),
+        Columna('contacto_emergencia_telefono', 'Teléfono de emergencia'),
+        Columna('contacto_emergencia_relacion', 'Relación del contacto'),
+        Columna('dentista_asignado', 'Cédula del dentista asignado', 'dentista_asignado__cedula_profesional'),
+        Columna('fecha_registro', 'Fecha de registro'),
+        Columna('activo', 'Activo'),
+    )
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -78,20 +111,21 @@ class PacienteViewSet(viewsets.ModelViewSet):
         
         return queryset.order_by('-fecha_registro')
     
-    def perform_create(self, serializer):
-        """Automatically assign the authenticated dentist as creator"""
-        creado_por = None
-        
+    def get_dentista(self):
+        """Dentista autenticado o, en desarrollo, el primero"""
         # Try to get authenticated dentist
         if hasattr(self.request, 'user') and self.request.user.is_authenticated:
             try:
-                creado_por = Dentista.objects.get(user=self.request.user)
+                return Dentista.objects.get(user=self.request.user)
             except Dentista.DoesNotExist:
                 pass
         
         # Fallback: get first dentist (for development)
-        if not creado_por:
-            creado_por = Dentista.objects.first()
+        return Dentista.objects.first()
+    
+    def perform_create(self, serializer):
+        """Automatically assign the authenticated dentist as creator"""
+        creado_por = self.get_dentista()
         
         if creado_por:
             serializer.save(creado_por=creado_por)
@@ -99,6 +133,85 @@ class PacienteViewSet(viewsets.ModelViewSet):
             # This should rarely happen, but just in case
             serializer.save()
     
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Typo-tolerant patient lookup for the front desk dropdown
+        
+        GET /api/pacientes/autocomplete/?q=garsia&limit=8
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        
+        return Response(autocomplete(query, limit=limit))
+    
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def importar(self, request):
+        """
+        Importación masiva de pacientes (ver ``pacientes.importacion``)
+        
+        POST /api/pacientes/importar/ (multipart: ``archivo`` y, si la
+        extensión no lo indica, ``formato`` csv, json o ndjson)
+        
+        Responde con el resumen y los primeros errores. Con ``?rechazos=1``
+        responde con el archivo de filas rechazadas y el resumen en las
+        cabeceras ``X-Importados`` y ``X-Rechazados``.
+        
+        Los pacientes quedan creados por el dentista del usuario; sin
+        dentista la importación se rechaza.
+        """
+        dentista = Dentista.objects.filter(user=request.user).first()
+        if dentista is None:
+            return Response(
+                {'error': 'El usuario no tiene un dentista asociado'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response({'error': 'Falta el archivo'}, status=status.HTTP_400_BAD_REQUEST)
+        formato = (request.data.get('formato') or importacion.formato_de(archivo.name) or '').lower()
+        if formato not in importacion.LECTORES:
+            return Response(
+                {'error': f"Formato no válido. Opciones: {', '.join(importacion.LECTORES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            lote = int(request.data.get('lote', importacion.LOTE))
+        except ValueError:
+            lote = importacion.LOTE
+        
+        rechazos = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        texto = io.TextIOWrapper(rechazos, encoding='utf-8', newline='')
+        archivo.seek(0)
+        try:
+            resumen = importacion.importar(
+                archivo.file, formato, dentista, rechazos=texto,
+                lote=min(max(lote, 1), 5000), alias=importacion.alias_de(self.export_columns),
+            )
+        except importacion.ErrorImportacion as e:
+            texto.close()
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if request.query_params.get('rechazos', '').lower() not in ['true', '1', 'yes']:
+            texto.close()
+            return Response(resumen)
+        
+        texto.flush()
+        texto.detach()
+        rechazos.seek(0)
+        extension = 'csv' if formato == 'csv' else 'ndjson'
+        response = FileResponse(
+            rechazos, as_attachment=True, filename=f'pacientes-rechazos.{extension}',
+            content_type='text/csv; charset=utf-8' if extension == 'csv' else 'application/x-ndjson',
+        )
+        response['X-Importados'] = resumen['importados']
+        response['X-Rechazados'] = resumen['rechazados']
+        return response
+    
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
         """Toggle patient active status"""
@@ -197,7 +310,11 @@ class PacienteStatsView(APIView):
 class PacienteSearchView(APIView):
     """
     Advanced search for patients
+    
+    Accepts ``?pagination=cursor`` for keyset pagination and
+    ``?count=exact|approx|none`` (see dental_erp.pagination).
     """
+    cursor_ordering = ('apellido_paterno', 'nombre')
     
     def get(self, request):
         query = request.query_params.get('q', '')
@@ -233,22 +350,45 @@ class PacienteSearchView(APIView):
         # Apply filters
         queryset = queryset.filter(**filters)
         
+        paginator = StandardPagination()
+        paginator.page_size = int(request.query_params.get('page_size', 20))
+        
+        # Keyset pagination: no OFFSET and no COUNT unless requested
+        if paginator.use_cursor(request):
+            results = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = PacienteSerializer(results, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        
         # Pagination
-        page_size = int(request.query_params.get('page_size', 20))
+        page_size = paginator.page_size
         page = int(request.query_params.get('page', 1))
         start = (page - 1) * page_size
         end = start + page_size
         
-        total_count = queryset.count()
-        results = queryset[start:end]
+        count_mode = paginator.get_count_mode(request, 'exact')
+        count_is_estimate = False
+        if count_mode == 'exact':
+            total_count = queryset.count()
+            results = list(queryset[start:end])
+            has_next = end < total_count
+        else:
+            # Fetch one extra row to know if there is a next page
+            results = list(queryset[start:end + 1])
+            has_next = len(results) > page_size
+            results = results[:page_size]
+            total_count = None
+            if count_mode == 'approx':
+                total_count, count_is_estimate = estimate_count(queryset)
         
         serializer = PacienteSerializer(results, many=True)
         
         return Response({
             'count': total_count,
+            'count_is_estimate': count_is_estimate,
             'page': page,
             'page_size': page_size,
-            'total_pages': (total_count + page_size - 1) // page_size,
+            'total_pages': (total_count + page_size - 1) // page_size if total_count is not None else None,
+            'has_next': has_next,
             'results': serializer.data
         })
 
@@ -349,6 +489,7 @@ class BitacoraCitaViewSet(viewsets.ModelViewSet):
     """
     queryset = BitacoraCita.objects.all()
     permission_classes = [permissions.AllowAny]  # Allow unauthenticated access for development
+    cursor_ordering = ('-fecha_hora',)
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -468,22 +609,122 @@ class ImagenMedicaViewSet(viewsets.ModelViewSet):
         
         return queryset.order_by('-fecha_toma')
     
-    def perform_create(self, serializer):
-        """Automatically assign the authenticated dentist and process image"""
-        dentista = None
-        
+    def get_dentista(self):
+        """Dentista autenticado o, en desarrollo, el primero"""
         # Try to get authenticated dentist
         if hasattr(self.request, 'user') and self.request.user.is_authenticated:
             try:
-                dentista = Dentista.objects.get(user=self.request.user)
+                return Dentista.objects.get(user=self.request.user)
             except Dentista.DoesNotExist:
                 pass
         
         # Fallback: get first dentist (for development)
-        if not dentista:
-            dentista = Dentista.objects.first()
+        return Dentista.objects.first()
+    
+    def perform_create(self, serializer):
+        """Automatically assign the authenticated dentist and process image"""
+        dentista = self.get_dentista()
         
         if dentista:
             serializer.save(dentista_responsable=dentista)
         else:
             serializer.save()
+    
+    @action(detail=True, methods=['get'], url_path='estado')
+    def estado_procesamiento(self, request, pk=None):
+        """
+        Estado de la miniatura y los metadatos, que se generan en segundo
+        plano. Con ``?esperar=<segundos>`` (máximo 30) la respuesta espera
+        a que terminen.
+        """
+        imagen = self.get_object()
+        try:
+            segundos = float(request.query_params.get('esperar', 0))
+        except ValueError:
+            segundos = 0
+        if segundos > 0:
+            return Response(procesamiento.esperar(imagen, segundos))
+        return Response(procesamiento.estado(imagen))
+    
+    def respuesta_carga(self, carga, status_code=status.HTTP_200_OK):
+        return Response(
+            CargaImagenMedicaSerializer(carga).data,
+            status=status_code,
+            headers={
+                'Upload-Offset': str(carga.recibido),
+                'Upload-Length': str(carga.tamaño),
+                'Location': reverse('pacientes:imagenmedica-carga', kwargs={'carga_id': carga.pk}),
+            }
+        )
+    
+    @action(detail=False, methods=['post'], url_path='cargas')
+    def iniciar_carga(self, request):
+        """
+        Inicia una subida por partes para archivos grandes (tomografías
+        CBCT, panorámicas en PNG...). Ver ``pacientes.cargas``.
+        """
+        serializer = CargaImagenMedicaSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        carga = cargas.iniciar(dentista=self.get_dentista(), **serializer.validated_data)
+        return self.respuesta_carga(carga, status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get', 'patch', 'delete'], url_path=r'cargas/(?P<carga_id>[^/.]+)', url_name='carga')
+    def carga(self, request, carga_id=None):
+        """
+        GET/HEAD: bytes recibidos (``Upload-Offset``).
+        PATCH: envía la parte que empieza en ``Upload-Offset``; la última
+        crea la imagen y devuelve 201 con ella.
+        DELETE: cancela la subida.
+        """
+        carga = get_object_or_404(CargaImagenMedica, pk=carga_id)
+        if request.method == 'DELETE':
+            cargas.cancelar(carga)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method != 'PATCH':
+            return self.respuesta_carga(carga)
+        
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            longitud = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Falta la cabecera Upload-Offset o no es un número'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if offset < 0 or longitud < 0 or offset + longitud > carga.tamaño:
+            return Response(
+                {'error': 'La parte excede el tamaño declarado del archivo'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        def crear_imagen(archivo):
+            serializer = ImagenMedicaCreateSerializer(data={**carga.datos, 'archivo': archivo})
+            serializer.is_valid(raise_exception=True)
+            if carga.dentista_id:
+                return serializer.save(dentista_responsable=carga.dentista)
+            return serializer.save()
+        
+        try:
+            carga = cargas.recibir(carga, offset, request.stream, longitud, crear_imagen)
+        except cargas.OffsetInvalido as e:
+            if e.offset is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            return Response(
+                {'error': str(e), 'offset': e.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(e.offset)}
+            )
+        except cargas.ChecksumInvalido as e:
+            return Response(
+                {'error': str(e), 'offset': 0},
+                status=status.HTTP_400_BAD_REQUEST,
+                headers={'Upload-Offset': '0'}
+            )
+        
+        if carga.imagen is not None:
+            return Response(
+                ImagenMedicaSerializer(carga.imagen, context=self.get_serializer_context()).data,
+                status=status.HTTP_201_CREATED,
+                headers={'Upload-Offset': str(carga.recibido)}
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT, headers={'Upload-Offset': str(carga.recibido)})
@@ -0,0 +1,220 @@
+"""
+Estadísticas de reseñas precalculadas por objeto.
+
+``ReviewAggregate`` guarda, por objeto reseñado y visibilidad, el número de
+reseñas, la suma de calificaciones, el histograma por estrellas, las compras
+verificadas y las reseñas creadas por día en los últimos ``RECENT_DAYS``
+días. Se mantiene de forma incremental desde ``reviews.signals``:
+
+- Alta y baja de una reseña: se suma o resta su aporte a la fila de su objeto
+- Cambio de calificación, estado, compra verificada u objeto: se resta el
+  aporte anterior y se suma el nuevo (sólo si cambió)
+- La fila se borra cuando su objeto se queda sin reseñas
+
+Cada ajuste bloquea la fila (``select_for_update``) porque los buckets por
+día son un JSON que se modifica en Python. ``ReviewViewSet.stats`` lee una
+sola fila por índice en lugar de agregar las reseñas.
+
+Las reseñas recientes se cuentan por día local: entran las de los días a
+partir de ``localdate(now - RECENT_DAYS)``, incluido el día completo del
+corte. ``update()`` sobre reseñas no envía señales; ``rebuild`` reconstruye
+todo a partir de las reseñas y sirve también para verificar la consistencia
+(``rebuild_review_aggregates --check``).
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Review, ReviewAggregate
+
+RECENT_DAYS = 30
+
+# Estados que ven los usuarios que no son staff (ver ReviewViewSet.get_queryset)
+VISIBLE_STATUSES = ('published', 'approved')
+
+COUNTERS = ('count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5', 'verified_count')
+
+
+def recent_cutoff():
+    """Primer día (ISO) que cuenta como reciente"""
+    return timezone.localdate(timezone.now() - timedelta(days=RECENT_DAYS)).isoformat()
+
+
+def contribution(review):
+    """
+    Aporte de una reseña a su agregado.
+
+    Returns:
+        tuple: ``((content_type_id, object_id, visible), rating, verificada, día)``
+    """
+    return (
+        (review.content_type_id, str(review.object_id), review.status in VISIBLE_STATUSES),
+        review.rating,
+        review.is_verified_purchase,
+        timezone.localdate(review.created_at).isoformat() if review.created_at else None,
+    )
+
+
+def add(aggregate, contribution, sign, cutoff):
+    """Sumar (``sign=1``) o restar (``sign=-1``) un aporte a un agregado en memoria"""
+    _, rating, verified, day = contribution
+    aggregate.count += sign
+    aggregate.rating_sum += sign * rating
+    setattr(aggregate, f'rating_{rating}', getattr(aggregate, f'rating_{rating}') + sign)
+    if verified:
+        aggregate.verified_count += sign
+    if day is not None and day >= cutoff:
+        aggregate.recent_days[day] = aggregate.recent_days.get(day, 0) + sign
+    aggregate.recent_days = prune(aggregate.recent_days, cutoff)
+
+
+def prune(days, cutoff):
+    """Buckets por día sin los días anteriores al corte ni los vacíos"""
+    return {day: n for day, n in sorted(days.items()) if day >= cutoff and n}
+
+
+def apply(contribution, sign, using='default'):
+    """
+    Sumar o restar el aporte de una reseña a la fila de su objeto.
+
+    Args:
+        contribution: Resultado de ``contribution(review)``
+        sign: 1 para sumar, -1 para restar
+    """
+    (content_type_id, object_id, visible), _, _, _ = contribution
+    aggregates = ReviewAggregate.objects.using(using).select_for_update()
+    lookup = {'content_type_id': content_type_id, 'object_id': object_id, 'visible': visible}
+
+    with transaction.atomic(using=using):
+        if sign > 0:
+            aggregate, _ = aggregates.get_or_create(**lookup)
+        else:
+            # Restar de una fila que no existe (por ejemplo al borrar en
+            # cascada el ContentType) no debe crearla
+            aggregate = aggregates.filter(**lookup).first()
+            if aggregate is None:
+                return
+        add(aggregate, contribution, sign, recent_cutoff())
+        if aggregate.count:
+            aggregate.save(using=using)
+        else:
+            # Un objeto sin reseñas no tiene fila, igual que tras ``rebuild``
+            aggregate.delete(using=using)
+
+
+def update(old, new, using='default'):
+    """Pasar de un aporte anterior a uno nuevo (cualquiera puede ser None)"""
+    if old == new:
+        return
+    with transaction.atomic(using=using):
+        if old is not None:
+            apply(old, -1, using)
+        if new is not None:
+            apply(new, 1, using)
+
+
+def accumulate(reviews, cutoff=None):
+    """
+    Calcular los agregados de un queryset de reseñas en una pasada.
+
+    Returns:
+        dict: ``{(content_type_id, object_id, visible): ReviewAggregate}`` sin guardar
+    """
+    cutoff = cutoff or recent_cutoff()
+    aggregates = {}
+    rows = reviews.order_by().prefetch_related(None).values_list(
+        'content_type_id', 'object_id', 'status', 'rating', 'is_verified_purchase', 'created_at'
+    )
+    for content_type_id, object_id, status, rating, verified, created_at in rows.iterator():
+        key = (content_type_id, object_id, status in VISIBLE_STATUSES)
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = ReviewAggregate(
+                content_type_id=content_type_id, object_id=object_id, visible=key[2], recent_days={}
+            )
+        add(aggregate, (key, rating, verified, timezone.localdate(created_at).isoformat()), 1, cutoff)
+    return aggregates
+
+
+def state(aggregate, cutoff):
+    """Valores de un agregado para compararlo con otro"""
+    if aggregate is None:
+        return None
+    return tuple(getattr(aggregate, name) for name in COUNTERS) + (prune(aggregate.recent_days, cutoff),)
+
+
+def rebuild(using='default', save=True):
+    """
+    Reconstruir los agregados y escribir sólo los que difieren.
+
+    Args:
+        save: Si es False sólo se informan las diferencias
+
+    Returns:
+        list: Tuplas ``(clave, actual, esperado)`` de las filas que no
+        coincidían; ``actual`` es None si faltaba la fila y ``esperado`` es
+        None si sobraba
+    """
+    cutoff = recent_cutoff()
+    expected = accumulate(Review.objects.using(using), cutoff)
+    current = {
+        (aggregate.content_type_id, aggregate.object_id, aggregate.visible): aggregate
+        for aggregate in ReviewAggregate.objects.using(using)
+    }
+
+    differences = []
+    for key in sorted(current.keys() | expected.keys(), key=str):
+        actual = state(current.get(key), cutoff)
+        wanted = state(expected.get(key), cutoff)
+        if actual != wanted:
+            differences.append((key, actual, wanted))
+
+    if save and differences:
+        new = []
+        changed = []
+        stale = []
+        for key, actual, wanted in differences:
+            if wanted is None:
+                stale.append(current[key].pk)
+            elif actual is None:
+                new.append(expected[key])
+            else:
+                expected[key].pk = current[key].pk
+                changed.append(expected[key])
+
+        with transaction.atomic(using=using):
+            ReviewAggregate.objects.using(using).filter(pk__in=stale).delete()
+            ReviewAggregate.objects.using(using).bulk_create(new, batch_size=500)
+            ReviewAggregate.objects.using(using).bulk_update(
+                changed, COUNTERS + ('recent_days',), batch_size=500
+            )
+
+    return differences
+
+
+def summarize(aggregates, cutoff=None):
+    """
+    Estadísticas de ``ReviewStatsSerializer`` a partir de uno o más agregados.
+
+    Args:
+        aggregates: Iterable de ``ReviewAggregate`` (por ejemplo las filas
+            visibles de un objeto)
+    """
+    cutoff = cutoff or recent_cutoff()
+    totals = dict.fromkeys(COUNTERS, 0)
+    recent = 0
+    for aggregate in aggregates:
+        for name in COUNTERS:
+            totals[name] += getattr(aggregate, name)
+        recent += sum(n for day, n in aggregate.recent_days.items() if day >= cutoff)
+
+    total = totals['count']
+    return {
+        'total_reviews': total,
+        'average_rating': round(totals['rating_sum'] / total, 2) if total else 0.0,
+        'verified_purchases': totals['verified_count'],
+        'rating_distribution': {str(i): totals[f'rating_{i}'] for i in range(1, 6)},
+        'recent_reviews': recent,
+    }
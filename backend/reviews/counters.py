@@ -0,0 +1,164 @@
+"""
+Contadores de reseñas: votos útiles y reportes.
+
+Los contadores se incrementan en la base de datos con ``update()`` y
+``F()`` en lugar de leer, sumar en Python y guardar: es una sola consulta,
+no se pierden incrementos concurrentes y no se dispara la cadena de
+``pre_save``/``post_save`` de ``Review`` (que consulta la reseña anterior,
+ajusta ``ReviewAggregate`` y encola notificaciones). En su lugar se envía
+``review_counters_changed``:
+
+    @receiver(review_counters_changed)
+    def on_counters_changed(sender, review_id, deltas, using, **kwargs):
+        ...
+
+La instancia en memoria se actualiza sumando el mismo incremento, así que
+su valor puede no incluir los votos concurrentes de otras peticiones.
+
+Con ``REVIEW_COUNTERS_BUFFERED = True`` los votos útiles se acumulan en
+memoria por reseña y se escriben juntos (un UPDATE por reseña) cuando han
+pasado ``REVIEW_COUNTERS_FLUSH_SECONDS`` desde la última escritura, al
+llamar a ``flush()`` o al terminar el proceso. El buffer es por proceso y
+sus incrementos no se revierten con la transacción de la petición: sirve
+para reseñas muy votadas donde un conteo aproximado por unos segundos es
+aceptable. Los reportes nunca se acumulan porque la auto-moderación
+depende del conteo exacto.
+"""
+
+import atexit
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.dispatch import Signal
+
+# Enviada tras escribir incrementos: sender=modelo, review_id, deltas ({campo: incremento}), using
+review_counters_changed = Signal()
+
+# Reportes a partir de los cuales una reseña pasa a moderación
+REPORTS_TO_MODERATE = 3
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def apply(model, review_id, deltas, using, **values):
+    """
+    Escribir incrementos (y valores fijos) de una reseña con un UPDATE.
+
+    Los decrementos no bajan de cero.
+
+    Returns:
+        int: Filas actualizadas (0 si la reseña ya no existe)
+    """
+    expressions = {
+        field: F(field) + delta if delta > 0 else Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    }
+    updated = model._default_manager.using(using).filter(pk=review_id).update(**expressions, **values)
+    if updated:
+        review_counters_changed.send(sender=model, review_id=review_id, deltas=dict(deltas), using=using)
+    return updated
+
+
+class CounterBuffer:
+    """
+    Incrementos pendientes por reseña, compartidos entre los hilos del proceso.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, model, review_id, deltas, using):
+        """Acumular incrementos y escribirlos si ya toca"""
+        interval = _setting('REVIEW_COUNTERS_FLUSH_SECONDS', 5)
+        with self._lock:
+            self._pending.setdefault((model, using, review_id), Counter()).update(deltas)
+            due = time.monotonic() - self._flushed >= interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Escribir todos los incrementos pendientes.
+
+        Returns:
+            int: Reseñas actualizadas
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed = time.monotonic()
+
+        updated = 0
+        for (model, using, review_id), deltas in pending.items():
+            deltas = {field: delta for field, delta in deltas.items() if delta}
+            if deltas:
+                updated += apply(model, review_id, deltas, using)
+        return updated
+
+
+buffer = CounterBuffer()
+atexit.register(buffer.flush)
+
+
+def flush():
+    """Escribir los votos acumulados en modo buffer"""
+    return buffer.flush()
+
+
+def increment(review, buffered=None, **deltas):
+    """
+    Sumar ``deltas`` (``campo=incremento``) a los contadores de una reseña.
+
+    Args:
+        review: Instancia de ``Review``; sus atributos se actualizan en memoria
+        buffered: Acumular en memoria; por defecto ``REVIEW_COUNTERS_BUFFERED``
+    """
+    model = type(review)
+    using = review._state.db or router.db_for_write(model, instance=review)
+    if buffered is None:
+        buffered = _setting('REVIEW_COUNTERS_BUFFERED', False)
+
+    if buffered:
+        buffer.add(model, review.pk, deltas, using)
+    else:
+        apply(model, review.pk, deltas, using)
+
+    for field, delta in deltas.items():
+        setattr(review, field, max(0, getattr(review, field) + delta))
+
+
+def report(review):
+    """
+    Contar un reporte y pasar la reseña a moderación al llegar a
+    ``REPORTS_TO_MODERATE``.
+
+    El cambio de estado sí se guarda con ``save()``: es un cambio real de la
+    reseña y debe ajustar sus agregados como cualquier otro.
+    """
+    model = type(review)
+    using = review._state.db or router.db_for_write(model, instance=review)
+
+    with transaction.atomic(using=using):
+        apply(model, review.pk, {'report_count': 1}, using, is_reported=True)
+        # El UPDATE deja la fila bloqueada hasta el final de la transacción
+        review.report_count, status = model._default_manager.using(using).filter(
+            pk=review.pk
+        ).values_list('report_count', 'status').get()
+        review.is_reported = True
+
+        if review.report_count >= REPORTS_TO_MODERATE and status != 'moderated':
+            review.status = 'moderated'
+            review.save(update_fields=['status'])
+        else:
+            review.status = status
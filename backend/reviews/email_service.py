@@ -4,7 +4,7 @@ Handles all email notifications related to reviews functionality.
 """
 
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Tuple
 from django.conf import settings
 from django.core.mail import send_mail, send_mass_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
@@ -14,6 +14,9 @@ from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 
+from emails import outbox
+from emails.bulk import BulkSender
+
 from .models import Review, ReviewReport
 
 logger = logging.getLogger(__name__)
@@ -31,6 +34,7 @@ class EmailService:
     Features:
     - Review notifications (new reviews, moderation, etc.)
     - Template-based emails with HTML/text versions
+    - Notifications queued in the email outbox (see emails.outbox)
     - Bulk email sending
     - Error handling and logging
     - Rate limiting and spam prevention
@@ -99,6 +103,56 @@ class EmailService:
                 raise EmailServiceError(f"Failed to send email: {str(e)}")
             return False
     
+    def _queue_email(
+        self,
+        subject: str,
+        message: str,
+        recipient_list: List[str],
+        html_message: Optional[str] = None,
+        categoria: str = '',
+        clave_idempotencia: Optional[str] = None
+    ) -> bool:
+        """
+        Queue an email in the outbox instead of sending it in the request.
+        
+        Used by the notifications fired from ``reviews.signals``; the
+        ``process_email_outbox`` worker delivers them with the Django email
+        backend, retrying temporary failures.
+        
+        Args:
+            subject: Email subject
+            message: Plain text message
+            recipient_list: List of recipient emails
+            html_message: Optional HTML version of the message
+            categoria: Notification type stored with the queued email
+            clave_idempotencia: Optional key; queuing the same key twice
+                returns the email already queued
+            
+        Returns:
+            bool: True if the email was queued, False otherwise
+        """
+        try:
+            if not recipient_list:
+                logger.warning("No recipients provided for email")
+                return False
+            
+            queued = outbox.enqueue(
+                destinatarios=recipient_list,
+                asunto=f"{self.subject_prefix}{subject}",
+                html=html_message or '',
+                texto=message,
+                remitente=self.from_email,
+                proveedor='django',
+                categoria=categoria,
+                clave_idempotencia=clave_idempotencia,
+            )
+            logger.info(f"Email queued for {len(recipient_list)} recipients: {subject} - ID: {queued.pk}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to queue email '{subject}': {str(e)}")
+            return False
+    
     def _render_email_template(
         self, 
         template_name: str, 
@@ -176,11 +230,13 @@ class EmailService:
             
             # Send email
             subject = f"Nueva reseña: {review.title}"
-            return self._send_email(
+            return self._queue_email(
                 subject=subject,
                 message=text_content,
                 recipient_list=recipients,
-                html_message=html_content
+                html_message=html_content,
+                categoria='review_nueva',
+                clave_idempotencia=f'review-nueva:{review.id}'
             )
             
         except Exception as e:
@@ -233,11 +289,12 @@ class EmailService:
             html_content, text_content = self._render_email_template(template_name, context)
             
             # Send email
-            return self._send_email(
+            return self._queue_email(
                 subject=subject,
                 message=text_content,
                 recipient_list=recipients,
-                html_message=html_content
+                html_message=html_content,
+                categoria='review_moderacion'
             )
             
         except Exception as e:
@@ -275,11 +332,13 @@ class EmailService:
             
             # Send email
             subject = f"Reseña reportada: {report.review.title}"
-            return self._send_email(
+            return self._queue_email(
                 subject=subject,
                 message=text_content,
                 recipient_list=recipients,
-                html_message=html_content
+                html_message=html_content,
+                categoria='review_reporte',
+                clave_idempotencia=f'review-reporte:{report.id}'
             )
             
         except Exception as e:
@@ -326,11 +385,13 @@ class EmailService:
             
             # Send email
             subject = "Tu reseña fue marcada como útil"
-            return self._send_email(
+            return self._queue_email(
                 subject=subject,
                 message=text_content,
                 recipient_list=recipients,
-                html_message=html_content
+                html_message=html_content,
+                categoria='review_util',
+                clave_idempotencia=f'review-util:{review.id}:{voter.id}'
             )
             
         except Exception as e:
@@ -341,49 +402,85 @@ class EmailService:
         self, 
         subject: str, 
         message: str,
-        recipient_list: List[str],
-        html_message: Optional[str] = None
+        recipient_list: Iterable[str],
+        html_message: Optional[str] = None,
+        concurrency: int = 4
     ) -> int:
         """
         Send bulk notification to multiple recipients.
         
+        Each recipient gets an individually addressed message (see
+        ``send_bulk``).
+        
         Args:
             subject: Email subject
             message: Plain text message
-            recipient_list: List of recipient emails
+            recipient_list: Recipient emails (any iterable)
             html_message: Optional HTML version
+            concurrency: Parallel sends, each on its own open connection
             
         Returns:
             int: Number of emails sent successfully
         """
         try:
-            if not recipient_list:
-                logger.warning("No recipients provided for bulk notification")
-                return 0
-            
-            # Chunk recipients to avoid overwhelming the email server
-            chunk_size = 50
-            total_sent = 0
-            
-            for i in range(0, len(recipient_list), chunk_size):
-                chunk = recipient_list[i:i + chunk_size]
-                
-                if self._send_email(
-                    subject=subject,
-                    message=message,
-                    recipient_list=chunk,
-                    html_message=html_message,
-                    fail_silently=True
-                ):
-                    total_sent += len(chunk)
-            
-            logger.info(f"Bulk notification sent to {total_sent}/{len(recipient_list)} recipients")
-            return total_sent
+            resumen = self.send_bulk(
+                subject=subject,
+                message=message,
+                recipients=enumerate((email for email in recipient_list if email), start=1),
+                html_message=html_message,
+                concurrency=concurrency
+            )
+            logger.info(
+                f"Bulk notification sent to {resumen['enviados']}/"
+                f"{resumen['enviados'] + resumen['fallidos']} recipients "
+                f"({resumen['por_segundo']} msg/s)"
+            )
+            return resumen['enviados']
             
         except Exception as e:
             logger.error(f"Failed to send bulk notification: {str(e)}")
             return 0
     
+    def send_bulk(
+        self,
+        subject: str,
+        message: str,
+        recipients: Iterable[Tuple[int, str]],
+        html_message: Optional[str] = None,
+        **sender_options
+    ) -> Dict[str, Any]:
+        """
+        Send one message per recipient with ``emails.bulk.BulkSender``.
+        
+        Connections are opened once per worker and reused, and recipients
+        are consumed lazily, so ``recipients`` can stream from a queryset.
+        
+        Args:
+            subject: Email subject
+            message: Plain text message
+            recipients: ``(key, email)`` pairs with increasing keys
+            html_message: Optional HTML version
+            **sender_options: ``BulkSender`` options (concurrency,
+                on_result, checkpoint, limiter...)
+            
+        Returns:
+            dict: Summary with sent/failed counts, last key and throughput
+        """
+        full_subject = f"{self.subject_prefix}{subject}"
+        
+        def build_message(clave, email):
+            email_message = EmailMultiAlternatives(
+                subject=full_subject,
+                body=message,
+                from_email=self.from_email,
+                to=[email]
+            )
+            if html_message:
+                email_message.attach_alternative(html_message, "text/html")
+            return email_message
+        
+        return BulkSender(build_message, **sender_options).send(recipients)
+    
     def send_weekly_review_digest(self) -> bool:
         """
         Send weekly digest of reviews to administrators.
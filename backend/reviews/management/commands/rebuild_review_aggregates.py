@@ -0,0 +1,41 @@
+"""
+Management command for rebuilding or checking the review aggregates.
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from reviews import aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-object review aggregates (ReviewAggregate) or check that they are up to date'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only check; exit with an error if any aggregate does not match the reviews'
+        )
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        differences = aggregates.rebuild(save=not options['check'])
+        elapsed_time = time.time() - start_time
+
+        for (content_type_id, object_id, visible), actual, expected in differences:
+            self.stdout.write(
+                f"- {content_type_id}:{object_id} ({'visible' if visible else 'hidden'}): "
+                f"{actual or 'missing'} -> {expected or 'stale'}"
+            )
+
+        if options['check']:
+            if differences:
+                raise CommandError(f"{len(differences)} review aggregates out of date")
+            self.stdout.write(self.style.SUCCESS(
+                f"Review aggregates up to date ({elapsed_time:.2f} seconds)"
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(differences)} review aggregates fixed in {elapsed_time:.2f} seconds"
+        ))
@@ -2,16 +2,28 @@
 Management command for sending bulk email notifications.
 """
 
+import csv
 import logging
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
+from emails.models import EnvioMasivo
+from emails.outbox import RateLimiter
 from reviews.email_service import email_service
 from reviews.models import Review
 
 logger = logging.getLogger(__name__)
 
+# Recipient sources for --audience, as querysets of active users with email
+AUDIENCES = {
+    'users': lambda: User.objects.filter(is_active=True),
+    'reviewers': lambda: User.objects.filter(
+        is_active=True, pk__in=Review.objects.values('user_id')
+    ),
+    'staff': lambda: User.objects.filter(is_active=True, is_staff=True),
+}
+
 
 class Command(BaseCommand):
     help = 'Send bulk email notifications for reviews system'
@@ -40,6 +52,39 @@ class Command(BaseCommand):
             nargs='+',
             help='List of email recipients (for bulk_notification type)'
         )
+        parser.add_argument(
+            '--audience',
+            type=str,
+            choices=list(AUDIENCES),
+            help='Stream recipients from the database instead of --recipients'
+        )
+        parser.add_argument(
+            '--job',
+            type=str,
+            help='Name of the bulk job; running it again resumes from its checkpoint'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the saved checkpoint of --job and start over'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Parallel sends, each on its own open connection'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=0,
+            help='Maximum emails per second (0 = unlimited)'
+        )
+        parser.add_argument(
+            '--report',
+            type=str,
+            help='CSV file with the result for each recipient'
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
@@ -133,35 +178,116 @@ class Command(BaseCommand):
         
         subject = options.get('subject')
         message = options.get('message')
-        recipients = options.get('recipients', [])
+        recipients = options.get('recipients') or []
+        audience = options.get('audience')
         
         if not subject:
             raise CommandError('Subject is required for bulk notification')
         if not message:
             raise CommandError('Message is required for bulk notification')
-        if not recipients:
-            raise CommandError('Recipients list is required for bulk notification')
+        if not recipients and not audience:
+            raise CommandError('Recipients list or --audience is required for bulk notification')
+        if recipients and audience:
+            raise CommandError('Use either --recipients or --audience, not both')
+        
+        job = None
+        ultimo_id = 0
+        if options.get('job'):
+            job, created = EnvioMasivo.objects.get_or_create(
+                nombre=options['job'],
+                defaults={'asunto': subject, 'audiencia': audience or 'recipients'}
+            )
+            if options.get('restart') and not created:
+                job.ultimo_id = job.enviados = job.fallidos = 0
+                job.estado = 'en_proceso'
+                job.fecha_fin = None
+                job.save()
+            elif job.estado == 'completado':
+                self.stdout.write(self.style.WARNING(
+                    f'   ℹ️  Job "{job.nombre}" already completed ({job.enviados} sent); use --restart to send again'
+                ))
+                return
+            elif not created:
+                self.stdout.write(f'   ↩️  Resuming job "{job.nombre}" after key {job.ultimo_id} '
+                                  f'({job.enviados} sent, {job.fallidos} failed so far)')
+            ultimo_id = job.ultimo_id
+        
+        # Recipients as (key, email) pairs with increasing keys: the position
+        # in --recipients or the user id, streamed from the database
+        if audience:
+            queryset = AUDIENCES[audience]().exclude(email='').filter(pk__gt=ultimo_id).order_by('pk')
+            total = queryset.count()
+            pairs = queryset.values_list('pk', 'email').iterator(chunk_size=2000)
+        else:
+            total = max(len(recipients) - ultimo_id, 0)
+            pairs = ((i, email) for i, email in enumerate(recipients, start=1) if i > ultimo_id)
         
         self.stdout.write(f'   📧 Subject: {subject}')
         self.stdout.write(f'   📝 Message: {message[:100]}...')
-        self.stdout.write(f'   👥 Recipients: {len(recipients)} emails')
+        self.stdout.write(f'   👥 Recipients: {total} emails')
         
         if dry_run:
             self.stdout.write(
-                self.style.WARNING(f'   🔍 DRY RUN - Bulk notification would be sent to {len(recipients)} recipients')
+                self.style.WARNING(f'   🔍 DRY RUN - Bulk notification would be sent to {total} recipients')
             )
-            for recipient in recipients:
+            for _, recipient in pairs:
                 self.stdout.write(f'     - {recipient}')
-        else:
-            sent_count = email_service.send_bulk_notification(
+            return
+        
+        base_enviados = job.enviados if job else 0
+        base_fallidos = job.fallidos if job else 0
+        
+        def checkpoint(ultimo, enviados, fallidos):
+            if job is not None:
+                EnvioMasivo.objects.filter(pk=job.pk).update(
+                    ultimo_id=ultimo,
+                    enviados=base_enviados + enviados,
+                    fallidos=base_fallidos + fallidos,
+                    fecha_actualizacion=timezone.now()
+                )
+        
+        report_file = open(options['report'], 'a', newline='') if options.get('report') else None
+        writer = csv.writer(report_file) if report_file else None
+        if report_file and report_file.tell() == 0:
+            writer.writerow(['key', 'email', 'status', 'error', 'ms'])
+        
+        def on_result(result):
+            if writer:
+                writer.writerow([
+                    result.clave, result.email, 'sent' if result.enviado else 'failed',
+                    result.error or '', result.duracion_ms
+                ])
+            if not result.enviado:
+                self.stdout.write(self.style.ERROR(f'     ❌ {result.email}: {result.error}'))
+        
+        completed = False
+        try:
+            resumen = email_service.send_bulk(
                 subject=subject,
                 message=message,
-                recipient_list=recipients
+                recipients=pairs,
+                concurrency=options.get('concurrency') or 4,
+                limiter=RateLimiter({'django': options['rate']}) if options.get('rate') else None,
+                on_result=on_result,
+                checkpoint=checkpoint
             )
-            
-            self.stdout.write(
-                self.style.SUCCESS(f'   ✅ Bulk notification sent to {sent_count}/{len(recipients)} recipients')
+            completed = True
+        finally:
+            if report_file:
+                report_file.close()
+            if job is not None:
+                job.refresh_from_db()
+                job.estado = 'completado' if completed else 'interrumpido'
+                job.fecha_fin = timezone.now() if completed else None
+                job.save(update_fields=['estado', 'fecha_fin', 'fecha_actualizacion'])
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"   ✅ Bulk notification sent to {resumen['enviados']}/"
+                f"{resumen['enviados'] + resumen['fallidos']} recipients "
+                f"in {resumen['segundos']:.1f}s ({resumen['por_segundo']} emails/s)"
             )
+        )
 
     def _send_reminders(self, dry_run=False):
         """Send reminders to users with pending actions."""
@@ -0,0 +1,75 @@
+# Generated by Django 5.0.14 on 2026-10-17 05:27
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def calcular_agregados(apps, schema_editor):
+    """Llenar los agregados de las reseñas existentes"""
+    Review = apps.get_model('reviews', 'Review')
+    ReviewAggregate = apps.get_model('reviews', 'ReviewAggregate')
+    db = schema_editor.connection.alias
+    corte = timezone.localdate(timezone.now() - timedelta(days=30)).isoformat()
+    
+    agregados = {}
+    filas = Review.objects.using(db).order_by().values_list(
+        'content_type_id', 'object_id', 'status', 'rating', 'is_verified_purchase', 'created_at'
+    )
+    for content_type_id, object_id, status, rating, verificada, created_at in filas.iterator():
+        visible = status in ('published', 'approved')
+        agregado = agregados.get((content_type_id, object_id, visible))
+        if agregado is None:
+            agregado = agregados[(content_type_id, object_id, visible)] = ReviewAggregate(
+                content_type_id=content_type_id, object_id=object_id, visible=visible, recent_days={}
+            )
+        agregado.count += 1
+        agregado.rating_sum += rating
+        setattr(agregado, f'rating_{rating}', getattr(agregado, f'rating_{rating}') + 1)
+        agregado.verified_count += int(verificada)
+        dia = timezone.localdate(created_at).isoformat()
+        if dia >= corte:
+            agregado.recent_days[dia] = agregado.recent_days.get(dia, 0) + 1
+    
+    ReviewAggregate.objects.using(db).bulk_create(agregados.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.CharField(max_length=255, verbose_name='ID del objeto')),
+                ('visible', models.BooleanField(verbose_name='Reseñas visibles')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Reseñas')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Suma de calificaciones')),
+                ('rating_1', models.PositiveIntegerField(default=0, verbose_name='Reseñas de 1 estrella')),
+                ('rating_2', models.PositiveIntegerField(default=0, verbose_name='Reseñas de 2 estrellas')),
+                ('rating_3', models.PositiveIntegerField(default=0, verbose_name='Reseñas de 3 estrellas')),
+                ('rating_4', models.PositiveIntegerField(default=0, verbose_name='Reseñas de 4 estrellas')),
+                ('rating_5', models.PositiveIntegerField(default=0, verbose_name='Reseñas de 5 estrellas')),
+                ('verified_count', models.PositiveIntegerField(default=0, verbose_name='Compras verificadas')),
+                ('recent_days', models.JSONField(default=dict, help_text='Reseñas creadas por día (fecha local ISO) en los últimos 30 días', verbose_name='Reseñas por día')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Tipo de contenido')),
+            ],
+            options={
+                'verbose_name': 'Agregado de reseñas',
+                'verbose_name_plural': 'Agregados de reseñas',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reviewaggregate',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id', 'visible'), name='unique_review_aggregate_per_object'),
+        ),
+        migrations.RunPython(calcular_agregados, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,8 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.utils import timezone
 import uuid
 
+from . import counters
+
 
 class Review(models.Model):
     """
@@ -212,17 +214,60 @@ class Review(models.Model):
         return user == self.user or user.is_staff
     
     def mark_helpful(self):
-        """Marcar reseña como útil"""
-        self.is_helpful_count += 1
-        self.save(update_fields=['is_helpful_count'])
+        """Marcar reseña como útil (incremento atómico, ver ``reviews.counters``)"""
+        counters.increment(self, is_helpful_count=1)
+    
+    def remove_helpful(self):
+        """Quitar un voto útil sin bajar de cero"""
+        counters.increment(self, is_helpful_count=-1)
     
     def report(self, reason=""):
-        """Reportar reseña"""
-        self.report_count += 1
-        self.is_reported = True
-        if self.report_count >= 3:  # Auto-moderación tras 3 reportes
-            self.status = 'moderated'
-        self.save(update_fields=['report_count', 'is_reported', 'status'])
+        """Reportar reseña; se auto-modera tras 3 reportes"""
+        counters.report(self)
+
+
+class ReviewAggregate(models.Model):
+    """
+    Estadísticas precalculadas de las reseñas de un objeto.
+    Hay una fila por objeto y visibilidad: ``visible`` agrupa las reseñas
+    publicadas y aprobadas, las únicas que ven los usuarios que no son staff.
+    Se mantiene desde ``reviews.signals`` (ver ``reviews.aggregates``).
+    """
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name="Tipo de contenido"
+    )
+    object_id = models.CharField(max_length=255, verbose_name="ID del objeto")
+    visible = models.BooleanField(verbose_name="Reseñas visibles")
+    
+    count = models.PositiveIntegerField(default=0, verbose_name="Reseñas")
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="Suma de calificaciones")
+    rating_1 = models.PositiveIntegerField(default=0, verbose_name="Reseñas de 1 estrella")
+    rating_2 = models.PositiveIntegerField(default=0, verbose_name="Reseñas de 2 estrellas")
+    rating_3 = models.PositiveIntegerField(default=0, verbose_name="Reseñas de 3 estrellas")
+    rating_4 = models.PositiveIntegerField(default=0, verbose_name="Reseñas de 4 estrellas")
+    rating_5 = models.PositiveIntegerField(default=0, verbose_name="Reseñas de 5 estrellas")
+    verified_count = models.PositiveIntegerField(default=0, verbose_name="Compras verificadas")
+    recent_days = models.JSONField(
+        default=dict,
+        verbose_name="Reseñas por día",
+        help_text="Reseñas creadas por día (fecha local ISO) en los últimos 30 días"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Fecha de actualización")
+    
+    class Meta:
+        verbose_name = "Agregado de reseñas"
+        verbose_name_plural = "Agregados de reseñas"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_type', 'object_id', 'visible'],
+                name='unique_review_aggregate_per_object'
+            )
+        ]
+    
+    def __str__(self):
+        return f"{self.content_type_id}:{self.object_id} - {self.count} reseñas"
 
 
 class ReviewHelpful(models.Model):
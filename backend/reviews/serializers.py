@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
+from dental_erp.eager_loading import get_precomputed
 from .models import Review, ReviewHelpful, ReviewReport, ReviewMedia
 
 
@@ -82,7 +83,12 @@ class ReviewHelpfulSerializer(serializers.ModelSerializer):
 
 
 class ReviewListSerializer(serializers.ModelSerializer):
-    """Serializer para listado de reseñas (vista compacta)"""
+    """
+    Serializer para listado de reseñas (vista compacta).
+    
+    Usa ``media_total`` y ``content_object`` precargados por
+    ``ReviewViewSet`` cuando están disponibles.
+    """
     user = UserBasicSerializer(read_only=True)
     star_display = serializers.CharField(read_only=True)
     content_preview = serializers.CharField(read_only=True)
@@ -115,7 +121,7 @@ class ReviewListSerializer(serializers.ModelSerializer):
     
     def get_media_count(self, obj):
         """Contar archivos multimedia"""
-        return obj.media.count()
+        return get_precomputed(obj, 'media_total', obj.media.count)
     
     def get_can_edit(self, obj):
         """Verificar si el usuario actual puede editar"""
@@ -1,12 +1,14 @@
 """
-Django signals for automatic email notifications in the reviews app.
+Django signals for the reviews app: email notifications and the
+precomputed per-object statistics in ``reviews.aggregates``.
 """
 
 import logging
-from django.db.models.signals import post_save, pre_save, m2m_changed
+from django.db.models.signals import post_delete, post_save, pre_save, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
 from .models import Review, ReviewReport, ReviewHelpful
+from . import aggregates
 from .email_service import email_service
 
 logger = logging.getLogger(__name__)
@@ -22,7 +24,7 @@ def handle_review_created(sender, instance, created, **kwargs):
             # Only send notification for non-draft reviews
             if instance.status != 'draft':
                 email_service.send_new_review_notification(instance)
-                logger.info(f"New review notification sent for review {instance.id}")
+                logger.info(f"New review notification queued for review {instance.id}")
         except Exception as e:
             logger.error(f"Failed to send new review notification for {instance.id}: {str(e)}")
 
@@ -30,12 +32,15 @@ def handle_review_created(sender, instance, created, **kwargs):
 @receiver(pre_save, sender=Review)
 def handle_review_status_change(sender, instance, **kwargs):
     """
-    Capture the old status before saving to detect status changes.
+    Capture the old status before saving to detect status changes, and the
+    old contribution to the review aggregates.
     """
+    instance._old_aggregate = None
     if instance.pk:  # Only for existing objects
         try:
-            old_instance = Review.objects.get(pk=instance.pk)
+            old_instance = Review.objects.using(kwargs.get('using')).get(pk=instance.pk)
             instance._old_status = old_instance.status
+            instance._old_aggregate = aggregates.contribution(old_instance)
         except Review.DoesNotExist:
             instance._old_status = None
 
@@ -56,11 +61,33 @@ def handle_review_moderation(sender, instance, created, **kwargs):
             
             try:
                 email_service.send_review_moderation_notification(instance, old_status)
-                logger.info(f"Moderation notification sent for review {instance.id}: {old_status} -> {new_status}")
+                logger.info(f"Moderation notification queued for review {instance.id}: {old_status} -> {new_status}")
             except Exception as e:
                 logger.error(f"Failed to send moderation notification for {instance.id}: {str(e)}")
 
 
+@receiver(post_save, sender=Review)
+def update_review_aggregate(sender, instance, using, **kwargs):
+    """
+    Move the review's contribution in ReviewAggregate when its rating,
+    status, verified flag or reviewed object changes.
+    """
+    aggregates.update(
+        getattr(instance, '_old_aggregate', None),
+        aggregates.contribution(instance),
+        using=using
+    )
+    instance._old_aggregate = aggregates.contribution(instance)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_aggregate(sender, instance, using, **kwargs):
+    """
+    Subtract a deleted review from its ReviewAggregate.
+    """
+    aggregates.apply(aggregates.contribution(instance), -1, using=using)
+
+
 @receiver(post_save, sender=ReviewReport)
 def handle_review_reported(sender, instance, created, **kwargs):
     """
@@ -69,7 +96,7 @@ def handle_review_reported(sender, instance, created, **kwargs):
     if created:
         try:
             email_service.send_review_report_notification(instance)
-            logger.info(f"Report notification sent for review {instance.review.id}")
+            logger.info(f"Report notification queued for review {instance.review.id}")
         except Exception as e:
             logger.error(f"Failed to send report notification for {instance.id}: {str(e)}")
 
@@ -85,7 +112,7 @@ def handle_helpful_vote(sender, instance, action, pk_set, **kwargs):
             for user_id in pk_set:
                 voter = User.objects.get(pk=user_id)
                 email_service.send_helpful_vote_notification(instance, voter)
-                logger.info(f"Helpful vote notification sent for review {instance.id}")
+                logger.info(f"Helpful vote notification queued for review {instance.id}")
         except Exception as e:
             logger.error(f"Failed to send helpful vote notification: {str(e)}")
 
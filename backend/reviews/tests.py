@@ -1,4 +1,9 @@
-from django.test import TestCase
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
@@ -8,8 +13,10 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 from datetime import timedelta
 
+from . import aggregates, counters
 from .models import Review, ReviewHelpful, ReviewReport, ReviewMedia
 from categorias.models import Category
+from dental_erp.testing import QueryBudgetMixin
 
 
 class ReviewModelTest(TestCase):
@@ -429,6 +436,195 @@ class ReviewAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class ReviewListQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """El listado de reseñas no consulta por fila"""
+    
+    def test_list_query_budget(self):
+        content_type = ContentType.objects.get_for_model(Category)
+        creadas = []
+        
+        def crear(n):
+            for _ in range(n):
+                i = len(creadas)
+                user = User.objects.create_user(username=f'budget{i}', password='testpass123')
+                category = Category.objects.create(name=f'Categoría {i}')
+                review = Review.objects.create(
+                    user=user,
+                    content_type=content_type,
+                    object_id=str(category.id),
+                    title=f'Reseña número {i}',
+                    content='Contenido suficiente para la reseña.',
+                    rating=4
+                )
+                ReviewMedia.objects.create(review=review, file='reviews/media/a.jpg', media_type='image')
+                creadas.append(review)
+        
+        self.client.force_authenticate(user=User.objects.create_user(username='lector', password='x'))
+        self.assertListQueryBudget('/api/reviews/', crear)
+        data = self.client.get('/api/reviews/').json()['results']
+        self.assertEqual({review['media_count'] for review in data}, {1})
+        self.assertTrue(all(review['content_object_name'].startswith('Categoría') for review in data))
+
+
+class ReviewAggregateTest(APITestCase):
+    """Tests de las estadísticas precalculadas por objeto"""
+
+    def setUp(self):
+        self.content_type = ContentType.objects.get_for_model(Category)
+        self.category = Category.objects.create(name='Ortodoncia')
+        self.other_category = Category.objects.create(name='Endodoncia')
+        self.users = [User.objects.create_user(username=f'reviewer{i}', password='x') for i in range(4)]
+
+    def crear(self, user, rating, category=None, **kwargs):
+        return Review.objects.create(
+            user=user,
+            content_type=self.content_type,
+            object_id=str((category or self.category).id),
+            title=f'Reseña de {rating} estrellas',
+            content='Contenido suficiente para la reseña.',
+            rating=rating,
+            **kwargs
+        )
+
+    def stats(self, category=None):
+        response = self.client.get('/api/reviews/stats/', {
+            'content_type': self.content_type.id, 'object_id': (category or self.category).id
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_signals_keep_aggregates(self):
+        """Altas, cambios y bajas ajustan el agregado de su objeto"""
+        first = self.crear(self.users[0], 5, is_verified_purchase=True)
+        second = self.crear(self.users[1], 4)
+        third = self.crear(self.users[2], 2)
+        self.crear(self.users[3], 1, status='draft')
+
+        with self.assertNumQueries(1):
+            data = self.stats()
+        self.assertEqual(data['total_reviews'], 3)
+        self.assertEqual(data['average_rating'], 3.67)
+        self.assertEqual(data['rating_distribution'], {'1': 0, '2': 1, '3': 0, '4': 1, '5': 1})
+        self.assertEqual(data['verified_purchases'], 1)
+        self.assertEqual(data['recent_reviews'], 3)
+
+        third.status = 'hidden'
+        third.save()
+        second.rating = 3
+        second.save()
+        first.object_id = str(self.other_category.id)
+        first.save()
+        self.assertEqual(self.stats()['rating_distribution'], {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0})
+        self.assertEqual(self.stats(self.other_category)['verified_purchases'], 1)
+
+        # El staff también ve las reseñas ocultas y los borradores
+        self.client.force_authenticate(User.objects.create_user(username='staff', is_staff=True))
+        self.assertEqual(self.stats()['total_reviews'], 3)
+
+        second.delete()
+        self.assertEqual(self.stats()['total_reviews'], 2)
+        self.assertEqual(aggregates.rebuild(save=False), [])
+
+    def test_recent_reviews(self):
+        """Sólo cuentan como recientes las reseñas de los últimos 30 días"""
+        old = self.crear(self.users[0], 5)
+        self.crear(self.users[1], 3)
+        Review.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=40))
+
+        # update() no envía señales
+        with self.assertRaises(CommandError):
+            call_command('rebuild_review_aggregates', '--check', stdout=StringIO())
+        call_command('rebuild_review_aggregates', stdout=StringIO())
+        call_command('rebuild_review_aggregates', '--check', stdout=StringIO())
+
+        data = self.stats()
+        self.assertEqual(data['total_reviews'], 2)
+        self.assertEqual(data['recent_reviews'], 1)
+
+        old.refresh_from_db()
+        old.delete()
+        self.assertEqual(self.stats()['recent_reviews'], 1)
+        self.assertEqual(aggregates.rebuild(save=False), [])
+
+        # Las estadísticas propias se calculan sobre las reseñas del usuario
+        self.client.force_authenticate(self.users[1])
+        data = self.client.get('/api/reviews/stats/', {'my_reviews': 'true'}).json()
+        self.assertEqual((data['total_reviews'], data['average_rating']), (1, 3.0))
+
+
+class ReviewCounterTest(TestCase):
+    """Tests de los contadores atómicos de votos útiles y reportes"""
+
+    def setUp(self):
+        self.review = Review.objects.create(
+            user=User.objects.create_user(username='autor', password='x'),
+            content_type=ContentType.objects.get_for_model(Category),
+            object_id=str(Category.objects.create(name='Periodoncia').id),
+            title='Reseña con votos',
+            content='Contenido suficiente para la reseña.',
+            rating=4
+        )
+        self.saves = []
+        self.changes = []
+        post_save.connect(self.on_save, sender=Review)
+        counters.review_counters_changed.connect(self.on_change)
+        self.addCleanup(post_save.disconnect, self.on_save, sender=Review)
+        self.addCleanup(counters.review_counters_changed.disconnect, self.on_change)
+
+    def on_save(self, sender, instance, **kwargs):
+        self.saves.append(instance.pk)
+
+    def on_change(self, sender, review_id, deltas, **kwargs):
+        self.changes.append((review_id, deltas))
+
+    def test_concurrent_votes_are_not_lost(self):
+        """Dos instancias desactualizadas suman sus votos sin post_save"""
+        first = Review.objects.get(pk=self.review.pk)
+        second = Review.objects.get(pk=self.review.pk)
+        with self.assertNumQueries(1):
+            first.mark_helpful()
+        second.mark_helpful()
+
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.is_helpful_count, 2)
+        self.assertEqual(self.saves, [])
+        self.assertEqual(self.changes, [(self.review.pk, {'is_helpful_count': 1})] * 2)
+
+        for _ in range(3):
+            first.remove_helpful()
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.is_helpful_count, 0)
+
+    def test_report_moderates_after_threshold(self):
+        """El tercer reporte pasa la reseña a moderación con save()"""
+        stale = Review.objects.get(pk=self.review.pk)
+        self.review.report()
+        self.review.report()
+        self.assertEqual(self.saves, [])
+
+        stale.report()
+        self.assertEqual((stale.report_count, stale.status), (3, 'moderated'))
+        self.assertEqual(self.saves, [self.review.pk])
+        self.review.refresh_from_db()
+        self.assertTrue(self.review.is_reported)
+        self.assertEqual(self.review.status, 'moderated')
+        self.assertEqual(aggregates.rebuild(save=False), [])
+
+    @override_settings(REVIEW_COUNTERS_BUFFERED=True, REVIEW_COUNTERS_FLUSH_SECONDS=3600)
+    def test_buffered_votes(self):
+        """En modo buffer los votos se escriben juntos al hacer flush"""
+        counters.flush()
+        for _ in range(3):
+            Review.objects.get(pk=self.review.pk).mark_helpful()
+        self.review.remove_helpful()
+
+        self.assertEqual(Review.objects.get(pk=self.review.pk).is_helpful_count, 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.flush(), 1)
+        self.assertEqual(Review.objects.get(pk=self.review.pk).is_helpful_count, 2)
+        self.assertEqual(self.changes, [(self.review.pk, {'is_helpful_count': 2})])
+
+
 class ReviewValidationTest(TestCase):
     """Tests para validaciones de reseñas"""
     
@@ -2,23 +2,25 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Avg, Count, Q
+from django.db.models import OuterRef
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 
-from .models import Review, ReviewHelpful, ReviewReport, ReviewMedia
+from . import aggregates
+from .models import Review, ReviewAggregate, ReviewHelpful, ReviewReport, ReviewMedia
 from .serializers import (
     ReviewListSerializer, ReviewDetailSerializer, ReviewCreateUpdateSerializer,
     ReviewReportSerializer, ReviewMediaSerializer, ReviewStatsSerializer
 )
 from .filters import ReviewFilter
+from dental_erp.eager_loading import EagerLoadingMixin, SubqueryCount
 from .permissions import IsOwnerOrReadOnly, IsModeratorOrReadOnly
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     """
     ViewSet completo para gestión de reseñas con operaciones CRUD,
     filtrado, búsqueda, paginación y acciones especiales.
@@ -30,6 +32,14 @@ class ReviewViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'content', 'user__username', 'user__first_name', 'user__last_name']
     ordering_fields = ['created_at', 'updated_at', 'rating', 'is_helpful_count']
     ordering = ['-created_at']
+    cursor_ordering = ('-created_at',)
+    
+    # Lo que necesita ReviewListSerializer sin consultar por fila
+    eager_loading_actions = ('list', 'my_reviews')
+    list_prefetch_related = ('content_object',)
+    list_annotations = {
+        'media_total': SubqueryCount(ReviewMedia.objects.filter(review=OuterRef('pk'))),
+    }
     
     def get_serializer_class(self):
         """Seleccionar serializer según la acción"""
@@ -44,9 +54,9 @@ class ReviewViewSet(viewsets.ModelViewSet):
         """Filtrar queryset según permisos y parámetros"""
         queryset = Review.objects.select_related(
             'user', 'content_type', 'moderated_by'
-        ).prefetch_related(
-            'media', 'helpful_votes', 'reports'
         )
+        if not self.uses_eager_loading():
+            queryset = queryset.prefetch_related('media', 'helpful_votes', 'reports')
         
         # Los usuarios no staff solo ven reseñas publicadas y aprobadas
         if not self.request.user.is_staff:
@@ -71,7 +81,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
             else:
                 queryset = queryset.none()
         
-        return queryset
+        return self.eager_load(queryset)
     
     def perform_create(self, serializer):
         """Personalizar creación de reseña"""
@@ -137,8 +147,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
             helpful_vote.delete()
             
             # Actualizar contador
-            review.is_helpful_count = max(0, review.is_helpful_count - 1)
-            review.save(update_fields=['is_helpful_count'])
+            review.remove_helpful()
             
             return Response({
                 'message': 'Voto de útil removido',
@@ -195,54 +204,42 @@ class ReviewViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Obtener estadísticas de reseñas"""
+        """
+        Obtener estadísticas de reseñas.
+        
+        Se leen de ``ReviewAggregate`` (una fila por objeto para usuarios no
+        staff); sólo las estadísticas de ``my_reviews=true`` se calculan
+        sobre las reseñas.
+        """
+        if request.query_params.get('my_reviews') == 'true':
+            return Response(ReviewStatsSerializer(
+                aggregates.summarize(aggregates.accumulate(self.get_queryset()).values())
+            ).data)
+        
         content_type_id = request.query_params.get('content_type')
         object_id = request.query_params.get('object_id')
         
-        queryset = self.get_queryset()
+        rows = ReviewAggregate.objects.all()
+        
+        # Los usuarios no staff solo ven reseñas publicadas y aprobadas
+        if not request.user.is_staff:
+            rows = rows.filter(visible=True)
         
         if content_type_id:
-            queryset = queryset.filter(content_type_id=content_type_id)
+            rows = rows.filter(content_type_id=content_type_id)
         
         if object_id:
-            queryset = queryset.filter(object_id=object_id)
-        
-        # Calcular estadísticas
-        stats = queryset.aggregate(
-            total_reviews=Count('id'),
-            average_rating=Avg('rating'),
-            verified_purchases=Count('id', filter=Q(is_verified_purchase=True))
-        )
+            rows = rows.filter(object_id=object_id)
         
-        # Distribución de calificaciones
-        rating_distribution = {}
-        for i in range(1, 6):
-            rating_distribution[str(i)] = queryset.filter(rating=i).count()
-        
-        # Reseñas recientes (últimos 30 días)
-        recent_date = timezone.now() - timezone.timedelta(days=30)
-        recent_reviews = queryset.filter(created_at__gte=recent_date).count()
-        
-        stats.update({
-            'rating_distribution': rating_distribution,
-            'recent_reviews': recent_reviews
-        })
-        
-        # Manejar valores None
-        if stats['average_rating'] is None:
-            stats['average_rating'] = 0.0
-        else:
-            stats['average_rating'] = round(stats['average_rating'], 2)
-        
-        serializer = ReviewStatsSerializer(stats)
+        serializer = ReviewStatsSerializer(aggregates.summarize(rows))
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def my_reviews(self, request):
         """Obtener reseñas del usuario actual"""
-        queryset = Review.objects.filter(user=request.user).select_related(
-            'content_type'
-        ).prefetch_related('media')
+        queryset = self.eager_load(
+            Review.objects.filter(user=request.user).select_related('user', 'content_type')
+        )
         
         # Aplicar filtros
         page = self.paginate_queryset(queryset)
@@ -250,7 +247,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
             serializer = ReviewListSerializer(page, many=True, context={'request': request})
             return self.get_paginated_response(serializer.data)
         
-        serializer = ReviewListSerializer(queryset, many=True, context={'request': request})
+        serializer = ReviewListSerializer(self.prefetch_page(queryset), many=True, context={'request': request})
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
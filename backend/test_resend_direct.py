@@ -3,10 +3,12 @@
 Test directo con Resend para enviar email a cualquier dirección
 Nota: Para producción necesitas verificar el dominio en Resend
 """
+import os
+
 import resend
 
 # Configurar API Key
-resend.api_key = "re_FPCt2fuB_6Fct8cxW19Bct73QqFjZGbEV"
+resend.api_key = os.environ.get("RESEND_API_KEY", "")
 
 def send_test_email_direct():
     """
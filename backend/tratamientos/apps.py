@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TratamientosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tratamientos'
+    
+    def ready(self):
+        import tratamientos.signals
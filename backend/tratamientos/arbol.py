@@ -0,0 +1,76 @@
+"""
+Árbol de categorías de tratamiento armado en memoria.
+
+Igual que ``categorias.tree``, construye el árbol a partir de una sola
+consulta ordenada por ``tree_id``/``lft`` y deja en cada nodo lo que los
+serializadores pedían con una consulta por nodo: hijos activos, número de
+hijos, breadcrumbs (y con ellos la ruta completa) y el conteo de
+tratamientos de ``ConteoCategoriaTratamiento``.
+"""
+
+from .models import CategoriaTratamiento
+
+
+def construir_arbol(queryset=None):
+    """
+    Cargar las categorías con sus datos de árbol precalculados.
+
+    Cada nodo lleva ``_tree_children`` (hijos activos),
+    ``_tree_children_count``, ``_tree_breadcrumbs``, su ``parent`` y su
+    ``conteo`` en caché.
+
+    Args:
+        queryset: Categorías a cargar; debe incluir los ancestros de los nodos
+            que se vayan a serializar (por ejemplo, un ``tree_id`` completo)
+
+    Returns:
+        list: Todos los nodos en preorden
+    """
+    if queryset is None:
+        queryset = CategoriaTratamiento.objects.all()
+    nodos = list(queryset.select_related('conteo').order_by('tree_id', 'lft'))
+    
+    pila = []
+    for nodo in nodos:
+        # Descartar los nodos que ya no son ancestros del actual
+        while pila and (pila[-1].tree_id != nodo.tree_id or pila[-1].rght < nodo.lft):
+            pila.pop()
+        
+        padre = pila[-1] if pila else None
+        nodo._tree_children = []
+        nodo._tree_children_count = 0
+        nodo._tree_breadcrumbs = (padre._tree_breadcrumbs if padre else []) + [
+            {'id': str(nodo.id), 'nombre': nodo.nombre, 'slug': nodo.slug}
+        ]
+        
+        if padre is not None:
+            nodo.parent = padre
+            padre._tree_children_count += 1
+            if nodo.activo:
+                padre._tree_children.append(nodo)
+        
+        pila.append(nodo)
+    
+    return nodos
+
+
+def raices_activas(nodos):
+    """Raíces activas de un árbol construido con ``construir_arbol``"""
+    return [nodo for nodo in nodos if nodo.level == 0 and nodo.activo]
+
+
+def con_categorias(tratamientos, nodos):
+    """
+    Asignar a cada tratamiento su categoría ya cargada en el árbol, para que
+    la ruta y los breadcrumbs no consulten por fila.
+
+    Returns:
+        list: Los tratamientos evaluados
+    """
+    por_id = {nodo.pk: nodo for nodo in nodos}
+    tratamientos = list(tratamientos)
+    for tratamiento in tratamientos:
+        categoria = por_id.get(tratamiento.categoria_id)
+        if categoria is not None:
+            tratamiento.categoria = categoria
+    return tratamientos
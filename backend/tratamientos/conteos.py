@@ -0,0 +1,138 @@
+"""
+Conteos desnormalizados de tratamientos por categoría.
+
+``ConteoCategoriaTratamiento`` guarda por categoría los tratamientos activos
+propios (``directos``) y los de todo su subárbol (``total``). Se mantienen de
+forma incremental desde ``tratamientos.signals``:
+
+- Alta, baja o cambio de categoría/estado de un tratamiento: un UPDATE con
+  ``F()`` de ``directos`` en su categoría y otro de ``total`` en la categoría
+  y todos sus ancestros, seleccionados por el rango ``lft``/``rght``
+- Movimiento de una categoría: los ``directos`` no cambian, así que los
+  totales se recalculan en memoria y sólo se escriben las filas afectadas
+
+``recalcular`` reconstruye todo a partir de los tratamientos y sirve también
+para verificar la consistencia (``recalcular_conteos_tratamientos --check``).
+"""
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import CategoriaTratamiento, ConteoCategoriaTratamiento, Tratamiento
+
+
+def crear(categoria, using='default'):
+    """Crear el conteo (en cero) de una categoría nueva"""
+    ConteoCategoriaTratamiento.objects.using(using).bulk_create(
+        [ConteoCategoriaTratamiento(categoria_id=categoria.pk)],
+        ignore_conflicts=True
+    )
+
+
+def ajustar(categoria_id, delta, using='default'):
+    """
+    Sumar ``delta`` tratamientos activos a una categoría y a sus ancestros.
+
+    Args:
+        categoria_id: Categoría del tratamiento
+        delta: Cantidad a sumar (negativa para restar)
+    """
+    if not delta:
+        return
+    
+    nodo = CategoriaTratamiento.objects.using(using).filter(
+        pk=categoria_id
+    ).values('tree_id', 'lft', 'rght').first()
+    if nodo is None:
+        return
+    
+    conteos = ConteoCategoriaTratamiento.objects.using(using)
+    with transaction.atomic(using=using):
+        conteos.filter(categoria_id=categoria_id).update(directos=F('directos') + delta)
+        conteos.filter(
+            categoria__tree_id=nodo['tree_id'],
+            categoria__lft__lte=nodo['lft'],
+            categoria__rght__gte=nodo['rght'],
+        ).update(total=F('total') + delta)
+
+
+def acumular(nodos, directos):
+    """
+    Calcular los totales por subárbol en una sola pasada.
+
+    Args:
+        nodos: Tuplas ``(id, tree_id, lft, rght)`` ordenadas por ``tree_id`` y ``lft``
+        directos: Tratamientos activos propios por id de categoría
+
+    Returns:
+        dict: ``{categoria_id: (directos, total)}``
+    """
+    conteos = {}
+    pila = []
+    
+    def cerrar():
+        categoria_id, _, _, total = pila.pop()
+        conteos[categoria_id] = (directos.get(categoria_id, 0), total)
+        if pila:
+            pila[-1][3] += total
+    
+    for categoria_id, tree_id, lft, rght in nodos:
+        # Cerrar los nodos que ya no son ancestros del actual
+        while pila and (pila[-1][1] != tree_id or pila[-1][2] < lft):
+            cerrar()
+        pila.append([categoria_id, tree_id, rght, directos.get(categoria_id, 0)])
+    while pila:
+        cerrar()
+    
+    return conteos
+
+
+def recalcular(using='default', solo_totales=False, guardar=True):
+    """
+    Recalcular los conteos y escribir sólo los que difieren.
+
+    Args:
+        solo_totales: Conservar ``directos`` y recalcular sólo ``total``
+            (basta tras mover categorías)
+        guardar: Si es False sólo se informan las diferencias
+
+    Returns:
+        list: Tuplas ``(categoria_id, actual, esperado)`` de las filas que no
+        coincidían; ``actual`` es None si faltaba la fila
+    """
+    actuales = {
+        categoria_id: (directos, total)
+        for categoria_id, directos, total in ConteoCategoriaTratamiento.objects.using(using).values_list(
+            'categoria_id', 'directos', 'total'
+        )
+    }
+    if solo_totales:
+        directos = {categoria_id: conteo[0] for categoria_id, conteo in actuales.items()}
+    else:
+        directos = dict(
+            Tratamiento.objects.using(using).filter(activo=True).order_by().values(
+                'categoria_id'
+            ).annotate(n=Count('id')).values_list('categoria_id', 'n')
+        )
+    
+    nodos = CategoriaTratamiento.objects.using(using).order_by('tree_id', 'lft').values_list(
+        'id', 'tree_id', 'lft', 'rght'
+    )
+    diferencias = [
+        (categoria_id, actuales.get(categoria_id), esperado)
+        for categoria_id, esperado in acumular(nodos, directos).items()
+        if actuales.get(categoria_id) != esperado
+    ]
+    
+    if guardar and diferencias:
+        nuevos = []
+        cambiados = []
+        for categoria_id, actual, (directos_, total) in diferencias:
+            conteo = ConteoCategoriaTratamiento(categoria_id=categoria_id, directos=directos_, total=total)
+            (nuevos if actual is None else cambiados).append(conteo)
+        
+        with transaction.atomic(using=using):
+            ConteoCategoriaTratamiento.objects.using(using).bulk_create(nuevos, ignore_conflicts=True)
+            ConteoCategoriaTratamiento.objects.using(using).bulk_update(cambiados, ['directos', 'total'])
+    
+    return diferencias
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from tratamientos import conteos
+import time
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los conteos de tratamientos por categoría o verifica que estén al día'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Sólo verificar; termina con error si algún conteo no coincide'
+        )
+    
+    def handle(self, *args, **options):
+        start_time = time.time()
+        diferencias = conteos.recalcular(guardar=not options['check'])
+        elapsed_time = time.time() - start_time
+        
+        for categoria_id, actual, esperado in diferencias:
+            self.stdout.write(f"- {categoria_id}: {actual or 'sin conteo'} -> {esperado}")
+        
+        if options['check']:
+            if diferencias:
+                raise CommandError(f"{len(diferencias)} conteos desactualizados")
+            self.stdout.write(self.style.SUCCESS(
+                f"Conteos al día ({elapsed_time:.2f} segundos)"
+            ))
+            return
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(diferencias)} conteos corregidos en {elapsed_time:.2f} segundos"
+        ))
@@ -0,0 +1,64 @@
+# Generated by Django 5.0.14 on 2026-10-17 05:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def calcular_conteos(apps, schema_editor):
+    """Llenar los conteos de las categorías existentes"""
+    CategoriaTratamiento = apps.get_model('tratamientos', 'CategoriaTratamiento')
+    Tratamiento = apps.get_model('tratamientos', 'Tratamiento')
+    ConteoCategoriaTratamiento = apps.get_model('tratamientos', 'ConteoCategoriaTratamiento')
+    db = schema_editor.connection.alias
+    
+    directos = dict(
+        Tratamiento.objects.using(db).filter(activo=True).order_by().values(
+            'categoria_id'
+        ).annotate(n=Count('id')).values_list('categoria_id', 'n')
+    )
+    totales = {}
+    pila = []
+    nodos = CategoriaTratamiento.objects.using(db).order_by('tree_id', 'lft').values_list(
+        'id', 'tree_id', 'lft', 'rght'
+    )
+    for categoria_id, tree_id, lft, rght in nodos:
+        totales[categoria_id] = directos.get(categoria_id, 0)
+        while pila and (pila[-1][1] != tree_id or pila[-1][2] < lft):
+            pila.pop()
+        # Cada tratamiento propio cuenta también en todos los ancestros
+        for ancestro_id, _, _ in pila:
+            totales[ancestro_id] += directos.get(categoria_id, 0)
+        pila.append((categoria_id, tree_id, rght))
+    
+    ConteoCategoriaTratamiento.objects.using(db).bulk_create([
+        ConteoCategoriaTratamiento(
+            categoria_id=categoria_id,
+            directos=directos.get(categoria_id, 0),
+            total=total
+        )
+        for categoria_id, total in totales.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tratamientos', '0010_alter_categoriatratamiento_fecha_actualizacion_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoCategoriaTratamiento',
+            fields=[
+                ('categoria', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='conteo', serialize=False, to='tratamientos.categoriatratamiento', verbose_name='Categoría')),
+                ('directos', models.IntegerField(default=0, help_text='Tratamientos activos de la propia categoría', verbose_name='Tratamientos directos')),
+                ('total', models.IntegerField(default=0, help_text='Tratamientos activos de la categoría y sus subcategorías', verbose_name='Tratamientos en el subárbol')),
+            ],
+            options={
+                'verbose_name': 'Conteo de tratamientos por categoría',
+                'verbose_name_plural': 'Conteos de tratamientos por categoría',
+            },
+        ),
+        migrations.RunPython(calcular_conteos, migrations.RunPython.noop),
+    ]
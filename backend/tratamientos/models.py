@@ -121,7 +121,7 @@ class CategoriaTratamiento(MPTTModel):
     
     def get_full_path(self):
         """Obtener la ruta completa de la categoría"""
-        return " > ".join([ancestor.nombre for ancestor in self.get_ancestors(include_self=True)])
+        return " > ".join([crumb['nombre'] for crumb in self.get_breadcrumbs()])
     
     @property
     def full_path(self):
@@ -130,6 +130,8 @@ class CategoriaTratamiento(MPTTModel):
     
     def get_children_count(self):
         """Obtener el número de hijos directos"""
+        if hasattr(self, '_tree_children_count'):
+            return self._tree_children_count
         return self.get_children().count()
     
     def get_descendants_count(self):
@@ -137,9 +139,27 @@ class CategoriaTratamiento(MPTTModel):
         return self.get_descendants().count()
     
     def get_treatments_count(self):
-        """Obtener el número de tratamientos en esta categoría y subcategorías"""
-        descendant_ids = self.get_descendants(include_self=True).values_list('id', flat=True)
-        return Tratamiento.objects.filter(categoria__id__in=descendant_ids, activo=True).count()
+        """
+        Obtener el número de tratamientos activos en esta categoría y
+        subcategorías (de ``ConteoCategoriaTratamiento``; sin consulta si se
+        cargó con ``select_related('conteo')``)
+        """
+        try:
+            return self.conteo.total
+        except ConteoCategoriaTratamiento.DoesNotExist:
+            return 0
+    
+    def get_treatments(self, include_descendants=True):
+        """
+        Tratamientos de esta categoría o de todo su subárbol, filtrando por
+        el rango ``lft``/``rght`` en lugar de listar los descendientes
+        """
+        if not include_descendants:
+            return Tratamiento.objects.filter(categoria=self)
+        return Tratamiento.objects.filter(
+            categoria__tree_id=self.tree_id,
+            categoria__lft__range=(self.lft, self.rght),
+        )
     
     def is_leaf(self):
         """Verificar si es una categoría hoja (sin hijos)"""
@@ -147,6 +167,8 @@ class CategoriaTratamiento(MPTTModel):
     
     def get_breadcrumbs(self):
         """Obtener breadcrumbs para navegación"""
+        if hasattr(self, '_tree_breadcrumbs'):
+            return self._tree_breadcrumbs
         return [{'id': str(cat.id), 'nombre': cat.nombre, 'slug': cat.slug} 
                 for cat in self.get_ancestors(include_self=True)]
 
@@ -320,3 +342,35 @@ class Tratamiento(models.Model):
     def get_categoria_breadcrumbs(self):
         """Obtener breadcrumbs de categoría"""
         return self.categoria.get_breadcrumbs()
+
+
+class ConteoCategoriaTratamiento(models.Model):
+    """
+    Tratamientos activos de una categoría: los suyos y los de todo su
+    subárbol. Se mantiene con ``tratamientos.conteos`` al guardar o eliminar
+    tratamientos y al mover categorías, para no contar por nodo al listar.
+    """
+    categoria = models.OneToOneField(
+        CategoriaTratamiento,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='conteo',
+        verbose_name="Categoría"
+    )
+    directos = models.IntegerField(
+        default=0,
+        verbose_name="Tratamientos directos",
+        help_text="Tratamientos activos de la propia categoría"
+    )
+    total = models.IntegerField(
+        default=0,
+        verbose_name="Tratamientos en el subárbol",
+        help_text="Tratamientos activos de la categoría y sus subcategorías"
+    )
+    
+    class Meta:
+        verbose_name = "Conteo de tratamientos por categoría"
+        verbose_name_plural = "Conteos de tratamientos por categoría"
+    
+    def __str__(self):
+        return f"{self.categoria.nombre}: {self.directos}/{self.total}"
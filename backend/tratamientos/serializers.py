@@ -18,7 +18,9 @@ class CategoriaTratamientoTreeSerializer(serializers.ModelSerializer):
         ]
     
     def get_children(self, obj):
-        if hasattr(obj, 'prefetched_children'):
+        if hasattr(obj, '_tree_children'):
+            children = obj._tree_children
+        elif hasattr(obj, 'prefetched_children'):
             children = obj.prefetched_children
         else:
             children = obj.get_children().filter(activo=True)
@@ -0,0 +1,81 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from . import conteos
+from .models import CategoriaTratamiento, Tratamiento
+
+
+@receiver(post_save, sender=CategoriaTratamiento)
+def crear_conteo_categoria(sender, instance, created, **kwargs):
+    """
+    Las categorías nuevas empiezan sin tratamientos
+    """
+    if created and not kwargs.get('raw'):
+        conteos.crear(instance, using=kwargs.get('using') or 'default')
+
+
+@receiver(node_moved, sender=CategoriaTratamiento)
+def recalcular_totales_categoria(sender, instance, **kwargs):
+    """
+    Al mover una categoría cambian los totales de sus ancestros anteriores y nuevos
+    """
+    conteos.recalcular(using=instance._state.db or 'default', solo_totales=True)
+
+
+@receiver(post_delete, sender=CategoriaTratamiento)
+def recalcular_totales_al_eliminar(sender, instance, using, **kwargs):
+    """
+    Al eliminar una categoría sus ancestros pierden los tratamientos del subárbol.
+
+    mptt cierra el hueco del árbol antes de borrar en cascada, así que los
+    ``ajustar`` de los tratamientos eliminados no encuentran a los ancestros
+    por el rango ``lft``/``rght``. Los totales se recalculan una vez, desde la
+    categoría eliminada cuyo padre sigue existiendo (las descendientes
+    borradas en cascada ya no tienen padre).
+    """
+    if instance.parent_id is not None and not CategoriaTratamiento.objects.using(using).filter(
+        pk=instance.parent_id
+    ).exists():
+        return
+    conteos.recalcular(using=using, solo_totales=True)
+
+
+@receiver(pre_save, sender=Tratamiento)
+def recordar_estado_tratamiento(sender, instance, **kwargs):
+    """
+    Guardar la categoría y el estado previos para ajustar los conteos
+    """
+    instance._conteo_anterior = None
+    if instance._state.adding or kwargs.get('raw'):
+        return
+    instance._conteo_anterior = Tratamiento.objects.using(kwargs.get('using') or 'default').filter(
+        pk=instance.pk
+    ).values_list('categoria_id', 'activo').first()
+
+
+@receiver(post_save, sender=Tratamiento)
+def ajustar_conteo_tratamiento(sender, instance, **kwargs):
+    """
+    Mantener los conteos de la categoría anterior y la nueva
+    """
+    if kwargs.get('raw'):
+        return
+    using = kwargs.get('using') or 'default'
+    anterior = getattr(instance, '_conteo_anterior', None)
+    if anterior == (instance.categoria_id, instance.activo):
+        return
+    
+    if anterior is not None and anterior[1]:
+        conteos.ajustar(anterior[0], -1, using=using)
+    if instance.activo:
+        conteos.ajustar(instance.categoria_id, 1, using=using)
+
+
+@receiver(post_delete, sender=Tratamiento)
+def descontar_tratamiento(sender, instance, **kwargs):
+    """
+    Los tratamientos eliminados dejan de contar en su categoría
+    """
+    if instance.activo:
+        conteos.ajustar(instance.categoria_id, -1, using=kwargs.get('using') or 'default')
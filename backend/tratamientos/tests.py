@@ -1,3 +1,165 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+from rest_framework.test import APITestCase
+
+from . import conteos
+from .models import CategoriaTratamiento, ConteoCategoriaTratamiento, Tratamiento
+
+
+def crear_tratamiento(categoria, nombre, **kwargs):
+    return Tratamiento.objects.create(
+        nombre=nombre,
+        categoria=categoria,
+        descripcion=nombre,
+        precio_base=Decimal('100.00'),
+        duracion_estimada=30,
+        **kwargs
+    )
+
+
+class ConteoCategoriaTratamientoTest(TestCase):
+    """Tests de los conteos desnormalizados de tratamientos por categoría"""
+
+    def setUp(self):
+        self.cirugia = CategoriaTratamiento.objects.create(nombre="Cirugía")
+        self.oral = CategoriaTratamiento.objects.create(nombre="Oral", parent=self.cirugia)
+        self.extracciones = CategoriaTratamiento.objects.create(nombre="Extracciones", parent=self.oral)
+        self.estetica = CategoriaTratamiento.objects.create(nombre="Estética")
+
+    def conteo(self, categoria):
+        conteo = ConteoCategoriaTratamiento.objects.get(categoria=categoria)
+        return conteo.directos, conteo.total
+
+    def test_save_and_delete(self):
+        """Los conteos se ajustan al crear, desactivar, cambiar de categoría y eliminar"""
+        muela = crear_tratamiento(self.extracciones, "Muela del juicio")
+        crear_tratamiento(self.oral, "Biopsia")
+        crear_tratamiento(self.oral, "Inactivo", activo=False)
+
+        self.assertEqual(self.conteo(self.extracciones), (1, 1))
+        self.assertEqual(self.conteo(self.oral), (1, 2))
+        self.assertEqual(self.conteo(self.cirugia), (0, 2))
+
+        muela.activo = False
+        muela.save()
+        self.assertEqual(self.conteo(self.cirugia), (0, 1))
+
+        muela.activo = True
+        muela.categoria = self.estetica
+        muela.save()
+        self.assertEqual(self.conteo(self.extracciones), (0, 0))
+        self.assertEqual(self.conteo(self.estetica), (1, 1))
+
+        muela.delete()
+        self.assertEqual(self.conteo(self.estetica), (0, 0))
+        self.assertEqual(conteos.recalcular(guardar=False), [])
+
+    def test_move_category(self):
+        """Mover una categoría traslada sus totales a los nuevos ancestros"""
+        crear_tratamiento(self.extracciones, "Muela del juicio")
+        crear_tratamiento(self.oral, "Biopsia")
+
+        self.oral.move_to(self.estetica, 'last-child')
+        self.assertEqual(self.conteo(self.cirugia), (0, 0))
+        self.assertEqual(self.conteo(self.estetica), (0, 2))
+
+        self.extracciones.refresh_from_db()
+        self.extracciones.parent = None
+        self.extracciones.save()
+        self.assertEqual(self.conteo(self.estetica), (0, 1))
+        self.assertEqual(self.conteo(self.extracciones), (1, 1))
+        self.assertEqual(conteos.recalcular(guardar=False), [])
+
+    def test_delete_category(self):
+        """Eliminar una categoría descuenta su subárbol de los ancestros"""
+        crear_tratamiento(self.extracciones, "Muela del juicio")
+        crear_tratamiento(self.oral, "Biopsia")
+        implantes = CategoriaTratamiento.objects.create(nombre="Implantes", parent=self.cirugia)
+        crear_tratamiento(implantes, "Implante")
+        self.assertEqual(self.conteo(self.cirugia), (0, 3))
+
+        CategoriaTratamiento.objects.get(pk=self.oral.pk).delete()
+        self.assertEqual(self.conteo(self.cirugia), (0, 1))
+        self.assertEqual(self.conteo(implantes), (1, 1))
+        self.assertFalse(ConteoCategoriaTratamiento.objects.filter(categoria_id=self.extracciones.pk).exists())
+        self.assertEqual(conteos.recalcular(guardar=False), [])
+
+        CategoriaTratamiento.objects.get(pk=self.cirugia.pk).delete()
+        self.assertEqual(self.conteo(self.estetica), (0, 0))
+        self.assertEqual(conteos.recalcular(guardar=False), [])
+
+    def test_command(self):
+        """El comando detecta y corrige conteos desactualizados"""
+        crear_tratamiento(self.extracciones, "Muela del juicio")
+        # update() no envía señales
+        Tratamiento.objects.update(activo=False)
+
+        with self.assertRaises(CommandError):
+            call_command('recalcular_conteos_tratamientos', '--check', stdout=StringIO())
+
+        call_command('recalcular_conteos_tratamientos', stdout=StringIO())
+        self.assertEqual(self.conteo(self.cirugia), (0, 0))
+        call_command('recalcular_conteos_tratamientos', '--check', stdout=StringIO())
+
+
+class CategoriaTratamientoAPITest(APITestCase):
+    """Tests de los endpoints de categorías con uniones por rango"""
+
+    def setUp(self):
+        self.cirugia = CategoriaTratamiento.objects.create(nombre="Cirugía")
+        self.oral = CategoriaTratamiento.objects.create(nombre="Oral", parent=self.cirugia)
+        self.extracciones = CategoriaTratamiento.objects.create(nombre="Extracciones", parent=self.oral)
+        self.estetica = CategoriaTratamiento.objects.create(nombre="Estética")
+        for i in range(3):
+            crear_tratamiento(self.extracciones, f"Extracción {i}")
+            crear_tratamiento(self.oral, f"Oral {i}")
+        crear_tratamiento(self.estetica, "Blanqueamiento")
+
+    def test_categorias_tree(self):
+        """El árbol se arma con una sola consulta"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tratamientos/categorias_tree/')
+        raiz = response.json()[0]
+        self.assertEqual(raiz['nombre'], "Cirugía")
+        self.assertEqual(raiz['treatments_count'], 6)
+        hoja = raiz['children'][0]['children'][0]
+        self.assertEqual(hoja['full_path'], "Cirugía > Oral > Extracciones")
+        self.assertEqual(hoja['treatments_count'], 3)
+
+    def test_categorias(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tratamientos/categorias/')
+        data = {cat['nombre']: cat for cat in response.json()}
+        self.assertEqual(data['Oral']['total_tratamientos'], 6)
+        self.assertEqual(data['Extracciones']['full_path'], "Cirugía > Oral > Extracciones")
+
+    def test_by_categoria(self):
+        """Los tratamientos del subárbol se leen con una unión por rango"""
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/tratamientos/by_categoria/', {'categoria': self.cirugia.id})
+        data = response.json()
+        self.assertEqual(len(data), 3)
+        self.assertEqual(len(data[str(self.oral.id)]['tratamientos']), 3)
+        extracciones = data[str(self.extracciones.id)]
+        self.assertEqual(extracciones['categoria']['total_tratamientos'], 3)
+        self.assertEqual(
+            extracciones['tratamientos'][0]['categoria_path'], "Cirugía > Oral > Extracciones"
+        )
+
+        response = self.client.get(
+            '/api/tratamientos/by_categoria/', {'categoria': self.cirugia.id, 'max_level': 1}
+        )
+        self.assertEqual(len(response.json()), 2)
+
+    def test_categoria_tratamientos(self):
+        url = f'/api/categorias-tratamientos/{self.oral.id}/tratamientos/'
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()), 6)
 
-# Create your tests here.
+        response = self.client.get(url, {'include_subcategorias': 'false'})
+        self.assertEqual(len(response.json()), 3)
@@ -6,6 +6,7 @@ from django.db.models import Q, Count, Avg
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 
+from .arbol import construir_arbol, raices_activas, con_categorias
 from .models import Tratamiento, CategoriaTratamiento
 from .serializers import (
     TratamientoSerializer,
@@ -61,9 +62,11 @@ class TratamientoViewSet(viewsets.ModelViewSet):
             try:
                 categoria = CategoriaTratamiento.objects.get(id=categoria_id)
                 if include_subcategorias.lower() in ['true', '1', 'yes']:
-                    # Include treatments from this category and all its descendants
-                    descendant_ids = categoria.get_descendants(include_self=True).values_list('id', flat=True)
-                    queryset = queryset.filter(categoria__id__in=descendant_ids)
+                    # Include treatments from this category and all its descendants (lft/rght range)
+                    queryset = queryset.filter(
+                        categoria__tree_id=categoria.tree_id,
+                        categoria__lft__range=(categoria.lft, categoria.rght)
+                    )
                 else:
                     # Only this specific category
                     queryset = queryset.filter(categoria=categoria)
@@ -115,12 +118,13 @@ class TratamientoViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def categorias(self, request):
         """Get all treatment categories with hierarchical structure"""
-        categorias = CategoriaTratamiento.objects.filter(activo=True)
+        # One query for the whole tree: paths and counts come precomputed
+        categorias = [cat for cat in construir_arbol() if cat.activo]
         
         # Option to get only root categories
         only_roots = request.query_params.get('only_roots', 'false')
         if only_roots.lower() in ['true', '1', 'yes']:
-            categorias = categorias.filter(level=0)
+            categorias = [cat for cat in categorias if cat.level == 0]
         
         data = [{
             'id': str(cat.id),
@@ -131,7 +135,7 @@ class TratamientoViewSet(viewsets.ModelViewSet):
             'level': cat.level,
             'full_path': cat.get_full_path(),
             'total_tratamientos': cat.get_treatments_count(),
-            'parent_id': str(cat.parent.id) if cat.parent else None
+            'parent_id': str(cat.parent_id) if cat.parent_id else None
         } for cat in categorias]
         
         return Response(data)
@@ -139,7 +143,7 @@ class TratamientoViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def categorias_tree(self, request):
         """Get treatment categories as a tree structure"""
-        root_categories = CategoriaTratamiento.objects.filter(level=0, activo=True)
+        root_categories = raices_activas(construir_arbol())
         serializer = CategoriaTratamientoTreeSerializer(root_categories, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -157,15 +161,25 @@ class TratamientoViewSet(viewsets.ModelViewSet):
         except CategoriaTratamiento.DoesNotExist:
             return Response({'error': 'Category not found'}, status=404)
         
-        # Get all subcategories up to specified level
-        descendant_categories = categoria.get_descendants(include_self=True).filter(
-            level__lte=categoria.level + max_level
-        )
+        # Load the category's whole tree once and keep its subtree up to the specified level
+        max_level = categoria.level + max_level
+        nodos = construir_arbol(CategoriaTratamiento.objects.filter(tree_id=categoria.tree_id))
+        descendant_categories = [
+            cat for cat in nodos
+            if categoria.lft <= cat.lft <= categoria.rght and cat.level <= max_level
+        ]
+        
+        # All the subtree's treatments in a single lft/rght range join
+        treatments_by_category = {cat.pk: [] for cat in descendant_categories}
+        treatments = categoria.get_treatments().filter(activo=True, categoria__level__lte=max_level)
+        for treatment in con_categorias(treatments, descendant_categories):
+            treatments_by_category[treatment.categoria_id].append(treatment)
         
         result = {}
         for cat in descendant_categories:
-            treatments = Tratamiento.objects.filter(categoria=cat, activo=True)
-            serializer = TratamientoListSerializer(treatments, many=True, context={'request': request})
+            serializer = TratamientoListSerializer(
+                treatments_by_category[cat.pk], many=True, context={'request': request}
+            )
             result[str(cat.id)] = {
                 'categoria': CategoriaTratamientoSerializer(cat, context={'request': request}).data,
                 'tratamientos': serializer.data
@@ -189,16 +203,13 @@ class TratamientoViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(categoria__id=categoria_level_4)
         elif categoria_level_3:
             cat = CategoriaTratamiento.objects.get(id=categoria_level_3)
-            descendant_ids = cat.get_descendants(include_self=True).values_list('id', flat=True)
-            queryset = queryset.filter(categoria__id__in=descendant_ids)
+            queryset = queryset.filter(categoria__tree_id=cat.tree_id, categoria__lft__range=(cat.lft, cat.rght))
         elif categoria_level_2:
             cat = CategoriaTratamiento.objects.get(id=categoria_level_2)
-            descendant_ids = cat.get_descendants(include_self=True).values_list('id', flat=True)
-            queryset = queryset.filter(categoria__id__in=descendant_ids)
+            queryset = queryset.filter(categoria__tree_id=cat.tree_id, categoria__lft__range=(cat.lft, cat.rght))
         elif categoria_level_1:
             cat = CategoriaTratamiento.objects.get(id=categoria_level_1)
-            descendant_ids = cat.get_descendants(include_self=True).values_list('id', flat=True)
-            queryset = queryset.filter(categoria__id__in=descendant_ids)
+            queryset = queryset.filter(categoria__tree_id=cat.tree_id, categoria__lft__range=(cat.lft, cat.rght))
         
         # Apply text search
         if search_term:
@@ -278,7 +289,7 @@ class CategoriaTratamientoViewSet(viewsets.ModelViewSet):
         return CategoriaTratamientoSerializer
 
     def get_queryset(self):
-        queryset = CategoriaTratamiento.objects.all()
+        queryset = CategoriaTratamiento.objects.select_related('parent', 'conteo')
         
         # Filter by active status
         activo = self.request.query_params.get('activo', None)
@@ -299,7 +310,7 @@ class CategoriaTratamientoViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def tree(self, request):
         """Get categories as a tree structure"""
-        root_categories = CategoriaTratamiento.objects.filter(level=0, activo=True)
+        root_categories = raices_activas(construir_arbol())
         serializer = CategoriaTratamientoTreeSerializer(root_categories, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -349,13 +360,13 @@ class CategoriaTratamientoViewSet(viewsets.ModelViewSet):
         categoria = self.get_object()
         include_subcategorias = request.query_params.get('include_subcategorias', 'true')
         
-        if include_subcategorias.lower() in ['true', '1', 'yes']:
-            # Include treatments from subcategories
-            descendant_ids = categoria.get_descendants(include_self=True).values_list('id', flat=True)
-            tratamientos = Tratamiento.objects.filter(categoria__id__in=descendant_ids, activo=True)
-        else:
-            # Only this category
-            tratamientos = categoria.tratamientos.filter(activo=True)
+        include = include_subcategorias.lower() in ['true', '1', 'yes']
+        # Subcategories are matched with a lft/rght range join instead of a list of descendant ids
+        tratamientos = categoria.get_treatments(include_descendants=include).filter(activo=True)
+        
+        # Category paths and breadcrumbs come from the tree loaded in one query
+        nodos = construir_arbol(CategoriaTratamiento.objects.filter(tree_id=categoria.tree_id))
+        tratamientos = con_categorias(tratamientos, nodos)
         
         serializer = TratamientoListSerializer(tratamientos, many=True, context={'request': request})
         return Response(serializer.data)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsuariosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'usuarios'
+    
+    def ready(self):
+        # Registra la invalidación por señales de las cachés de referencia
+        import dental_erp.reference_data
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from dental_erp import sequences
+from usuarios.models import Secuencia
+import threading
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga de dental_erp.sequences: varios hilos, cada uno con su '
+        'propia conexión, piden números del mismo contador y se verifica que no '
+        'haya duplicados ni huecos.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Hilos concurrentes')
+        parser.add_argument('--per-worker', type=int, default=250, help='Asignaciones por hilo')
+        parser.add_argument('--block', type=int, default=1, help='Números por asignación (modo bloque)')
+    
+    def handle(self, *args, **options):
+        workers = options['workers']
+        per_worker = options['per_worker']
+        block = options['block']
+        nombre = f'loadtest:{uuid.uuid4().hex}'
+        barrier = threading.Barrier(workers)
+        
+        def worker(_):
+            numeros = []
+            try:
+                # Arrancar todos a la vez para provocar la primera inicialización concurrente
+                barrier.wait()
+                for _ in range(per_worker):
+                    numeros.extend(sequences.allocate(nombre, block))
+            finally:
+                connection.close()
+            return numeros
+        
+        self.stdout.write(
+            f"{workers} hilos x {per_worker} asignaciones de {block} número(s) "
+            f"sobre {connection.vendor}..."
+        )
+        start_time = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                resultados = list(executor.map(worker, range(workers)))
+        finally:
+            Secuencia.objects.filter(nombre=nombre).delete()
+        elapsed = time.time() - start_time
+        
+        numeros = [n for resultado in resultados for n in resultado]
+        esperado = workers * per_worker * block
+        duplicados = len(numeros) - len(set(numeros))
+        
+        self.stdout.write(f"- Números asignados: {len(numeros)} (esperados {esperado})")
+        self.stdout.write(f"- Duplicados: {duplicados}")
+        self.stdout.write(f"- Rango: {min(numeros)}..{max(numeros)}")
+        self.stdout.write(f"- Tiempo: {elapsed:.2f} s ({len(numeros) / elapsed:.0f} números/s)")
+        
+        if duplicados or sorted(numeros) != list(range(1, esperado + 1)):
+            raise CommandError("La secuencia asignó números duplicados o con huecos")
+        self.stdout.write(self.style.SUCCESS("Sin duplicados ni huecos"))
@@ -155,3 +155,21 @@ class ConfiguracionSistema(models.Model):
     
     def __str__(self):
         return f"{self.clave}: {self.valor}"
+
+
+class Secuencia(models.Model):
+    """
+    Contador para los números consecutivos legibles (citas, facturas, pagos,
+    expedientes). Se incrementa con ``dental_erp.sequences``.
+    """
+    nombre = models.CharField(max_length=100, unique=True)
+    valor = models.BigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Secuencia"
+        verbose_name_plural = "Secuencias"
+        ordering = ['nombre']
+    
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
@@ -1,3 +1,91 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from dental_erp import sequences
+from dental_erp.reference_data import especialidades_cache, get_especialidades
+from dentistas.models import Especialidad
+from pacientes.models import Paciente
+from pacientes.tests import crear_dentista, crear_paciente
+from .models import Secuencia
+
+
+class ReferenceCacheTest(TestCase):
+    """Tests para la caché de lectura de datos de referencia"""
+    
+    def setUp(self):
+        Especialidad.objects.create(nombre="Ortodoncia")
+        Especialidad.objects.create(nombre="Endodoncia")
+        cache.clear()
+        especialidades_cache.reset_stats()
+    
+    def test_read_through_and_invalidation(self):
+        """La segunda lectura sale de la caché y un cambio la invalida"""
+        with self.assertNumQueries(1):
+            self.assertEqual([e.nombre for e in get_especialidades()], ["Endodoncia", "Ortodoncia"])
+        with self.assertNumQueries(0):
+            get_especialidades()
+        
+        Especialidad.objects.create(nombre="Periodoncia")
+        self.assertEqual(len(get_especialidades()), 3)
+        
+        Especialidad.objects.get(nombre="Ortodoncia").delete()
+        self.assertEqual(len(get_especialidades()), 2)
+        
+        stats = especialidades_cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['invalidations'], 2)
+
+
+class CacheStatsAPITest(APITestCase):
+    """Tests para el endpoint de estadísticas de caché"""
+    
+    def test_requires_admin(self):
+        url = '/api/sistema/cache/stats/'
+        user = User.objects.create_user(username='user', password='testpass123')
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        
+        admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('especialidades', response.json())
+
+
+class SequenceTest(TestCase):
+    """Tests para los contadores de números consecutivos"""
+    
+    def test_allocate_and_blocks(self):
+        self.assertEqual(sequences.next_value('prueba'), 1)
+        self.assertEqual(sequences.next_value('prueba'), 2)
+        self.assertEqual(list(sequences.allocate('prueba', 3)), [3, 4, 5])
+        self.assertEqual(Secuencia.objects.get(nombre='prueba').valor, 5)
+        # Cada contador es independiente
+        self.assertEqual(sequences.next_value('otra'), 1)
+    
+    def test_seed_only_on_first_use(self):
+        llamadas = []
+        
+        def seed():
+            llamadas.append(1)
+            return 41
+        
+        self.assertEqual(sequences.next_value('sembrada', seed=seed), 42)
+        self.assertEqual(sequences.next_value('sembrada', seed=seed), 43)
+        self.assertEqual(len(llamadas), 1)
+    
+    def test_expediente_numbers_continue_existing_ones(self):
+        """Los contadores parten del mayor número ya usado con el prefijo"""
+        dentista = crear_dentista()
+        prefijo = f"DEN{dentista.id.hex[:3].upper()}-PAC-"
+        crear_paciente(dentista, 'Ana', 'López', numero_expediente=f"{prefijo}000007")
+        
+        paciente = crear_paciente(dentista, 'Luis', 'Pérez')
+        self.assertEqual(paciente.numero_expediente, f"{prefijo}000008")
+        
+        bloque = Paciente.reservar_numeros_expediente(dentista, 2)
+        self.assertEqual(bloque, [f"{prefijo}000009", f"{prefijo}000010"])
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'usuarios'
+
+urlpatterns = [
+    path('api/sistema/cache/stats/', views.cache_stats, name='cache-stats'),
+]
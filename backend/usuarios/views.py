@@ -1,3 +1,16 @@
-from django.shortcuts import render
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
-# Create your views here.
+from dental_erp.cache import get_cache_stats
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    Contadores de aciertos y fallos de las cachés de datos de referencia
+    
+    GET /api/sistema/cache/stats/
+    """
+    return Response(get_cache_stats())